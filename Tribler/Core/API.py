@@ -8,6 +8,16 @@
 """ Tribler Core API v1.0.8, Mar 2011. Import this to use the API """
 
 # History:
+# 1.0.9rc1   Added: [s/g]et_reactor_backend() to SessionConfig to select an
+#            edge-triggered epoll() network event loop.
+#            Added: [s/g]et_disk_io_threads() and [s/g]et_disk_io_queue_size()
+#            to DownloadConfig for asynchronous disk I/O.
+#            Added: [s/g]et_mmap_cache_size() to DownloadConfig to upload
+#            from memory-mapped files.
+#            Added: [s/g]et_hashcheck_threads(), [s/g]et_hashcheck_max_downloads()
+#            and [s/g]et_hashcheck_io_budget() to SessionConfig to check the
+#            data of several Downloads at once on multiple cores.
+#
 # 1.0.8:      Renamed set_proxy_mode/get_proxy_mode to set_doe_mode/get_doe_mode in
 #            DownloadConfig and DownloadRuntimeConfig. Renamed set_no_helpers/
 #            get_no_helpers to set_no_proxies/get_no_proxies in DownloadConfig and
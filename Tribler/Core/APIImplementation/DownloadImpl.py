@@ -5,6 +5,7 @@
 import sys
 import os
 import copy
+import binascii
 from traceback import print_exc,print_stack
 from threading import RLock,Condition,Event,Thread,currentThread
 
@@ -164,6 +165,10 @@ class DownloadImpl:
         # RePEX: extend kvconfig with initialdlstatus
         kvconfig['initialdlstatus'] = initialdlstatus
         
+        # Journal of the writes since the last checkpoint, see WriteJournal
+        basename = binascii.hexlify(infohash)+'.journal'
+        kvconfig['resume_journal'] = os.path.join(self.session.get_downloads_pstate_dir(),basename)
+        
         # Define which file to DL in VOD mode
         live = self.get_def().get_live()
         vodfileindex = {
@@ -333,6 +333,36 @@ class DownloadRuntimeConfig(DownloadConfigInterface):
         finally:
             self.dllock.release()
 
+    def set_disk_io_threads(self,value):
+        raise OperationNotPossibleAtRuntimeException()
+
+    def get_disk_io_threads(self):
+        self.dllock.acquire()
+        try:
+            return DownloadConfigInterface.get_disk_io_threads(self)
+        finally:
+            self.dllock.release()
+
+    def set_disk_io_queue_size(self,value):
+        raise OperationNotPossibleAtRuntimeException()
+
+    def get_disk_io_queue_size(self):
+        self.dllock.acquire()
+        try:
+            return DownloadConfigInterface.get_disk_io_queue_size(self)
+        finally:
+            self.dllock.release()
+
+    def set_mmap_cache_size(self,value):
+        raise OperationNotPossibleAtRuntimeException()
+
+    def get_mmap_cache_size(self):
+        self.dllock.acquire()
+        try:
+            return DownloadConfigInterface.get_mmap_cache_size(self)
+        finally:
+            self.dllock.release()
+
     def set_breakup_seed_bitfield(self,value):
         raise OperationNotPossibleAtRuntimeException()
 
@@ -16,6 +16,8 @@ from Tribler.__init__ import LIBRARYNAME
 from Tribler.Core.BitTornado.RawServer import RawServer
 from Tribler.Core.BitTornado.ServerPortHandler import MultiHandler
 from Tribler.Core.BitTornado.BT1.track import Tracker
+from Tribler.Core.BitTornado.BT1.HashChecker import HashCheckPool
+from Tribler.Core.BitTornado.BT1.TrackerClient import TrackerClient
 from Tribler.Core.BitTornado.HTTPHandler import HTTPHandler,DummyHTTPHandler
 from Tribler.Core.simpledefs import *
 from Tribler.Core.exceptions import *
@@ -74,7 +76,14 @@ class TriblerLaunchMany(Thread):
         
         # Following two attributes set/get by network thread ONLY
         self.hashcheck_queue = []
-        self.sdownloadtohashcheck = None
+        self.sdownloadstohashcheck = []
+        if config['hashcheck_threads'] > 0:
+            self.hashcheckpool = HashCheckPool(config['hashcheck_threads'], 
+                                               config['hashcheck_io_budget'] * 1048576)
+            self.hashcheck_max_downloads = max(config['hashcheck_max_downloads'], 1)
+        else:
+            self.hashcheckpool = None
+            self.hashcheck_max_downloads = 1
         
         # Following 2 attributes set/get by UPnPThread
         self.upnp_thread = None
@@ -86,8 +95,11 @@ class TriblerLaunchMany(Thread):
                                    config['timeout'],
                                    ipv6_enable = config['ipv6_enabled'],
                                    failfunc = self.rawserver_fatalerrorfunc,
-                                   errorfunc = self.rawserver_nonfatalerrorfunc)
+                                   errorfunc = self.rawserver_nonfatalerrorfunc,
+                                   reactor_backend = config['reactor_backend'])
         self.rawserver.add_task(self.rawserver_keepalive,1)
+        # Announces and scrapes of all downloads and the torrent checker
+        self.trackerclient = TrackerClient.getInstance(self.rawserver)
 
         self.listen_port = self.rawserver.find_and_bind(0, 
                     config['minport'], config['maxport'], config['bind'], 
@@ -280,6 +292,10 @@ class TriblerLaunchMany(Thread):
             
             # Start up KTH mainline DHT
             #TODO: Can I get the local IP number?
+            # The DHT runs in a thread of its own: its callbacks, e.g. 
+            # mainlineDHTChecker.got_peers_callback and the saving of its 
+            # state, do disk and database work that would stall the network 
+            # thread if it ran on our RawServer
             mainlineDHT.init(('127.0.0.1', self.listen_port), config['state_dir'])
                
         
@@ -544,28 +560,31 @@ class TriblerLaunchMany(Thread):
             # Check smallest torrents first
             self.hashcheck_queue.sort(singledownload_size_cmp)
             
-        if not self.sdownloadtohashcheck:
-            self.dequeue_and_start_hashcheck()
+        self.dequeue_and_start_hashcheck()
 
     def dequeue_and_start_hashcheck(self):
-        """ Start integriy check for first SingleDownload in queue
+        """ Start integrity checks for the first SingleDownloads in queue,
+        up to hashcheck_max_downloads at a time
         
         Called by network thread """
-        self.sdownloadtohashcheck = self.hashcheck_queue.pop(0)
-        self.sdownloadtohashcheck.perform_hashcheck(self.hashcheck_done)
-
-    def hashcheck_done(self,success=True):
-        """ Integrity check for first SingleDownload in queue done
+        while self.hashcheck_queue and len(self.sdownloadstohashcheck) < self.hashcheck_max_downloads:
+            sd = self.hashcheck_queue.pop(0)
+            self.sdownloadstohashcheck.append(sd)
+            done = lambda success=True, sd=sd: self.hashcheck_done(success, sd)
+            sd.perform_hashcheck(done, self.hashcheckpool)
+
+    def hashcheck_done(self,success=True,sd=None):
+        """ Integrity check for SingleDownload sd done. sd is None when a
+        SingleDownload still in the queue was stopped.
         
         Called by network thread """
         if DEBUG:
             print >>sys.stderr,"tlm: hashcheck_done, success",success
-        if success:
-            self.sdownloadtohashcheck.hashcheck_done()
-        if self.hashcheck_queue:
-            self.dequeue_and_start_hashcheck()
-        else:
-            self.sdownloadtohashcheck = None
+        if sd in self.sdownloadstohashcheck:
+            self.sdownloadstohashcheck.remove(sd)
+            if success:
+                sd.hashcheck_done()
+        self.dequeue_and_start_hashcheck()
 
     #
     # State retrieval
@@ -614,6 +633,9 @@ class TriblerLaunchMany(Thread):
             dir = self.session.get_downloads_pstate_dir()
             filelist = os.listdir(dir)
             for basename in filelist:
+                if basename.endswith('.journal'):
+                    # see WriteJournal, read by the Download itself
+                    continue
                 # Make this go on when a torrent fails to start
                 filename = os.path.join(dir,basename)
                 self.resume_download(filename,initialdlstatus)
@@ -725,7 +747,10 @@ class TriblerLaunchMany(Thread):
                 from Tribler.Core.CacheDB.sqlitecachedb import SQLiteCacheDB
                 
                 db = SQLiteCacheDB.getInstance()
-                db.commit()
+                # Includes the batched writes of the other threads
+                db.flush()
+                if DEBUG:
+                    print >>sys.stderr,"tlm: database stats",db.get_stats()
             
             mainlineDHT.deinit()
             
@@ -736,6 +761,10 @@ class TriblerLaunchMany(Thread):
         except:
             print_exc()
         
+        if self.hashcheckpool is not None:
+            self.hashcheckpool.shutdown()
+        self.trackerclient.shutdown()
+
         # Stop network thread
         self.sessdoneflag.set()
         # Arno, 2010-08-09: Stop Session pool threads only after gracetime
@@ -122,6 +122,46 @@ class SessionRuntimeConfig(SessionConfigInterface):
         finally:
             self.sesslock.release()
 
+    def set_reactor_backend(self,value):
+        raise OperationNotPossibleAtRuntimeException()
+
+    def get_reactor_backend(self):
+        self.sesslock.acquire()
+        try:
+            return SessionConfigInterface.get_reactor_backend(self)
+        finally:
+            self.sesslock.release()
+
+    def set_hashcheck_threads(self,value):
+        raise OperationNotPossibleAtRuntimeException()
+
+    def get_hashcheck_threads(self):
+        self.sesslock.acquire()
+        try:
+            return SessionConfigInterface.get_hashcheck_threads(self)
+        finally:
+            self.sesslock.release()
+
+    def set_hashcheck_max_downloads(self,value):
+        raise OperationNotPossibleAtRuntimeException()
+
+    def get_hashcheck_max_downloads(self):
+        self.sesslock.acquire()
+        try:
+            return SessionConfigInterface.get_hashcheck_max_downloads(self)
+        finally:
+            self.sesslock.release()
+
+    def set_hashcheck_io_budget(self,value):
+        raise OperationNotPossibleAtRuntimeException()
+
+    def get_hashcheck_io_budget(self):
+        self.sesslock.acquire()
+        try:
+            return SessionConfigInterface.get_hashcheck_io_budget(self)
+        finally:
+            self.sesslock.release()
+
     def set_megacache(self,value):
         raise OperationNotPossibleAtRuntimeException()
 
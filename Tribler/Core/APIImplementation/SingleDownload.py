@@ -161,8 +161,9 @@ class SingleDownload:
         except Exception,e:
             self.fatalerrorfunc(e)
 
-    def perform_hashcheck(self,complete_callback):
-        """ Called by any thread """
+    def perform_hashcheck(self,complete_callback,hashcheckpool=None):
+        """ Called by any thread. If given, the data is checked by the
+        threads of the HashCheckPool. """
         if DEBUG:
             print >>sys.stderr,"SingleDownload: perform_hashcheck()" # ,self.videoinfo
         try:
@@ -170,7 +171,7 @@ class SingleDownload:
             self._getstatsfunc = SPECIAL_VALUE # signal we're hashchecking
             # Already set, should be same
             self.lmhashcheckcompletecallback = complete_callback
-            self._hashcheckfunc(self.lmhashcheckcompletecallback)
+            self._hashcheckfunc(self.lmhashcheckcompletecallback, hashcheckpool=hashcheckpool)
         except Exception,e:
             self.fatalerrorfunc(e)
             
@@ -106,6 +106,9 @@ class UserCallbackHandler:
                 print >>sys.stderr,"Session: sesscb_removestate: removing dlcheckpoint entry",filename
             if os.access(filename,os.F_OK):
                 os.remove(filename)
+            filename = os.path.join(dlpstatedir,hexinfohash+'.journal')
+            if os.access(filename,os.F_OK):
+                os.remove(filename)
         except:
             # Show must go on
             print_exc()
@@ -307,6 +307,8 @@ class Connection:
             return 0
         if not self.can_send_to():
             return 0
+        sent = 0
+        out = []
         if self.partial_message is None:
             s = self.upload.get_upload_chunk()
             if s is None:
@@ -332,39 +334,49 @@ class Connection:
                 bhashlist = bencode(hashlist)
                 if hashpiece_msg_id is None:
                     # old Tribler <= 4.5.2 style
-                    self.partial_message = ''.join((
+                    header = ''.join((
                                     tobinary(1+4+4+4+len(bhashlist)+len(piece)), HASHPIECE,
-                                    tobinary(index), tobinary(begin), tobinary(len(bhashlist)), bhashlist, piece.tostring() ))
+                                    tobinary(index), tobinary(begin), tobinary(len(bhashlist)), bhashlist ))
                 else:
                     # Merkle BEP
-                    self.partial_message = ''.join((
+                    header = ''.join((
                                     tobinary(2+4+4+4+len(bhashlist)+len(piece)), EXTEND, hashpiece_msg_id,
-                                    tobinary(index), tobinary(begin), tobinary(len(bhashlist)), bhashlist, piece.tostring() ))
-                    
+                                    tobinary(index), tobinary(begin), tobinary(len(bhashlist)), bhashlist ))
             else:
-                self.partial_message = ''.join((
-                            tobinary(len(piece) + 9), PIECE, 
-                            tobinary(index), tobinary(begin), piece.tostring()))
+                header = ''.join((tobinary(len(piece) + 9), PIECE, 
+                            tobinary(index), tobinary(begin)))
+            # The piece, an array or a buffer on a memory-mapped file, is 
+            # written after the header as it is, it is not copied into 
+            # the message
+            out.append(header)
+            sent = len(header)
+            self.partial_message = piece
             if DEBUG_NORMAL_MSGS:
                 print >>sys.stderr,'sending chunk: '+str(index)+': '+str(begin)+'-'+str(begin+len(piece))
 
         if bytes < len(self.partial_message):
-            self.connection.send_message_raw(self.partial_message[:bytes])
-            self.partial_message = self.partial_message[bytes:]
-            return bytes
+            # buffer() slices do not copy the rest of the message
+            out.append(buffer(self.partial_message, 0, bytes))
+            self.partial_message = buffer(self.partial_message, bytes)
+            self.connection.send_message_vector(out)
+            return sent + bytes
 
-        q = [self.partial_message]
+        q = self.partial_message
         self.partial_message = None
         if self.send_choke_queued:
             self.send_choke_queued = False
             self.outqueue.append(tobinary(1)+CHOKE)
             self.upload.choke_sent()
             self.just_unchoked = 0
-        q.extend(self.outqueue)
-        self.outqueue = []
-        q = ''.join(q)
-        self.connection.send_message_raw(q)
-        return len(q)
+        out.append(q)
+        sent += len(q)
+        if self.outqueue:
+            q = ''.join(self.outqueue)
+            self.outqueue = []
+            out.append(q)
+            sent += len(q)
+        self.connection.send_message_vector(out)
+        return sent
 
     def get_upload(self):
         return self.upload
@@ -0,0 +1,252 @@
+# see LICENSE.txt for license information
+#
+# Asynchronous disk I/O for a Storage. The reads and writes of a download
+# are carried out by a few threads, so a slow disk does not stall the network
+# thread and with it every other connection of the session.
+#
+# Writes are collected and written by one thread at a time, sorted and
+# merged into contiguous runs, so a piece received as 16 KB blocks is
+# written with a single write() call. Reads see the writes queued before
+# them: data that is still waiting to be written is served from memory,
+# otherwise the pending writes are done first.
+#
+
+import sys
+from Queue import Queue
+from threading import Thread, Condition
+from traceback import print_exc
+
+from Tribler.Core.BitTornado.BT1.Storage import PieceBuffer
+
+DEBUG = False
+
+
+class DiskIOExecutor:
+    def __init__(self, storage, numthreads, queuesize, schedulefunc, failfunc):
+        """
+        @param storage The Storage to read from and write to.
+        @param numthreads The number of disk I/O threads.
+        @param queuesize The maximum number of queued reads and, separately,
+        of writes waiting to be written. Beyond that the caller blocks.
+        @param schedulefunc Thread-safe function to run a callback on the
+        network thread, e.g., RawServer.add_task.
+        @param failfunc Called on the network thread with a message when a
+        read or write failed.
+        """
+        self.storage = storage
+        self.queuesize = queuesize
+        self.schedulefunc = schedulefunc
+        self.failfunc = failfunc
+        self.tasks = Queue(queuesize)
+        self.cond = Condition()
+        # [(pos, data)] in the order they were queued
+        self.pending = []
+        # writes taken from pending that are being written
+        self.inflight = []
+        self.flushing = False
+        self.flush_queued = False
+        self.closed = False
+
+        self.threads = []
+        for i in xrange(numthreads):
+            t = Thread(target = self._run)
+            t.setName('DiskIO' + t.getName())
+            t.setDaemon(True)
+            t.start()
+            self.threads.append(t)
+
+    def queue_task(self, func, args = (), callback = None):
+        """ Runs func(*args) on a disk I/O thread. When done, callback is
+        called on the network thread with the result, or with None if func
+        raised an IOError or OSError. Blocks when the queue is full. """
+        self.tasks.put((func, args, callback))
+
+    def write(self, pos, data):
+        """ Queues data to be written at position pos of the storage """
+        if not isinstance(data, str):
+            # A PieceBuffer or array, which the caller may reuse
+            data = data[:].tostring()
+        self.cond.acquire()
+        try:
+            while len(self.pending) >= self.queuesize and not self.closed:
+                if self.flushing or self.flush_queued:
+                    self.cond.wait()
+                else:
+                    self._flush_locked()
+            self.pending.append((pos, data))
+            queue_flush = not (self.flushing or self.flush_queued)
+            if queue_flush:
+                self.flush_queued = True
+        finally:
+            self.cond.release()
+        if queue_flush:
+            self.tasks.put((self._flush_task, (), None))
+
+    def read(self, pos, amount, flush_first = False):
+        """ Reads amount bytes at position pos from the storage, taking the
+        queued writes into account. Can be called from any thread, blocks.
+        Returns a PieceBuffer, may raise an IOError like Storage.read. """
+        self.cond.acquire()
+        try:
+            while True:
+                data, overlap = self._read_pending(pos, amount)
+                if not overlap:
+                    break
+                if data is not None and not flush_first:
+                    r = PieceBuffer()
+                    r.append(data)
+                    return r
+                if self.flushing:
+                    self.cond.wait()
+                else:
+                    self._flush_locked()
+        finally:
+            self.cond.release()
+        return self.storage.read(pos, amount, flush_first)
+
+    def has_pending(self, pos, amount):
+        """ Returns whether queued writes overlap the given range """
+        self.cond.acquire()
+        try:
+            return self._read_pending(pos, amount)[1]
+        finally:
+            self.cond.release()
+
+    def flush(self):
+        """ Waits until all queued writes have been written """
+        self.cond.acquire()
+        try:
+            while self.pending or self.flushing:
+                if self.flushing:
+                    self.cond.wait()
+                else:
+                    self._flush_locked()
+        finally:
+            self.cond.release()
+
+    def shutdown(self):
+        """ Writes the queued writes and stops the threads. Queued reads
+        are still carried out. """
+        self.flush()
+        self.closed = True
+        for t in self.threads:
+            self.tasks.put(None)
+        for t in self.threads:
+            t.join(5.0)
+
+    #
+    # Internal methods
+    #
+    def _run(self):
+        while True:
+            task = self.tasks.get()
+            if task is None:
+                break
+            func, args, callback = task
+            try:
+                result = func(*args)
+            except (IOError, OSError), e:
+                self._failed(e)
+                result = None
+            except:
+                print_exc()
+                result = None
+            if callback is not None:
+                self.schedulefunc(lambda callback = callback, result = result: callback(result))
+
+    def _failed(self, e):
+        if DEBUG:
+            print >>sys.stderr,"DiskIO: failed:",str(e)
+        if isinstance(e, IOError):
+            msg = 'IO Error: ' + str(e)
+        else:
+            msg = 'OS Error: ' + str(e)
+        self.schedulefunc(lambda: self.failfunc(msg))
+
+    def _flush_task(self):
+        self.cond.acquire()
+        try:
+            self.flush_queued = False
+            if not self.flushing:
+                self._flush_locked()
+        finally:
+            self.cond.release()
+
+    def _flush_locked(self):
+        """ Writes the pending writes until there are none left. Called with
+        self.cond held, which is released while writing. """
+        self.flushing = True
+        try:
+            while self.pending:
+                writes = self.pending
+                self.pending = []
+                self.inflight = writes
+                self.cond.notifyAll()
+                self.cond.release()
+                try:
+                    try:
+                        self._write_runs(writes)
+                    except (IOError, OSError), e:
+                        self._failed(e)
+                finally:
+                    self.cond.acquire()
+                    self.inflight = []
+        finally:
+            self.flushing = False
+            self.cond.notifyAll()
+
+    def _write_runs(self, writes):
+        runs = coalesce(writes)
+        if DEBUG:
+            print >>sys.stderr,"DiskIO: writing",len(writes),"blocks as",len(runs),"runs"
+        for pos, data in runs:
+            self.storage.write(pos, data)
+
+    def _read_pending(self, pos, amount):
+        """ Returns (data, overlap): overlap is whether queued writes overlap
+        the range, data is the range if those writes cover all of it. Called
+        with self.cond held. """
+        stop = pos + amount
+        writes = [(p, d) for p, d in self.inflight + self.pending
+                  if p < stop and p + len(d) > pos]
+        if not writes:
+            return None, False
+
+        covered = pos
+        for p, d in sorted(writes):
+            if p > covered:
+                return None, True
+            covered = max(covered, p + len(d))
+        if covered < stop:
+            return None, True
+
+        buf = bytearray(amount)
+        for p, d in writes:
+            begin = max(p, pos)
+            end = min(p + len(d), stop)
+            buf[begin-pos:end-pos] = d[begin-p:end-p]
+        return str(buf), True
+
+
+def coalesce(writes):
+    """ Merges a list of (pos, data) writes into the fewest contiguous runs.
+    Writes that overlap must be done in the order given, in that case the
+    list is returned as is. """
+    if len(writes) < 2:
+        return writes
+    l = sorted(writes)
+    for i in xrange(1, len(l)):
+        if l[i][0] < l[i-1][0] + len(l[i-1][1]):
+            return writes
+    runs = []
+    start, chunks = l[0][0], [l[0][1]]
+    end = start + len(l[0][1])
+    for pos, data in l[1:]:
+        if pos == end:
+            chunks.append(data)
+        else:
+            runs.append((start, ''.join(chunks)))
+            start, chunks = pos, [data]
+        end = pos + len(data)
+    runs.append((start, ''.join(chunks)))
+    return runs
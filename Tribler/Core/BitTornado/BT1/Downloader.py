@@ -548,8 +548,8 @@ class SingleDownload():
     def _check_interests(self):
         if self.interested or self.downloader.paused:
             return
-        for i in xrange(len(self.have)):
-            if ( self.have[i] and not self.downloader.picker.is_blocked(i)
+        for i in self.have.iter_true():
+            if ( not self.downloader.picker.is_blocked(i)
                  and ( self.downloader.endgamemode
                        or self.downloader.storage.do_I_have_requests(i) ) ):
                 self.send_interested()
@@ -604,9 +604,16 @@ class SingleDownload():
             if DEBUGBF:
                 print >>sys.stderr,"Downloader: got_have_field: live: Filtering bitfield",activerangeiterators 
 
-            if not self.downloader.picker.videostatus or self.downloader.picker.videostatus.live_streaming:
+            if not self.downloader.picker.videostatus:
                 if DEBUGBF:
-                    print >>sys.stderr,"Downloader: got_have_field: live or normal filter"
+                    print >>sys.stderr,"Downloader: got_have_field: normal"
+                # All pieces are valid, only visit the ones he has
+                validhave = Bitfield(copyfrom=have)
+                for i in have.iter_true():
+                    self.downloader.picker.got_have(i,self.connection)
+            elif self.downloader.picker.videostatus.live_streaming:
+                if DEBUGBF:
+                    print >>sys.stderr,"Downloader: got_have_field: live filter"
                 # Transfer HAVE knowledge to PiecePicker and filter pieces if live
                 validhave = Bitfield(self.downloader.numpieces)
                 for iterator in activerangeiterators:
@@ -1083,14 +1090,13 @@ class Downloader:
         """
         if len(toinvalidateranges) == 1:
             (s,e) = toinvalidateranges[0]
-            emptyrange = [False for piece in xrange(s,e+1)]
-            assert len(emptyrange) == e+1-s
             
             for d in self.downloads:
-                newhave = d.have[0:s] + emptyrange + d.have[e+1:]
+                newhave = Bitfield(copyfrom=d.have)
+                newhave.clear_range(s,e+1)
 
                 #oldhave = d.have
-                d.have = Bitfield(length=len(newhave),fromarray=newhave)
+                d.have = newhave
                 #assert oldhave.tostring() == d.have.tostring()
                 """
                 for piece in toinvalidateset:
@@ -1107,17 +1113,14 @@ class Downloader:
         else:
             (s1,e1) = toinvalidateranges[0]
             (s2,e2) = toinvalidateranges[1]
-            emptyrange1 = [False for piece in xrange(s1,e1+1)]
-            emptyrange2 = [False for piece in xrange(s2,e2+1)]
-            
-            assert len(emptyrange1) == e1+1-s1
-            assert len(emptyrange2) == e2+1-s2
             
             for d in self.downloads:
-                newhave = emptyrange1 + d.have[e1+1:s2] + emptyrange2
+                newhave = Bitfield(copyfrom=d.have)
+                newhave.clear_range(s1,e1+1)
+                newhave.clear_range(s2,e2+1)
                 
                 #oldhave = d.have
-                d.have = Bitfield(length=len(newhave),fromarray=newhave)
+                d.have = newhave
                 #assert oldhave.tostring() == d.have.tostring()
                 """
                 for piece in toinvalidateset:
@@ -1143,24 +1146,11 @@ class Downloader:
             if DEBUG:
                 print >> sys.stderr,"Downloader: aggregate_and_send_haves"
             
-            # haves_vector is a matrix, having on each line a Bitfield
-            # len(self.downloads) = the number of connections to swarm peers
-            # +1 = me (the pieces i have locally)
-            haves_vector = [None] * (len(self.downloads)+1)
-            for i in range(0, len(self.downloads)):
-                haves_vector[i] = self.downloads[i].have
-            
-            haves_vector[len(self.downloads)] = self.storage.get_have_copy()
-            
-            #Calculate the aggregated haves
-            aggregated_haves = Bitfield(self.numpieces)
-            for piece in range (0, self.numpieces):
-                aggregated_value = False
-                # For every column in the haves_vector matrix
-                for d in range(0, len(self.downloads)+1):
-                    # For every active connection
-                    aggregated_value = aggregated_value or haves_vector[d][piece] # Logical OR operation 
-                aggregated_haves[piece] = aggregated_value
+            # Calculate the aggregated haves: the OR of the haves of all
+            # connections to swarm peers and the pieces I have locally
+            aggregated_haves = Bitfield(self.numpieces, self.storage.get_have_list())
+            for d in self.downloads:
+                aggregated_haves |= d.have
             
             if DEBUG:
                 print >> sys.stderr, "Downloader: aggregate_and_send_haves" #, len(self.downloads), aggregated_haves.toboollist()
@@ -353,6 +353,12 @@ class Connection:
         if not self.closed:
             self.connection.write(message)    # SingleSocket
 
+    def send_message_vector(self, messages):
+        """ Sends the messages with as few writes as possible, without
+        joining them first """
+        if not self.closed:
+            self.connection.write_vector(messages)    # SingleSocket
+
     def data_came_in(self, connection, s):
         self.Encoder.measurefunc(len(s))
         while 1:
@@ -118,6 +118,7 @@ class FileSelector:
                 buffer.append((piece, start, data))
 
         files_updated = False        
+        self.storagewrapper.wait_for_writes()
         try:
             for f in xrange(self.numfiles):
                 if new_disabled[f] and not old_disabled[f]:
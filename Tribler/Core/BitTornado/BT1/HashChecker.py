@@ -0,0 +1,222 @@
+# see LICENSE.txt for license information
+#
+# Parallel hash checking of the data of downloads on start-up. A pool of
+# threads, shared by all downloads of a session, reads runs of consecutive
+# pieces with a single read and computes their SHA1 hashes. The SHA1 code
+# and the disk reads release the GIL, so the threads use several cores.
+#
+# The pieces of the downloads being checked are handed out round-robin, and
+# the amount of data read but not yet hashed by all threads together is kept
+# under an I/O budget. The decisions on the hashes, as well as the progress
+# reports, are left to the StorageWrapper on the network thread, see
+# StorageWrapper.hashcheckfunc().
+#
+
+import sys
+from threading import Thread, Condition
+from traceback import print_exc
+
+from Tribler.Core.Utilities.Crypto import sha
+
+DEBUG = False
+
+READAHEAD = 4 * 1048576
+
+
+class HashCheckPool:
+    def __init__(self, numthreads, budget, readahead = READAHEAD):
+        """
+        @param numthreads The number of hashing threads.
+        @param budget The maximum number of bytes read from disk and not yet
+        hashed, for all downloads together.
+        @param readahead The number of bytes of consecutive pieces read at
+        once. At least one piece is read.
+        """
+        self.budget = budget
+        self.available = budget
+        self.readahead = readahead
+        self.cond = Condition()
+        # HashCheckJobs with pieces left to hand out, in round-robin order
+        self.jobs = []
+        self.closed = False
+
+        self.threads = []
+        for i in xrange(numthreads):
+            t = Thread(target = self._run)
+            t.setName('HashCheck' + t.getName())
+            t.setDaemon(True)
+            t.start()
+            self.threads.append(t)
+
+    def check_pieces(self, readfunc, pieces, piece_length, piecelenfunc, lastlen, 
+                     doneflag):
+        """ Starts checking pieces, returns the HashCheckJob.
+        @param readfunc Thread-safe function that returns a PieceBuffer with
+        the data at position pos, like Storage.read(pos, amount). May raise
+        IOError.
+        @param pieces The piece numbers, in the order they are read.
+        @param piece_length The length of all but the last piece.
+        @param piecelenfunc Returns the length of a piece.
+        @param lastlen The length of the last piece of the torrent, see
+        HashCheckJob.get_results().
+        @param doneflag Event that is set when the download is stopped, the
+        rest of its pieces is then skipped.
+        """
+        job = HashCheckJob(self, readfunc, pieces, piece_length, piecelenfunc, 
+                           lastlen, doneflag)
+        self.cond.acquire()
+        try:
+            if job.pieces:
+                self.jobs.append(job)
+                self.cond.notifyAll()
+        finally:
+            self.cond.release()
+        return job
+
+    def shutdown(self):
+        """ Stops the threads after the pieces they are hashing """
+        self.cond.acquire()
+        try:
+            self.closed = True
+            self.jobs = []
+            self.cond.notifyAll()
+        finally:
+            self.cond.release()
+
+    #
+    # Internal methods
+    #
+    def _run(self):
+        while True:
+            self.cond.acquire()
+            try:
+                while not self.jobs and not self.closed:
+                    self.cond.wait()
+                if self.closed:
+                    return
+                job = self.jobs.pop(0)
+                if job.doneflag.isSet():
+                    continue
+                batch = job._next_batch(self.readahead)
+                if job.pieces:
+                    self.jobs.append(job)
+                size = sum([length for piece, length in batch])
+                # A batch larger than the budget is read by itself
+                while self.available < min(size, self.budget) and not self.closed:
+                    self.cond.wait()
+                self.available -= size
+            finally:
+                self.cond.release()
+            try:
+                job._check(batch)
+            finally:
+                self.cond.acquire()
+                self.available += size
+                self.cond.notifyAll()
+                self.cond.release()
+
+    def _cancel(self, job):
+        self.cond.acquire()
+        try:
+            if job in self.jobs:
+                self.jobs.remove(job)
+        finally:
+            self.cond.release()
+
+
+class HashCheckJob:
+    """ The hash check of the pieces of one download. The pool threads add
+    results, the network thread takes them with get_results(). """
+    def __init__(self, pool, readfunc, pieces, piece_length, piecelenfunc, 
+                 lastlen, doneflag):
+        self.pool = pool
+        self.readfunc = readfunc
+        self.pieces = list(pieces)
+        self.piece_length = piece_length
+        self.piecelenfunc = piecelenfunc
+        self.lastlen = lastlen
+        self.doneflag = doneflag
+        self.lock = pool.cond
+        self.results = []
+        self.error = None
+
+    def get_results(self):
+        """ Returns the new results as a list of (piece, sp, s): s is the
+        SHA1 hash of the piece and sp that of its first lastlen bytes. Both
+        are None if the piece could not be read, see the error attribute. """
+        self.lock.acquire()
+        try:
+            results = self.results
+            self.results = []
+            return results
+        finally:
+            self.lock.release()
+
+    def cancel(self):
+        """ Stops handing out pieces to check """
+        self.pool._cancel(self)
+
+    #
+    # Internal methods, called by the pool threads with the pool lock held
+    #
+    def _next_batch(self, readahead):
+        """ Takes a run of consecutive pieces of at most readahead bytes
+        from the pieces to check, returns [(piece, length)] """
+        piece = self.pieces.pop(0)
+        length = self.piecelenfunc(piece)
+        batch = [(piece, length)]
+        size = length
+        while self.pieces and self.pieces[0] == piece + 1:
+            piece = self.pieces[0]
+            length = self.piecelenfunc(piece)
+            if size + length > readahead:
+                break
+            del self.pieces[0]
+            batch.append((piece, length))
+            size += length
+        return batch
+
+    #
+    # Internal methods, called by the pool threads
+    #
+    def _check(self, batch):
+        first = batch[0][0]
+        size = sum([length for piece, length in batch])
+        results = []
+        try:
+            try:
+                data = self.readfunc(first * self.piece_length, size)
+            except IOError, e:
+                if DEBUG:
+                    print >>sys.stderr,"HashCheck: failed to read pieces",first,"-",batch[-1][0],str(e)
+                self.error = 'IO Error: ' + str(e)
+                results = [(piece, None, None) for piece, length in batch]
+                return
+            except:
+                print_exc()
+                self.error = 'error reading data'
+                results = [(piece, None, None) for piece, length in batch]
+                return
+
+            if len(data) != size:
+                # Storage.read reads or raises, but its callers check too
+                self.error = 'error reading data'
+                results = [(piece, None, None) for piece, length in batch]
+                data.release()
+                return
+            offset = 0
+            for piece, length in batch:
+                # No copies, hash the data in the buffer in place
+                sh = sha(buffer(data.buf, offset, min(self.lastlen, length)))
+                sp = sh.digest()
+                if length > self.lastlen:
+                    sh.update(buffer(data.buf, offset + self.lastlen, length - self.lastlen))
+                results.append((piece, sp, sh.digest()))
+                offset += length
+            data.release()
+        finally:
+            self.lock.acquire()
+            try:
+                self.results.extend(results)
+            finally:
+                self.lock.release()
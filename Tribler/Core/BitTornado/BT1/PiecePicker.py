@@ -405,16 +405,67 @@ class PiecePicker:
 
         # select first acceptable piece, best interest index first.
         # r is an interest-range
-        for lo, hi in r:
-            for i in xrange(lo, hi):
-                for j in self.interests[i]:
-                    if haves[j] and wantfunc(j):
-                        return j
+        if isinstance(haves, Bitfield):
+            # Scan the levels as long as that is cheaper than visiting the
+            # pieces the peer has. Peers that have few pieces mostly have
+            # pieces that are not rare, so for them the rarest levels are
+            # skipped this way.
+            budget = haves.get_numtrue()
+            bits = haves.bits
+            for lo, hi in r:
+                for i in xrange(lo, hi):
+                    l = self.interests[i]
+                    if len(l) > budget:
+                        piece = self._next_from_haves(haves, wantfunc, r)
+                        if piece is not None:
+                            return piece
+                        return best
+                    budget -= len(l)
+                    for j in l:
+                        # Inlined haves[j], this loop is hot
+                        if bits[j >> 3] & (0x80 >> (j & 7)) and wantfunc(j):
+                            return j
+        else:
+            for lo, hi in r:
+                for i in xrange(lo, hi):
+                    for j in self.interests[i]:
+                        if haves[j] and wantfunc(j):
+                            return j
 
         if best is not None:
             return best
         return None
 
+    def _next_from_haves(self, haves, wantfunc, r):
+        """ Returns a piece the interest level scan in _next could return,
+        but only visits the pieces the peer has. Of the pieces at the best
+        interest level a random acceptable one is returned, as the levels
+        are kept shuffled. """
+        has = self.has
+        priority = self.priority
+        levels = self.level_in_interests
+        candidates = {}
+        for j in haves.iter_true():
+            # Pieces we have or don't want are not in the interests
+            if has[j] or priority[j] < 0:
+                continue
+            level = levels[j]
+            rank = 0
+            for lo, hi in r:
+                if lo <= level < hi:
+                    candidates.setdefault((rank, level), []).append(j)
+                    break
+                rank += 1
+        keys = candidates.keys()
+        keys.sort()
+        for key in keys:
+            pieces = candidates[key]
+            shuffle(pieces)
+            for j in pieces:
+                if wantfunc(j):
+                    return j
+        return None
+
     def next(self, haves, wantfunc, sdownload, complete_first = False, slowpieces= [], willrequest = True, connection = None):
         """ Return the next piece number to be downloaded
         
@@ -597,10 +648,8 @@ class PiecePicker:
         if connection.download.have.complete():
             self.lost_seed()
         else:
-            has = connection.download.have
-            for i in xrange(0, self.numpieces):
-                if has[i]:
-                    self.lost_have(i)
+            for i in connection.download.have.iter_true():
+                self.lost_have(i)
 
         if connection in self.seed_connections:
             del self.seed_connections[connection]
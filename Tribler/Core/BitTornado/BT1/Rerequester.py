@@ -6,11 +6,10 @@
 # see LICENSE.txt for license information
 
 import sys
-from Tribler.Core.BitTornado.zurllib import urlopen
 from urllib import quote
 from btformats import check_peers
-from Tribler.Core.BitTornado.bencode import bdecode
-from threading import Thread, Lock, currentThread
+from TrackerClient import TrackerClient, ERROR_DATA
+from threading import currentThread
 from cStringIO import StringIO
 from traceback import print_exc,print_stack
 from socket import error, gethostbyname, inet_aton, inet_ntoa
@@ -89,7 +88,7 @@ class Rerequester:
             connect, externalsched, amount_left, up, down, 
             port, ip, myid, infohash, timeout, errorfunc, excfunc, 
             maxpeers, doneflag, upratefunc, downratefunc, 
-            unpauseflag = fakeflag(True), config=None):
+            unpauseflag = fakeflag(True), config=None, trackerclient=None):
 
         self.excfunc = excfunc
         newtrackerlist = []        
@@ -130,7 +129,10 @@ class Rerequester:
         self.last_failed = True
         self.never_succeeded = True
         self.errorcodes = {}
-        self.lock = SuccessLock()
+        self.busy = False   # announcing to the trackers
+        if trackerclient is None:
+            trackerclient = TrackerClient.getInstance()
+        self.trackerclient = trackerclient
         self.special = None
         self.started = False
         self.stopped = False
@@ -252,37 +254,27 @@ class Rerequester:
         #
         # _ProxyService
 
-        if not self.lock.isfinished():  # still waiting for prior cycle to complete??
+        if self.busy:  # still waiting for prior cycle to complete??
             def retry(self = self, s = s, callback = callback):
                 self.rerequest(s, callback)
             self.sched(retry, 5)         # retry in 5 seconds
             return
-        self.lock.reset()
-        rq = Thread(target = self._rerequest, args = [s, callback])
-        rq.setName( "TrackerRerequestA"+rq.getName() )
-        # Arno: make this a daemon thread so the client closes sooner.
-        rq.setDaemon(True)
-        rq.start()
+        self.busy = True
+        self._rerequest(s, callback)
 
     def _rerequest(self, s, callback):
         try:
-            def fail(self = self, callback = callback):
-                self._fail(callback)
             if self.ip:
-                try:
-                    # IPVSIX
-                    if ':' in self.ip:
-                        # TODO: support for ipv4= field
-                        urlip = "["+self.ip+"]" # URL encoding for IPv6, see RFC3986
-                        field = "ipv6"
-                    else:
-                        urlip = self.ip
-                        field = "ip"
-                        
-                    s += '&' + field + '=' + urlip  
-                except:
-                    self.errorcodes['troublecode'] = 'unable to resolve: '+self.ip
-                    self.externalsched(fail)
+                # IPVSIX
+                if ':' in self.ip:
+                    # TODO: support for ipv4= field
+                    urlip = "["+self.ip+"]" # URL encoding for IPv6, see RFC3986
+                    field = "ipv6"
+                else:
+                    urlip = self.ip
+                    field = "ip"
+                    
+                s += '&' + field + '=' + urlip  
             self.errorcodes = {}
             if self.special is None:
 
@@ -292,31 +284,41 @@ class Rerequester:
                 elif DEBUG_DHT:
                     print >>sys.stderr,"Rerequester: No DHT support loaded"
 
-                for t in range(len(self.trackerlist)):
-                    for tr in range(len(self.trackerlist[t])):
-                        tracker  = self.trackerlist[t][tr]
-                        # Arno: no udp support yet
-                        if tracker.startswith( 'udp:' ):
-                            if DEBUG:
-                                print >>sys.stderr,"Rerequester: Ignoring tracker",tracker
-                            continue
-                        #elif DEBUG:
-                        #    print >>sys.stderr,"Rerequester: Trying tracker",tracker
-                        if self.rerequest_single(tracker, s, callback):
-                            if not self.last_failed and tr != 0:
-                                del self.trackerlist[t][tr]
-                                self.trackerlist[t] = [tracker] + self.trackerlist[t]
-                            return
+                trackers = []
+                for tier in self.trackerlist:
+                    for tracker in tier:
+                        trackers.append((tier, tracker))
             else:
-                tracker = self.special
+                trackers = [(None, self.special)]
                 self.special = None
-                if self.rerequest_single(tracker, s, callback):
-                    return
-            # no success from any tracker
-            self.externalsched(fail)
+            self.rerequest_next(trackers, s, callback)
         except:
+            self.busy = False
             self.exception(callback)
 
+    def rerequest_next(self, trackers, s, callback):
+        """ Announces to the first of the (tier, tracker) pairs, and to the
+        next if it fails """
+        if not trackers:
+            # no success from any tracker
+            self._fail(callback)
+            return
+        tier, tracker = trackers[0]
+        def done(response, error, self = self, trackers = trackers, s = s, callback = callback):
+            try:
+                if not self.rerequest_done(tracker, response, error, callback):
+                    self.rerequest_next(trackers[1:], s, callback)
+                elif tier is not None and not self.last_failed and tier[0] != tracker:
+                    tier.remove(tracker)
+                    tier.insert(0, tracker)
+            except:
+                # busy stays set only while the next tracker is announced to
+                self.busy = False
+                raise
+        if DEBUG:
+            print >>sys.stderr,"Rerequest tracker:"
+            print >>sys.stderr,merge_announce(tracker, s+get_key(tracker))
+        self.trackerclient.announce(tracker, s+get_key(tracker), done, self.timeout)
 
     def _fail(self, callback):
         if ( (self.upratefunc() < 100 and self.downratefunc() < 100)
@@ -330,123 +332,51 @@ class Rerequester:
             self.errorfunc(r)
 
         self.last_failed = True
-        self.lock.give_up()
+        self.busy = False
         self.externalsched(callback)
 
-
-    def rerequest_single(self, t, s, callback):
-        l = self.lock.set()
-        rq = Thread(target = self._rerequest_single, args = [t, s+get_key(t), l, callback])
-        rq.setName( "TrackerRerequestB"+rq.getName() )
-        # Arno: make this a daemon thread so the client closes sooner.
-        rq.setDaemon(True)
-        rq.start()
-        self.lock.wait()
-        if self.lock.success:
-            self.lastsuccessful = t
-            self.last_failed = False
-            self.never_succeeded = False
-            return True
-        if not self.last_failed and self.lastsuccessful == t:
-            # if the last tracker hit was successful, and you've just tried the tracker
-            # you'd contacted before, don't go any further, just fail silently.
-            self.last_failed = True
-            self.externalsched(callback)
-            self.lock.give_up()
-            return True
-        return False    # returns true if it wants rerequest() to exit
-
-
-    def _rerequest_single(self, t, s, l, callback):
-        try:        
-            closer = [None]
-            def timedout(self = self, l = l, closer = closer):
-                if self.lock.trip(l):
-                    self.errorcodes['troublecode'] = 'Problem connecting to tracker - timeout exceeded'
-                    self.lock.unwait(l)
+    def rerequest_done(self, t, r, error, callback):
+        """ Handles the response of tracker t, returns True if it wants
+        rerequest_next() to exit """
+        try:
+            if error is not None:
+                kind, message = error
+                if kind == ERROR_DATA:
+                    self.errorcodes['bad_data'] = 'bad data from tracker - ' + message
+                else:
+                    self.errorcodes['troublecode'] = 'Problem connecting to tracker - ' + message
+            elif r.has_key('failure reason'):
+                self.errorcodes['rejected'] = self.rejectedmessage + str(r['failure reason'])
+            else:
                 try:
-                    closer[0]()
-                except:
-                    pass
-                    
-            self.externalsched(timedout, self.timeout)
-
-            err = None
-            try:
-                if DEBUG:
-                    print >>sys.stderr,"Rerequest tracker:"
-                    print >>sys.stderr,merge_announce(t, s)
-                h = urlopen(merge_announce(t, s), silent = True)
-                closer[0] = h.close
-                data = h.read()
-            except (IOError, error), e:
-                err = 'Problem connecting to tracker - ' + str(e)
-                if DEBUG:
-                    print_exc()
-            except:
-                err = 'Problem connecting to tracker'
-                if DEBUG:
-                    print_exc()
-                    
-                    
-            #if DEBUG:
-            #    print >>sys.stderr,"rerequest: Got data",data
-                    
-            try:
-                h.close()
-            except:
-                pass
-            if err:        
-                if self.lock.trip(l):
-                    self.errorcodes['troublecode'] = err
-                    self.lock.unwait(l)
-                return
-
-            if not data:
-                if self.lock.trip(l):
-                    self.errorcodes['troublecode'] = 'no data from tracker'
-                    self.lock.unwait(l)
-                return
-            
-            try:
-                r = bdecode(data, sloppy=1)
-                if DEBUG:
-                    print >>sys.stderr,"Rerequester: Tracker returns:", r
-                check_peers(r)
-                
-                #print >>sys.stderr,"Rerequester: Tracker returns, post check done"
-                
-            except ValueError, e:
-                if DEBUG:
-                    print_exc()
-                if self.lock.trip(l):
+                    if DEBUG:
+                        print >>sys.stderr,"Rerequester: Tracker returns:", r
+                    check_peers(r)
+                except ValueError, e:
+                    if DEBUG:
+                        print_exc()
                     self.errorcodes['bad_data'] = 'bad data from tracker - ' + str(e)
-                    self.lock.unwait(l)
-                return
-            
-            if r.has_key('failure reason'):
-                if self.lock.trip(l):
-                    self.errorcodes['rejected'] = self.rejectedmessage + r['failure reason']
-                    self.lock.unwait(l)
-                return
-                
-            if self.lock.trip(l, True):     # success!
-                self.lock.unwait(l)
-            else:
-                callback = lambda: None     # attempt timed out, don't do a callback
-
-            # even if the attempt timed out, go ahead and process data
-            def add(self = self, r = r, callback = callback):
-                # print >>sys.stderr,"Rerequester: add: postprocessing",r
-                self.postrequest(r, callback, self.notifiers)
-                
-            #print >>sys.stderr,"Rerequester: _request_single: scheduling processing of returned",r
-            self.externalsched(add)
+                else:
+                    # success!
+                    self.lastsuccessful = t
+                    self.last_failed = False
+                    self.never_succeeded = False
+                    self.busy = False
+                    self.postrequest(r, callback, self.notifiers)
+                    return True
+
+            if not self.last_failed and self.lastsuccessful == t:
+                # if the last tracker hit was successful, and you've just tried the tracker
+                # you'd contacted before, don't go any further, just fail silently.
+                self.last_failed = True
+                self.busy = False
+                self.externalsched(callback)
+                return True
+            return False
         except:
-            
-            print_exc()
-            
+            self.busy = False
             self.exception(callback)
+            return True
 
     def _dht_rerequest(self):
         if DEBUG_DHT:
@@ -585,57 +515,3 @@ class Rerequester:
                 print s
             callback()
         self.externalsched(r)
-
-
-class SuccessLock:
-    def __init__(self):
-        self.lock = Lock()
-        self.pause = Lock()
-        self.code = 0L
-        self.success = False
-        self.finished = True
-
-    def reset(self):
-        self.success = False
-        self.finished = False
-
-    def set(self):
-        self.lock.acquire()
-        if not self.pause.locked():
-            self.pause.acquire()
-        self.first = True
-        self.code += 1L
-        self.lock.release()
-        return self.code
-
-    def trip(self, code, s = False):
-        self.lock.acquire()
-        try:
-            if code == self.code and not self.finished:
-                r = self.first
-                self.first = False
-                if s:
-                    self.finished = True
-                    self.success = True
-                return r
-        finally:
-            self.lock.release()
-
-    def give_up(self):
-        self.lock.acquire()
-        self.success = False
-        self.finished = True
-        self.lock.release()
-
-    def wait(self):
-        self.pause.acquire()
-
-    def unwait(self, code):
-        if code == self.code and self.pause.locked():
-            self.pause.release()
-
-    def isfinished(self):
-        self.lock.acquire()
-        x = self.finished
-        self.lock.release()
-        return x    
@@ -5,6 +5,7 @@ from Tribler.Core.BitTornado.piecebuffer import BufferPool
 from threading import Lock
 from time import strftime, localtime
 import os
+import mmap
 from os.path import exists, getsize, getmtime as getmtime_, basename
 from traceback import print_exc
 try:
@@ -110,6 +111,19 @@ class Storage:
         else:
             self.handlebuffer = None
 
+        # Memory maps of complete files for serving reads, least recently
+        # used first. None if disabled.
+        self.max_mapped = config.get('mmap_cache_size', 0) * 1048576L
+        if self.max_mapped > 0:
+            self.mapped = {}
+            self.mappedlist = []
+            self.mapped_size = 0L
+        else:
+            self.mapped = None
+
+        # Optional WriteJournal, see set_journal()
+        self.journal = None
+
 
     if os.name == 'nt':
         def _lock_file(self, name, f):
@@ -224,6 +238,8 @@ class Storage:
         
 
     def _get_file_handle(self, file, for_write):
+        if for_write and self.mapped:
+            self._unmap(file)
         if self.handles.has_key(file):
             if for_write and not self.whandles.has_key(file):
                 self._close(file)
@@ -314,8 +330,73 @@ class Storage:
                 raise IOError('error reading data from '+ file)
         return r
 
+    def read_mapped(self, pos, amount):
+        """ Returns a read-only buffer on the data at pos, backed by a
+        memory map of the file, so no data is copied. Returns None if the
+        data should be read with read(): mapping is disabled, the data spans
+        files or its file is open for writing. """
+        if self.mapped is None:
+            return None
+        intervals = self._intervals(pos, amount)
+        if len(intervals) != 1:
+            return None
+        file, begin, end = intervals[0]
+        self.lock.acquire()
+        try:
+            if self.whandles.has_key(file):
+                return None
+            m = self.mapped.get(file)
+            if m is None:
+                m = self._map(file)
+                if m is None:
+                    return None
+            elif self.mappedlist[-1] != file:
+                self.mappedlist.remove(file)
+                self.mappedlist.append(file)
+            if end > len(m):
+                return None
+            return buffer(m, begin, end - begin)
+        finally:
+            self.lock.release()
+
+    def _map(self, file):
+        size = self.tops.get(file, 0)
+        if size == 0 or size > self.max_mapped:
+            return None
+        try:
+            f = self._open(file, 'rb')
+            try:
+                m = mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ)
+            finally:
+                f.close()
+        except (IOError, OSError, EnvironmentError, ValueError):
+            if DEBUG:
+                print_exc()
+            return None
+        self.mapped[file] = m
+        self.mappedlist.append(file)
+        self.mapped_size += len(m)
+        while self.mapped_size > self.max_mapped:
+            self._unmap(self.mappedlist[0])
+        return m
+
+    def _unmap(self, file):
+        # Buffers handed out by read_mapped may still be queued on a
+        # socket, so the map is not closed but unmapped when they are gone
+        m = self.mapped.pop(file, None)
+        if m is not None:
+            self.mappedlist.remove(file)
+            self.mapped_size -= len(m)
+
+    def set_journal(self, journal):
+        """ Has the positions written to recorded in a WriteJournal, so 
+        after a crash only those have to be checked again, see unpickle() """
+        self.journal = journal
+
     def write(self, pos, s):
         # might raise an IOError
+        if self.journal is not None:
+            self.journal.record(pos, len(s))
         total = 0
         for file, begin, end in self._intervals(pos, len(s)):
             if DEBUG:
@@ -357,6 +438,10 @@ class Storage:
         self.handles = {}
         self.whandles = {}
         self.handlebuffer = None
+        if self.mapped is not None:
+            self.mapped = {}
+            self.mappedlist = []
+            self.mapped_size = 0L
 
 
     def _get_disabled_ranges(self, f):
@@ -502,8 +587,20 @@ class Storage:
                     the file is disabled but is smaller than one piece, and that
                     all the data is cached inside so adjacent files may be
                     verified.
+    d['journal'] = generation
+                    The generation of the WriteJournal started when the
+                    data was pickled, if any.  The pieces at the positions in
+                    that journal are checked again on unpickling.  The other
+                    pieces of a file modified since are kept only if the
+                    journal has some of its pieces and the file was not
+                    modified after the last record.
     '''
     def pickle(self):
+        d = {}
+        if self.journal is not None:
+            # Writes done from now on are recorded in the new journal
+            self.flush()
+            d['journal'] = self.journal.reset()
         files = []
         pfiles = []
         for i in xrange(len(self.files)):
@@ -515,7 +612,9 @@ class Storage:
                 continue
             file = self.files[i][0]
             files.extend([i, getsize(file), getmtime(file)])
-        return {'files': files, 'partial files': pfiles}
+        d['files'] = files
+        d['partial files'] = pfiles
+        return d
 
 
     def unpickle(self, data):
@@ -533,6 +632,11 @@ class Storage:
             l = [l[x:x+3] for x in xrange(0, len(l), 3)]
             for file, size, mtime in l:
                 pfiles[file] = (size, mtime)
+            if self.journal is not None:
+                written = self.journal.get_written(data.get('journal'))
+                last_record = self.journal.get_last_record_time()
+            else:
+                written = None
 
             valid_pieces = {}
             for i in xrange(len(self.files)):
@@ -551,6 +655,24 @@ class Storage:
             if DEBUG:
                 print valid_pieces.keys()
             
+            def journaled(i, file):
+                """ The file was modified by the writes in the journal only:
+                some of its pieces are in the journal and it was not
+                modified after the last record """
+                if written is None or last_record is None:
+                    return False
+                if not files.has_key(i) or files[i][0] != getsize(file):
+                    return False
+                if getmtime(file) > last_record + 1:
+                    return False
+                start, end, offset, file = self.file_ranges[i]
+                first = int(start/self.piece_length)
+                last = int((end-1)/self.piece_length)
+                for p in written:
+                    if first <= p <= last:
+                        return True
+                return False
+
             def test(old, size, mtime):
                 oldsize, oldmtime = old
                 if size != oldsize:
@@ -579,6 +701,9 @@ class Storage:
                     continue
                 if ( not files.has_key(i)
                      or not test(files[i], getsize(file), getmtime(file)) ):
+                    if journaled(i, file):
+                        # Written to after pickling, the positions are in the journal
+                        continue
                     start, end, offset, file = self.file_ranges[i]
                     if DEBUG:
                         print 'removing '+file
@@ -586,6 +711,10 @@ class Storage:
                                      int((end-1)/self.piece_length)+1 ):
                         if valid_pieces.has_key(p):
                             del valid_pieces[p]
+            if written is not None:
+                for p in written:
+                    if valid_pieces.has_key(p):
+                        del valid_pieces[p]
         except:
             if DEBUG:
                 print_exc()
@@ -25,6 +25,7 @@ from bisect import insort
 DEBUG = False
 
 STATS_INTERVAL = 0.2
+HASHCHECK_POLL_INTERVAL = 0.1
 RARE_RAWSERVER_TASKID = -481  # This must be a rawserver task ID that is never valid.
 
 
@@ -140,6 +141,8 @@ class StorageWrapper:
         self.write_buf_size = 0L
         self.write_buf = {}   # structure:  piece: [(start, data), ...]
         self.write_buf_list = []
+        # Optional DiskIOExecutor, see set_diskio()
+        self.diskio = None
         # Arno, 2010-04-23: STBSPEED: the piece that were correct on disk at start
         self.pieces_on_disk_at_startup = []
 
@@ -168,6 +171,11 @@ class StorageWrapper:
             ['moving data', 1, self.init_movedata, self.movedatafunc], 
             ['allocating disk space', 1, self.init_alloc, self.allocfunc] ]
         self.initialize_done = None
+        self.initialize_wait = 0
+        # Optional HashCheckPool, see initialize()
+        self.hashcheckpool = None
+        self.hashcheck_job = None
+        self.hashcheck_results = {}
 
         # Arno: move starting of periodic _bgalloc to init_alloc
         self.backfunc(self._bgsync, max(self.config['auto_flush']*60, 60))
@@ -199,11 +207,15 @@ class StorageWrapper:
         return True
 
 
-    def initialize(self, donefunc, statusfunc = None):
+    def initialize(self, donefunc, statusfunc = None, hashcheckpool = None):
+        """ Checks the data on disk and allocates disk space, on the network
+        thread. If hashcheckpool is given, the pieces are hashed by its 
+        threads. When done, donefunc is called. """
         if DEBUG:
             print >>sys.stderr,"StorageWrapper: initialize: enter, backfunc is",self.backfunc
         
         self.initialize_done = donefunc
+        self.hashcheckpool = hashcheckpool
         if statusfunc is None:
             statusfunc = self.statusfunc
         self.initialize_status = statusfunc
@@ -289,7 +301,8 @@ class StorageWrapper:
                 diff = et - st
                 print >>sys.stderr,"StorageWrapper: _initialize: task took",diff
 
-        self.backfunc(self._initialize)
+        self.backfunc(self._initialize, self.initialize_wait)
+        self.initialize_wait = 0
 
 
     def init_hashcheck(self):
@@ -367,6 +380,11 @@ class StorageWrapper:
         if DEBUG:
             print "StorageWrapper: init_hashcheck: checking",self.check_list
             print "StorageWrapper: init_hashcheck: return self.check_total > 0 is ",(self.check_total > 0)
+        if self.hashcheckpool is not None and self.check_hashes and self.check_total > 0:
+            self.hashcheck_results = {}
+            self.hashcheck_job = self.hashcheckpool.check_pieces(self.storage.read, 
+                        self.check_list, self.piece_size, self._piecelen, 
+                        self.lastlen, self.flag)
         return self.check_total > 0
 
 
@@ -418,6 +436,8 @@ class StorageWrapper:
                 return None
             if not self.check_list:
                 return None
+            if self.hashcheck_job is not None:
+                return self._collect_hashchecked()
 
             i = self.check_list.pop(0)
             if not self.check_hashes:
@@ -435,60 +455,90 @@ class StorageWrapper:
                 sh.update(d2[:])
                 d2.release()
                 s = sh.digest()
-
-
-                if DEBUG:
-                    if s != self.hashes[i]:
-                        print >>sys.stderr,"StorageWrapper: hashcheckfunc: piece corrupt",i
-
-                # Merkle: If we didn't read the hashes from persistent storage then
-                # we can't check anything. Exception is the case where we are the
-                # initial seeder. In that case we first calculate all hashes, 
-                # and then compute the hash tree. If the root hash equals the
-                # root hash in the .torrent we're a seeder. Otherwise, we are
-                # client with messed up data and no (local) way of checking it.
-                #
-                if not self.hashes_unpickled:
-                    if DEBUG:
-                        print "StorageWrapper: Merkle torrent, saving calculated hash",i
-                    self.initial_hashes[i] = s
-                    self._markgot(i, i)
-                elif s == self.hashes[i]:
-                    self._markgot(i, i)
-                elif (self.check_targets.get(s)
-                       and self._piecelen(i) == self._piecelen(self.check_targets[s][-1])):
-                    self._markgot(self.check_targets[s].pop(), i)
-                    self.out_of_place += 1
-                elif (not self.have[-1] and sp == self.hashes[-1]
-                       and (i == len(self.hashes) - 1
-                            or not self._waspre(len(self.hashes) - 1))):
-                    self._markgot(len(self.hashes) - 1, i)
-                    self.out_of_place += 1
-                else:
-                    self.places[i] = i
-            self.numchecked += 1
-            if self.amount_left == 0:
-                if not self.hashes_unpickled:
-                    # Merkle: The moment of truth. Are we an initial seeder?
-                    self.merkletree = MerkleTree(self.piece_size,self.total_length,None,self.initial_hashes)
-                    if self.merkletree.compare_root_hashes(self.root_hash):
-                        if DEBUG:
-                            print "StorageWrapper: Merkle torrent, initial seeder!"
-                        self.hashes = self.initial_hashes
-                    else:
-                        # Bad luck
-                        if DEBUG:
-                            print "StorageWrapper: Merkle torrent, NOT a seeder!"
-                        self.failed('download corrupted, hash tree does not compute; please delete and restart')
-                        return 1
-                self.finished()
-                
-            return (self.numchecked / self.check_total)
+                self._hashchecked(i, sp, s)
+            return self._hashcheck_progress()
 
         except Exception, e:
             print_exc()
             self.failed('download corrupted: '+str(e)+'; please delete and restart')
-    
+
+    def _collect_hashchecked(self):
+        """ hashcheckfunc() for the pieces hashed by the HashCheckPool. The
+        hashes are handled in the order of check_list, as when checking 
+        serially, so the same pieces are found. """
+        for i, sp, s in self.hashcheck_job.get_results():
+            self.hashcheck_results[i] = (sp, s)
+        x = self.numchecked / self.check_total
+        if not self.hashcheck_results.has_key(self.check_list[0]):
+            self.initialize_wait = HASHCHECK_POLL_INTERVAL
+            return x
+        while self.check_list and self.hashcheck_results.has_key(self.check_list[0]):
+            i = self.check_list.pop(0)
+            sp, s = self.hashcheck_results.pop(i)
+            if s is None:
+                self.failed(self.hashcheck_job.error)
+                return None
+            self._hashchecked(i, sp, s)
+            x = self._hashcheck_progress()
+            if self.flag.isSet():
+                break
+        if not self.check_list:
+            self.hashcheck_job = None
+        return x
+
+    def _hashchecked(self, i, sp, s):
+        """ Handles the hash s of the data at position i, sp is the hash of
+        its first lastlen bytes """
+        if DEBUG:
+            if s != self.hashes[i]:
+                print >>sys.stderr,"StorageWrapper: hashcheckfunc: piece corrupt",i
+
+        # Merkle: If we didn't read the hashes from persistent storage then
+        # we can't check anything. Exception is the case where we are the
+        # initial seeder. In that case we first calculate all hashes, 
+        # and then compute the hash tree. If the root hash equals the
+        # root hash in the .torrent we're a seeder. Otherwise, we are
+        # client with messed up data and no (local) way of checking it.
+        #
+        if not self.hashes_unpickled:
+            if DEBUG:
+                print "StorageWrapper: Merkle torrent, saving calculated hash",i
+            self.initial_hashes[i] = s
+            self._markgot(i, i)
+        elif s == self.hashes[i]:
+            self._markgot(i, i)
+        elif (self.check_targets.get(s)
+               and self._piecelen(i) == self._piecelen(self.check_targets[s][-1])):
+            self._markgot(self.check_targets[s].pop(), i)
+            self.out_of_place += 1
+        elif (not self.have[-1] and sp == self.hashes[-1]
+               and (i == len(self.hashes) - 1
+                    or not self._waspre(len(self.hashes) - 1))):
+            self._markgot(len(self.hashes) - 1, i)
+            self.out_of_place += 1
+        else:
+            self.places[i] = i
+
+    def _hashcheck_progress(self):
+        """ Counts a checked piece, returns the fraction checked """
+        self.numchecked += 1
+        if self.amount_left == 0:
+            if not self.hashes_unpickled:
+                # Merkle: The moment of truth. Are we an initial seeder?
+                self.merkletree = MerkleTree(self.piece_size,self.total_length,None,self.initial_hashes)
+                if self.merkletree.compare_root_hashes(self.root_hash):
+                    if DEBUG:
+                        print "StorageWrapper: Merkle torrent, initial seeder!"
+                    self.hashes = self.initial_hashes
+                else:
+                    # Bad luck
+                    if DEBUG:
+                        print "StorageWrapper: Merkle torrent, NOT a seeder!"
+                    self.failed('download corrupted, hash tree does not compute; please delete and restart')
+                    return 1
+            self.finished()
+            
+        return (self.numchecked / self.check_total)
 
     def init_movedata(self):
         if self.flag.isSet():
@@ -612,11 +662,15 @@ class StorageWrapper:
     def bgalloc(self):
         if self.bgalloc_enabled:
             if not self.holes and not self.blocked_moveout and self.backfunc:
-                self.backfunc(self.storage.flush)
+                self.backfunc(self._flush_storage)
                 # force a flush whenever the "finish allocation" button is hit
         self.bgalloc_enabled = True
         return False
 
+    def _flush_storage(self):
+        self.wait_for_writes()
+        self.storage.flush()
+
     def _bgalloc(self):
         self.allocfunc()
         if self.config.get('alloc_rate', 0) < 0.1:
@@ -731,9 +785,24 @@ class StorageWrapper:
         self.amount_inactive += self._piecelen(index)
 
 
+    def set_diskio(self, diskio):
+        """ Have reads and writes done by the threads of the given
+        DiskIOExecutor. Writes are then queued, and get_piece_async() reads
+        without blocking the network thread. """
+        self.diskio = diskio
+
+    def wait_for_writes(self):
+        """ Waits until the writes queued with the disk I/O threads are on
+        disk. Must be called before changing the layout of the Storage. """
+        if self.diskio is not None:
+            self.diskio.flush()
+
     def write_raw(self, index, begin, data):
         try:
-            self.storage.write(self.piece_size * index + begin, data)
+            if self.diskio is not None:
+                self.diskio.write(self.piece_size * index + begin, data)
+            else:
+                self.storage.write(self.piece_size * index + begin, data)
             return True
         except IOError, e:
             traceback.print_exc()
@@ -783,6 +852,7 @@ class StorageWrapper:
             except:
                 pass
         try:
+            self.wait_for_writes()
             self.storage.sync()
         except IOError, e:
             self.failed('IO Error: ' + str(e))
@@ -1018,16 +1088,57 @@ class StorageWrapper:
             hashlist = []
         return [pb,hashlist]
 
+    def get_piece_async(self, index, begin, length, callback):
+        """ Like get_piece(), but the data is read by the disk I/O threads.
+        callback is called with the result of get_piece() on the network
+        thread. Without disk I/O threads it is called right away. """
+        if self.diskio is None or not self.have[index]:
+            callback(self.get_piece(index, begin, length))
+            return
+
+        place = self.places[index]
+        def failed(reason):
+            self.backfunc(lambda: self.failed(reason))
+        def done(pb):
+            if self.merkle_torrent and pb is not None and begin == 0:
+                hashlist = self.merkletree.get_hashes_for_piece(index)
+            else:
+                hashlist = []
+            callback([pb, hashlist])
+        self.diskio.queue_task(self._get_piece_data, 
+                               (index, place, begin, length, self._read_diskio, failed), 
+                               done)
+
+    def get_piece_mapped(self, index, begin, length):
+        """ Returns a read-only buffer on (part of) a piece that is
+        complete and checked, backed by a memory map of its file (see
+        Storage.read_mapped), or None if it has to be read with get_piece().
+        The buffer can be written to a socket without copying the data. """
+        if (self.merkle_torrent or not self.have[index] or not self.waschecked[index]
+            or begin + length > self._piecelen(index)):
+            return None
+        pos = self.piece_size * self.places[index] + begin
+        if self.diskio is not None and self.diskio.has_pending(pos, length):
+            return None
+        return self.storage.read_mapped(pos, length)
+
     def do_get_piece(self, index, begin, length):
         if not self.have[index]:
             return None
+        return self._get_piece_data(index, self.places[index], begin, length, 
+                                    self.read_raw, self.failed)
+
+    def _get_piece_data(self, index, place, begin, length, readfunc, failfunc):
+        """ Reads (part of) a piece from position place with readfunc,
+        which returns None or raises IOError on error. Also runs on the disk
+        I/O threads. """
         data = None
         if not self.waschecked[index]:
-            data = self.read_raw(self.places[index], 0, self._piecelen(index))
+            data = readfunc(place, 0, self._piecelen(index))
             if data is None:
                 return None
             if not self.live_streaming and sha(data[:]).digest() != self.hashes[index]:
-                self.failed('file supposed to be complete on start-up, but piece failed hash check')
+                failfunc('file supposed to be complete on start-up, but piece failed hash check')
                 return None
             self.waschecked[index] = True
             if length == -1 and begin == 0:
@@ -1037,22 +1148,31 @@ class StorageWrapper:
                 return None
             length = self._piecelen(index)-begin
             if begin == 0:
-                return self.read_raw(self.places[index], 0, length)
+                return readfunc(place, 0, length)
         elif begin + length > self._piecelen(index):
             return None
         if data is not None:
             s = data[begin:begin+length]
+            if s is data.buf:
+                s = s[:]    # data is reused once released
             data.release()
             return s
-        data = self.read_raw(self.places[index], begin, length)
+        data = readfunc(place, begin, length)
         if data is None:
             return None
         s = data.getarray()
         data.release()
         return s
 
+    def _read_diskio(self, piece, begin, length):
+        """ read_raw() for the disk I/O threads, raises IOError """
+        return self.diskio.read(self.piece_size * piece + begin, length)
+
     def read_raw(self, piece, begin, length, flush_first = False):
         try:
+            if self.diskio is not None:
+                return self.diskio.read(self.piece_size * piece + begin, 
+                                        length, flush_first)
             return self.storage.read(self.piece_size * piece + begin, 
                                                      length, flush_first)
         except IOError, e:
@@ -1062,6 +1182,7 @@ class StorageWrapper:
 
     def set_file_readonly(self, n):
         try:
+            self.wait_for_writes()
             self.storage.set_readonly(n)
         except IOError, e:
             self.failed('IO Error: ' + str(e))
@@ -2,6 +2,7 @@
 # see LICENSE.txt for license information
 
 from Rerequester import Rerequester
+from TrackerClient import TrackerClient
 from urllib import quote
 from threading import Event
 from random import randrange
@@ -40,7 +41,7 @@ class T2TConnection:
             rawserver.add_task, lambda: 0, peers, self.addtolist, 
             rawserver.add_task, lambda: 1, 0, 0, 0, '',
             myid, hash, timeout, self.errorfunc, excfunc, peers, Event(),
-            lambda: 0, lambda: 0)
+            lambda: 0, lambda: 0, trackerclient=TrackerClient.getInstance(rawserver))
 
         if self.isactive():
             rawserver.add_task(self.refresh, randrange(int(self.interval/10), self.interval))
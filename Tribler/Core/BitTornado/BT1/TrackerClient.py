@@ -0,0 +1,1004 @@
+# see LICENSE.txt for license information
+#
+# Non-blocking tracker client, shared by all downloads of a session and the
+# torrent checker. Announces and scrapes are sent from the network thread
+# through the RawServer, over HTTP or over UDP (BEP 15). HTTP connections
+# are kept alive and reused, scrapes for the same tracker are collected
+# for a moment and sent as one multi-infohash request, at most MAX_ACTIVE
+# requests are in progress per tracker and a tracker that cannot be reached
+# is left alone for a while, doubling the time after each failure.
+#
+# Host names are resolved by a single helper thread and cached. HTTPS
+# trackers are still contacted with a blocking urlopen, on a thread of
+# their own.
+#
+
+import sys
+import socket
+from struct import pack, unpack
+from urllib import quote, unquote
+from urlparse import urlparse, urljoin
+from random import randrange
+from threading import Thread
+from Queue import Queue
+from gzip import GzipFile
+from cStringIO import StringIO
+from traceback import print_exc
+
+from Tribler.Core.BitTornado.bencode import bdecode
+from Tribler.Core.BitTornado.clock import clock
+from Tribler.Core.BitTornado.zurllib import urlopen, VERSION
+from Tribler.Core.Utilities.timeouturlopen import find_proxy
+from Tribler.Core.Utilities.Crypto import sha
+
+DEBUG = False
+
+TIMEOUT = 60                # seconds, for a request and its retransmissions
+MAX_ACTIVE = 2              # requests in progress per tracker
+IDLE_TIMEOUT = 30           # seconds before an unused connection is closed
+BACKOFF = 15                # seconds, doubled after each further failure
+MAX_BACKOFF = 30 * 60
+SCRAPE_DELAY = 1.0          # seconds that scrapes for a tracker are collected
+HTTP_SCRAPE_BATCH = 32      # infohashes in one HTTP scrape
+UDP_SCRAPE_BATCH = 74       # infohashes in one UDP scrape, see BEP 15
+UDP_RETRY = 15              # seconds before the first UDP retransmission
+UDP_CONNECTION_TTL = 60     # seconds a UDP connection id may be used
+DNS_TTL = 300
+MAX_REDIRECTS = 10
+MAX_RESPONSE = 2 * 1048576
+
+# Kinds of errors passed to the callbacks
+ERROR_CONNECTION = 'connection'     # no usable response from the tracker
+ERROR_DATA = 'data'                 # a response that could not be decoded
+
+UDP_PROTOCOL_ID = 0x41727101980
+UDP_CONNECT, UDP_ANNOUNCE, UDP_SCRAPE, UDP_ERROR = range(4)
+UDP_EVENTS = {'completed': 1, 'started': 2, 'stopped': 3}
+
+
+def get_scrape_url(announce):
+    """ Returns the scrape URL of a tracker, or None if it has none. By
+    convention an HTTP tracker supports scrape if the last part of the path
+    of its announce URL starts with 'announce'. """
+    if announce.startswith('udp:'):
+        return announce
+    i = announce.rfind('/')
+    if announce[i+1:i+9] != 'announce':
+        return None
+    return announce[:i+1] + 'scrape' + announce[i+9:]
+
+def split_url(url):
+    """ Returns (scheme, host, port, path) of an http, https or udp URL """
+    (scheme, netloc, path, pars, query, fragment) = urlparse(url)
+    if scheme not in ('http', 'https', 'udp'):
+        raise ValueError('unknown url type ' + scheme)
+    if '@' in netloc:
+        netloc = netloc[netloc.find('@')+1:]
+    if netloc.startswith('['):
+        # IPVSIX: [address]:port
+        i = netloc.find(']')
+        host = netloc[1:i]
+        port = netloc[i+2:]
+    elif ':' in netloc:
+        host, port = netloc.split(':', 1)
+    else:
+        host, port = netloc, ''
+    if port:
+        port = int(port)
+    elif scheme == 'http':
+        port = 80
+    elif scheme == 'https':
+        port = 443
+    else:
+        raise ValueError('no port in ' + url)
+    if pars:
+        path += ';' + pars
+    if query:
+        path += '?' + query
+    return scheme, host.lower(), port, path or '/'
+
+def merge_params(url, params):
+    """ Appends the key=value pairs in params, which start with '&' or '?',
+    to the url """
+    if '?' in url:
+        return url + '&' + params[1:]
+    return url + '?' + params[1:]
+
+
+class TrackerClient:
+    """ Sends announces and scrapes to trackers. All methods are called by
+    the network thread, and so are the callbacks. """
+
+    __single = None
+
+    def __init__(self, rawserver, timeout = TIMEOUT):
+        if TrackerClient.__single:
+            raise RuntimeError, "TrackerClient is singleton"
+        TrackerClient.__single = self
+        self.rawserver = rawserver
+        self.timeout = timeout
+        self.trackers = {}      # TrackerState by (scheme, host, port)
+        self.idle = {}          # idle HTTPConnections by (ip, port)
+        self.scrapes = {}       # infohash: [callback] by scrape URL
+        self.resolver = Resolver(rawserver)
+        self.udp = None
+
+    def getInstance(*args, **kw):
+        if TrackerClient.__single is None:
+            TrackerClient(*args, **kw)
+        return TrackerClient.__single
+    getInstance = staticmethod(getInstance)
+
+    def delInstance():
+        TrackerClient.__single = None
+    delInstance = staticmethod(delInstance)
+
+    def announce(self, url, params, callback, timeout = None):
+        """ Announces to the tracker at url. params is the query string of
+        the announce, starting with '&', as built by the Rerequester. The
+        callback is called as callback(response, error). response is the
+        bdecoded dict the tracker returned, which may have a 'failure
+        reason'. If there is no response, error is (ERROR_*, message). """
+        try:
+            state = self._get_state(url)
+        except ValueError, e:
+            self.rawserver.add_task(lambda: callback(None, (ERROR_CONNECTION, str(e))))
+            return
+        if state.scheme == 'udp':
+            request = UDPAnnounce(self, state, url, params, callback)
+        elif state.scheme == 'https':
+            request = ThreadedHTTPRequest(self, state, merge_params(url, params), callback)
+        else:
+            request = HTTPRequest(self, state, merge_params(url, params), callback)
+        self._submit(request, timeout)
+
+    def scrape(self, announce, infohash, callback):
+        """ Asks the tracker at the announce URL for the number of seeders
+        and leechers of a torrent. Scrapes for the same tracker are sent
+        together. The callback is called as callback(infohash, response,
+        error), with the dict that the tracker returned, where the numbers
+        are in response['files'][infohash], or with (ERROR_*, message). """
+        url = get_scrape_url(announce)
+        if url is None:
+            error = (ERROR_DATA, 'tracker does not support scrape')
+            self.rawserver.add_task(lambda: callback(infohash, None, error))
+            return
+        self._queue_scrape(url, infohash, callback)
+
+    def shutdown(self):
+        for connections in self.idle.values():
+            for connection in connections:
+                connection.close()
+        self.idle = {}
+        if self.udp is not None:
+            self.udp.close()
+            self.udp = None
+        self.resolver.shutdown()
+
+    #
+    # Requests
+    #
+    def _get_state(self, url):
+        scheme, host, port, path = split_url(url)
+        key = (scheme, host, port)
+        state = self.trackers.get(key)
+        if state is None:
+            state = self.trackers[key] = TrackerState(scheme, host, port)
+        return state
+
+    def _submit(self, request, timeout = None):
+        if timeout is None:
+            timeout = self.timeout
+        self.rawserver.add_task(lambda: self._timed_out(request), timeout)
+        request.state.queue.append(request)
+        self._dispatch(request.state)
+
+    def _dispatch(self, state):
+        if state.queue and state.backoff_until > clock():
+            # Fail fast, a request would most likely time out as well
+            message = 'tracker did not respond, not retrying for %d s' % (state.backoff_until - clock())
+            queue = state.queue
+            state.queue = []
+            for request in queue:
+                self._finish(request, None, (ERROR_CONNECTION, message))
+            return
+        while state.queue and state.active < MAX_ACTIVE:
+            request = state.queue.pop(0)
+            request.active = True
+            state.active += 1
+            try:
+                request.start()
+            except:
+                if DEBUG:
+                    print_exc()
+                self._finish(request, None, (ERROR_CONNECTION, 'could not send request'))
+
+    def _timed_out(self, request):
+        if not request.done:
+            if request in request.state.queue:
+                request.state.queue.remove(request)
+            request.abort()
+            self._finish(request, None, (ERROR_CONNECTION, 'timeout exceeded'))
+
+    def _finish(self, request, response, error):
+        """ Completes the request and calls its callback """
+        if request.done:
+            return
+        request.done = True
+        state = request.state
+        if request.active:
+            request.active = False
+            state.active -= 1
+            if error is not None and error[0] == ERROR_CONNECTION:
+                state.failures += 1
+                state.backoff_until = clock() + min(BACKOFF * 2 ** (state.failures - 1), MAX_BACKOFF)
+            else:
+                state.failures = 0
+                state.backoff_until = 0
+        if DEBUG:
+            print >>sys.stderr,"TrackerClient: request to",state.host,"done, error",error
+        try:
+            request.callback(response, error)
+        except:
+            print_exc()
+        self._dispatch(state)
+
+    #
+    # Scrapes
+    #
+    def _queue_scrape(self, url, infohash, callback):
+        batch = self.scrapes.get(url)
+        if batch is None:
+            batch = self.scrapes[url] = {}
+            self.rawserver.add_task(lambda: self._send_scrapes(url), SCRAPE_DELAY)
+        batch.setdefault(infohash, []).append(callback)
+
+    def _send_scrapes(self, url):
+        batch = self.scrapes.pop(url)
+        state = self._get_state(url)
+        remaining = state.scrape_after - clock()
+        if remaining > 0:
+            # Answer as the tracker would
+            response = {'flags': {'min_request_interval': int(remaining) + 1}}
+            for infohash, callbacks in batch.iteritems():
+                self._scraped(infohash, callbacks, response, None)
+            return
+
+        if state.scheme == 'udp':
+            size = UDP_SCRAPE_BATCH
+        elif state.multiscrape:
+            size = HTTP_SCRAPE_BATCH
+        else:
+            size = 1
+        infohashes = batch.keys()
+        for i in xrange(0, len(infohashes), size):
+            chunk = dict([(infohash, batch[infohash]) for infohash in infohashes[i:i+size]])
+            callback = lambda response, error, url=url, chunk=chunk: self._scrape_done(url, chunk, response, error)
+            if state.scheme == 'udp':
+                request = UDPScrape(self, state, url, chunk.keys(), callback)
+            else:
+                params = ''.join(['&info_hash=' + quote(infohash) for infohash in chunk])
+                if state.scheme == 'https':
+                    request = ThreadedHTTPRequest(self, state, merge_params(url, params), callback)
+                else:
+                    request = HTTPRequest(self, state, merge_params(url, params), callback)
+            self._submit(request)
+
+    def _scrape_done(self, url, chunk, response, error):
+        if response is not None:
+            state = self._get_state(url)
+            try:
+                interval = response['flags']['min_request_interval']
+                state.scrape_after = clock() + interval
+            except:
+                pass
+            files = response.get('files')
+            if len(chunk) > 1 and isinstance(files, dict) and len(files) <= 1 and state.scheme != 'udp':
+                # The tracker only returns the first infohash, scrape the
+                # others one by one
+                missing = [infohash for infohash in chunk if infohash not in files]
+                if missing:
+                    state.multiscrape = False
+                    for infohash in missing:
+                        for callback in chunk.pop(infohash):
+                            self._queue_scrape(url, infohash, callback)
+        for infohash, callbacks in chunk.iteritems():
+            self._scraped(infohash, callbacks, response, error)
+
+    def _scraped(self, infohash, callbacks, response, error):
+        for callback in callbacks:
+            try:
+                callback(infohash, response, error)
+            except:
+                print_exc()
+
+    #
+    # HTTP connections
+    #
+    def _get_connection(self, dns):
+        """ Returns an idle connection to dns or a new one """
+        connections = self.idle.get(dns)
+        if connections:
+            connection = connections.pop()
+            if not connections:
+                del self.idle[dns]
+            return connection
+        return HTTPConnection(self, dns)
+
+    def _release_connection(self, connection):
+        """ Keeps a connection that completed its request for reuse """
+        connections = self.idle.setdefault(connection.dns, [])
+        if len(connections) >= MAX_ACTIVE:
+            connection.close()
+            return
+        connection.idle_since = clock()
+        connections.append(connection)
+        self.rawserver.add_task(lambda: self._check_idle(connection), IDLE_TIMEOUT)
+
+    def _check_idle(self, connection):
+        connections = self.idle.get(connection.dns, [])
+        if connection in connections and connection.idle_since + IDLE_TIMEOUT <= clock() + 1:
+            self._forget_connection(connection)
+            connection.close()
+
+    def _forget_connection(self, connection):
+        connections = self.idle.get(connection.dns)
+        if connections and connection in connections:
+            connections.remove(connection)
+            if not connections:
+                del self.idle[connection.dns]
+
+    def _get_udp(self):
+        if self.udp is None:
+            self.udp = UDPTrackerSocket(self.rawserver)
+        return self.udp
+
+
+class TrackerState:
+    """ The requests and failures of a tracker """
+    def __init__(self, scheme, host, port):
+        self.scheme = scheme
+        self.host = host
+        self.port = port
+        self.queue = []         # requests waiting for one in progress to finish
+        self.active = 0         # requests in progress
+        self.failures = 0       # failures since the last response
+        self.backoff_until = 0
+        self.scrape_after = 0   # the min_request_interval of scrapes
+        self.multiscrape = True
+
+
+class Request:
+    """ A request to a tracker. start() sends it, when it is done the
+    TrackerClient is told through client._finish(). """
+    def __init__(self, client, state, callback):
+        self.client = client
+        self.state = state
+        self.callback = callback
+        self.active = False
+        self.done = False
+
+    def start(self):
+        raise NotImplementedError()
+
+    def abort(self):
+        pass
+
+    def resolve(self, host, func):
+        """ Calls func(ip) when host is resolved """
+        def resolved(ip):
+            if self.done:
+                return
+            if ip is None:
+                self.client._finish(self, None, (ERROR_CONNECTION, 'unable to resolve: ' + host))
+            else:
+                func(ip)
+        self.client.resolver.resolve(host, resolved)
+
+
+class HTTPRequest(Request):
+    def __init__(self, client, state, url, callback):
+        Request.__init__(self, client, state, callback)
+        self.url = url
+        self.redirects = 0
+        self.connection = None
+        self.reused = False
+
+    def start(self):
+        scheme, host, port, path = split_url(self.url)
+        netloc = host
+        if port != 80:
+            netloc += ':' + str(port)
+        proxy = find_proxy(self.url)
+        if proxy is None:
+            target = path
+        else:
+            target = self.url
+            if ':' in proxy:
+                host, port = proxy.split(':', 1)
+                port = int(port)
+            else:
+                host, port = proxy, 80
+        self.data = ('GET %s HTTP/1.1\r\nHost: %s\r\nUser-Agent: %s\r\n'
+                     'Accept-Encoding: gzip\r\nConnection: keep-alive\r\n\r\n' %
+                     (target, netloc, VERSION))
+        self.resolve(host, lambda ip: self._send((ip, port)))
+
+    def _send(self, dns):
+        try:
+            self.connection = self.client._get_connection(dns)
+        except socket.error, e:
+            self.client._finish(self, None, (ERROR_CONNECTION, str(e)))
+            return
+        self.reused = self.connection.requests > 0
+        self.connection.send(self)
+
+    def abort(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+    def connection_lost(self, response):
+        """ Called by the HTTPConnection when it closed before the response
+        was complete """
+        self.connection = None
+        if self.reused and not response.started():
+            # The tracker closed the idle connection, try a new one
+            self.start()
+        else:
+            self.client._finish(self, None, (ERROR_CONNECTION, 'connection closed'))
+
+    def got_response(self, response):
+        self.connection = None
+        status = response.status
+        if status in (301, 302, 303, 307) and 'location' in response.headers:
+            self.redirects += 1
+            if self.redirects > MAX_REDIRECTS:
+                self.client._finish(self, None, (ERROR_CONNECTION, 'redirect recursion'))
+                return
+            self.url = urljoin(self.url, response.headers['location'])
+            if self.url.startswith('https:'):
+                self.client._finish(self, None, (ERROR_CONNECTION, 'redirect to https'))
+                return
+            self.start()
+            return
+        try:
+            data = response.get_body()
+        except IOError:
+            self.client._finish(self, None, (ERROR_DATA, 'got corrupt response'))
+            return
+        if not data:
+            if status != 200:
+                self.client._finish(self, None, (ERROR_CONNECTION, 'HTTP error %d %s' % (status, response.reason)))
+            else:
+                self.client._finish(self, None, (ERROR_CONNECTION, 'no data from tracker'))
+            return
+        try:
+            r = bdecode(data, sloppy=1)
+            if not isinstance(r, dict):
+                raise ValueError('not a dictionary')
+        except ValueError, e:
+            if status != 200:
+                self.client._finish(self, None, (ERROR_CONNECTION, 'HTTP error %d %s' % (status, response.reason)))
+            else:
+                self.client._finish(self, None, (ERROR_DATA, str(e)))
+            return
+        if status != 200 and not r.has_key('failure reason'):
+            self.client._finish(self, None, (ERROR_CONNECTION, 'HTTP error %d %s' % (status, response.reason)))
+            return
+        self.client._finish(self, r, None)
+
+
+class ThreadedHTTPRequest(Request):
+    """ A request with the blocking urlopen on a thread of its own, for
+    HTTPS trackers """
+    def __init__(self, client, state, url, callback):
+        Request.__init__(self, client, state, callback)
+        self.url = url
+
+    def start(self):
+        t = Thread(target = self._run)
+        t.setName("TrackerClient"+t.getName())
+        t.setDaemon(True)
+        t.start()
+
+    def _run(self):
+        response = None
+        error = None
+        try:
+            h = urlopen(self.url, silent = True)
+            try:
+                data = h.read()
+            finally:
+                h.close()
+        except Exception, e:
+            error = (ERROR_CONNECTION, str(e))
+        else:
+            try:
+                response = bdecode(data, sloppy=1)
+                if not isinstance(response, dict):
+                    raise ValueError('not a dictionary')
+            except ValueError, e:
+                response = None
+                error = (ERROR_DATA, str(e))
+        self.client.rawserver.add_task(lambda: self.client._finish(self, response, error))
+
+
+class HTTPConnection:
+    """ A keep-alive connection to an HTTP tracker or proxy, it is the
+    handler of the SingleSocket """
+    def __init__(self, client, dns):
+        self.client = client
+        self.dns = dns
+        self.request = None
+        self.response = None
+        self.requests = 0
+        self.idle_since = 0
+        self.socket = client.rawserver.start_connection(dns, self)
+
+    def send(self, request):
+        self.request = request
+        self.response = HTTPResponse()
+        self.requests += 1
+        self.socket.write(request.data)
+
+    def close(self):
+        if self.socket is not None:
+            s = self.socket
+            self.socket = None
+            try:
+                s.close()
+            except:
+                pass
+
+    def data_came_in(self, s, data):
+        request = self.request
+        if request is None:
+            # Unexpected data on an idle connection
+            self.client._forget_connection(self)
+            self.close()
+            return
+        try:
+            complete = self.response.feed(data)
+        except ValueError, e:
+            if DEBUG:
+                print >>sys.stderr,"TrackerClient: bad response from",self.dns,str(e)
+            self.request = None
+            self.close()
+            self.client._finish(request, None, (ERROR_CONNECTION, 'bad HTTP response'))
+            return
+        if complete:
+            response = self.response
+            self.request = None
+            self.response = None
+            if response.keepalive:
+                self.client._release_connection(self)
+            else:
+                self.close()
+            request.got_response(response)
+
+    def connection_flushed(self, s):
+        pass
+
+    def connection_lost(self, s):
+        self.socket = None
+        self.client._forget_connection(self)
+        request = self.request
+        if request is not None:
+            response = self.response
+            self.request = None
+            self.response = None
+            if response.close():
+                request.got_response(response)
+            else:
+                request.connection_lost(response)
+
+
+class HTTPResponse:
+    """ Parses an HTTP response as it comes in """
+    def __init__(self):
+        self.buffer = ''
+        self.status = None
+        self.reason = ''
+        self.headers = {}
+        self.keepalive = False
+        self.length = None      # None for a body that ends at close
+        self.chunked = False
+        self.body = []
+        self.bodylength = 0
+        self.complete = False
+
+    def started(self):
+        return self.status is not None or self.buffer != ''
+
+    def feed(self, data):
+        """ Adds data, returns True when the response is complete. Raises
+        ValueError for an invalid response. """
+        self.buffer += data
+        if self.status is None and not self._parse_head():
+            return False
+        if self.chunked:
+            self._parse_chunks()
+        else:
+            self.body.append(self.buffer)
+            self.bodylength += len(self.buffer)
+            self.buffer = ''
+            if self.length is not None and self.bodylength >= self.length:
+                self.complete = True
+        if self.bodylength > MAX_RESPONSE:
+            raise ValueError('response too large')
+        return self.complete
+
+    def close(self):
+        """ The connection closed, returns True if this completes the
+        response """
+        if self.status is not None and self.length is None and not self.chunked:
+            self.complete = True
+        return self.complete
+
+    def get_body(self):
+        data = ''.join(self.body)
+        if self.length is not None:
+            data = data[:self.length]
+        if self.headers.get('content-encoding', '').find('gzip') >= 0:
+            try:
+                data = GzipFile(fileobj = StringIO(data)).read()
+            except:
+                raise IOError('corrupt response')
+        return data
+
+    def _parse_head(self):
+        while True:
+            i = self.buffer.find('\r\n\r\n')
+            if i == -1:
+                if len(self.buffer) > 65536:
+                    raise ValueError('header too long')
+                return False
+            lines = self.buffer[:i].split('\r\n')
+            self.buffer = self.buffer[i+4:]
+            words = lines[0].split(None, 2)
+            if len(words) < 2 or not words[0].startswith('HTTP/'):
+                raise ValueError('bad status line')
+            try:
+                status = int(words[1])
+            except ValueError:
+                raise ValueError('bad status line')
+            if 100 <= status < 200:
+                # 100 Continue and the like, the response follows
+                continue
+            self.status = status
+            if len(words) > 2:
+                self.reason = words[2]
+            for line in lines[1:]:
+                if ':' in line:
+                    key, value = line.split(':', 1)
+                    self.headers[key.strip().lower()] = value.strip()
+            connection = self.headers.get('connection', '').lower()
+            if words[0] == 'HTTP/1.0':
+                self.keepalive = connection == 'keep-alive'
+            else:
+                self.keepalive = connection != 'close'
+            if self.headers.get('transfer-encoding', '').lower() == 'chunked':
+                self.chunked = True
+            elif 'content-length' in self.headers:
+                try:
+                    self.length = int(self.headers['content-length'])
+                except ValueError:
+                    raise ValueError('bad content-length')
+                if self.length == 0:
+                    self.complete = True
+            else:
+                self.keepalive = False
+            return True
+
+    def _parse_chunks(self):
+        while not self.complete:
+            if self.length is None:
+                i = self.buffer.find('\r\n')
+                if i == -1:
+                    return
+                try:
+                    self.length = int(self.buffer[:i].split(';')[0], 16)
+                except ValueError:
+                    raise ValueError('bad chunk size')
+                self.buffer = self.buffer[i+2:]
+            if self.length == 0:
+                # Skip the trailer
+                if self.buffer.startswith('\r\n'):
+                    self.complete = True
+                    self.length = None
+                    return
+                i = self.buffer.find('\r\n\r\n')
+                if i == -1:
+                    return
+                self.complete = True
+                self.length = None
+                return
+            if len(self.buffer) < self.length + 2:
+                return
+            self.body.append(self.buffer[:self.length])
+            self.bodylength += self.length
+            self.buffer = self.buffer[self.length+2:]
+            self.length = None
+
+
+class UDPRequest(Request):
+    """ A request to a UDP tracker, see BEP 15 """
+    def __init__(self, client, state, url, callback):
+        Request.__init__(self, client, state, callback)
+        self.url = url
+        self.transaction = None
+        self.fresh = False      # whether the connection id was just obtained
+
+    def start(self):
+        scheme, host, port, path = split_url(self.url)
+        self.resolve(host, lambda ip: self._connect((ip, port)))
+
+    def _connect(self, addr):
+        self.addr = addr
+        udp = self.client._get_udp()
+        connection_id = udp.get_connection_id(addr)
+        if connection_id is not None:
+            self.fresh = False
+            self._send(connection_id)
+        else:
+            self.fresh = True
+            self.transaction = udp.connect(addr, self._connected, self.client.timeout)
+
+    def _connected(self, connection_id):
+        self.transaction = None
+        if self.done:
+            return
+        if connection_id is None:
+            self.client._finish(self, None, (ERROR_CONNECTION, 'no response from tracker'))
+        else:
+            self._send(connection_id)
+
+    def _send(self, connection_id):
+        udp = self.client._get_udp()
+        self.transaction = udp.request(self.addr, connection_id, self.action, self.get_payload(), self._received, self.client.timeout)
+
+    def _received(self, action, data):
+        self.transaction = None
+        if self.done:
+            return
+        if action is None:
+            self.client._finish(self, None, (ERROR_CONNECTION, 'no response from tracker'))
+        elif action == UDP_ERROR:
+            if not self.fresh:
+                # The connection id may have expired, get a new one
+                self.client._get_udp().forget_connection_id(self.addr)
+                self._connect(self.addr)
+                return
+            self.client._finish(self, {'failure reason': data}, None)
+        elif action != self.action:
+            self.client._finish(self, None, (ERROR_DATA, 'unexpected action %d' % action))
+        else:
+            try:
+                response = self.parse(data)
+            except ValueError, e:
+                self.client._finish(self, None, (ERROR_DATA, str(e)))
+            else:
+                self.client._finish(self, response, None)
+
+    def abort(self):
+        if self.transaction is not None:
+            self.client._get_udp().cancel(self.transaction)
+            self.transaction = None
+
+
+class UDPAnnounce(UDPRequest):
+    action = UDP_ANNOUNCE
+
+    def __init__(self, client, state, url, params, callback):
+        UDPRequest.__init__(self, client, state, url, callback)
+        self.params = {}
+        for pair in params.split('&'):
+            if '=' in pair:
+                key, value = pair.split('=', 1)
+                self.params[key] = unquote(value)
+
+    def get_payload(self):
+        p = self.params
+        try:
+            ip = unpack('!I', socket.inet_aton(p['ip']))[0]
+        except:
+            ip = 0
+        key = unpack('!I', sha(p.get('key', '')).digest()[:4])[0]
+        event = UDP_EVENTS.get(p.get('event'), 0)
+        return pack('!20s20sQQQIIIiH', p['info_hash'], p['peer_id'],
+                    long(p.get('downloaded', 0)), long(p.get('left', 0)),
+                    long(p.get('uploaded', 0)), event, ip, key,
+                    int(p.get('numwant', -1)), int(p['port']))
+
+    def parse(self, data):
+        if len(data) < 12:
+            raise ValueError('announce response too short')
+        interval, leechers, seeders = unpack('!III', data[:12])
+        peers = data[12:]
+        peers = peers[:len(peers) - len(peers) % 6]
+        return {'interval': interval, 'complete': seeders, 'incomplete': leechers, 'peers': peers}
+
+
+class UDPScrape(UDPRequest):
+    action = UDP_SCRAPE
+
+    def __init__(self, client, state, url, infohashes, callback):
+        UDPRequest.__init__(self, client, state, url, callback)
+        self.infohashes = infohashes
+
+    def get_payload(self):
+        return ''.join(self.infohashes)
+
+    def parse(self, data):
+        files = {}
+        for i in xrange(min(len(self.infohashes), len(data) / 12)):
+            seeders, completed, leechers = unpack('!III', data[i*12:i*12+12])
+            files[self.infohashes[i]] = {'complete': seeders, 'downloaded': completed, 'incomplete': leechers}
+        return {'files': files}
+
+
+class UDPTransaction:
+    def __init__(self, addr, packet, callback, deadline):
+        self.addr = addr
+        self.packet = packet
+        self.callback = callback
+        self.deadline = deadline
+
+
+class UDPTrackerSocket:
+    """ The UDP socket for all UDP trackers. It matches responses to
+    requests by transaction id and retransmits requests that are not
+    answered. """
+    def __init__(self, rawserver):
+        self.rawserver = rawserver
+        self.socket = rawserver.create_udpsocket(0, '0.0.0.0')
+        rawserver.start_listening_udp(self.socket, self)
+        self.transactions = {}      # UDPTransaction by transaction id
+        self.connection_ids = {}    # (connection id, expiry time) by address
+        self.connecting = {}        # the callbacks waiting for a connection id by address
+
+    def close(self):
+        self.rawserver.stop_listening_udp(self.socket)
+        self.socket.close()
+        self.transactions = {}
+
+    def get_connection_id(self, addr):
+        entry = self.connection_ids.get(addr)
+        if entry is not None and entry[1] > clock():
+            return entry[0]
+        return None
+
+    def forget_connection_id(self, addr):
+        self.connection_ids.pop(addr, None)
+
+    def connect(self, addr, callback, timeout):
+        """ Gets a connection id for addr, calls callback(connection id) or
+        callback(None) if the tracker did not respond. Returns a handle for
+        cancel(). """
+        callbacks = self.connecting.get(addr)
+        if callbacks is None:
+            callbacks = self.connecting[addr] = []
+            self.request(addr, UDP_PROTOCOL_ID, UDP_CONNECT, '', lambda action, data: self._connected(addr, action, data), timeout)
+        callbacks.append(callback)
+        return (addr, callback)
+
+    def _connected(self, addr, action, data):
+        connection_id = None
+        if action == UDP_CONNECT and len(data) >= 8:
+            connection_id = unpack('!Q', data[:8])[0]
+            self.connection_ids[addr] = (connection_id, clock() + UDP_CONNECTION_TTL)
+        for callback in self.connecting.pop(addr, []):
+            callback(connection_id)
+
+    def request(self, addr, connection_id, action, payload, callback, timeout):
+        """ Sends a request, calls callback(action, data) with the response
+        or callback(None, None) after timeout. Returns a handle for cancel(). """
+        tid = randrange(0, 1 << 32)
+        while tid in self.transactions:
+            tid = randrange(0, 1 << 32)
+        packet = pack('!QII', connection_id, action, tid) + payload
+        self.transactions[tid] = UDPTransaction(addr, packet, callback, clock() + timeout)
+        self._transmit(tid, UDP_RETRY)
+        return tid
+
+    def cancel(self, handle):
+        if isinstance(handle, tuple):
+            addr, callback = handle
+            callbacks = self.connecting.get(addr, [])
+            if callback in callbacks:
+                callbacks.remove(callback)
+        else:
+            self.transactions.pop(handle, None)
+
+    def _transmit(self, tid, delay):
+        transaction = self.transactions.get(tid)
+        if transaction is None:
+            return
+        if clock() >= transaction.deadline:
+            del self.transactions[tid]
+            transaction.callback(None, None)
+            return
+        try:
+            self.socket.sendto(transaction.packet, transaction.addr)
+        except socket.error:
+            if DEBUG:
+                print_exc()
+        delay = min(delay, max(transaction.deadline - clock(), 0))
+        self.rawserver.add_task(lambda: self._transmit(tid, delay * 2), delay)
+
+    def data_came_in(self, packets):
+        for addr, data in packets:
+            if len(data) < 8:
+                continue
+            action, tid = unpack('!II', data[:8])
+            transaction = self.transactions.get(tid)
+            if transaction is None or transaction.addr[0] != addr[0]:
+                continue
+            del self.transactions[tid]
+            try:
+                transaction.callback(action, data[8:])
+            except:
+                print_exc()
+
+
+class Resolver:
+    """ Resolves host names on a helper thread, and caches the results """
+    def __init__(self, rawserver):
+        self.rawserver = rawserver
+        self.cache = {}         # (ip, expiry time) by host
+        self.pending = {}       # callbacks by host
+        self.queue = None
+
+    def resolve(self, host, callback):
+        """ Calls callback(ip), or callback(None) if host cannot be
+        resolved. Called by the network thread, and so is the callback. """
+        try:
+            socket.inet_aton(host) # IPVSIX: change to inet_pton()
+            callback(host)
+            return
+        except socket.error:
+            if ':' in host:
+                callback(host)
+                return
+        entry = self.cache.get(host)
+        if entry is not None and entry[1] > clock():
+            callback(entry[0])
+            return
+        if host in self.pending:
+            self.pending[host].append(callback)
+            return
+        self.pending[host] = [callback]
+        if self.queue is None:
+            self.queue = Queue()
+            t = Thread(target = self._run)
+            t.setName("TrackerResolver"+t.getName())
+            t.setDaemon(True)
+            t.start()
+        self.queue.put(host)
+
+    def shutdown(self):
+        if self.queue is not None:
+            self.queue.put(None)
+            self.queue = None
+
+    def _run(self):
+        queue = self.queue
+        while True:
+            host = queue.get()
+            if host is None:
+                return
+            try:
+                ip = socket.gethostbyname(host)
+            except:
+                ip = None
+            self.rawserver.add_task(lambda host=host, ip=ip: self._resolved(host, ip))
+
+    def _resolved(self, host, ip):
+        if ip is not None:
+            self.cache[host] = (ip, clock() + DNS_TTL)
+        for callback in self.pending.pop(host, []):
+            try:
+                callback(ip)
+            except:
+                print_exc()
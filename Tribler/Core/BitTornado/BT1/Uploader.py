@@ -52,6 +52,18 @@ class Upload:
         self.piecebuf = None
         # Merkle
         self.hashlist = []
+        # With disk I/O threads: what is being read for us, see
+        # _get_upload_chunk_async()
+        self.reading = None
+        self.closed = False
+        # Without buffer_reads: the chunk read for the request at the head
+        # of the queue, an array of its own (not a PieceBuffer)
+        self.chunk = None
+        self.chunkdl = None
+        # With memory-mapped reads: (index, begin, buffer) mapped for the
+        # requests at the head of the queue, see _get_upload_chunk_mapped()
+        self.use_mmap = config.get('mmap_cache_size', 0) > 0
+        self.mapped = None
 
     def send_haves(self, connection):
         """
@@ -89,6 +101,8 @@ class Upload:
             if self.piecebuf:
                 self.piecebuf.release()
             self.piecebuf = None
+            self.chunk = None
+            self.chunkdl = None
             self.choker.not_interested(self.connection)
 
     def got_interested(self):
@@ -100,6 +114,12 @@ class Upload:
     def get_upload_chunk(self):
         if self.choked or not self.buffer:
             return None
+        if self.use_mmap:
+            chunk = self._get_upload_chunk_mapped()
+            if chunk is not None:
+                return chunk
+        if self.storage.diskio is not None:
+            return self._get_upload_chunk_async()
         index, begin, length = self.buffer.pop(0)
         if self.config['buffer_reads']:
             if index != self.piecedl:
@@ -109,7 +129,7 @@ class Upload:
                 # Merkle
                 [ self.piecebuf, self.hashlist ] = self.storage.get_piece(index, 0, -1)
             try:
-                piece = self.piecebuf[begin:begin+length]
+                piece = self._slice_piecebuf(begin, length)
                 assert len(piece) == length
             except:     # fails if storage.get_piece returns None or if out of range
                 self.connection.close()
@@ -126,6 +146,117 @@ class Upload:
             if piece is None:
                 self.connection.close()
                 return None
+        return self._uploaded(index, begin, length, hashlist, piece)
+
+    def _slice_piecebuf(self, begin, length):
+        """ Returns part of self.piecebuf as an array of its own. The
+        connection sends it without copying, after the PieceBuffer may 
+        have been released and reused. """
+        piece = self.piecebuf[begin:begin+length]
+        if piece is getattr(self.piecebuf, 'buf', None):
+            piece = piece[:]
+        return piece
+
+    def _get_upload_chunk_mapped(self):
+        """ Returns the next chunk as a buffer on the memory-mapped file,
+        or None if the data cannot be mapped. Adjacent requests for the same
+        piece are mapped together and sliced without copying. """
+        index, begin, length = self.buffer[0]
+        if self.mapped is not None:
+            mindex, mbegin, view = self.mapped
+            if (index != mindex or begin < mbegin 
+                or begin + length > mbegin + len(view)):
+                self.mapped = None
+        if self.mapped is None:
+            end = begin + length
+            for i, b, l in self.buffer[1:]:
+                if i != index or b != end:
+                    break
+                end += l
+            view = self.storage.get_piece_mapped(index, begin, end - begin)
+            if view is None:
+                return None
+            mbegin = begin
+            self.mapped = (index, begin, view)
+        del self.buffer[0]
+        return self._uploaded(index, begin, length, [], 
+                              buffer(view, begin - mbegin, length))
+
+    def _get_upload_chunk_async(self):
+        """ Returns the next chunk if its data has been read from disk,
+        otherwise has the disk I/O threads read it and returns None. When
+        the data is in, _chunk_read() queues us with the rate limiter again.
+        There is at most one read in progress per upload. """
+        index, begin, length = self.buffer[0]
+        if self.config['buffer_reads']:
+            key = index
+            loaded = self.piecedl
+        else:
+            key = (index, begin, length)
+            loaded = self.chunkdl
+        if key != loaded:
+            if self.reading is None:
+                if self.piecebuf:
+                    self.piecebuf.release()
+                self.piecebuf = None
+                self.piecedl = None
+                self.chunk = None
+                self.chunkdl = None
+                self.reading = key
+                if self.config['buffer_reads']:
+                    self.storage.get_piece_async(index, 0, -1, self._chunk_read)
+                else:
+                    self.storage.get_piece_async(index, begin, length, self._chunk_read)
+            if self.config['buffer_reads']:
+                loaded = self.piecedl
+            else:
+                loaded = self.chunkdl
+            if key != loaded:
+                return None
+
+        del self.buffer[0]
+        try:
+            if self.config['buffer_reads']:
+                piece = self._slice_piecebuf(begin, length)
+            else:
+                # an array, not a PieceBuffer, see StorageWrapper.do_get_piece()
+                piece = self.chunk
+                self.chunk = None
+                self.chunkdl = None
+            assert len(piece) == length
+        except:     # fails if storage.get_piece returns None or if out of range
+            self.connection.close()
+            return None
+        if begin == 0:
+            hashlist = self.hashlist
+        else:
+            hashlist = []
+        return self._uploaded(index, begin, length, hashlist, piece)
+
+    def _chunk_read(self, result):
+        """ Called on the network thread with the result of
+        StorageWrapper.get_piece_async() """
+        piece, hashlist = result
+        key = self.reading
+        self.reading = None
+        if self.closed or self.choked:
+            if piece is not None and self.config['buffer_reads']:
+                piece.release()
+            return
+        if piece is None:
+            self.connection.close()
+            return
+        if self.config['buffer_reads']:
+            self.piecedl = key
+            self.piecebuf = piece
+        else:
+            self.chunkdl = key
+            self.chunk = piece
+        self.hashlist = hashlist
+        if self.buffer and self.connection.next_upload is None:
+            self.ratelimiter.queue(self.connection)
+
+    def _uploaded(self, index, begin, length, hashlist, piece):
         self.measure.update_rate(len(piece))
         self.totalup.update_rate(len(piece))
 
@@ -159,10 +290,13 @@ class Upload:
         if not self.choked:
             self.choked = True
             self.connection.send_choke()
+        self.mapped = None
         self.piecedl = None
         if self.piecebuf:
             self.piecebuf.release()
             self.piecebuf = None
+        self.chunk = None
+        self.chunkdl = None
 
     def choke_sent(self):
         del self.buffer[:]
@@ -178,9 +312,13 @@ class Upload:
                 pass
         
     def disconnected(self):
+        self.closed = True
+        self.mapped = None
         if self.piecebuf:
             self.piecebuf.release()
             self.piecebuf = None
+        self.chunk = None
+        self.chunkdl = None
 
     def is_choked(self):
         return self.choked
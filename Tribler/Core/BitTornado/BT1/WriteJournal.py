@@ -0,0 +1,171 @@
+# see LICENSE.txt for license information
+#
+# Journal of the pieces of a download written to since its resume data was
+# last saved. When Tribler is not shut down cleanly the files it was writing
+# to have changed since the resume data was saved, so it cannot tell which
+# of their pieces are still valid and checks all of them again. With the
+# journal only the pieces written to since are checked.
+#
+# The resume data carries the generation of the journal that was started
+# when it was saved, see Storage.pickle(). A journal of another generation
+# says nothing about the files and is not used.
+#
+# File format: the generation on the first line, followed by one line per
+# piece position, in decimal. A position is handed to the OS before any data
+# is written to it, so it survives a crash of Tribler. Like the data files,
+# the records are not synced to disk on every write, which would block the
+# writing thread, but when the journal is reset at a checkpoint or closed.
+# A record lost in a power failure leaves its file modified after the last
+# record that is on disk, so all pieces of that file are checked again.
+#
+# The mtime of the journal is the time of its last record: writes to pieces
+# already in the journal touch it (at most every TOUCH_INTERVAL seconds). A
+# file modified after that was not modified by the writes in the journal.
+#
+
+import os
+import sys
+from binascii import hexlify
+from time import time
+from threading import Lock
+from traceback import print_exc
+try:
+    from os import fsync
+except ImportError:
+    fsync = lambda x: None
+
+DEBUG = False
+
+TOUCH_INTERVAL = 0.5
+
+
+class WriteJournal:
+    def __init__(self, filename, piece_length):
+        self.filename = filename
+        self.piece_length = piece_length
+        self.lock = Lock()
+        self.f = None
+        self.generation = None
+        self.pieces = {}
+        self.touched = 0
+        self._load()
+
+    def get_written(self, generation):
+        """ Returns the piece positions written to since the resume data with
+        the given journal generation was saved, or None if not known. """
+        if generation is None or generation != self.generation:
+            return None
+        return self.pieces.keys()
+
+    def get_last_record_time(self):
+        """ Returns the time of the last record (the mtime of the journal),
+        or None if there is no journal. """
+        try:
+            return os.path.getmtime(self.filename)
+        except OSError:
+            return None
+
+    def record(self, pos, length):
+        """ Records a write of length bytes at position pos, before it is
+        done. Can be called from any thread, may raise IOError. """
+        first = pos / self.piece_length
+        last = (pos + max(length, 1) - 1) / self.piece_length
+        self.lock.acquire()
+        try:
+            new = [p for p in xrange(first, last + 1) if not self.pieces.has_key(p)]
+            if not new:
+                self._touch()
+                return
+            if self.f is None:
+                if self.generation is None:
+                    self._reset()
+                else:
+                    self.f = open(self.filename, 'ab')
+            self.f.write(''.join(['%d\n' % p for p in new]))
+            self.f.flush()
+            for p in new:
+                self.pieces[p] = 1
+            self.touched = time()
+        finally:
+            self.lock.release()
+
+    def reset(self):
+        """ Starts a new, empty journal and returns its generation, to be
+        stored with the resume data saved now. May raise IOError. """
+        self.lock.acquire()
+        try:
+            return self._reset()
+        finally:
+            self.lock.release()
+
+    def close(self):
+        self.lock.acquire()
+        try:
+            if self.f is not None:
+                self._sync()
+                self.f.close()
+                self.f = None
+        finally:
+            self.lock.release()
+
+    #
+    # Internal methods
+    #
+    def _load(self):
+        try:
+            f = open(self.filename, 'rb')
+            try:
+                lines = f.read().split('\n')
+            finally:
+                f.close()
+        except IOError:
+            return
+        if len(lines) < 2:
+            return
+        try:
+            # The last line is empty, or was cut off while being written. In
+            # that case its write had not started yet.
+            pieces = {}
+            for line in lines[1:-1]:
+                pieces[int(line)] = 1
+        except ValueError:
+            if DEBUG:
+                print_exc()
+            return
+        self.generation = lines[0]
+        self.pieces = pieces
+        if DEBUG:
+            print >>sys.stderr,"WriteJournal: generation",self.generation,"pieces written",len(pieces)
+
+    def _touch(self):
+        if self.f is None or time() - self.touched < TOUCH_INTERVAL:
+            return
+        try:
+            os.utime(self.filename, None)
+        except OSError:
+            # the file will look modified after the last record, its
+            # pieces are checked again
+            if DEBUG:
+                print_exc()
+        self.touched = time()
+
+    def _sync(self):
+        try:
+            fsync(self.f.fileno())
+        except OSError:
+            if DEBUG:
+                print_exc()
+
+    def _reset(self):
+        if self.f is not None:
+            self.f.close()
+            self.f = None
+        generation = hexlify(os.urandom(8))
+        self.f = open(self.filename, 'wb')
+        self.f.write(generation + '\n')
+        self.f.flush()
+        fsync(self.f.fileno())
+        self.generation = generation
+        self.pieces = {}
+        self.touched = time()
+        return generation
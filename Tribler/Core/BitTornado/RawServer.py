@@ -1,7 +1,7 @@
 # Written by Bram Cohen and Pawel Garbacki
 # see LICENSE.txt for license information
 
-from bisect import insort
+from heapq import heappush, heappop, heapify
 from SocketHandler import SocketHandler
 import socket
 from cStringIO import StringIO
@@ -13,6 +13,8 @@ from clock import clock
 import sys
 import time
 
+from Tribler.Core.simpledefs import REACTOR_POLL
+
 try:
     True
 except:
@@ -48,7 +50,8 @@ READSIZE = 100000
 class RawServer:
     def __init__(self, doneflag, timeout_check_interval, timeout, noisy = True,
                  ipv6_enable = True, failfunc = lambda x: None, errorfunc = None,
-                 sockethandler = None, excflag = Event()):
+                 sockethandler = None, excflag = Event(),
+                 reactor_backend = REACTOR_POLL):
         self.timeout_check_interval = timeout_check_interval
         self.timeout = timeout
         self.servers = {}
@@ -59,7 +62,10 @@ class RawServer:
         self.failfunc = failfunc
         self.errorfunc = errorfunc
         self.exccount = 0
+        # Heap of (time, seqno, func, id). The sequence number keeps tasks
+        # scheduled for the same time in FIFO order.
         self.funcs = []
+        self.funcs_seqno = 0
         self.externally_added = []
         self.finished = Event()
         self.tasks_to_kill = []
@@ -67,7 +73,7 @@ class RawServer:
         self.lock = RLock()
 
         if sockethandler is None:
-            sockethandler = SocketHandler(timeout, ipv6_enable, READSIZE)
+            sockethandler = SocketHandler(timeout, ipv6_enable, READSIZE, reactor_backend)
         self.sockethandler = sockethandler
 
         self.thread_ident = None
@@ -81,7 +87,8 @@ class RawServer:
     def _add_task(self, func, delay, id = None):
         if delay < 0:
             delay = 0
-        insort(self.funcs, (clock() + delay, func, id))
+        self.funcs_seqno += 1
+        heappush(self.funcs, (clock() + delay, self.funcs_seqno, func, id))
 
     def add_task(self, func, delay = 0, id = None):
         #if DEBUG:
@@ -121,8 +128,9 @@ class RawServer:
 
     def pop_external(self):
         self.lock.acquire()
-        while self.externally_added:
-            (a, b, c) = self.externally_added.pop(0)
+        added = self.externally_added
+        self.externally_added = []
+        for (a, b, c) in added:
             self._add_task(a, b, c)
         self.lock.release()
 
@@ -157,9 +165,7 @@ class RawServer:
 
 
                     while self.funcs and self.funcs[0][0] <= clock():
-                        garbage1, func, id = self.funcs.pop(0)
-                        if id in self.tasks_to_kill:
-                            pass
+                        garbage1, garbage2, func, id = heappop(self.funcs)
                         try:
 #                            print func.func_name
                             if DEBUG:
@@ -242,9 +248,10 @@ class RawServer:
     def _kill_tasks(self):
         if self.tasks_to_kill:
             new_funcs = []
-            for (t, func, id) in self.funcs:
-                if id not in self.tasks_to_kill:
-                    new_funcs.append((t, func, id))
+            for task in self.funcs:
+                if task[3] not in self.tasks_to_kill:
+                    new_funcs.append(task)
+            heapify(new_funcs)
             self.funcs = new_funcs
             self.tasks_to_kill = []
 
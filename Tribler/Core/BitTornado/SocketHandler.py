@@ -9,12 +9,18 @@ try:
 except ImportError:
     from selectpoll import poll, POLLIN, POLLOUT, POLLERR, POLLHUP
     timemult = 1
+try:
+    import epollpoll
+except ImportError:
+    epollpoll = None
 from time import sleep
 from clock import clock
 import sys
 from random import shuffle, randrange
 from traceback import print_exc
 
+from Tribler.Core.simpledefs import REACTOR_POLL, REACTOR_EPOLL
+
 try:
     True
 except:
@@ -88,7 +94,10 @@ class SingleSocket:
         self.socket_handler = socket_handler
         self.socket = sock
         self.handler = handler
+        # Strings, buffers or arrays to send, offset bytes of the first
+        # have been sent already
         self.buffer = []
+        self.offset = 0
         self.last_hit = clock()
         self.fileno = sock.fileno()
         self.connected = False
@@ -163,6 +172,7 @@ class SingleSocket:
         sock = self.socket
         self.socket = None
         self.buffer = []
+        self.offset = 0
         del self.socket_handler.single_sockets[self.fileno]
         self.socket_handler.poll.unregister(sock)
         sock.close()
@@ -183,6 +193,17 @@ class SingleSocket:
         if len(self.buffer) == 1:
             self.try_write()
 
+    def write_vector(self, l):
+        """ Writes the strings, buffers or arrays in l in order. Python has
+        no writev(), so they are sent one by one, but without joining or
+        otherwise copying them: they must not change until sent. """
+        if self.socket is None or not l:
+            return
+        empty = not self.buffer
+        self.buffer.extend(l)
+        if empty:
+            self.try_write()
+
     def try_write(self):
         
         if self.connected:
@@ -190,6 +211,9 @@ class SingleSocket:
             try:
                 while self.buffer:
                     buf = self.buffer[0]
+                    if self.offset:
+                        # buffer() does not copy the unsent rest
+                        buf = buffer(buf, self.offset)
                     amount = self.socket.send(buf)
                     self.data_sent += amount # RePEX: Measurement TODO: Remove when measurement test has been done
                     if amount == 0:
@@ -197,9 +221,10 @@ class SingleSocket:
                         break
                     self.skipped = 0
                     if amount != len(buf):
-                        self.buffer[0] = buf[amount:]
+                        self.offset += amount
                         break
                     del self.buffer[0]
+                    self.offset = 0
             except socket.error, e:
                 #if DEBUG:
                 #    print_exc(file=sys.stderr)
@@ -225,12 +250,25 @@ class SingleSocket:
         self.handler = handler
 
 
+def create_poll(backend = REACTOR_POLL):
+    """ Returns a (poll object, timeout multiplier) pair for the requested
+    reactor backend, falling back to poll() when it is not available. """
+    if backend == REACTOR_EPOLL and epollpoll is not None and epollpoll.available():
+        return epollpoll.poll(), 1000
+    if backend != REACTOR_POLL and DEBUG:
+        print >>sys.stderr,"SocketHandler: reactor backend",backend,"not available, using poll"
+    return poll(), timemult
+
+
 class SocketHandler:
-    def __init__(self, timeout, ipv6_enable, readsize = 100000):
+    def __init__(self, timeout, ipv6_enable, readsize = 100000, backend = REACTOR_POLL):
         self.timeout = timeout
         self.ipv6_enable = ipv6_enable
         self.readsize = readsize
-        self.poll = poll()
+        self.poll, self.timemult = create_poll(backend)
+        # With edge-triggered backends sockets that may still have data
+        # pending must be rearmed after handling them, see epollpoll.py
+        self.edge_triggered = getattr(self.poll, 'edge_triggered', False)
         # {socket: SingleSocket}
         self.single_sockets = {}
         self.dead_from_write = []
@@ -490,11 +528,15 @@ class SocketHandler:
                         else:
                             print >> sys.stderr,"SocketHandler: too many connects"
                             newsock.close()
+                        if self.edge_triggered:
+                            # More connections may be waiting in the backlog
+                            self.poll.rearm(sock, POLLIN)
                         
                     except socket.error,e:
                         if DEBUG:
                             print >> sys.stderr,"SocketHandler: SocketError while accepting new connection",str(e)
-                        self._sleep()
+                        if not self.edge_triggered or e[0] != SOCKET_BLOCK_ERRORCODE:
+                            self._sleep()
                 continue
 
             s = self.udp_sockets.get(sock)
@@ -506,6 +548,8 @@ class SocketHandler:
                         if not data:
                             if DEBUG:
                                 print >> sys.stderr, "SocketHandler: UDP no-data", addr
+                            if self.edge_triggered:
+                                self.poll.rearm(sock, POLLIN)
                             break
                         else:
                             if DEBUG:
@@ -531,7 +575,7 @@ class SocketHandler:
                 if (event & POLLIN):
                     try:
                         s.last_hit = clock()
-                        data = s.socket.recv(100000)
+                        data = s.socket.recv(self.readsize)
                         if not data:
                             if DEBUG:
                                 print >> sys.stderr,"SocketHandler: no-data closing connection",s.get_ip(),s.get_port()
@@ -542,6 +586,10 @@ class SocketHandler:
 
                             # btlaunchmany: NewSocketHandler, btdownloadheadless: Encrypter.Connection
                             if hasattr(s, 'data_received'): s.data_received += len(data) # RePEX: Measurement TODO: Remove when measurement test has been done
+                            if self.edge_triggered and (len(data) == self.readsize or isinstance(s, InterruptSocket)):
+                                # A full read or a datagram may have left more
+                                # data behind, read again next round
+                                self.poll.rearm(sock, POLLIN)
                             s.handler.data_came_in(s, data)
                     except socket.error, e:
                         if DEBUG:
@@ -575,7 +623,7 @@ class SocketHandler:
         s.handler.connection_lost(s)
 
     def do_poll(self, t):
-        r = self.poll.poll(t*timemult)
+        r = self.poll.poll(t*self.timemult)
         if r is None:
             connects = len(self.single_sockets)
             to_close = int(connects*0.05)+1 # close 5% of sockets
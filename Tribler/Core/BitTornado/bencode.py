@@ -19,10 +19,8 @@ DEBUG = False
 def decode_int(x, f):
     f += 1
     newf = x.index('e', f)
-    try:
-        n = int(x[f:newf])
-    except:
-        n = long(x[f:newf])
+    # int() returns a long when needed
+    n = int(x[f:newf])
     if x[f] == '-':
         if x[f + 1] == '0':
             raise ValueError
@@ -32,10 +30,7 @@ def decode_int(x, f):
 
 def decode_string(x, f):
     colon = x.index(':', f)
-    try:
-        n = int(x[f:colon])
-    except (OverflowError, ValueError):
-        n = long(x[f:colon])
+    n = int(x[f:colon])
     if x[f] == '0' and colon != f+1:
         raise ValueError
     colon += 1
@@ -47,23 +42,30 @@ def decode_unicode(x, f):
 
 def decode_list(x, f):
     r, f = [], f+1
+    append = r.append
+    func = decode_func
     while x[f] != 'e':
-        v, f = decode_func[x[f]](x, f)
-        r.append(v)
+        v, f = func[x[f]](x, f)
+        append(v)
     return (r, f + 1)
 
 def decode_dict(x, f):
     r, f = {}, f+1
-    lastkey = None
+    func = decode_func
     while x[f] != 'e':
-        k, f = decode_string(x, f)
         # Arno, 2008-09-12: uTorrent 1.8 violates the bencoding spec, its keys
         # in an EXTEND handshake message are not sorted. Be liberal in what we
-        # receive:
-        ##if lastkey >= k:
-        ##    raise ValueError
-        lastkey = k
-        r[k], f = decode_func[x[f]](x, f)
+        # receive, and do not check the order of the keys.
+        #
+        # Inlined decode_string(), most of the strings are keys
+        colon = x.index(':', f)
+        n = int(x[f:colon])
+        if x[f] == '0' and colon != f+1:
+            raise ValueError
+        colon += 1
+        f = colon+n
+        k = x[colon:f]
+        r[k], f = func[x[f]](x, f)
     return (r, f + 1)
 
 decode_func = {}
@@ -94,6 +96,175 @@ def bdecode(x, sloppy = 0):
         raise ValueError, "bad bencoded data"
     return r
 
+#
+# Lazy decoding: bdecode_lazy() only finds where the values of a dictionary
+# begin and end, a value is decoded when it is accessed. The bencoded form of
+# a value is available too, e.g. to compute the infohash of a torrent from
+# the 'info' dictionary as read from the .torrent file.
+#
+# The skip functions return the position after the value at position f, and
+# whether the value is in canonical form, i.e. whether bencode() of the
+# decoded value gives the same bytes. Integers and strings are checked when
+# decoded, only the order of the keys of dictionaries is checked here.
+#
+def skip_int(x, f):
+    return (x.index('e', f+1) + 1, True)
+
+def skip_string(x, f):
+    colon = x.index(':', f)
+    n = int(x[f:colon])
+    if n < 0 or (x[f] == '0' and colon != f+1):
+        raise ValueError
+    end = colon+1+n
+    if end > len(x):
+        raise ValueError
+    return (end, True)
+
+def skip_list(x, f):
+    f += 1
+    canonical = True
+    func = skip_func
+    while x[f] != 'e':
+        f, c = func[x[f]](x, f)
+        if not c:
+            canonical = False
+    return (f + 1, canonical)
+
+def skip_dict(x, f):
+    f += 1
+    canonical = True
+    lastkey = None
+    func = skip_func
+    while x[f] != 'e':
+        k, f = decode_string(x, f)
+        if lastkey is not None and lastkey >= k:
+            canonical = False
+        lastkey = k
+        f, c = func[x[f]](x, f)
+        if not c:
+            canonical = False
+    return (f + 1, canonical)
+
+skip_func = {}
+skip_func['l'] = skip_list
+skip_func['d'] = skip_dict
+skip_func['i'] = skip_int
+skip_func['0'] = skip_string
+skip_func['1'] = skip_string
+skip_func['2'] = skip_string
+skip_func['3'] = skip_string
+skip_func['4'] = skip_string
+skip_func['5'] = skip_string
+skip_func['6'] = skip_string
+skip_func['7'] = skip_string
+skip_func['8'] = skip_string
+skip_func['9'] = skip_string
+
+class LazyDict:
+    """ Bencoded dictionary of which the values are decoded when accessed.
+    Dictionaries inside it are LazyDicts too, other values are decoded with
+    bdecode(). Errors in a value are only found when it is accessed, they
+    raise a ValueError like bdecode(). """
+    def __init__(self, x, f = 0):
+        self.x = x
+        self.begin = f
+        self.spans = {}     # key -> (begin, end, canonical) of the value
+        self.decoded = {}   # key -> decoded value
+        self.canonical = True
+        f += 1
+        lastkey = None
+        while x[f] != 'e':
+            k, f = decode_string(x, f)
+            if lastkey is not None and lastkey >= k:
+                self.canonical = False
+            lastkey = k
+            end, canonical = skip_func[x[f]](x, f)
+            self.spans[k] = (f, end, canonical)
+            self.canonical = self.canonical and canonical
+            f = end
+        self.end = f + 1
+
+    def __getitem__(self, key):
+        try:
+            return self.decoded[key]
+        except KeyError:
+            pass
+        begin, end, canonical = self.spans[key]
+        try:
+            if self.x[begin] == 'd':
+                v = LazyDict(self.x, begin)
+            else:
+                v, l = decode_func[self.x[begin]](self.x, begin)
+        except (IndexError, KeyError, ValueError):
+            if DEBUG:
+                print_exc()
+            raise ValueError, "bad bencoded data"
+        self.decoded[key] = v
+        return v
+
+    def get(self, key, default = None):
+        if key in self.spans:
+            return self[key]
+        return default
+
+    def has_key(self, key):
+        return key in self.spans
+
+    __contains__ = has_key
+
+    def __len__(self):
+        return len(self.spans)
+
+    def __iter__(self):
+        return iter(self.spans)
+
+    def keys(self):
+        return self.spans.keys()
+
+    def values(self):
+        return [self[key] for key in self.spans]
+
+    def items(self):
+        return [(key, self[key]) for key in self.spans]
+
+    def get_raw(self, key):
+        """ Returns the bencoded value of key, as it was received """
+        begin, end, canonical = self.spans[key]
+        return self.x[begin:end]
+
+    def is_canonical(self, key = None):
+        """ Returns whether bencode() of the decoded value of key, or of the
+        whole dictionary when no key is given, returns the bencoded form as
+        received. Only then e.g. get_raw('info') of a torrent can be used in
+        place of bencode(metainfo['info']). """
+        if key is None:
+            return self.canonical
+        return self.spans[key][2]
+
+    def todict(self):
+        """ Returns the dictionary as decoded by bdecode() """
+        try:
+            r, l = decode_dict(self.x, self.begin)
+        except (IndexError, KeyError, ValueError):
+            if DEBUG:
+                print_exc()
+            raise ValueError, "bad bencoded data"
+        return r
+
+def bdecode_lazy(x, sloppy = 0):
+    """ Like bdecode(), but returns a LazyDict when x is a dictionary """
+    if not x or x[0] != 'd':
+        return bdecode(x, sloppy)
+    try:
+        r = LazyDict(x)
+    except (IndexError, KeyError, ValueError):
+        if DEBUG:
+            print_exc()
+        raise ValueError, "bad bencoded data"
+    if not sloppy and r.end != len(x):
+        raise ValueError, "bad bencoded data"
+    return r
+
 def test_bdecode():
     try:
         bdecode('0:0:')
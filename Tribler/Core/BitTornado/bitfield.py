@@ -1,7 +1,15 @@
 # Written by Bram Cohen, Uoti Urpala, and John Hoffman
 # see LICENSE.txt for license information
+#
+# The bits are stored packed in a bytearray in wire format (most significant
+# bit first), so a BITFIELD message is used as is and a Bitfield costs one
+# bit per piece instead of one list slot. The padding bits in the last byte
+# are always zero.
+#
 
 import sys
+import re
+from binascii import hexlify, unhexlify
 
 try:
     True
@@ -10,12 +18,6 @@ except:
     False = 0
     bool = lambda x: not not x
 
-try:
-    sum([1])
-    negsum = lambda a: len(a) - sum(a)
-except:
-    negsum = lambda a: reduce(lambda x, y: x + (not y), a, 0)
-    
 def _int_to_booleans(x):
     r = []
     for i in range(8):
@@ -30,21 +32,34 @@ for i in xrange(256):
     lookup_table.append(x)
     reverse_lookup_table[x] = chr(i)
 
+# Number of bits set per byte value, as a str.translate() table
+popcount_table = ''.join([chr(sum(lookup_table[i])) for i in xrange(256)])
+
+# Offsets of the bits set per byte value
+bitoffset_table = [tuple([j for j in xrange(8) if lookup_table[i][j]]) for i in xrange(256)]
+
+nonzero_byte = re.compile(r'[^\x00]')
+
+
+def popcount(s):
+    """ Returns the number of bits set in string s """
+    return sum(bytearray(s.translate(popcount_table)))
+
 
 class Bitfield:
     def __init__(self, length = None, bitstring = None, copyfrom = None, fromarray = None, calcactiveranges=False):
         """
-        STBSPEED 
-        @param calcactivetanges   Calculate which parts of the piece-space 
+        STBSPEED
+        @param calcactivetanges   Calculate which parts of the piece-space
         are non-zero, used an optimization for hooking in whilst live streaming.
         Only works in combination with bitstring parameter.
         """
-        
+
         self.activeranges = []
-        
+
         if copyfrom is not None:
             self.length = copyfrom.length
-            self.array = copyfrom.array[:]
+            self.bits = bytearray(copyfrom.bits)
             self.numfalse = copyfrom.numfalse
             return
         if length is None:
@@ -54,87 +69,89 @@ class Bitfield:
             extra = len(bitstring) * 8 - length
             if extra < 0 or extra >= 8:
                 raise ValueError
-            t = lookup_table
-            r = []
-            
-            chr0 = chr(0)
-            inrange = False
-            startpiece = 0
-            countpiece = 0
-            for c in bitstring:
-                r.extend(t[ord(c)])
-        
-                # STBSPEED        
-                if calcactiveranges:
-                    if c != chr0:
+            if extra > 0 and ord(bitstring[-1]) & ((1 << extra) - 1):
+                raise ValueError
+            self.bits = bytearray(bitstring)
+            self.numfalse = length - popcount(bitstring)
+
+            # STBSPEED
+            if calcactiveranges:
+                inrange = False
+                startpiece = 0
+                countpiece = 0
+                for c in self.bits:
+                    if c:
                         # Non-zero value, either start or continuation of range
-                        if inrange:
-                            # Stay in activerange
-                            pass
-                        else:
+                        if not inrange:
                             # Start activerange
                             startpiece = countpiece
                             inrange = True
-                    else:
-                        # Zero, either end or continuation of zeroness
-                        if inrange:
-                            # End of activerange
-                            self.activeranges.append((startpiece,countpiece))
-                            inrange = False
-                        else:
-                            # Stay in zero
-                            pass
+                    elif inrange:
+                        # End of activerange
+                        self.activeranges.append((startpiece,countpiece))
+                        inrange = False
                     countpiece += 8
-
-            if calcactiveranges:
                 if inrange:
-                    # activerange ended at end of piece space 
+                    # activerange ended at end of piece space
                     self.activeranges.append((startpiece,min(countpiece,self.length-1)))
-                       
-            if extra > 0:
-                if r[-extra:] != [0] * extra:
-                    raise ValueError
-                del r[-extra:]
-            self.array = r
-            self.numfalse = negsum(r)
-            
+
         elif fromarray is not None:
-            self.array = fromarray
-            self.numfalse = negsum(self.array)
+            t = reverse_lookup_table
+            s = length % 8
+            r = [ t[tuple(fromarray[x:x+8])] for x in xrange(0, length-s, 8) ]
+            if s:
+                r.append(t[tuple(fromarray[length-s:length]) + (False,) * (8-s)])
+            self.bits = bytearray(''.join(r))
+            self.numfalse = length - popcount(''.join(r))
         else:
-            self.array = [False] * length
+            self.bits = bytearray((length + 7) >> 3)
             self.numfalse = length
 
     def __setitem__(self, index, val):
-        val = bool(val)
-        self.numfalse += self.array[index]-val
-        self.array[index] = val
+        if index < 0:
+            index += self.length
+        if not 0 <= index < self.length:
+            raise IndexError, index
+        mask = 0x80 >> (index & 7)
+        old = self.bits[index >> 3]
+        if val:
+            if not old & mask:
+                self.bits[index >> 3] = old | mask
+                self.numfalse -= 1
+        elif old & mask:
+            self.bits[index >> 3] = old & ~mask
+            self.numfalse += 1
 
     def __getitem__(self, index):
-        return self.array[index]
+        if isinstance(index, slice):
+            return self.toboollist()[index]
+        if index < 0:
+            index += self.length
+        if not 0 <= index < self.length:
+            raise IndexError, index
+        return bool(self.bits[index >> 3] & (0x80 >> (index & 7)))
 
     def __len__(self):
         return self.length
 
+    def __iter__(self):
+        return iter(self.toboollist())
+
     def tostring(self):
-        booleans = self.array
-        t = reverse_lookup_table
-        s = len(booleans) % 8
-        r = [ t[tuple(booleans[x:x+8])] for x in xrange(0, len(booleans)-s, 8) ]
-        if s:
-            r += t[tuple(booleans[-s:] + ([0] * (8-s)))]
-        return ''.join(r)
+        return str(self.bits)
 
     def complete(self):
         return not self.numfalse
 
     def copy(self):
-        return self.array[:self.length]
+        return self.toboollist()
 
     def toboollist(self):
-        bools = [False] * self.length
-        for piece in range(0,self.length):
-            bools[piece] = self.array[piece]
+        t = lookup_table
+        bools = []
+        for c in self.bits:
+            bools.extend(t[c])
+        del bools[self.length:]
         return bools
 
     def get_active_ranges(self):
@@ -144,6 +161,76 @@ class Bitfield:
     def get_numtrue(self):
         return self.length - self.numfalse
 
+    def iter_true(self):
+        """ Yields the indices of the bits that are set, in order. Runs of
+        zero bytes are skipped at C speed. """
+        offsets = bitoffset_table
+        for match in nonzero_byte.finditer(str(self.bits)):
+            byteindex = match.start()
+            base = byteindex << 3
+            for offset in offsets[self.bits[byteindex]]:
+                yield base + offset
+
+    def clear_range(self, start, stop):
+        """ Clears bits start up to but not including stop """
+        stop = min(stop, self.length)
+        while start < stop and start & 7:
+            self[start] = False
+            start += 1
+        while stop > start and stop & 7:
+            stop -= 1
+            self[stop] = False
+        if start < stop:
+            first, last = start >> 3, stop >> 3
+            self.numfalse += popcount(str(self.bits[first:last]))
+            self.bits[first:last] = bytearray(last - first)
+
+    #
+    # Bulk set operations, the other Bitfield must have the same length
+    #
+    def _tolong(self):
+        if not self.bits:
+            return 0L
+        return long(hexlify(self.bits), 16)
+
+    def _fromlong(self, value):
+        n = len(self.bits)
+        if n:
+            self.bits = bytearray(unhexlify('%0*x' % (2 * n, value)))
+        self.numfalse = self.length - popcount(str(self.bits))
+
+    def _check_length(self, other):
+        if other.length != self.length:
+            raise ValueError, "bitfields differ in length"
+
+    def __iand__(self, other):
+        self._check_length(other)
+        self._fromlong(self._tolong() & other._tolong())
+        return self
+
+    def __ior__(self, other):
+        self._check_length(other)
+        self._fromlong(self._tolong() | other._tolong())
+        return self
+
+    def __and__(self, other):
+        result = Bitfield(copyfrom = self)
+        result &= other
+        return result
+
+    def __or__(self, other):
+        result = Bitfield(copyfrom = self)
+        result |= other
+        return result
+
+    def andnot(self, other):
+        """ Returns a new Bitfield with the bits set in self but not in
+        other, e.g., the pieces a peer has that we do not have. """
+        self._check_length(other)
+        result = Bitfield(copyfrom = self)
+        result._fromlong(self._tolong() & ~other._tolong())
+        return result
+
 
 def test_bitfield():
     try:
@@ -224,3 +311,16 @@ def test_bitfield():
     assert len(x) == 8
     assert x.numfalse == 5
     assert x.tostring() == chr(0xC4)
+    x = Bitfield(9, chr(0xC4) + chr(0x80))
+    assert x[-1] and x[0] and not x[2]
+    assert x[1:3] == [True, False]
+    assert list(x.iter_true()) == [0, 1, 5, 8]
+    x.clear_range(1, 9)
+    assert x.numfalse == 8
+    assert x.tostring() == chr(0x80) + chr(0)
+    a = Bitfield(10, chr(0xF0) + chr(0x40))
+    b = Bitfield(10, chr(0x3C) + chr(0xC0))
+    assert (a & b).tostring() == chr(0x30) + chr(0x40)
+    assert (a | b).tostring() == chr(0xFC) + chr(0xC0)
+    assert a.andnot(b).tostring() == chr(0xC0) + chr(0)
+    assert a.andnot(b).numfalse == 8
@@ -11,6 +11,8 @@ from BT1.btformats import check_message
 from BT1.Choker import Choker
 from BT1.Storage import Storage
 from BT1.StorageWrapper import StorageWrapper
+from BT1.DiskIO import DiskIOExecutor
+from BT1.WriteJournal import WriteJournal
 from BT1.FileSelector import FileSelector
 from BT1.Uploader import Upload
 from BT1.Downloader import Downloader
@@ -94,6 +96,8 @@ class BT1Download:
         self.downloader = None
         self.storagewrapper = None
         self.fileselector = None
+        self.diskio = None
+        self.journal = None
         self.super_seeding_active = False
         self.filedatflag = Event()
         self.spewflag = Event()
@@ -313,6 +317,10 @@ class BT1Download:
 
         self.storage = Storage(self.files, self.info['piece length'], 
                                self.doneflag, self.config, disabled_files)
+        if self.config.get('resume_journal'):
+            self.journal = WriteJournal(self.config['resume_journal'], 
+                                        self.info['piece length'])
+            self.storage.set_journal(self.journal)
 
         # Merkle: Are we dealing with a Merkle torrent y/n?
         if self.info.has_key('root hash'):
@@ -397,6 +405,12 @@ class BT1Download:
         
         self.checking = False
 
+        if self.config.get('disk_io_threads', 0) > 0:
+            self.diskio = DiskIOExecutor(self.storage, self.config['disk_io_threads'], 
+                                         self.config['disk_io_queue_size'], 
+                                         self.rawserver.add_task, self._failed)
+            self.storagewrapper.set_diskio(self.diskio)
+
         # Arno, 2010-08-11: STBSPEED: if at all, loop only over pieces I have, 
         # not piece range.
         completeondisk = (self.storagewrapper.get_amount_left() == 0)
@@ -634,6 +648,8 @@ class BT1Download:
     def shutdown(self):
         if self.checking or self.started:
             self.storagewrapper.sync()
+            if self.diskio is not None:
+                self.diskio.shutdown()
             self.storage.close()
             self.rerequest_stopped()
         resumedata = None
@@ -641,6 +657,8 @@ class BT1Download:
             if not self.failed:
                 self.fileselector.finish()
                 resumedata = self.fileselector.pickle()
+        if self.journal is not None:
+            self.journal.close()
         if self.voddownload is not None:
             self.voddownload.stop()
         return resumedata
@@ -0,0 +1,125 @@
+# see LICENSE.txt for license information
+#
+# Edge-triggered epoll() backend for SocketHandler. It offers the same
+# register/unregister/poll interface as select.poll (and selectpoll.py), so
+# SocketHandler can use it as a drop-in. Timeouts are in milliseconds, like
+# select.poll.
+#
+# With edge-triggered notification the kernel only reports a socket when its
+# state changes. SocketHandler reads at most one buffer per socket per loop
+# iteration to stay fair, so after each read it calls rearm() to have the
+# socket reported again on the next poll(), until a read returns EWOULDBLOCK.
+#
+
+import sys
+import select
+from select import POLLIN, POLLOUT, POLLERR, POLLHUP
+from types import IntType
+
+DEBUG = False
+
+def available():
+    """ Returns whether this platform has epoll() support """
+    return hasattr(select, 'epoll')
+
+# On Linux the EPOLL* flags have the same values as the POLL* flags
+NATIVE_FLAGS = available() and \
+    (select.EPOLLIN, select.EPOLLOUT, select.EPOLLERR, select.EPOLLHUP) == \
+    (POLLIN, POLLOUT, POLLERR, POLLHUP)
+
+
+class poll:
+    def __init__(self, edge_triggered = True):
+        self.edge_triggered = edge_triggered
+        self.epoll = select.epoll()
+        # {fileno: poll-style eventmask} of registered descriptors
+        self.registered = {}
+        # {fileno: poll-style eventmask} to report again on next poll()
+        self.ready = {}
+
+    def _to_epoll(self, t):
+        mask = 0
+        if t & POLLIN:
+            mask |= select.EPOLLIN
+        if t & POLLOUT:
+            mask |= select.EPOLLOUT
+        if self.edge_triggered:
+            mask |= select.EPOLLET
+        return mask
+
+    def _from_epoll(self, mask):
+        t = 0
+        if mask & select.EPOLLIN:
+            t |= POLLIN
+        if mask & select.EPOLLOUT:
+            t |= POLLOUT
+        if mask & select.EPOLLERR:
+            t |= POLLERR
+        if mask & select.EPOLLHUP:
+            t |= POLLHUP
+        return t
+
+    def register(self, f, t):
+        if type(f) != IntType:
+            f = f.fileno()
+        old = self.registered.get(f)
+        if old == t:
+            # Don't make a syscall when nothing changes, SocketHandler
+            # reregisters on every write.
+            return
+        if old is None:
+            self.epoll.register(f, self._to_epoll(t))
+        else:
+            self.epoll.modify(f, self._to_epoll(t))
+        self.registered[f] = t
+
+    def unregister(self, f):
+        if type(f) != IntType:
+            f = f.fileno()
+        if f in self.registered:
+            del self.registered[f]
+            self.ready.pop(f, None)
+            try:
+                self.epoll.unregister(f)
+            except (IOError, OSError):
+                # Already closed, the kernel dropped it
+                pass
+
+    def rearm(self, f, t):
+        """ Report file descriptor f again with events t on the next poll()
+        without waiting for the kernel to signal a new edge. """
+        if f in self.registered:
+            ready = self.ready
+            ready[f] = ready.get(f, 0) | t
+
+    def poll(self, timeout = None):
+        if timeout is None or timeout < 0:
+            timeout = -1
+        else:
+            timeout = timeout / 1000.0
+        if self.ready:
+            timeout = 0
+        try:
+            events = self.epoll.poll(timeout)
+        except IOError, e:
+            # EINTR, let the caller loop around
+            if DEBUG:
+                print >>sys.stderr,"epollpoll: poll:",str(e)
+            events = []
+
+        if not NATIVE_FLAGS:
+            events = [(f, self._from_epoll(mask)) for (f, mask) in events]
+        if not self.ready:
+            return events
+
+        ready = self.ready
+        self.ready = {}
+        result = dict(events)
+        for f, t in ready.iteritems():
+            t &= self.registered.get(f, 0)
+            if t:
+                result[f] = result.get(f, 0) | t
+        return result.items()
+
+    def close(self):
+        self.epoll.close()
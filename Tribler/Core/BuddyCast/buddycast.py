@@ -172,8 +172,8 @@ from Tribler.Core.Utilities.unicode import dunno2unicode
 from Tribler.Core.simpledefs import NTFY_ACT_MEET, NTFY_ACT_RECOMMEND, NTFY_MYPREFERENCES, NTFY_INSERT, NTFY_DELETE
 from Tribler.Core.NATFirewall.DialbackMsgHandler import DialbackMsgHandler
 from Tribler.Core.Overlay.SecureOverlay import OLPROTO_VER_FIRST, OLPROTO_VER_SECOND, OLPROTO_VER_THIRD, OLPROTO_VER_FOURTH, OLPROTO_VER_FIFTH, OLPROTO_VER_SIXTH, OLPROTO_VER_SEVENTH, OLPROTO_VER_EIGHTH, OLPROTO_VER_ELEVENTH, OLPROTO_VER_FIFTEENTH, OLPROTO_VER_CURRENT, OLPROTO_VER_LOWEST
-from Tribler.Core.CacheDB.sqlitecachedb import bin2str, str2bin
-from similarity import P2PSim_Single, P2PSim_Full, P2PSimColdStart
+from Tribler.Core.CacheDB.sqlitecachedb import bin2str, str2bin, BATCH_COMMIT
+from similarity import P2PSimColdStart, PreferenceMatrix
 from TorrentCollecting import SimpleTorrentCollecting   #, TiT4TaTTorrentCollecting
 from Tribler.Core.Statistics.Logger import OverlayLogger
 from Tribler.Core.Statistics.Crawler import Crawler
@@ -2166,6 +2166,7 @@ class DataHandler:
         self.myfriends = Set() # FIXME: implement friends
         self.myprefs = []    # torrent ids
         self.peers = {}    # peer_id: [similarity, last_seen, prefs(array('l',[torrent_id])] 
+        self.pref_matrix = PreferenceMatrix() # preferences of the cached peers
         self.default_peer = [0, 0, None]
         self.permid = self.getMyPermid()
         self.ntorrents = 0
@@ -2238,20 +2239,24 @@ class DataHandler:
         # get most recent preferences, and sort by torrent id
         res = self.mypref_db.getAll('torrent_id', order_by='creation_time desc', limit=num_pref)
         self.myprefs = [p[0] for p in res]
+        self.pref_matrix.setMyPreferences(self.myprefs)
                 
     def loadAllPeers(self, num_peers=None):
         """ Read peers from db and put them in self.peers.
             At most num_peers (=self.max_num_peers) recently seen peers can be cached.
             
         """
-        peer_values = self.peer_db.getAll(['peer_id','similarity','last_seen'], order_by='last_connected desc', limit=num_peers)
+        peer_values = self.peer_db.getAll(['peer_id','similarity','last_seen','num_prefs'], order_by='last_connected desc', limit=num_peers)
         self.peers = dict(zip([p[0] for p in peer_values], [[p[1],p[2],array('l', [])] for p in peer_values])) 
 
-        """ Not needed due to new similarity function
-        user_item_pairs = self.pref_db.getRecentPeersPrefs('last_connected',num_peers)
-        for pid,tid in user_item_pairs:
-            self.peers[pid][PEER_PREF_POS].append(tid)
-        """
+        # The preferences of these peers, to compute their similarity 
+        user_prefs = {}
+        for pid,tid in self.pref_db.getRecentPeersPrefs('last_connected',num_peers):
+            user_prefs.setdefault(pid, []).append(tid)
+        self.pref_matrix = PreferenceMatrix()
+        self.pref_matrix.setMyPreferences(self.myprefs)
+        for p in peer_values:
+            self.pref_matrix.addPeerPreferences(p[0], user_prefs.get(p[0], []), p[3])
         #print >> sys.stderr, '**************** loadAllPeers', len(self.peers)
 
 #        for pid in self.peers:
@@ -2315,8 +2320,7 @@ class DataHandler:
         #call full_update
         updates = {}
         if len(self.myprefs) > 0:
-           not_peer_id = self.getPeerID(self.permid)
-           similarities = P2PSim_Full(self.simi_db.getPeersWithOverlap(not_peer_id, self.myprefs), len(self.myprefs))
+           similarities = self.pref_matrix.getSimilarities()
             
            for peer_id in self.peers:
                if peer_id in similarities:
@@ -2402,6 +2406,7 @@ class DataHandler:
         
         if torrent_id not in self.myprefs:
             insort(self.myprefs, torrent_id)
+            self.pref_matrix.addMyPreference(torrent_id)
             self.old_peer_num = 0
             self.updateAllSim() # time-consuming
             #self.total_pref_changed += self.update_i2i_threshold
@@ -2410,6 +2415,7 @@ class DataHandler:
         torrent_id = self.torrent_db.getTorrentID(infohash)
         if torrent_id in self.myprefs:
             self.myprefs.remove(torrent_id)
+            self.pref_matrix.removeMyPreference(torrent_id)
             self.old_peer_num = 0
             self.updateAllSim()
             #self.total_pref_changed += self.update_i2i_threshold
@@ -2495,6 +2501,7 @@ class DataHandler:
             sim = self.peer_db.getPeerSim(peer_permid)
             peerprefs = self.pref_db.getPrefList(peer_permid)    # [torrent_id]
             self.peers[peer_id] = [last_seen, sim, array('l', peerprefs)]    # last_seen, similarity, pref
+            self.pref_matrix.addPeerPreferences(peer_id, peerprefs, self.peer_db.getOne('num_prefs', peer_id=peer_id))
         else:
             self.peers[peer_id][PEER_LASTSEEN_POS] = last_seen
                     
@@ -2562,6 +2569,7 @@ class DataHandler:
         if len(prefs2add) > 0:
             self.pref_db.addPreferences(peer_permid, prefs2add, recvTime, is_torrent_id=True, commit=commit) 
             peer_id = self.getPeerID(peer_permid)
+            self.pref_matrix.addPeerPreferences(peer_id, [pref['torrent_id'] for pref in prefs2add])
             self.updateSimilarity(peer_id, commit=commit)
             
         if len(pops2update)>0:
@@ -2605,7 +2613,9 @@ class DataHandler:
         if len(self.myprefs) == 0:
             return
         
-        sim = P2PSim_Single(self.simi_db.getOverlapWithPeer(peer_id, self.myprefs), len(self.myprefs));
+        # the number of preferences it reported in its last BuddyCast message
+        self.pref_matrix.setPeerNumPrefs(peer_id, self.peer_db.getOne('num_prefs', peer_id=peer_id))
+        sim = self.pref_matrix.getSimilarity(peer_id)
         self.peers[peer_id][PEER_SIM_POS] = sim
         if update_db and sim>0:
             self.peer_db.updatePeerSims([(sim,peer_id)], commit=commit)
@@ -2776,10 +2786,12 @@ class DataHandler:
             
         # Arno, 2010-02-04: Since when are collected torrents also a peer pref?
 
+        # Nothing reads the popularity of collected torrents right away,
+        # commit it together with later writes
         if cache_db_data['coll']:
             self.addCollectedTorrentsPopularity(sender_permid, 
                                     cache_db_data['coll'], selversion, recvTime, 
-                                    commit=True)
+                                    commit=BATCH_COMMIT)
         
                 
         #print hash(k), peer_data[k]
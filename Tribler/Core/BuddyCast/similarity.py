@@ -23,6 +23,7 @@ Test:
 """
 
 from sets import Set
+from array import array
 
 def P2PSim(pref1, pref2):
     """ Calculate simple similarity between peers """
@@ -120,6 +121,82 @@ def P2PSim_Full(db_rows, nmyprefs):
         similarity[db_row[0]] = P2PSim_Single(db_row, nmyprefs)
     return similarity
 
+class PreferenceMatrix:
+    """
+        The preferences of peers, kept as sparse integer arrays by torrent, and
+        the overlap of each peer with my preferences. The similarities of all 
+        peers to me (see P2PSim_Single) follow from one pass over the peers of 
+        my preferences, and are updated incrementally when preferences are 
+        added, instead of querying the overlap of each peer from the database.
+    """
+    
+    def __init__(self):
+        self.owners = {}     # torrent_id: array('l', [peer_id])
+        self.prefs = {}      # peer_id: array('l', [torrent_id])
+        self.nprefs = {}     # peer_id: number of preferences the peer reported
+        self.myprefs = {}    # torrent_id: True
+        self.overlap = {}    # peer_id: number of my preferences the peer has
+
+    def addPeerPreferences(self, peer_id, torrent_ids, num_prefs=None):
+        """ Add the preferences of a peer. num_prefs is the number of 
+        preferences it reported, the number added so far if None """
+        peer_prefs = self.prefs.get(peer_id)
+        if peer_prefs is None:
+            peer_prefs = self.prefs[peer_id] = array('l')
+        for torrent_id in torrent_ids:
+            if torrent_id in peer_prefs:
+                continue
+            peer_prefs.append(torrent_id)
+            owners = self.owners.get(torrent_id)
+            if owners is None:
+                owners = self.owners[torrent_id] = array('l')
+            owners.append(peer_id)
+            if torrent_id in self.myprefs:
+                self.overlap[peer_id] = self.overlap.get(peer_id, 0) + 1
+        if num_prefs is not None:
+            self.nprefs[peer_id] = num_prefs
+        elif self.nprefs.get(peer_id) < len(peer_prefs):
+            self.nprefs[peer_id] = len(peer_prefs)
+
+    def setPeerNumPrefs(self, peer_id, num_prefs):
+        self.nprefs[peer_id] = num_prefs
+
+    def setMyPreferences(self, torrent_ids):
+        self.myprefs = dict.fromkeys(torrent_ids, True)
+        self.overlap = {}
+        for torrent_id in self.myprefs:
+            for peer_id in self.owners.get(torrent_id, ()):
+                self.overlap[peer_id] = self.overlap.get(peer_id, 0) + 1
+
+    def addMyPreference(self, torrent_id):
+        if torrent_id not in self.myprefs:
+            self.myprefs[torrent_id] = True
+            for peer_id in self.owners.get(torrent_id, ()):
+                self.overlap[peer_id] = self.overlap.get(peer_id, 0) + 1
+
+    def removeMyPreference(self, torrent_id):
+        if torrent_id in self.myprefs:
+            del self.myprefs[torrent_id]
+            for peer_id in self.owners.get(torrent_id, ()):
+                self.overlap[peer_id] -= 1
+                if not self.overlap[peer_id]:
+                    del self.overlap[peer_id]
+
+    def getSimilarity(self, peer_id):
+        """ Same as P2PSim_Single with the overlap from the database """
+        overlap = self.overlap.get(peer_id)
+        if not overlap:
+            return 0
+        return P2PSim_Single((peer_id, self.nprefs.get(peer_id), overlap), len(self.myprefs))
+
+    def getSimilarities(self):
+        """ Same as P2PSim_Full with the peers with overlap from the 
+        database """
+        nmyprefs = len(self.myprefs)
+        nprefs = self.nprefs
+        return dict([(peer_id, P2PSim_Single((peer_id, nprefs.get(peer_id), overlap), nmyprefs))
+                     for peer_id, overlap in self.overlap.iteritems()])
+
 def P2PSimColdStart(choose_from, not_in, nr):
     """
         choose_from has keys: ip port oversion num_torrents
@@ -3,6 +3,7 @@
 
 import sys
 import threading
+from time import time
 from traceback import print_exc, print_stack
 
 from Tribler.Core.simpledefs import *
@@ -20,7 +21,18 @@ class Notifier:
             raise RuntimeError, "Notifier is singleton"
         self.pool = pool
         self.observers = []    
+        # Observers by (subject, changeType, id), with id None for the 
+        # observers of all objects
+        self.index = {}
+        self.seqno = 0
         self.observerLock = threading.Lock()
+
+        # Statistics, see get_stats()
+        self.events = 0
+        self.events_per_second = 0.0
+        self.rate_start = time()
+        self.rate_events = 0
+        self.pending = 0 # observer calls that were not made yet
         Notifier.__single = self
         
     def getInstance(*args, **kw):
@@ -29,7 +41,7 @@ class Notifier:
         return Notifier.__single
     getInstance = staticmethod(getInstance)
     
-    def add_observer(self, func, subject, changeTypes = [NTFY_UPDATE, NTFY_INSERT, NTFY_DELETE], id = None):
+    def add_observer(self, func, subject, changeTypes = [NTFY_UPDATE, NTFY_INSERT, NTFY_DELETE], id = None, cache = 0):
         """
         Add observer function which will be called upon certain event
         Example: 
@@ -38,28 +50,39 @@ class Notifier:
         addObserver(NTFY_PEERS, [NTFY_SEARCH_RESULT], 'a_search_id') -> get 
                     callbacks when peer-searchresults of of search
                     with id=='a_search_id' come in
+        If cache is given, the events of the next cache seconds are collected
+        and the observer is called once for each subject and changeType with
+        the list of object ids, instead of once for each event.
         """
         assert type(changeTypes) == list
         assert subject in self.SUBJECTS
         
-        obs = (func, subject, changeTypes, id)
         self.observerLock.acquire()
-        self.observers.append(obs)
-        self.observerLock.release()
+        try:
+            obs = Observer(func, subject, changeTypes, id, cache, self.seqno)
+            self.seqno += 1
+            self.observers.append(obs)
+            for changeType in changeTypes:
+                self.index.setdefault((subject, changeType, id), []).append(obs)
+        finally:
+            self.observerLock.release()
         
     def remove_observer(self, func):
         """ Remove all observers with function func
         """
         
         self.observerLock.acquire()
-        i=0
-        while i < len(self.observers):
-            ofunc = self.observers[i][0]
-            if ofunc == func:
-                del self.observers[i]
-            else:
-                i+=1
-        self.observerLock.release()
+        try:
+            for obs in [obs for obs in self.observers if obs.func == func]:
+                self.observers.remove(obs)
+                obs.removed = True
+                for changeType in obs.changeTypes:
+                    key = (obs.subject, changeType, obs.id)
+                    self.index[key].remove(obs)
+                    if not self.index[key]:
+                        del self.index[key]
+        finally:
+            self.observerLock.release()
         
     def notify(self, subject, changeType, obj_id, *args):
         """
@@ -69,22 +92,126 @@ class Notifier:
         assert subject in self.SUBJECTS
         
         self.observerLock.acquire()
-        for ofunc, osubject, ochangeTypes, oid in self.observers:
-            try:
-                if (subject == osubject and
-                    changeType in ochangeTypes and
-                    (oid is None or oid == obj_id)):
-                    tasks.append(ofunc)
-            except:
-                print_stack()
-                print_exc()
-                print >>sys.stderr,"notify: OIDs were",`oid`,`obj_id`
-                
-        self.observerLock.release()
+        try:
+            self.events += 1
+            self.rate_events += 1
+            now = time()
+            if now - self.rate_start >= 1.0:
+                self.events_per_second = self.rate_events / (now - self.rate_start)
+                self.rate_start = now
+                self.rate_events = 0
+
+            observers = self.index.get((subject, changeType, None), [])
+            if obj_id is not None:
+                try:
+                    byid = self.index.get((subject, changeType, obj_id), [])
+                except TypeError:
+                    print_stack()
+                    print_exc()
+                    print >>sys.stderr,"notify: OID was",`obj_id`
+                    byid = []
+                if byid:
+                    # in the order they were added
+                    observers = observers + byid
+                    observers.sort(key = lambda obs: obs.seqno)
+
+            for obs in observers:
+                if obs.cache:
+                    if obs.add_event(subject, changeType, obj_id):
+                        self.pending += 1
+                        timer = threading.Timer(obs.cache, self._flush, (obs,))
+                        timer.setDaemon(True)
+                        timer.start()
+                else:
+                    tasks.append(obs.func)
+            self.pending += len(tasks)
+        finally:
+            self.observerLock.release()
+
         args = [subject, changeType, obj_id] + list(args)
         for task in tasks:
-            if self.pool:
-                self.pool.queueTask(task, args)
+            self._call(task, args)
+
+    def _call(self, task, args):
+        def notifier_call():
+            self.observerLock.acquire()
+            self.pending -= 1
+            self.observerLock.release()
+            task(*args)
+
+        if self.pool:
+            self.pool.queueTask(notifier_call)
+        else:
+            notifier_call() # call observer function in this thread
+
+    def _flush(self, obs):
+        """ Called by a Timer thread at the end of the cache window of obs """
+        self.observerLock.acquire()
+        try:
+            self.pending -= 1
+            batches = obs.take_events()
+        finally:
+            self.observerLock.release()
+        if obs.removed:
+            return
+        for subject, changeType, obj_ids in batches:
+            self.observerLock.acquire()
+            self.pending += 1
+            self.observerLock.release()
+            self._call(obs.func, [subject, changeType, obj_ids])
+
+    def get_stats(self):
+        """ Returns the number of events notified, the number per second 
+        and the number of observer calls waiting to be made """
+        self.observerLock.acquire()
+        try:
+            return {'events':self.events,
+                    'events_per_second':self.events_per_second,
+                    'pending':self.pending}
+        finally:
+            self.observerLock.release()
+
+
+class Observer:
+    """ An observer function and the events it is interested in """
+    
+    def __init__(self, func, subject, changeTypes, id, cache, seqno):
+        self.func = func
+        self.subject = subject
+        self.changeTypes = changeTypes
+        self.id = id
+        self.cache = cache
+        self.seqno = seqno
+        self.removed = False
+        # Events collected during the cache window, as 
+        # [(subject, changeType, [obj_id])], and the object ids already 
+        # collected by (subject, changeType, obj_id)
+        self.events = []
+        self.seen = {}
+        
+    def add_event(self, subject, changeType, obj_id):
+        """ Returns True if this is the first event of a cache window """
+        first = not self.events
+        key = (subject, changeType, obj_id)
+        try:
+            seen = key in self.seen
+        except TypeError:
+            # unhashable obj_id, not merged with others
+            seen = False
+            key = None
+        if not seen:
+            for esubject, echangeType, obj_ids in self.events:
+                if esubject == subject and echangeType == changeType:
+                    obj_ids.append(obj_id)
+                    break
             else:
-                task(*args) # call observer function in this thread
+                self.events.append((subject, changeType, [obj_id]))
+            if key is not None:
+                self.seen[key] = True
+        return first
 
+    def take_events(self):
+        events = self.events
+        self.events = []
+        self.seen = {}
+        return events
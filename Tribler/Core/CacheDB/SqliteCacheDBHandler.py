@@ -5,7 +5,7 @@
 # for any function you add to database.
 # Please reuse the functions in sqlitecachedb as much as possible
 
-from Tribler.Core.CacheDB.sqlitecachedb import SQLiteCacheDB, bin2str, str2bin, NULL
+from Tribler.Core.CacheDB.sqlitecachedb import SQLiteCacheDB, bin2str, str2bin, NULL, BATCH_COMMIT
 from copy import deepcopy,copy
 from traceback import print_exc
 from time import time
@@ -21,7 +21,8 @@ from sets import Set
 import math
 import re
 
-from maxflow import Network
+from bartergraph import BarterGraph
+from torrentrows import TorrentResultSet
 from math import atan, pi
 
 
@@ -1101,6 +1102,9 @@ class TorrentDBHandler(BasicDBHandler):
                 'num_seeders', 'num_leechers', 'comment']
         self.existed_torrents = Set()
 
+        # Whether the keywords of the torrents are in the TorrentFTS
+        # full-text index, see searchNames()
+        self.fts = self._hasFullTextIndex()
 
         self.value_name = ['C.torrent_id', 'category_id', 'status_id', 'name', 'creation_date', 'num_files',
                       'num_leechers', 'num_seeders', 'length',
@@ -1110,6 +1114,13 @@ class TorrentDBHandler(BasicDBHandler):
         self.value_name_for_channel = ['C.torrent_id', 'infohash', 'name', 'torrent_file_name', 'length', 'creation_date', 'num_files', 'thumbnail', 'insert_time', 'secret', 'relevance', 'source_id', 'category_id', 'status_id', 'num_seeders', 'num_leechers', 'comment']
 
 
+    def _hasFullTextIndex(self):
+        """ Returns whether the database has the TorrentFTS full-text index.
+        The v8 upgrade does not create it if SQLite has no FTS3 support,
+        searchNames() then uses the InvertedIndex. """
+        sql = "SELECT name FROM sqlite_master WHERE type='table' AND name='TorrentFTS'"
+        return self._db.fetchone(sql) is not None
+
     def register(self, category, torrent_dir):
         self.category = category
         self.torrent_dir = torrent_dir
@@ -1255,6 +1266,9 @@ class TorrentDBHandler(BasicDBHandler):
             self._db.executemany(u"INSERT OR IGNORE INTO InvertedIndex VALUES(?, ?)", values, commit=False)
             if DEBUG:
                 print >> sys.stderr, "torrentdb: Extending the InvertedIndex table with", len(values), "new keywords for", torrent_name
+            if self.fts:
+                self._db.execute_write(u"DELETE FROM TorrentFTS WHERE docid = ?", (torrent_id,), commit=False)
+                self._db.execute_write(u"INSERT INTO TorrentFTS (docid, keywords) VALUES(?, ?)", (torrent_id, u' '.join(keywords)), commit=False)
 
         # vliegendhart: extract terms and bi-term phrase from Torrent and store it
         nb = NetworkBuzzDBHandler.getInstance()
@@ -1405,6 +1419,8 @@ class TorrentDBHandler(BasicDBHandler):
                 self._db.update(self.table_name, where="torrent_id=%d"%torrent_id, commit=commit, torrent_file_name=None)
             else:
                 self._db.delete(self.table_name, commit=commit, torrent_id=torrent_id)
+                if self.fts:
+                    self._db.execute_write(u"DELETE FROM TorrentFTS WHERE docid = ?", (torrent_id,), commit=commit)
                 # vliegendhart: synch bi-term phrase table
                 nb = NetworkBuzzDBHandler.getInstance()
                 nb.deleteTorrent(torrent_id, commit)
@@ -1597,6 +1613,11 @@ class TorrentDBHandler(BasicDBHandler):
 
         niels 25-10-2010: changed behaviour to left join TorrentTracker, due to magnet links
         """
+        return self.getTorrentRows(category_name, range, library, sort, reverse).todicts()
+
+    def getTorrentRows(self, category_name = 'all', range = None, library = False, sort = None, reverse = False):
+        """ Like getTorrents(), but returns a TorrentResultSet which only
+        decodes the fields of a torrent when they are read """
 
         #print >> sys.stderr, 'TorrentDBHandler: getTorrents(%s, %s, %s, %s, %s)' % (category_name, range, library, sort, reverse)
         s = time()
@@ -1645,48 +1666,50 @@ class TorrentDBHandler(BasicDBHandler):
 
         #print >>sys.stderr,"TorrentDBHandler: getTorrents: getAll returned ###################",len(res_list)
 
-        torrent_list = self.valuelist2torrentlist(value_name,res_list,ranks,mypref_stats)
+        torrent_list = self.valuelist2resultset(value_name,res_list,ranks,mypref_stats)
         del res_list
         del mypref_stats
         return torrent_list
 
     def valuelist2torrentlist(self,value_name,res_list,ranks,mypref_stats):
+        return self.valuelist2resultset(value_name,res_list,ranks,mypref_stats).todicts()
+
+    def valuelist2resultset(self,value_name,res_list,ranks,mypref_stats):
+        value_name[0] = 'torrent_id'
+        decoders = self._getTorrentDecoders()
+        decoders['simRank'] = ('infohash', lambda infohash: ranksfind(ranks,infohash))
+        decoders['last_check_time'] = ('last_check', None)
+        torrent_list = TorrentResultSet(value_name, res_list, decoders, ('last_check', 'source_id', 'category_id', 'status_id'))
+
+        if mypref_stats:
+            for i in xrange(len(res_list)):
+                torrent_id = res_list[i][0]
+                if torrent_id in mypref_stats:
+                    # add extra info for torrent in mypref
+                    data = mypref_stats[torrent_id]  #(create_time,progress,destdir)
+                    torrent = torrent_list[i]
+                    torrent['myDownloadHistory'] = True
+                    torrent['download_started'] = data[0]
+                    torrent['progress'] = data[1]
+                    torrent['destdir'] = data[2]
 
-        torrent_list = []
-        for item in res_list:
-            value_name[0] = 'torrent_id'
-            torrent = dict(zip(value_name, item))
-
-            try:
-                torrent['source'] = self.id2src[torrent['source_id']]
-            except:
-                print_exc()
-                # Arno: RSS subscription and id2src issue
-                torrent['source'] = 'http://some/RSS/feed'
-
-            torrent['category'] = [self.id2category[torrent['category_id']]]
-            torrent['status'] = self.id2status[torrent['status_id']]
-            torrent['simRank'] = ranksfind(ranks,torrent['infohash'])
-            torrent['infohash'] = str2bin(torrent['infohash'])
-            #torrent['num_swarm'] = torrent['num_seeders'] + torrent['num_leechers']
-            torrent['last_check_time'] = torrent['last_check']
-            del torrent['last_check']
-            del torrent['source_id']
-            del torrent['category_id']
-            del torrent['status_id']
-            torrent_id = torrent['torrent_id']
-            if mypref_stats is not None and torrent_id in mypref_stats:
-                # add extra info for torrent in mypref
-                torrent['myDownloadHistory'] = True
-                data = mypref_stats[torrent_id]  #(create_time,progress,destdir)
-                torrent['download_started'] = data[0]
-                torrent['progress'] = data[1]
-                torrent['destdir'] = data[2]
+        return torrent_list
 
-            #print >>sys.stderr,"TorrentDBHandler: GET TORRENTS",`torrent`
+    def _getTorrentDecoders(self):
+        """ Returns the decoders of the fields of the torrents in a
+        TorrentResultSet that are not stored as is """
+        return {'source': ('source_id', self._decodeSource),
+                'category': ('category_id', lambda category_id: [self.id2category[category_id]]),
+                'status': ('status_id', self.id2status.__getitem__),
+                'infohash': ('infohash', str2bin)}
 
-            torrent_list.append(torrent)
-        return  torrent_list
+    def _decodeSource(self, source_id):
+        try:
+            return self.id2src[source_id]
+        except:
+            print_exc()
+            # Arno: RSS subscription and id2src issue
+            return 'http://some/RSS/feed'
 
     def getRanks(self):
         value_name = 'infohash'
@@ -1766,7 +1789,16 @@ class TorrentDBHandler(BasicDBHandler):
             sql_update_sims = 'UPDATE Torrent SET relevance=? WHERE torrent_id=?'
             self._db.executemany(sql_update_sims, tid_rel_pairs, commit=commit)
 
-    def searchNames(self,kws,local=True):
+    def searchNames(self,kws,local=True,limit=None,offset=0):
+        """ Returns the torrents with all keywords kws, the best first. With
+        full-text search a keyword also matches the keywords it is a prefix
+        of. limit and offset select a page of the results, remote searches
+        (local=False) return at most 20 torrents. """
+        return self.searchNameRows(kws, local, limit, offset).todicts()
+
+    def searchNameRows(self,kws,local=True,limit=None,offset=0):
+        """ Like searchNames(), but returns a TorrentResultSet which only
+        decodes the fields of a torrent when they are read """
         t1 = time()
         value_name = ['torrent_id',
                       'infohash',
@@ -1788,22 +1820,37 @@ class TorrentDBHandler(BasicDBHandler):
                       'channel_permid',
                       'channel_name']
 
-        sql = ""
-        count = 0
-        for word in kws:
-            word = word.lower()
-            count += 1
-            sql += " select torrent_id from InvertedIndex where word='" + word + "' "
-            if count < len(kws):
-                sql += " intersect "
+        words = []
+        for kw in kws:
+            words.extend(split_into_keywords(kw))
+        if not words:
+            return TorrentResultSet(value_name, [])
 
-        mainsql = """select T.*, C.publisher_id as channel_permid, C.publisher_name as channel_name
+        if self.fts:
+            # split_into_keywords() leaves no FTS query syntax
+            sql = "select docid from TorrentFTS where keywords match ?"
+            args = [' '.join([word + '*' for word in words])]
+        else:
+            sql = " intersect ".join(["select torrent_id from InvertedIndex where word = ?"] * len(words))
+            args = words
+
+        if limit is None and not local:
+            limit = 20
+        if limit is not None or offset:
+            # Select the page of torrents before joining their channels
+            if limit is None:
+                limit = -1
+            sql = """select torrent_id from Torrent where torrent_id in (%s)
+                     order by num_seeders desc, torrent_id limit ? offset ?""" % (sql)
+            args = args + [limit, offset]
+
+        #bug fix: If channel_permid and/or channel_name is None, it cannot bencode
+        #bencode(None) is an Error
+        mainsql = """select T.*, coalesce(C.publisher_id,'') as channel_permid, coalesce(C.publisher_name,'') as channel_name
                      from Torrent T LEFT OUTER JOIN ChannelCast C on T.infohash = C.infohash
-                     where T.torrent_id in (%s) order by T.num_seeders desc """ % (sql)
-        if not local:
-            mainsql += " limit 20"
+                     where T.torrent_id in (%s) order by T.num_seeders desc, T.torrent_id """ % (sql)
 
-        results = self._db.fetchall(mainsql)
+        results = self._db.fetchall(mainsql, args)
 
         channels = set()
         for result in results:
@@ -1817,72 +1864,36 @@ class TorrentDBHandler(BasicDBHandler):
             votes = {}
         t3 = time()
 
-        torrents_dict = {}
-        #step 1, merge torrents keep one with best channel
+        records = {}
+        infohashes = []
+        #step 1, merge torrents keep one with best channel, in the order of the results
         for result in results:
-            torrent = dict(zip(value_name,result))
+            infohash = result[1]
 
-            if torrent['infohash'] in torrents_dict:
-                old_record = torrents_dict[torrent['infohash']]
+            if infohash in records:
+                old_result = records[infohash]
 
                 # check if this channel has votes and if so, is it better than previous channel
-                posvotes, negvotes = votes.get(torrent['channel_permid'], (0,0))
-                old_posvotes, old_negvotes = votes.get(old_record['channel_permid'], (0,0))
+                posvotes, negvotes = votes.get(result[-2], (0,0))
+                old_posvotes, old_negvotes = votes.get(old_result[-2], (0,0))
 
                 if (posvotes - negvotes) > (old_posvotes - old_negvotes):
                     #this is better
-                    torrents_dict[torrent['infohash']] = torrent
+                    records[infohash] = result
             else:
-                torrents_dict[torrent['infohash']] = torrent
+                records[infohash] = result
+                infohashes.append(infohash)
 
         t4 = time()
 
-        #step 2, fix all dict fields
-        torrent_list = []
-
-        #Niels: small optimization, for larger resultlists this will result in a 0.3s speedup
-        dont_sort_torrent_list = []
-        for torrent in torrents_dict.itervalues():
-            #bug fix: If channel_permid and/or channel_name is None, it cannot bencode
-            #bencode(None) is an Error
-            if torrent['channel_permid'] is None:
-                torrent['channel_permid'] = ""
-            if torrent['channel_name'] is None:
-                torrent['channel_name'] = ""
-
-            try:
-                torrent['source'] = self.id2src[torrent['source_id']]
-            except:
-                print_exc()
-                # Arno: RSS subscription and id2src issue
-                torrent['source'] = 'http://some/RSS/feed'
-
-            torrent['category'] = [self.id2category[torrent['category_id']]]
-            torrent['status'] = self.id2status[torrent['status_id']]
-            torrent['simRank'] = -1
-            torrent['infohash'] = str2bin(torrent['infohash'])
-            torrent['last_check_time'] = 0 #torrent['last_check']
-
-            del torrent['source_id']
-            del torrent['category_id']
-            del torrent['status_id']
-
-            torrent['subscriptions'], torrent['neg_votes'] = votes.get(torrent['channel_permid'], (0,0))
-
+        #step 2, the fields are decoded when they are read, the torrents are sorted by the database
+        decoders = self._getTorrentDecoders()
+        decoders['subscriptions'] = ('channel_permid', lambda channel_permid: votes.get(channel_permid, (0,0))[0])
+        decoders['neg_votes'] = ('channel_permid', lambda channel_permid: votes.get(channel_permid, (0,0))[1])
+        constants = {'simRank': -1, 'last_check_time': 0} #torrent['last_check']
+        torrent_list = TorrentResultSet(value_name, [records[infohash] for infohash in infohashes], decoders, ('source_id', 'category_id', 'status_id'), constants)
 
-            if torrent['num_seeders'] > 0:
-                torrent_list.append(torrent)
-            else:
-                dont_sort_torrent_list.append(torrent)
-
-        t5 = time()
-
-        def compare(a,b):
-            return cmp(a['num_seeders'], b['num_seeders'])
-        torrent_list.sort(compare, reverse = True)
-        torrent_list.extend(dont_sort_torrent_list)
-
-        #print >> sys.stderr, "# hits:%d (%d from db, %d sorted); search time:%.3f,%.3f,%.3f,%.3f,%.3f,%.3f" % (len(torrent_list),len(results),len(dont_sort_torrent_list),t2-t1, t3-t2, t4-t3, t5-t4, time()-t5, time()-t1)
+        #print >> sys.stderr, "# hits:%d (%d from db); search time:%.3f,%.3f,%.3f,%.3f,%.3f" % (len(torrent_list),len(results),t2-t1, t3-t2, t4-t3, time()-t4, time()-t1)
         return torrent_list
 
 
@@ -2443,8 +2454,9 @@ class BarterCastDBHandler(BasicDBHandler):
         BasicDBHandler.__init__(self, db,'BarterCast') ## self,db,'BarterCast'
         self.peer_db = PeerDBHandler.getInstance()
 
-        # create the maxflow network
-        self.network = Network({})
+        # the graph of the records, loaded on first use
+        self.graph = None
+        self.graph_lock = threading.RLock()
         self.update_network()
 
         if DEBUG:
@@ -2645,6 +2657,7 @@ class BarterCastDBHandler(BasicDBHandler):
         item['peer_id_to'] = peer_id2
 
         self._db.insert(self.table_name, commit=commit, **item)
+        self._updateGraph(peer_id1, peer_id2, item.get('uploaded'), item.get('downloaded'))
 
     def updateItem(self, (permid_from, permid_to), key, value, commit=True):
 
@@ -2667,6 +2680,8 @@ class BarterCastDBHandler(BasicDBHandler):
             where = "peer_id_from=%s and peer_id_to=%s" % (peer_id1, peer_id2)
             item = {key: value}
             self._db.update(self.table_name, where = where, commit=commit, **item)
+            itemdict[key] = value
+            self._updateGraph(peer_id1, peer_id2, itemdict['uploaded'], itemdict['downloaded'])
 
     def incrementItem(self, (permid_from, permid_to), key, value, commit=True):
         if DEBUG:
@@ -2698,6 +2713,8 @@ class BarterCastDBHandler(BasicDBHandler):
 
             item = {key: new_value}
             self._db.update(self.table_name, where = where, commit=commit, **item)
+            itemdict[key] = new_value
+            self._updateGraph(peer_id1, peer_id2, itemdict['uploaded'], itemdict['downloaded'])
             return new_value
 
         return None
@@ -2736,6 +2753,7 @@ class BarterCastDBHandler(BasicDBHandler):
             where = "peer_id_from=%s and peer_id_to=%s" % (peer_id1, peer_id2)
             item = {'uploaded': ul, 'downloaded':dl}
             self._db.update(self.table_name, where = where, commit=commit, **item)
+            self._updateGraph(peer_id1, peer_id2, ul, dl)
 
     def getPeerIDPairs(self):
         keys = self.getAll(('peer_id_from','peer_id_to'))
@@ -2744,108 +2762,27 @@ class BarterCastDBHandler(BasicDBHandler):
     def getTopNPeers(self, n, local_only = False):
         """
         Return (sorted) list of the top N peers with the highest (combined)
-        values for the given keys. This version uses batched reads and peer_ids
-        in calculation
+        values for the given keys. The totals are kept up to date in memory
+        by BarterGraph as records are written.
         @return a dict containing a 'top' key with a list of (permid,up,down)
         tuples, a 'total_up', 'total_down', 'tribler_up', 'tribler_down' field.
         Sizes are in kilobytes.
         """
 
-        # TODO: this won't scale to many interactions, as the size of the DB
-        # is NxN
-
         if DEBUG:
             print >> sys.stderr, "bartercastdb: getTopNPeers: local = ", local_only
             #print_stack()
 
         n = max(1, n)
-        my_peer_id = self.getPeerID(self.my_permid)
-        total_up = {}
-        total_down = {}
-        # Arno, 2008-10-30: I speculate this is to count transfers only once,
-        # i.e. the DB stored (a,b) and (b,a) and we want to count just one.
-
-        processed =  Set()
-
-
-        value_name = '*'
-        increment = 500
-
-        nrecs = self.size()
-        #print >>sys.stderr,"NEXTtopN: size is",nrecs
-
-        for offset in range(0,nrecs,increment):
-            if offset+increment > nrecs:
-                limit = nrecs-offset
-            else:
-                limit = increment
-            #print >>sys.stderr,"NEXTtopN: get",offset,limit
-
-            reslist = self.getAll(value_name, offset=offset, limit=limit)
-            #print >>sys.stderr,"NEXTtopN: res len is",len(reslist),`reslist`
-            for res in reslist:
-                (peer_id_from,peer_id_to,downloaded,uploaded,last_seen,value) = res
 
-                if local_only:
-                    if not (peer_id_to == my_peer_id or peer_id_from == my_peer_id):
-                        # get only items of my local dealings
-                        continue
-
-                if (not (peer_id_to, peer_id_from) in processed) and (not peer_id_to == peer_id_from):
-                #if (not peer_id_to == peer_id_from):
-
-                    up = uploaded *1024 # make into bytes
-                    down = downloaded *1024
-
-                    if DEBUG:
-                        print >> sys.stderr, "bartercastdb: getTopNPeers: DB entry: (%s, %s) up = %d down = %d" % (self.getNameByID(peer_id_from), self.getNameByID(peer_id_to), up, down)
-
-                    processed.add((peer_id_from, peer_id_to))
-
-                    # fix for multiple my_permids
-                    if peer_id_from == -1: # 'non-tribler':
-                        peer_id_to = my_peer_id
-                    if peer_id_to == -1: # 'non-tribler':
-                        peer_id_from = my_peer_id
-
-                    # process peer_id_from
-                    total_up[peer_id_from] = total_up.get(peer_id_from, 0) + up
-                    total_down[peer_id_from] = total_down.get(peer_id_from, 0) + down
-
-                    # process peer_id_to
-                    total_up[peer_id_to] = total_up.get(peer_id_to, 0) + down
-                    total_down[peer_id_to] = total_down.get(peer_id_to, 0) +  up
-
-
-        # create top N peers
-        top = []
-        min = 0
-
-        for peer_id in total_up.keys():
-
-            up = total_up[peer_id]
-            down = total_down[peer_id]
-
-            if DEBUG:
-                print >> sys.stderr, "bartercastdb: getTopNPeers: total of %s: up = %d down = %d" % (self.getName(peer_id), up, down)
-
-            # we know rank on total upload?
-            value = up
-
-            # check if peer belongs to current top N
-            if peer_id != -1 and peer_id != my_peer_id and (len(top) < n or value > min):
-
-                top.append((peer_id, up, down))
-
-                # sort based on value
-                top.sort(cmp = lambda (p1, u1, d1), (p2, u2, d2): cmp(u2, u1))
-
-                # if list contains more than N elements: remove the last (=lowest value)
-                if len(top) > n:
-                    del top[-1]
-
-                # determine new minimum of values
-                min = top[-1][1]
+        self.graph_lock.acquire()
+        try:
+            graph = self._getGraph()
+            top = graph.getTopNPeers(n, local_only)
+            (total_up, total_down) = graph.getTotals(graph.my_id, local_only)
+            (nontribler_up, nontribler_down) = graph.getTotals(-1, local_only) # -1 = 'non-tribler'
+        finally:
+            self.graph_lock.release()
 
         # Now convert to permid
         peer_ids = [val[0] for val in top]
@@ -2855,19 +2792,19 @@ class BarterCastDBHandler(BasicDBHandler):
         for i in xrange(len(top)):
             peer_id,up,down = top[i]
             permid = perm_ids[i]
-            permidtop.append((permid,up,down))
+            permidtop.append((permid,up*1024,down*1024)) # make into bytes
 
         result = {}
 
         result['top'] = permidtop
 
         # My total up and download, including interaction with non-tribler peers
-        result['total_up'] = total_up.get(my_peer_id, 0)
-        result['total_down'] = total_down.get(my_peer_id, 0)
+        result['total_up'] = total_up*1024
+        result['total_down'] = total_down*1024
 
         # My up and download with tribler peers only
-        result['tribler_up'] = result['total_up'] - total_down.get(-1, 0) # -1 = 'non-tribler'
-        result['tribler_down'] = result['total_down'] - total_up.get(-1, 0) # -1 = 'non-tribler'
+        result['tribler_up'] = result['total_up'] - nontribler_down*1024
+        result['tribler_down'] = result['total_down'] - nontribler_up*1024
 
         if DEBUG:
             print >> sys.stderr, result
@@ -2877,10 +2814,36 @@ class BarterCastDBHandler(BasicDBHandler):
 
     ################################
     def update_network(self):
+        """ Reloads the graph from the database on its next use """
 
-        #Niels: This seems useless, removing...
-        #keys = self.getPeerIDPairs() #getItemList()
-        pass
+        self.graph_lock.acquire()
+        try:
+            self.graph = None
+        finally:
+            self.graph_lock.release()
+
+    def _getGraph(self):
+        # call with graph_lock held
+        if self.graph is not None and self.graph.my_id is None:
+            # The totals depend on my peer_id, reload once it is known
+            if self.getPeerID(self.my_permid) is not None:
+                self.graph = None
+        if self.graph is None:
+            graph = BarterGraph(self.getPeerID(self.my_permid), MAXFLOW_DISTANCE)
+            sql = "SELECT peer_id_from, peer_id_to, uploaded, downloaded FROM BarterCast ORDER BY rowid"
+            for (peer_id_from, peer_id_to, uploaded, downloaded) in self._db.fetchall(sql):
+                graph.setRecord(peer_id_from, peer_id_to, uploaded, downloaded)
+            self.graph = graph
+        return self.graph
+
+    def _updateGraph(self, peer_id_from, peer_id_to, uploaded, downloaded):
+        # Until it is loaded, the graph will read the record from the database
+        self.graph_lock.acquire()
+        try:
+            if self.graph is not None:
+                self.graph.setRecord(peer_id_from, peer_id_to, uploaded, downloaded)
+        finally:
+            self.graph_lock.release()
 
     ################################
     def getMyReputation(self, alpha = ALPHA):
@@ -2888,6 +2851,21 @@ class BarterCastDBHandler(BasicDBHandler):
         rep = atan((self.total_up - self.total_down) * alpha)/(0.5 * pi)
         return rep
 
+    def getReputation(self, permid, alpha = ALPHA):
+        """ Returns the reputation of a peer in [-1, 1], from the maxflow
+        to me minus the maxflow from me over at most MAXFLOW_DISTANCE hops.
+        It is cached until a record it depends on changes. """
+
+        peer_id = self.getPeerID(permid)
+        if peer_id is None:
+            return 0.0
+
+        self.graph_lock.acquire()
+        try:
+            return self._getGraph().getReputation(peer_id, alpha)
+        finally:
+            self.graph_lock.release()
+
 
 class VoteCastDBHandler(BasicDBHandler):
 
@@ -2998,16 +2976,16 @@ class VoteCastDBHandler(BasicDBHandler):
 
     def addVote(self, vote, clone=True):
         if self.hasVote(vote['mod_id'],vote['voter_id']):
-            self.deleteVote(vote['mod_id'],vote['voter_id'])
-        self._db.insert(self.table_name, **vote)
+            self.deleteVote(vote['mod_id'],vote['voter_id'],commit=BATCH_COMMIT)
+        self._db.insert(self.table_name, commit=BATCH_COMMIT, **vote)
 
     def deleteVotes(self, permid):
         sql = 'Delete From VoteCast where mod_id==?'
         self._db.execute_write(sql,(permid,))
 
-    def deleteVote(self, permid, voter_id):
+    def deleteVote(self, permid, voter_id, commit=True):
         sql = 'Delete From VoteCast where mod_id==? and voter_id==?'
-        self._db.execute_write(sql,(permid,voter_id,))
+        self._db.execute_write(sql,(permid,voter_id,),commit=commit)
 
     def getPermid(self, peer_id):
 
@@ -3250,7 +3228,7 @@ class ChannelCastDBHandler(BasicDBHandler):
 
     def addTorrents(self, records):
         sql = "insert or ignore into ChannelCast (publisher_id, publisher_name, infohash, torrenthash, torrentname, time_stamp, signature) Values(?,?,?,?,?,?,?)"
-        self._db.executemany(sql, records)
+        self._db.executemany(sql, records, commit=BATCH_COMMIT)
 
     def selectTorrentsToCollect(self, publisher_id = None):
         if publisher_id:
@@ -3393,8 +3371,9 @@ class ChannelCastDBHandler(BasicDBHandler):
         del results
         return torrent_list
 
-    def searchChannels(self,query):
+    def searchChannels(self,query,limit=-1,offset=0):
         # query would be of the form: "k barack obama" or "p 4fw342d23re2we2w3e23d2334d" permid
+        # limit and offset select a page of the channels found by keywords
         value_name = deepcopy(self.value_name) ##
         if query[0] == 'k':
             # search channels based on keywords
@@ -3403,17 +3382,14 @@ class ChannelCastDBHandler(BasicDBHandler):
             kwlist = split_into_keywords(query[2:])
             kwlist = [keyword for keyword in kwlist if keyword and len(keyword) > 0]
             if len(kwlist) > 0:
-                sql = "select publisher_id, publisher_name from ChannelCast where "
-                count = 0
-                for kw in kwlist:
-                    count += 1
-                    sql += " publisher_name like '%" + kw + "%' "
-                    if count<len(kwlist):
-                        sql += " and "
-
-                sql += " group by publisher_id"
-
-                channellist = self._db.fetchall(sql)
+                # the most popular channels first
+                where = " and ".join(["publisher_name like ?"] * len(kwlist))
+                sql = """select publisher_id from ChannelStats where publisher_id in 
+                         (select publisher_id from ChannelCast where %s) 
+                         order by nr_favorites desc, latest_update desc limit ? offset ?""" % where
+                args = ['%' + kw + '%' for kw in kwlist] + [limit, offset]
+
+                channellist = self._db.fetchall(sql, args)
                 channels = {}
                 allrecords = []
                 for channel in channellist:
@@ -3521,58 +3497,39 @@ class ChannelCastDBHandler(BasicDBHandler):
         return False
 
     def getChannel(self, permid):
-        sql = "Select distinct publisher_id FROM ChannelCast WHERE publisher_id == ?"
-        channels = self._getChannels(sql, (permid,))
+        channels = self._getChannels("S.publisher_id = ?", (permid,))
         if len(channels) > 0:
             return channels[0]
 
     def getChannels(self, permids):
-        publishers = "','".join(permids)
-        sql = "Select distinct publisher_id FROM ChannelCast WHERE publisher_id IN ('" + publishers + "')"
-        return self._getChannels(sql)
+        where = "S.publisher_id IN (" + ",".join(["?"] * len(permids)) + ")"
+        return self._getChannels(where, permids)
 
-    def getAllChannels(self):
+    def getAllChannels(self, limit = None, offset = 0):
         """ Returns all the channels """
-        sql = "Select distinct publisher_id FROM ChannelCast"
-        return self._getChannels(sql, allChannels = True)
+        return self._getChannels(limit = limit, offset = offset)
 
-    def getNewChannels(self, updated_since = None):
+    def getNewChannels(self, updated_since = None, limit = None, offset = 0):
         """ Returns all newest unsubscribed channels, ie the ones with no votes (positive or negative)"""
+        where = "S.publisher_id <> ? AND S.nr_favorites = 0 AND S.nr_spam = 0"
+        args = [bin2str(self.my_permid)]
         if updated_since:
-            sql = "Select distinct publisher_id FROM ChannelCast WHERE publisher_id <> ? Group By publisher_id Having max(ChannelCast.time_stamp) > ?"
-            return self._getChannels(sql,(bin2str(self.my_permid),updated_since), 0)
-        else:
-            sql = "Select distinct publisher_id FROM ChannelCast WHERE publisher_id <> ?"
-            return self._getChannels(sql,(bin2str(self.my_permid),), 0)
-
-    def getLatestUpdated(self, max_nr = 20):
-        def channel_sort(a,b):
-            #first compare local vote, spam -> return -1
-            if a[6] == -1:
-                return 1
-            if b[6] == -1:
-                return -1
-
-            #then compare latest update
-            if a[2] < b[2]:
-                return 1
-            if a[2] > b[2]:
-                return -1
-            #finally compare nr_torrents
-            return cmp(a[4], b[4])
-
-        sql = "Select publisher_id FROM ChannelCast Group By publisher_id Order By max(ChannelCast.time_stamp) DESC Limit ?"
-        return self._getChannels(sql, (max_nr,), cmpF = channel_sort)
-
-    def getMostPopularChannels(self, max_nr = 20):
-        return self.getAllChannels()[:max_nr]
+            where += " AND S.latest_update > ?"
+            args.append(updated_since)
+        return self._getChannels(where, args, limit = limit, offset = offset)
+
+    def getLatestUpdated(self, max_nr = 20, offset = 0):
+        return self._getChannels(order_by = "S.latest_update DESC", limit = max_nr, offset = offset)
+
+    def getMostPopularChannels(self, max_nr = 20, offset = 0):
+        return self._getChannels(limit = max_nr, offset = offset)
 
     def getMySubscribedChannels(self):
         #Sometimes we have no actual channelcast entries, but do know this channel
         sql = "Select mod_id FROM VoteCast Where voter_id = ? AND vote == 2"
         my_sub_channels = [mod_id for mod_id, in self._db.fetchall(sql, (bin2str(self.my_permid),))]
-        sql = "Select distinct publisher_id FROM ChannelCast WHERE publisher_id in (Select mod_id FROM VoteCast Where voter_id = ? AND vote == 2)"
-        channels_with_content = self._getChannels(sql, (bin2str(self.my_permid),))
+        where = "S.publisher_id in (Select mod_id FROM VoteCast Where voter_id = ? AND vote == 2)"
+        channels_with_content = self._getChannels(where, (bin2str(self.my_permid),))
 
         for channel in channels_with_content:
             my_sub_channels.remove(channel[0])
@@ -3584,71 +3541,42 @@ class ChannelCastDBHandler(BasicDBHandler):
         sql = 'Select min(time_stamp), max(time_stamp), count(distinct infohash) From ChannelCast Where publisher_id = ? Group By publisher_id'
         return  self._db.fetchone(sql, (publisher_id,))
 
-    def _getChannels(self, sql, args = None, maxvotes = sys.maxint, minvotes = 0, cmpF = None, allChannels = False):
-        """Returns the channels based on the input sql, if the number of positive votes is less than maxvotes and the number of torrent > 0"""
-        channels = []
-        results = self._db.fetchall(sql, args)
-
-        sqla = "Select count(distinct ChannelCast.infohash), max(ChannelCast.time_stamp) FROM ChannelCast, CollectedTorrent WHERE publisher_id = ? AND status_id <> ? AND ChannelCast.infohash = CollectedTorrent.infohash LIMIT 1"
-        sqlb = "Select publisher_name From ChannelCast Where publisher_id = ? And time_stamp = ? LIMIT 1"
-
-        if allChannels:
-            votedict = self.votecast_db.getAllPosNegVotes()
-            my_votes = self.votecast_db.getMyVotes()
-
-            #append all other channels as (0,0)
-            for result in results:
-                if result[0] not in votedict:
-                    votedict[result[0]] = (0,0)
-                if result[0] not in my_votes:
-                    my_votes[result[0]] = 0
-        else:
-            votedict = {}
-            my_votes = {}
-
-        for result in results:
-            if result[0] not in votedict:
-                votedict[result[0]] = self.votecast_db.getPosNegVotes(result[0])
-
-            nr_favorites, nr_spam = votedict[result[0]]
-            nr_votes = nr_favorites + nr_spam
-            if nr_votes >= minvotes and nr_votes <= maxvotes:
-                nr_torrents, max_timestamp = self._db.fetchone(sqla, (result[0], self.torrent_db.status_table['dead']))
-
-                name = self._db.fetchone(sqlb, (result[0], max_timestamp)) or ''
-                name = name[:40] #max 40 characters long
-
-                if result[0] not in my_votes:
-                    vote = self.votecast_db.getVote(result[0], bin2str(self.my_permid))
-                else:
-                    vote = my_votes[result[0]]
-
-                channels.append((result[0], name, max_timestamp, nr_favorites, nr_torrents, nr_spam, vote))
-
-        def channel_sort(a, b):
-            #first compare local vote, spam -> return -1
-            if a[6] == -1:
-                return 1
-            if b[6] == -1:
-                return -1
-
-            #first compare nr_votes
-            if a[3] < b[3]:
-                return 1
-            if a[3] > b[3]:
-                return -1
-            #then compare latest update
-            if a[2] < b[2]:
-                return 1
-            if a[2] > b[2]:
-                return -1
-            #finally compare nr_torrents
-            return cmp(a[4], b[4])
-
-        if cmpF == None:
-            cmpF = channel_sort
-        channels.sort(cmpF)
-        return channels
+    def _getChannels(self, where = None, args = (), order_by = "S.nr_favorites DESC, S.latest_update DESC", limit = None, offset = 0):
+        """ Returns (publisher_id, name, latest update, nr_favorites, 
+        nr_torrents, nr_spam, my vote) of the channels with torrents that 
+        match where, in the order of order_by, with the channels I marked as
+        spam last. limit and offset select a page of them. The default order
+        is the most popular channels first. """
+        my_id = bin2str(self.my_permid)
+        if limit is None:
+            limit = -1
+        select = """SELECT S.publisher_id, 
+                        (SELECT publisher_name FROM ChannelCast C WHERE C.publisher_id = S.publisher_id ORDER BY time_stamp DESC LIMIT 1),
+                        S.latest_update, S.nr_favorites, S.nr_torrents, S.nr_spam, ifnull(V.vote, 0)
+                 FROM ChannelStats S LEFT JOIN VoteCast V ON V.mod_id = S.publisher_id AND V.voter_id = ?
+                 WHERE S.nr_torrents > 0 AND """
+        spam = "S.publisher_id IN (SELECT mod_id FROM VoteCast WHERE voter_id = ? AND vote = -1)"
+        if where:
+            spam += " AND " + where
+        sql = select + "NOT " + spam
+        spam_sql = select + spam
+        page = " ORDER BY " + order_by + " LIMIT ? OFFSET ?"
+
+        # The channels I did not mark as spam, then those I did
+        results = self._db.fetchall(sql + page, [my_id, my_id] + list(args) + [limit, offset])
+        if limit < 0 or len(results) < limit:
+            if results or offset == 0:
+                spam_offset = 0
+            else:
+                count_sql = "SELECT count(*) FROM (" + sql + ")"
+                spam_offset = max(0, offset - self._db.fetchone(count_sql, [my_id, my_id] + list(args)))
+            spam_limit = limit
+            if limit >= 0:
+                spam_limit = limit - len(results)
+            results += self._db.fetchall(spam_sql + page, [my_id, my_id] + list(args) + [spam_limit, spam_offset])
+
+        return [(publisher_id, (name or '')[:40], latest_update, nr_favorites, nr_torrents, nr_spam, vote)
+                for publisher_id, name, latest_update, nr_favorites, nr_torrents, nr_spam, vote in results]
 
     def getSubscribersCount(self,permid):
         """returns the number of subscribers in integer format"""
@@ -0,0 +1,192 @@
+# see LICENSE.txt for license information
+#
+# In-memory view of the BarterCast table. It keeps the totals of every peer
+# and a ranking on total upload up to date as records are added or changed,
+# and computes maxflow reputations over paths of bounded length, which are
+# cached until an edge they depend on changes.
+#
+
+from bisect import bisect_left, insort
+from math import atan, pi
+
+from maxflow import Network
+
+# by convention -1 is the id of non-tribler peers
+NON_TRIBLER = -1
+
+NO_RECORD = (0, 0, False)
+
+
+class BarterGraph:
+    """ The records of the BarterCast table, as a graph of peer ids.
+
+    A record (peer_from, peer_to) holds what peer_from uploaded to and
+    downloaded from peer_to, in kilobytes. Like getTopNPeers did, a record
+    only counts in the totals if its reverse did not exist before it, and
+    records with non-tribler peers count for me.
+
+    The capacity of the arc from a to b is the largest of what a reported
+    to upload to b and what b reported to download from a.
+    """
+
+    def __init__(self, my_id, max_distance = 2):
+        self.my_id = my_id
+        self.max_distance = max_distance
+        self.records = {}           # (peer_from, peer_to) -> [uploaded, downloaded, counted]
+        self.totals = {}            # peer_id -> [up, down]
+        self.local_totals = {}      # idem, of the records with me only
+        self.ranking = []           # sorted [(-up, peer_id)]
+        self.local_ranking = []
+        self.arcs = {}              # peer_id -> {peer_id: capacity}
+        self.backarcs = {}
+        self.flows = {}             # peer_id -> flow to me minus flow from me
+
+    def setRecord(self, peer_from, peer_to, uploaded, downloaded):
+        """ Sets the uploaded and downloaded values of a record """
+        uploaded = uploaded or 0
+        downloaded = downloaded or 0
+        key = (peer_from, peer_to)
+        record = self.records.get(key)
+        if record is None:
+            counted = peer_from != peer_to and (peer_to, peer_from) not in self.records
+            record = self.records[key] = [0, 0, counted]
+        elif record[0] == uploaded and record[1] == downloaded:
+            return
+
+        delta_up = uploaded - record[0]
+        delta_down = downloaded - record[1]
+        record[0] = uploaded
+        record[1] = downloaded
+
+        if record[2]:
+            self._addTotals(peer_from, peer_to, delta_up, delta_down)
+        if peer_from != peer_to:
+            self._updateCapacity(peer_from, peer_to)
+            self._updateCapacity(peer_to, peer_from)
+
+    def getRecord(self, peer_from, peer_to):
+        """ Returns (uploaded, downloaded) of a record """
+        record = self.records.get((peer_from, peer_to), NO_RECORD)
+        return (record[0], record[1])
+
+    def getTotals(self, peer_id, local_only = False):
+        """ Returns (up, down) of a peer """
+        if local_only:
+            totals = self.local_totals
+        else:
+            totals = self.totals
+        return tuple(totals.get(peer_id, (0, 0)))
+
+    def getTopNPeers(self, n, local_only = False):
+        """ Returns [(peer_id, up, down)] of the n peers with the highest
+        total upload, except me and the non-tribler peers """
+        if local_only:
+            totals, ranking = self.local_totals, self.local_ranking
+        else:
+            totals, ranking = self.totals, self.ranking
+        top = []
+        for up, peer_id in ranking:
+            if len(top) == n:
+                break
+            if peer_id != NON_TRIBLER and peer_id != self.my_id:
+                top.append((peer_id, totals[peer_id][0], totals[peer_id][1]))
+        return top
+
+    def getFlow(self, source, sink):
+        """ Returns the maxflow from source to sink over paths of at most
+        max_distance arcs """
+        if self.max_distance > 2:
+            return self._getNetworkFlow(source, sink)
+
+        arcs = self.arcs.get(source, {})
+        flow = arcs.get(sink, 0)
+        if self.max_distance == 2:
+            # The paths source -> peer -> sink share no arcs
+            backarcs = self.backarcs.get(sink, {})
+            if len(arcs) > len(backarcs):
+                arcs, backarcs = backarcs, arcs
+            for peer_id, capacity in arcs.iteritems():
+                if peer_id != source and peer_id != sink and peer_id in backarcs:
+                    flow += min(capacity, backarcs[peer_id])
+        return flow
+
+    def getReputation(self, peer_id, alpha):
+        """ Returns the reputation of a peer in [-1, 1], from the maxflow
+        from the peer to me minus the maxflow from me to the peer """
+        flow = self.flows.get(peer_id)
+        if flow is None:
+            flow = self.getFlow(peer_id, self.my_id) - self.getFlow(self.my_id, peer_id)
+            self.flows[peer_id] = flow
+        return atan(flow * alpha) / (0.5 * pi)
+
+    def _addTotals(self, peer_from, peer_to, delta_up, delta_down):
+        local = self.my_id in (peer_from, peer_to)
+        if peer_from == NON_TRIBLER:
+            peer_to = self.my_id
+        if peer_to == NON_TRIBLER:
+            peer_from = self.my_id
+
+        self._addTotal(self.totals, self.ranking, peer_from, delta_up, delta_down)
+        self._addTotal(self.totals, self.ranking, peer_to, delta_down, delta_up)
+        if local:
+            self._addTotal(self.local_totals, self.local_ranking, peer_from, delta_up, delta_down)
+            self._addTotal(self.local_totals, self.local_ranking, peer_to, delta_down, delta_up)
+
+    def _addTotal(self, totals, ranking, peer_id, up, down):
+        total = totals.get(peer_id)
+        if total is None:
+            total = totals[peer_id] = [0, 0]
+        else:
+            del ranking[bisect_left(ranking, (-total[0], peer_id))]
+        total[0] += up
+        total[1] += down
+        insort(ranking, (-total[0], peer_id))
+
+    def _updateCapacity(self, a, b):
+        capacity = max(self.records.get((a, b), NO_RECORD)[0], self.records.get((b, a), NO_RECORD)[1])
+        arcs = self.arcs.setdefault(a, {})
+        if arcs.get(b) == capacity:
+            return
+        arcs[b] = capacity
+        self.backarcs.setdefault(b, {})[a] = capacity
+        self._invalidate(a, b)
+
+    def _invalidate(self, a, b):
+        """ Forgets the flows that depend on the arc from a to b """
+        if self.max_distance > 2:
+            self.flows.clear()
+            return
+        self.flows.pop(a, None)
+        self.flows.pop(b, None)
+        if self.my_id == a:
+            other = b
+        elif self.my_id == b:
+            other = a
+        else:
+            return
+        # A path to or from me through other
+        for peer_id in self.arcs.get(other, {}):
+            self.flows.pop(peer_id, None)
+        for peer_id in self.backarcs.get(other, {}):
+            self.flows.pop(peer_id, None)
+
+    def _getNetworkFlow(self, source, sink):
+        # The peers within max_distance arcs of the source
+        distance = {source: 0}
+        todo = [source]
+        for peer_id in todo:
+            if distance[peer_id] < self.max_distance:
+                for next in self.arcs.get(peer_id, {}):
+                    if next not in distance:
+                        distance[next] = distance[peer_id] + 1
+                        todo.append(next)
+        if sink not in distance:
+            return 0
+        arcs = {}
+        for peer_id in distance:
+            arcs[peer_id] = {}
+        for peer_id in distance:
+            for next, capacity in self.arcs.get(peer_id, {}).iteritems():
+                if next in arcs and capacity > 0:
+                    arcs[peer_id][next] = {'cap': capacity, 'flow': 0}
+        return Network(arcs).maxflow(source, sink, self.max_distance)
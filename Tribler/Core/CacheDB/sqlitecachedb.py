@@ -12,6 +12,7 @@ from traceback import print_exc, print_stack
 from Tribler.Core.simpledefs import INFOHASH_LENGTH
 from Tribler.__init__ import LIBRARYNAME
 from Tribler.Core.Utilities.unicode import dunno2unicode
+from Tribler.Utilities.TimedTaskQueue import TimedTaskQueue
 
 # ONLY USE APSW >= 3.5.9-r1
 import apsw
@@ -25,7 +26,9 @@ import apsw
 ##Changed from 4 to 5 by andrea for subtitles support
 ##Changed from 5 to 6 by George Milescu for ProxyService  
 ##Changed from 6 to 7 for Raynor's TermFrequency table
-CURRENT_MAIN_DB_VERSION = 7
+##Changed from 7 to 8 for the TorrentFTS full-text index
+##Changed from 8 to 9 for the ChannelStats table
+CURRENT_MAIN_DB_VERSION = 9
 
 TEST_SQLITECACHEDB_UPGRADE = False
 CREATE_SQL_FILE = None
@@ -34,6 +37,13 @@ DB_FILE_NAME = 'tribler.sdb'
 DB_DIR_NAME = 'sqlite'    # db file path = DB_DIR_NAME/DB_FILE_NAME
 DEFAULT_BUSY_TIMEOUT = 10000
 MAX_SQL_BATCHED_TO_TRANSACTION = 1000   # don't change it unless carefully tested. A transaction with 1000 batched updates took 1.5 seconds
+# Writes done with commit=BATCH_COMMIT are committed together with later
+# writes of the same thread, at most BATCH_MAX_DELAY seconds or
+# BATCH_MAX_STATEMENTS statements later, see commit_batched()
+BATCH_COMMIT = 'batch'
+BATCH_MAX_DELAY = 5.0
+BATCH_MAX_STATEMENTS = 500
+MAX_SQL_CACHE = 1000    # max number of generated SQL statements remembered
 NULL = None
 icon_dir = None
 SHOW_ALL_EXECUTE = False
@@ -179,6 +189,21 @@ class SQLiteCacheDBBase:
         self.category_table = None
         self.src_table = None
         self.applied_pragma_sync_norm = False
+
+        # SQL of insert(), getOne() etc. by the shape of the query
+        self.sql_cache = {}
+        # {thread_name:time of its oldest write waiting for a batch commit}
+        self.batch_started = safe_dict()
+        # {thread_name:number of its queued writes that belong to the batch}
+        self.batch_length = safe_dict()
+        # {thread_name:TimedTask that commits its batch after BATCH_MAX_DELAY}
+        self.batch_tasks = safe_dict()
+        self.batch_queue = None
+        # Batched writes are committed by their thread or by the batch_queue
+        self.commit_lock = threading.RLock()
+        self.stats_lock = threading.Lock()
+        self.stats_start = time()
+        self.stats = {'statements':0, 'commits':0, 'commit_time':0.0, 'max_commit_time':0.0}
         
     def __del__(self):
         self.close()
@@ -198,6 +223,7 @@ class SQLiteCacheDBBase:
             try:
                 if thread_name in self.cache_transaction_table.keys(): 
                     del self.cache_transaction_table[thread_name]
+                self._end_batch(thread_name)
             except:
                 print_exc()
         if clean:    # used for test suite
@@ -207,6 +233,10 @@ class SQLiteCacheDBBase:
             self.class_variables = safe_dict({'db_path':None,'busytimeout':None})
             self.cursor_table = safe_dict()
             self.cache_transaction_table = safe_dict()
+            self.batch_started = safe_dict()
+            self.batch_length = safe_dict()
+            self.batch_tasks = safe_dict()
+            self._stop_batch_queue()
             
             
     # --------- static functions --------
@@ -469,11 +499,16 @@ class SQLiteCacheDBBase:
 
     def execute_read(self, sql, args=None):
         # this is only called for reading. If you want to write the db, always use execute_write or executemany
+        if self.batch_started and threading.currentThread().getName() in self.batch_started:
+            # a thread reads its own batched writes
+            self.commit()
         return self._execute(sql, args)
     
     def execute_write(self, sql, args=None, commit=True):
         self.cache_transaction(sql, args)
-        if commit:
+        if commit is BATCH_COMMIT:
+            self.commit_batched(1)
+        elif commit:
             self.commit()
             
     def executemany(self, sql, args, commit=True):
@@ -484,8 +519,107 @@ class SQLiteCacheDBBase:
         all = [(sql, arg) for arg in args]
         self.cache_transaction_table[thread_name].extend(all)
 
-        if commit:
+        if commit is BATCH_COMMIT:
+            self.commit_batched(len(all))
+        elif commit:
             self.commit()
+
+    def commit_batched(self, count):
+        """ Commits the writes of this thread if there are
+        BATCH_MAX_STATEMENTS of them. Otherwise they are committed by a
+        later commit() or flush() of this thread, before this thread reads
+        from the database, or by the batch_queue BATCH_MAX_DELAY seconds
+        after the first of them. count is the number of writes the caller
+        just queued. The batch_queue only commits batched writes: once a
+        write that was not batched is queued, the later writes wait for
+        the thread itself. """
+        thread_name = threading.currentThread().getName()
+        sql_queue = self.cache_transaction_table.get(thread_name,None)
+        if not sql_queue:
+            return
+        if len(sql_queue) >= BATCH_MAX_STATEMENTS:
+            self.commit()
+            return
+        self.commit_lock.acquire()
+        try:
+            if thread_name not in self.batch_started:
+                self.batch_started[thread_name] = time()
+            if len(sql_queue) - count != self.batch_length.get(thread_name,0):
+                # writes that were not batched are queued before these
+                return
+            # The writes up to here are complete, a commit by the
+            # batch_queue does not split the ones of a later call
+            self.batch_length[thread_name] = len(sql_queue)
+            if thread_name not in self.batch_tasks:
+                started = self.batch_started[thread_name]
+                if self.batch_queue is None:
+                    self.batch_queue = TimedTaskQueue(nameprefix="BatchCommit")
+                task = lambda: self._commit_batch(thread_name, started)
+                self.batch_tasks[thread_name] = self.batch_queue.add_task(task, BATCH_MAX_DELAY)
+        finally:
+            self.commit_lock.release()
+
+    def _commit_batch(self, thread_name, started):
+        """ Commits the batched writes of another thread that did not
+        commit them itself in BATCH_MAX_DELAY seconds """
+        self.commit_lock.acquire()
+        try:
+            if self.batch_started.get(thread_name,None) != started:
+                # committed by the thread itself
+                return
+            sql_queue = self.cache_transaction_table.get(thread_name,None)
+            self._commit_queue(sql_queue, self.batch_length.get(thread_name,0))
+            self._end_batch(thread_name)
+            if sql_queue:
+                # later batched writes, still read back by the thread
+                self.batch_started[thread_name] = time()
+        finally:
+            self.commit_lock.release()
+
+    def _end_batch(self, thread_name):
+        task = self.batch_tasks.get(thread_name,None)
+        if task is not None:
+            task.cancel()
+        for table in self.batch_started, self.batch_length, self.batch_tasks:
+            try:
+                del table[thread_name]
+            except KeyError:
+                pass
+
+    def flush(self):
+        """ Commits the writes of all threads, e.g. before shutdown """
+        self.commit_lock.acquire()
+        try:
+            for thread_name in self.cache_transaction_table.keys():
+                self._commit_queue(self.cache_transaction_table.get(thread_name,None))
+                self._end_batch(thread_name)
+            self._stop_batch_queue()
+        finally:
+            self.commit_lock.release()
+
+    def _stop_batch_queue(self):
+        if self.batch_queue is not None:
+            self.batch_queue.add_task('stop')
+            self.batch_queue = None
+
+    def get_stats(self):
+        """ Returns the number of statements written per second since the
+        database object was created, and the number of commits and the
+        average and maximum time they took, in seconds. """
+        self.stats_lock.acquire()
+        try:
+            elapsed = max(time() - self.stats_start, 0.001)
+            commits = self.stats['commits']
+            if commits:
+                avg_commit_time = self.stats['commit_time'] / commits
+            else:
+                avg_commit_time = 0.0
+            return {'statements_per_second':self.stats['statements'] / elapsed,
+                    'commits':commits,
+                    'avg_commit_time':avg_commit_time,
+                    'max_commit_time':self.stats['max_commit_time']}
+        finally:
+            self.stats_lock.release()
             
     def cache_transaction(self, sql, args=None):
         thread_name = threading.currentThread().getName()
@@ -498,13 +632,21 @@ class SQLiteCacheDBBase:
             self.cache_transaction(sql, args)
         
         thread_name = threading.currentThread().getName()
-        
-        n = 0
-        sql_full = ''
-        arg_list = []
-        sql_queue = self.cache_transaction_table.get(thread_name,None)
+        self.commit_lock.acquire()
+        try:
+            self._commit_queue(self.cache_transaction_table.get(thread_name,None))
+            if thread_name in self.batch_started:
+                self._end_batch(thread_name)
+        finally:
+            self.commit_lock.release()
+
+    def _commit_queue(self, sql_queue, count=None):
+        """ Commits the statements in sql_queue, or its first count ones """
         if sql_queue:
-            while True:
+            statements = []
+            while count is None or count > 0:
+                if count is not None:
+                    count -= 1
                 try:
                     _sql,_args = sql_queue.pop(0)
                 except IndexError:
@@ -515,27 +657,62 @@ class SQLiteCacheDBBase:
                     continue
                 if not _sql.endswith(';'):
                     _sql += ';'
-                sql_full += _sql + '\n'
-                if _args != None:
-                    arg_list += list(_args)
-                n += 1
+                statements.append((_sql,_args))
                 
                 # if too many sql in cache, split them into batches to prevent processing and locking DB for a long time
                 # TODO: optimize the value of MAX_SQL_BATCHED_TO_TRANSACTION
-                if n % MAX_SQL_BATCHED_TO_TRANSACTION == 0:
-                    self._transaction(sql_full, arg_list)
-                    sql_full = ''
-                    arg_list = []
+                if len(statements) == MAX_SQL_BATCHED_TO_TRANSACTION:
+                    self._transaction(statements)
+                    statements = []
                     
-            self._transaction(sql_full, arg_list)
+            self._transaction(statements)
             
-    def _transaction(self, sql, args=None):
-        if sql:
-            sql = 'BEGIN TRANSACTION; \n' + sql + 'COMMIT TRANSACTION;'
+    def _transaction(self, statements):
+        """ Executes the (sql, args) statements in a transaction. The same
+        SQL text is executed each time, instead of one script of all the
+        statements, so SQLite's prepared statements are reused from the
+        statement cache of APSW. Runs of the same statement are executed
+        with a single executemany(). """
+        if statements:
+            start = time()
             try:
-                self._execute(sql, args)
+                self._execute('BEGIN TRANSACTION;')
+                i = 0
+                while i < len(statements):
+                    sql, args = statements[i]
+                    j = i + 1
+                    if args is not None:
+                        while j < len(statements) and statements[j][0] == sql and statements[j][1] is not None:
+                            j += 1
+                    if j - i > 1:
+                        self._executemany(sql, [statements[k][1] for k in xrange(i, j)])
+                    else:
+                        self._execute(sql, args)
+                    i = j
+                self._execute('COMMIT TRANSACTION;')
             except Exception,e:
-                self.commit_retry_if_busy_or_rollback(e,0,sql=sql)
+                self.commit_retry_if_busy_or_rollback(e,0,sql='\n'.join([sql for sql, args in statements]))
+            elapsed = time() - start
+            self.stats_lock.acquire()
+            try:
+                self.stats['statements'] += len(statements)
+                self.stats['commits'] += 1
+                self.stats['commit_time'] += elapsed
+                self.stats['max_commit_time'] = max(self.stats['max_commit_time'], elapsed)
+            finally:
+                self.stats_lock.release()
+
+    def _executemany(self, sql, args_list):
+        cur = self.getCursor()
+        if SHOW_ALL_EXECUTE or self.show_execute:
+            thread_name = threading.currentThread().getName()
+            print >> sys.stderr, '===', thread_name, '===\n', sql, '\n-----\n', len(args_list), 'times\n======\n'
+        try:
+            return cur.executemany(sql, args_list)
+        except Exception, msg:
+            print_exc()
+            print >> sys.stderr, "cachedb: executemany error:", Exception, msg
+            raise msg
             
     def commit_retry_if_busy_or_rollback(self,e,tries,sql=None):
         """ 
@@ -580,20 +757,29 @@ class SQLiteCacheDBBase:
         
     # -------- Write Operations --------
     def insert_or_replace(self, table_name, commit=True, **argv):
-        if len(argv) == 1:
-            sql = 'INSERT OR REPLACE INTO %s (%s) VALUES (?);'%(table_name, argv.keys()[0])
-        else:
-            questions = '?,'*len(argv)
-            sql = 'INSERT OR REPLACE INTO %s %s VALUES (%s);'%(table_name, tuple(argv.keys()), questions[:-1])
+        sql = self._insert_sql('INSERT OR REPLACE', table_name, tuple(argv.keys()))
         self.execute_write(sql, argv.values(), commit)
     
     def insert(self, table_name, commit=True, **argv):
-        if len(argv) == 1:
-            sql = 'INSERT INTO %s (%s) VALUES (?);'%(table_name, argv.keys()[0])
-        else:
-            questions = '?,'*len(argv)
-            sql = 'INSERT INTO %s %s VALUES (%s);'%(table_name, tuple(argv.keys()), questions[:-1])
+        sql = self._insert_sql('INSERT', table_name, tuple(argv.keys()))
         self.execute_write(sql, argv.values(), commit)
+
+    def _insert_sql(self, verb, table_name, keys):
+        cache_key = (verb, table_name, keys)
+        sql = self.sql_cache.get(cache_key)
+        if sql is None:
+            if len(keys) == 1:
+                sql = '%s INTO %s (%s) VALUES (?);'%(verb, table_name, keys[0])
+            else:
+                questions = '?,'*len(keys)
+                sql = '%s INTO %s %s VALUES (%s);'%(verb, table_name, keys, questions[:-1])
+            self._cache_sql(cache_key, sql)
+        return sql
+
+    def _cache_sql(self, cache_key, sql):
+        if len(self.sql_cache) >= MAX_SQL_CACHE:
+            self.sql_cache.clear()
+        self.sql_cache[cache_key] = sql
     
     def insertMany(self, table_name, values, keys=None, commit=True):
         """ values must be a list of tuples """
@@ -669,43 +855,7 @@ class SQLiteCacheDBBase:
     def getOne(self, table_name, value_name, where=None, conj='and', **kw):
         """ value_name could be a string, a tuple of strings, or '*' 
         """
-
-        if isinstance(value_name, tuple):
-            value_names = u",".join(value_name)
-        elif isinstance(value_name, list):
-            value_names = u",".join(value_name)
-        else:
-            value_names = value_name
-            
-        if isinstance(table_name, tuple):
-            table_names = u",".join(table_name)
-        elif isinstance(table_name, list):
-            table_names = u",".join(table_name)
-        else:
-            table_names = table_name
-            
-        sql = u'select %s from %s'%(value_names, table_names)
-
-        if where or kw:
-            sql += u' where '
-        if where:
-            sql += where
-            if kw:
-                sql += u' %s '%conj
-        if kw:
-            arg = []
-            for k,v in kw.iteritems():
-                if type(v) is tuple:
-                    operator = v[0]
-                    arg.append(v[1])
-                else:
-                    operator = "="
-                    arg.append(v)
-                sql += u' %s %s ? ' % (k, operator)
-                sql += conj
-            sql = sql[:-len(conj)]
-        else:
-            arg = None
+        sql, arg = self._select_sql(table_name, value_name, where, conj, kw)
 
         # print >> sys.stderr, 'SQL: %s %s' % (sql, arg)
         return self.fetchone(sql,arg)
@@ -715,13 +865,59 @@ class SQLiteCacheDBBase:
             order by is represented as order_by
             group by is represented as group_by
         """
+        sql, arg = self._select_sql(table_name, value_name, where, conj, kw)
+        
+        if group_by != None:
+            sql += u' group by ' + group_by
+        if having != None:
+            sql += u' having ' + having
+        if order_by != None:
+            sql += u' order by ' + order_by    # you should add desc after order_by to reversely sort, i.e, 'last_seen desc' as order_by
+        if limit != None:
+            sql += u' limit %d'%limit
+        if offset != None:
+            sql += u' offset %d'%offset
+
+        try:
+            return self.fetchall(sql, arg) or []
+        except Exception, msg:
+            print >> sys.stderr, "sqldb: Wrong getAll sql statement:", sql
+            raise Exception, msg
+
+    def _select_sql(self, table_name, value_name, where, conj, kw):
+        """ Returns the SQL and the arguments of getOne() and getAll(). The
+        SQL of queries without a where string is remembered. """
+        keys = tuple(kw.keys())
+        arg = []
+        operators = []
+        for k in keys:
+            v = kw[k]
+            if type(v) is tuple:
+                operators.append(v[0])
+                arg.append(v[1])
+            else:
+                operators.append("=")
+                arg.append(v)
+        if not kw:
+            arg = None
+
+        if where is None:
+            if isinstance(value_name, list):
+                value_name = tuple(value_name)
+            if isinstance(table_name, list):
+                table_name = tuple(table_name)
+            cache_key = ('SELECT', table_name, value_name, conj, keys, tuple(operators))
+            sql = self.sql_cache.get(cache_key)
+            if sql is not None:
+                return sql, arg
+
         if isinstance(value_name, tuple):
             value_names = u",".join(value_name)
         elif isinstance(value_name, list):
             value_names = u",".join(value_name)
         else:
             value_names = value_name
-        
+            
         if isinstance(table_name, tuple):
             table_names = u",".join(table_name)
         elif isinstance(table_name, list):
@@ -730,7 +926,7 @@ class SQLiteCacheDBBase:
             table_names = table_name
             
         sql = u'select %s from %s'%(value_names, table_names)
-        
+
         if where or kw:
             sql += u' where '
         if where:
@@ -738,37 +934,11 @@ class SQLiteCacheDBBase:
             if kw:
                 sql += u' %s '%conj
         if kw:
-            arg = []
-            for k,v in kw.iteritems():
-                if type(v) is tuple:
-                    operator = v[0]
-                    arg.append(v[1])
-                else:
-                    operator = "="
-                    arg.append(v)
+            sql += conj.join([u' %s %s ? ' % (k, operator) for k, operator in zip(keys, operators)])
 
-                sql += u' %s %s ?' % (k, operator)
-                sql += conj
-            sql = sql[:-len(conj)]
-        else:
-            arg = None
-        
-        if group_by != None:
-            sql += u' group by ' + group_by
-        if having != None:
-            sql += u' having ' + having
-        if order_by != None:
-            sql += u' order by ' + order_by    # you should add desc after order_by to reversely sort, i.e, 'last_seen desc' as order_by
-        if limit != None:
-            sql += u' limit %d'%limit
-        if offset != None:
-            sql += u' offset %d'%offset
-
-        try:
-            return self.fetchall(sql, arg) or []
-        except Exception, msg:
-            print >> sys.stderr, "sqldb: Wrong getAll sql statement:", sql
-            raise Exception, msg
+        if where is None:
+            self._cache_sql(cache_key, sql)
+        return sql, arg
     
     # ----- Tribler DB operations ----
 
@@ -1249,6 +1419,106 @@ ALTER TABLE Peer ADD COLUMN services integer DEFAULT 0;
             """
             self.execute_write(sql, commit=False)
 
+        if fromver < 8:
+            # SQLite may be built without FTS3, the TorrentFTS table is
+            # then missing and searches use the InvertedIndex
+            self.commit()
+            try:
+                self.getCursor().execute(u"CREATE VIRTUAL TABLE TorrentFTS USING fts3(keywords);")
+            except apsw.SQLError, e:
+                if not str(e).endswith('no such module: fts3'):
+                    raise
+                print >> sys.stderr, "sqlitecachedb: No FTS3 support in SQLite, TorrentFTS not created"
+            else:
+                sql = u"""INSERT INTO TorrentFTS (docid, keywords)
+                         SELECT torrent_id, group_concat(word, ' ')
+                         FROM InvertedIndex GROUP BY torrent_id"""
+                self.execute_write(sql, commit=False)
+
+        if fromver < 9:
+            sql=\
+            """
+            --------------------------------------
+            -- Creating ChannelStats, kept up to date by triggers
+            ----------------------------------
+            DROP TABLE IF EXISTS ChannelStats;
+            DROP TRIGGER IF EXISTS ChannelStats_torrent_insert;
+            DROP TRIGGER IF EXISTS ChannelStats_torrent_delete;
+            DROP TRIGGER IF EXISTS ChannelStats_torrent_update;
+            DROP TRIGGER IF EXISTS ChannelStats_vote_insert;
+            DROP TRIGGER IF EXISTS ChannelStats_vote_delete;
+            DROP TRIGGER IF EXISTS ChannelStats_vote_update;
+
+            CREATE TABLE ChannelStats (
+              publisher_id   text PRIMARY KEY,
+              nr_torrents    integer DEFAULT 0,
+              latest_update  integer,
+              nr_favorites   integer DEFAULT 0,
+              nr_spam        integer DEFAULT 0
+            );
+
+            CREATE INDEX ChannelStats_popular_idx
+              ON ChannelStats
+              (nr_favorites, latest_update);
+
+            CREATE INDEX ChannelStats_latest_idx
+              ON ChannelStats
+              (latest_update);
+
+            CREATE TRIGGER ChannelStats_torrent_insert AFTER INSERT ON ChannelCast
+            BEGIN
+              INSERT OR IGNORE INTO ChannelStats (publisher_id) VALUES (NEW.publisher_id);
+              UPDATE ChannelStats SET nr_torrents = nr_torrents + 1,
+                                      latest_update = max(ifnull(latest_update, NEW.time_stamp), NEW.time_stamp)
+                WHERE publisher_id = NEW.publisher_id;
+            END;
+
+            CREATE TRIGGER ChannelStats_torrent_delete AFTER DELETE ON ChannelCast
+            BEGIN
+              UPDATE ChannelStats SET nr_torrents = nr_torrents - 1,
+                                      latest_update = (SELECT max(time_stamp) FROM ChannelCast WHERE publisher_id = OLD.publisher_id)
+                WHERE publisher_id = OLD.publisher_id;
+            END;
+
+            CREATE TRIGGER ChannelStats_torrent_update AFTER UPDATE OF publisher_id, time_stamp ON ChannelCast
+            BEGIN
+              INSERT OR IGNORE INTO ChannelStats (publisher_id) VALUES (NEW.publisher_id);
+              UPDATE ChannelStats SET nr_torrents = (SELECT count(*) FROM ChannelCast WHERE publisher_id = ChannelStats.publisher_id),
+                                      latest_update = (SELECT max(time_stamp) FROM ChannelCast WHERE publisher_id = ChannelStats.publisher_id)
+                WHERE publisher_id IN (OLD.publisher_id, NEW.publisher_id);
+            END;
+
+            CREATE TRIGGER ChannelStats_vote_insert AFTER INSERT ON VoteCast
+            BEGIN
+              INSERT OR IGNORE INTO ChannelStats (publisher_id) VALUES (NEW.mod_id);
+              UPDATE ChannelStats SET nr_favorites = nr_favorites + (CASE WHEN NEW.vote = 2 THEN 1 ELSE 0 END),
+                                      nr_spam = nr_spam + (CASE WHEN NEW.vote = -1 THEN 1 ELSE 0 END)
+                WHERE publisher_id = NEW.mod_id;
+            END;
+
+            CREATE TRIGGER ChannelStats_vote_delete AFTER DELETE ON VoteCast
+            BEGIN
+              UPDATE ChannelStats SET nr_favorites = nr_favorites - (CASE WHEN OLD.vote = 2 THEN 1 ELSE 0 END),
+                                      nr_spam = nr_spam - (CASE WHEN OLD.vote = -1 THEN 1 ELSE 0 END)
+                WHERE publisher_id = OLD.mod_id;
+            END;
+
+            CREATE TRIGGER ChannelStats_vote_update AFTER UPDATE OF mod_id, vote ON VoteCast
+            BEGIN
+              INSERT OR IGNORE INTO ChannelStats (publisher_id) VALUES (NEW.mod_id);
+              UPDATE ChannelStats SET nr_favorites = (SELECT count(*) FROM VoteCast WHERE mod_id = ChannelStats.publisher_id AND vote = 2),
+                                      nr_spam = (SELECT count(*) FROM VoteCast WHERE mod_id = ChannelStats.publisher_id AND vote = -1)
+                WHERE publisher_id IN (OLD.mod_id, NEW.mod_id);
+            END;
+
+            INSERT INTO ChannelStats (publisher_id, nr_torrents, latest_update)
+              SELECT publisher_id, count(*), max(time_stamp) FROM ChannelCast GROUP BY publisher_id;
+            INSERT OR IGNORE INTO ChannelStats (publisher_id) SELECT DISTINCT mod_id FROM VoteCast;
+            UPDATE ChannelStats SET nr_favorites = (SELECT count(*) FROM VoteCast WHERE mod_id = ChannelStats.publisher_id AND vote = 2),
+                                    nr_spam = (SELECT count(*) FROM VoteCast WHERE mod_id = ChannelStats.publisher_id AND vote = -1);
+            """
+            self.execute_write(sql, commit=False)
+
         # updating version stepwise so if this works, we store it
         # regardless of later, potentially failing updates
         self.writeDBVersion(CURRENT_MAIN_DB_VERSION, commit=False)
@@ -1264,6 +1534,8 @@ ALTER TABLE Peer ADD COLUMN services integer DEFAULT 0;
             state_dir = session.get_state_dir()
         tmpfilename = os.path.join(state_dir,"upgradingdb.txt")
         if fromver < 4 or os.path.exists(tmpfilename):
+            fts = self.fetchone(u"SELECT name FROM sqlite_master WHERE type='table' AND name='TorrentFTS'") is not None
+
             def upgradeTorrents():
                 # fetch some un-inserted torrents to put into the InvertedIndex
                 sql = """
@@ -1305,6 +1577,9 @@ ALTER TABLE Peer ADD COLUMN services integer DEFAULT 0;
                     if len(keywords) > 0:
                         values = [(keyword, torrent_id) for keyword in keywords]
                         self.executemany(u"INSERT OR REPLACE INTO InvertedIndex VALUES(?, ?)", values, commit=False)
+                        if fts:
+                            self.execute_write(u"DELETE FROM TorrentFTS WHERE docid = ?", (torrent_id,), commit=False)
+                            self.execute_write(u"INSERT INTO TorrentFTS (docid, keywords) VALUES(?, ?)", (torrent_id, u' '.join(keywords)), commit=False)
                         if DEBUG:
                             print >> sys.stderr, "DB Upgradation: Extending the InvertedIndex table with", len(values), "new keywords for", torrent_name
 
@@ -0,0 +1,209 @@
+# see LICENSE.txt for license information
+#
+# Compact results of the torrent queries of TorrentDBHandler. A result set
+# keeps the rows as the database returned them, and a field of a torrent
+# that needs decoding (such as the binary infohash or the name of its
+# category) is only decoded when it is read. The rows behave like the dicts
+# the handler returned before, todicts() converts them for callers that
+# need real dicts.
+#
+
+from itertools import izip, repeat
+from operator import itemgetter
+
+DELETED = object()
+
+
+class TorrentResultSet(object):
+    """ The torrents of a query.
+
+    columns are the names of the values in each record. decoders maps a
+    field to (column, function), its value is the function of the value of
+    the column, or the value itself if function is None. constants maps a
+    field to its value for all torrents. Both take precedence over a column
+    of the same name. The hidden columns are only available through
+    TorrentRow.raw().
+    """
+
+    def __init__(self, columns, records, decoders = {}, hidden = (), constants = {}):
+        self.columns = dict([(name, i) for i, name in enumerate(columns)])
+        self.records = records
+        self.decoders = {}
+        for key, (column, function) in decoders.iteritems():
+            self.decoders[key] = (self.columns[column], function)
+        self.decoderitems = self.decoders.items()
+        self.constants = constants
+        self.hidden = dict.fromkeys(hidden)
+        self.rows = [None] * len(records)
+
+        # The columns that are fields as is
+        self.plain = plain = [i for i, name in enumerate(columns) if name not in self.hidden and name not in decoders and name not in constants]
+        self.plainnames = [columns[i] for i in plain]
+        self.fieldnames = self.plainnames + decoders.keys() + constants.keys()
+
+    def __len__(self):
+        return len(self.records)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            result = TorrentResultSet.__new__(TorrentResultSet)
+            result.__dict__.update(self.__dict__)
+            result.records = self.records[index]
+            result.rows = self.rows[index]
+            return result
+        row = self.rows[index]
+        if row is None:
+            row = self.rows[index] = TorrentRow(self, self.records[index])
+        return row
+
+    def __iter__(self):
+        for i in xrange(len(self.records)):
+            yield self[i]
+
+    def sort(self, column, reverse = False):
+        """ Sorts the torrents on a column, such as num_seeders, without
+        decoding them """
+        i = self.columns[column]
+        records = self.records
+        order = range(len(records))
+        order.sort(key = lambda j: records[j][i], reverse = reverse)
+        self.records = [records[j] for j in order]
+        self.rows = [self.rows[j] for j in order]
+
+    def todicts(self):
+        """ Returns the torrents as a list of dicts """
+        records = self.records
+        n = len(records)
+        # Build the dicts from the values of each field for all torrents
+        names = list(self.plainnames)
+        columns = [map(itemgetter(i), records) for i in self.plain]
+        for key, (i, function) in self.decoderitems:
+            values = map(itemgetter(i), records)
+            if function is not None:
+                values = map(function, values)
+            names.append(key)
+            columns.append(values)
+        for key, value in self.constants.iteritems():
+            names.append(key)
+            columns.append(repeat(value, n))
+        if columns:
+            torrents = [dict(izip(names, values)) for values in izip(*columns)]
+        else:
+            torrents = [{} for record in records]
+
+        # The rows that were changed or decoded
+        for i, row in enumerate(self.rows):
+            if row is not None and row.fields is not None:
+                torrents[i] = row.todict()
+        return torrents
+
+
+class TorrentRow(object):
+    """ A torrent of a TorrentResultSet, which can be used as a dict """
+
+    __slots__ = ('resultset', 'record', 'fields')
+
+    def __init__(self, resultset, record):
+        self.resultset = resultset
+        self.record = record
+        self.fields = None          # the decoded and assigned fields
+
+    def raw(self, column):
+        """ Returns the value of a column as the database returned it """
+        return self.record[self.resultset.columns[column]]
+
+    def __getitem__(self, key):
+        fields = self.fields
+        if fields is not None and key in fields:
+            value = fields[key]
+            if value is DELETED:
+                raise KeyError(key)
+            return value
+        resultset = self.resultset
+        decoder = resultset.decoders.get(key)
+        if decoder is not None:
+            i, function = decoder
+            value = self.record[i]
+            if function is not None:
+                value = function(value)
+            if fields is None:
+                fields = self.fields = {}
+            fields[key] = value
+            return value
+        if key in resultset.constants:
+            return resultset.constants[key]
+        if key in resultset.hidden:
+            raise KeyError(key)
+        return self.record[resultset.columns[key]]
+
+    def __setitem__(self, key, value):
+        if self.fields is None:
+            self.fields = {}
+        self.fields[key] = value
+
+    def __delitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        self[key] = DELETED
+
+    def __contains__(self, key):
+        fields = self.fields
+        if fields is not None and key in fields:
+            return fields[key] is not DELETED
+        resultset = self.resultset
+        return key in resultset.decoders or key in resultset.constants or (key in resultset.columns and key not in resultset.hidden)
+
+    has_key = __contains__
+
+    def get(self, key, default = None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def keys(self):
+        keys = self.resultset.fieldnames
+        if self.fields is not None:
+            keys = [key for key in keys if key not in self.fields] + [key for key, value in self.fields.iteritems() if value is not DELETED]
+        return keys
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def values(self):
+        return [self[key] for key in self.keys()]
+
+    def items(self):
+        return [(key, self[key]) for key in self.keys()]
+
+    def update(self, other):
+        for key in other.keys():
+            self[key] = other[key]
+
+    def todict(self):
+        resultset = self.resultset
+        record = self.record
+        torrent = dict(zip(resultset.plainnames, [record[i] for i in resultset.plain]))
+        torrent.update(resultset.constants)
+        fields = self.fields
+        for key, (i, function) in resultset.decoderitems:
+            if fields is None or key not in fields:
+                if function is None:
+                    torrent[key] = record[i]
+                else:
+                    torrent[key] = function(record[i])
+        if fields is not None:
+            for key, value in fields.iteritems():
+                if value is DELETED:
+                    torrent.pop(key, None)
+                else:
+                    torrent[key] = value
+        return torrent
+
+    copy = todict
+
+    def __repr__(self):
+        return repr(self.todict())
@@ -12,15 +12,20 @@ dht_imported = False
 if sys.version.split()[0] >= '2.5':
     try:
         import Tribler.Core.DecentralizedTracking.pymdht.core.pymdht as pymdht
+        from Tribler.Core.DecentralizedTracking.pymdht.core.minitwisted import RawServerReactor
         import Tribler.Core.DecentralizedTracking.pymdht.plugins.routing_nice_rtt as routing_mod
         import Tribler.Core.DecentralizedTracking.pymdht.plugins.lookup_a16 as lookup_mod
+        from Tribler.Core.DecentralizedTracking.mainlineDHTLookups import LookupManager
         dht_imported = True
     except (ImportError), e:
         print_exc()
 
 dht = None
 
-def init(addr, conf_path):
+def init(addr, conf_path, rawserver=None):
+    """ Starts the DHT. When a rawserver is given the DHT runs on its 
+    thread, otherwise in a thread of its own. The lookups go through a
+    LookupManager (see mainlineDHTLookups). """
     global dht
     global dht_imported
     
@@ -31,8 +36,14 @@ def init(addr, conf_path):
         log_level = logging.ERROR
     if dht_imported and dht is None:
         private_dht_name = None
-        dht = pymdht.Pymdht(addr, conf_path, routing_mod, lookup_mod,
-                            private_dht_name, log_level)
+        reactor = None
+        sched = None
+        if rawserver is not None:
+            reactor = RawServerReactor(rawserver)
+            sched = rawserver.add_task
+        dht = LookupManager(pymdht.Pymdht(addr, conf_path, routing_mod, lookup_mod,
+                                          private_dht_name, log_level, reactor),
+                            sched)
         if DEBUG:
             print >>sys.stderr,'dht: DHT running'
 
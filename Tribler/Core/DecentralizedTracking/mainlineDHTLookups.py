@@ -0,0 +1,244 @@
+# see LICENSE.txt for license information
+#
+# The get_peers lookups of the Rerequesters, the MagnetLinks and the
+# mainlineDHTChecker (torrent checking) go through the LookupManager, which
+# mainlineDHT.init() puts in front of the DHT:
+#
+#  - a lookup for an infohash that is already being looked up is not sent
+#    to the DHT: the caller gets the peers found so far and the ones found
+#    later,
+#  - the peers a lookup found are cached for PEERS_TTL seconds and handed
+#    out without a lookup,
+#  - the nodes closest to the infohash that responded are cached for
+#    NODES_TTL seconds and later lookups for the infohash start from them.
+#
+# Lookups that announce (bt_port) always go to the DHT, but also start from
+# the cached nodes.
+#
+
+import sys
+from threading import RLock
+from time import time
+from traceback import print_exc
+
+DEBUG = False
+
+PEERS_TTL = 2 * 60
+NODES_TTL = 15 * 60
+MAX_CACHED = 1000
+# a lookup that did not end by then is not joined anymore
+LOOKUP_TIMEOUT = 2 * 60
+
+
+class _Lookup:
+    """ A lookup sent to the DHT and the callers waiting for its peers """
+    def __init__(self, key, bt_port, warm, lookup_id, callback_f):
+        self.key = key
+        self.bt_port = bt_port
+        self.warm = warm
+        self.start = time()
+        self.first_peers_time = None
+        self.peers = []
+        self.peer_set = set()
+        self.waiters = [(lookup_id, callback_f)]
+
+
+class _Cached:
+    """ What the last lookups for an infohash found """
+    def __init__(self):
+        self.peers = None
+        self.peers_ts = 0
+        self.nodes = None
+        self.nodes_ts = 0
+
+
+class LookupManager:
+    def __init__(self, dht, sched=None):
+        """ dht is the Pymdht. Cached peers are handed out through
+        sched(func, delay), the RawServer's add_task, or right away if
+        sched is None """
+        self.dht = dht
+        self.sched = sched
+        self.lock = RLock()
+        self.lookups = {}    # infohash -> _Lookup
+        self.cache = {}      # infohash -> _Cached
+
+        self.num_requests = 0
+        self.num_cache_hits = 0
+        self.num_coalesced = 0
+        self.num_lookups = 0
+        self.num_warm_lookups = 0
+        self.num_done = [0, 0]          # [cold, warm]
+        self.total_lookup_time = [0.0, 0.0]
+        self.num_first_peers = 0
+        self.total_first_peers_time = 0.0
+
+    def get_peers(self, lookup_id, info_hash, callback_f, bt_port=0):
+        """ Same as Pymdht.get_peers(): callback_f(lookup_id, peers) is
+        called for every batch of peers found and with None as peers when
+        the lookup is done """
+        key = str(info_hash)
+        now = time()
+        self.lock.acquire()
+        try:
+            self.num_requests += 1
+            lookup = self.lookups.get(key)
+            if lookup is not None and now - lookup.start > LOOKUP_TIMEOUT:
+                del self.lookups[key]
+                lookup = None
+            if lookup is not None and (not bt_port or bt_port == lookup.bt_port):
+                # join the lookup in progress
+                self.num_coalesced += 1
+                lookup.waiters.append((lookup_id, callback_f))
+                peers = lookup.peers[:]
+                done = False
+            else:
+                cached = self.cache.get(key)
+                if not bt_port and cached is not None and cached.peers and now - cached.peers_ts < PEERS_TTL:
+                    self.num_cache_hits += 1
+                    peers = cached.peers[:]
+                    done = True
+                else:
+                    bootstrap_nodes = None
+                    if cached is not None and cached.nodes and now - cached.nodes_ts < NODES_TTL:
+                        bootstrap_nodes = cached.nodes
+                    lookup = _Lookup(key, bt_port, bootstrap_nodes is not None, lookup_id, callback_f)
+                    # later callers join this one
+                    self.lookups[key] = lookup
+                    self.num_lookups += 1
+                    if lookup.warm:
+                        self.num_warm_lookups += 1
+                    peers = None
+        finally:
+            self.lock.release()
+
+        if peers is not None:
+            if DEBUG:
+                print >>sys.stderr,"mainlineDHTLookups: No lookup for",`key`,"cached",done,"peers",len(peers)
+            if peers or done:
+                self._deliver(lookup_id, callback_f, peers, done)
+            return True
+
+        if DEBUG:
+            print >>sys.stderr,"mainlineDHTLookups: Lookup",`key`,"warm",lookup.warm
+        # not holding the lock: the DHT may call back from its own thread
+        result = self.dht.get_peers(lookup, info_hash, self._got_peers, bt_port,
+                                    bootstrap_nodes, self._got_closest_nodes)
+        if not result:
+            # no queries sent, this lookup won't end
+            self.lock.acquire()
+            try:
+                if self.lookups.get(key) is lookup:
+                    del self.lookups[key]
+            finally:
+                self.lock.release()
+        return result
+
+    def _deliver(self, lookup_id, callback_f, peers, done):
+        def deliver():
+            try:
+                callback_f(lookup_id, peers)
+                if done:
+                    callback_f(lookup_id, None)
+            except:
+                print_exc()
+        if self.sched is None:
+            deliver()
+        else:
+            self.sched(deliver, 0)
+
+    def _got_peers(self, lookup, peers):
+        """ Called by the DHT (network thread) """
+        now = time()
+        self.lock.acquire()
+        try:
+            if peers:
+                for peer in peers:
+                    if peer not in lookup.peer_set:
+                        lookup.peer_set.add(peer)
+                        lookup.peers.append(peer)
+                if lookup.first_peers_time is None:
+                    lookup.first_peers_time = now - lookup.start
+                    self.num_first_peers += 1
+                    self.total_first_peers_time += lookup.first_peers_time
+            else:
+                # the lookup is done
+                if self.lookups.get(lookup.key) is lookup:
+                    del self.lookups[lookup.key]
+                self.num_done[lookup.warm] += 1
+                self.total_lookup_time[lookup.warm] += now - lookup.start
+                if lookup.peers:
+                    cached = self._get_cached(lookup.key, now)
+                    cached.peers = lookup.peers
+                    cached.peers_ts = now
+            waiters = lookup.waiters[:]
+        finally:
+            self.lock.release()
+
+        for lookup_id, callback_f in waiters:
+            try:
+                callback_f(lookup_id, peers)
+            except:
+                print_exc()
+
+    def _got_closest_nodes(self, lookup, nodes):
+        """ Called by the DHT (network thread) when the lookup is done,
+        before _got_peers() """
+        if not nodes:
+            return
+        now = time()
+        self.lock.acquire()
+        try:
+            cached = self._get_cached(lookup.key, now)
+            cached.nodes = nodes
+            cached.nodes_ts = now
+        finally:
+            self.lock.release()
+
+    def _get_cached(self, key, now):
+        cached = self.cache.get(key)
+        if cached is None:
+            if len(self.cache) >= MAX_CACHED:
+                self._expire(now)
+            cached = self.cache[key] = _Cached()
+        return cached
+
+    def _expire(self, now):
+        for key, cached in self.cache.items():
+            if now - cached.peers_ts >= PEERS_TTL and now - cached.nodes_ts >= NODES_TTL:
+                del self.cache[key]
+        if len(self.cache) >= MAX_CACHED:
+            # still full, the least recently refreshed goes
+            oldest = min(self.cache.iteritems(), key=lambda (key, cached): max(cached.peers_ts, cached.nodes_ts))
+            del self.cache[oldest[0]]
+
+    def get_stats(self):
+        """ Returns a dict with the number of get_peers requests, how many
+        were answered from the cache or joined a lookup in progress
+        (hit_rate), the number of lookups sent to the DHT (warm: started
+        from cached nodes) and their average duration and time to the
+        first peers, in seconds """
+        self.lock.acquire()
+        try:
+            def avg(total, num):
+                if num:
+                    return total / num
+                return None
+            hits = self.num_cache_hits + self.num_coalesced
+            return {'requests': self.num_requests,
+                    'cache_hits': self.num_cache_hits,
+                    'coalesced': self.num_coalesced,
+                    'hit_rate': avg(float(hits), self.num_requests),
+                    'lookups': self.num_lookups,
+                    'warm_lookups': self.num_warm_lookups,
+                    'lookups_in_progress': len(self.lookups),
+                    'cached': len(self.cache),
+                    'avg_lookup_time': avg(sum(self.total_lookup_time), sum(self.num_done)),
+                    'avg_cold_lookup_time': avg(self.total_lookup_time[0], self.num_done[0]),
+                    'avg_warm_lookup_time': avg(self.total_lookup_time[1], self.num_done[1]),
+                    'avg_first_peers_time': avg(self.total_first_peers_time, self.num_first_peers)}
+        finally:
+            self.lock.release()
+
+    def stop(self):
+        self.dht.stop()
@@ -0,0 +1,272 @@
+# Copyright (C) 2009-2010 Raul Jimenez
+# Released under GNU LGPL 2.1
+# See LICENSE.txt for more information
+
+'''
+Benchmark of the minitwisted reactor loop, in packets per second.
+
+1. Datagrams (ping and get_peers queries) come from a _SocketMock holding
+a queue and are handled by a Controller, which responds through a
+ThreadedReactorMock. 1,000 timeouts with different delays are pending and
+fire during the run. For bursts of 1, 16 and 256 datagrams per wakeup it
+compares
+ - single: one recvfrom() per loop iteration and a linear scan for the
+   next task (minitwisted as it was), and
+ - drain: all the datagrams waiting are received per wakeup and tasks are
+   kept in a heap (ThreadedReactor._receive_datagrams and TaskManager).
+
+2. The reactor thread alone on a real UDP socket on localhost, with a
+handler that only counts, while UDP_SENDERS processes send as fast as
+they can: the old loop (recvfrom() on a socket with a timeout) against the
+ThreadedReactor loop (select() and non-blocking recvfrom() until the
+socket is empty).
+
+Not a test, run as: python benchmark_minitwisted.py [datagrams]
+
+'''
+
+import sys
+import errno
+import socket
+import tempfile
+import shutil
+import random
+import subprocess
+
+import ptime as time
+import logging, logging_conf
+logging.getLogger('dht').setLevel(logging.CRITICAL)
+
+import identifier
+import message
+import controller
+import minitwisted
+from minitwisted import Task, TaskManager, ThreadedReactor, \
+     ThreadedReactorMock, _SocketMock
+import routing_plugin_template as routing_m_mod
+import lookup_plugin_template as lookup_m_mod
+
+DATAGRAMS = 20000
+BURSTS = (1, 16, 256)
+PENDING_TASKS = 1000
+UDP_PORT = 6020
+UDP_DURATION = 3
+UDP_SENDERS = 3
+
+
+class DictTaskManager(object):
+
+    """The TaskManager of minitwisted before the heap: tasks in lists
+    keyed by delay, the next task is found with a linear scan"""
+
+    def __init__(self):
+        self.tasks = {}
+        self.next_task = None
+
+    def add(self, task):
+        ms_delay = int(task.delay * 1000)
+        self.tasks.setdefault(ms_delay, []).append(task)
+        if self.next_task is None or task.call_time < self.next_task.call_time:
+            self.next_task = task
+
+    def _get_next_task(self):
+        next_task = None
+        for _, task_list in self.tasks.items():
+            task = task_list[0]
+            if next_task is None:
+                next_task = task
+            if task.call_time < next_task.call_time:
+                next_task = task
+        return next_task
+
+    def consume_task(self):
+        current_time = time.time()
+        if self.next_task is None:
+            return None
+        if self.next_task.call_time > current_time:
+            return None
+        task = self.next_task
+        ms_delay = int(self.next_task.delay * 1000)
+        del self.tasks[ms_delay][0]
+        if not self.tasks[ms_delay]:
+            del self.tasks[ms_delay]
+        self.next_task = self._get_next_task()
+        return task
+
+
+class QueueSocketMock(_SocketMock):
+
+    """A socket with a queue of datagrams to receive"""
+
+    def __init__(self):
+        self.queue = []
+
+    def recvfrom(self, buffer_size):
+        if not self.queue:
+            raise socket.error(errno.EWOULDBLOCK, 'would block')
+        return self.queue.pop()
+
+
+def make_datagrams(num):
+    datagrams = []
+    for i in xrange(num):
+        sender_id = identifier.RandomId()
+        if i % 2:
+            msg = message.OutgoingPingQuery(sender_id)
+        else:
+            msg = message.OutgoingGetPeersQuery(sender_id,
+                                                identifier.RandomId())
+        addr = ('10.%d.%d.%d' % (i >> 16 & 255, i >> 8 & 255, i & 255),
+                6881)
+        datagrams.append((msg.encode('\0\0'), addr))
+    datagrams.reverse()
+    return datagrams
+
+def make_reactor(state_path, task_m):
+    c = controller.Controller(('127.0.0.1', 7000), state_path,
+                              routing_m_mod, lookup_m_mod, None,
+                              ThreadedReactorMock())
+    r = ThreadedReactor(floodbarrier_active=False)
+    r.datagram_received_f = c._on_datagram_received
+    r.s = QueueSocketMock()
+    r.tasks = task_m
+    # pending timeouts with different delays, each adds another when fired
+    rand = random.Random(42)
+    def timeout():
+        task_m.add(Task(rand.uniform(.5, 2), timeout))
+    for i in xrange(PENDING_TASKS):
+        task_m.add(Task(rand.uniform(0, 2), timeout))
+    return r
+
+def fire_tasks(r):
+    current_time = time.time()
+    while True:
+        task = r.tasks.consume_task(current_time)
+        if task is None:
+            break
+        task.fire_callbacks()
+
+def run_single(r, burst):
+    """ Loop iterations as minitwisted did: one datagram each """
+    while r.s.queue:
+        for _ in xrange(burst):
+            try:
+                data, addr = r.s.recvfrom(minitwisted.BUFFER_SIZE)
+            except socket.error:
+                break
+            r._datagram_received(data, addr)
+            fire_tasks(r)
+
+def run_drain(r, burst):
+    """ Loop iterations as ThreadedReactor does: one per burst """
+    queue = r.s.queue
+    while queue:
+        # the datagrams waiting when we wake up
+        r.s.queue = queue[-burst:]
+        del queue[-burst:]
+        r._receive_datagrams()
+        fire_tasks(r)
+
+class OldThreadedReactor(ThreadedReactor):
+
+    """The loop of minitwisted before select(): one recvfrom() with a
+    timeout per iteration"""
+
+    def listen_udp(self, port, datagram_received_f):
+        s = ThreadedReactor.listen_udp(self, port, datagram_received_f)
+        s.settimeout(self.task_interval)
+        return s
+
+    def _protected_run(self):
+        last_task_run = time.time()
+        stop_flag = self.stop_flag
+        while not stop_flag:
+            timeout_raised = False
+            try:
+                data, addr = self.s.recvfrom(minitwisted.BUFFER_SIZE)
+            except (socket.timeout):
+                timeout_raised = True
+            except (socket.error), e:
+                pass
+            else:
+                self._datagram_received(data, addr)
+            if timeout_raised or \
+                   time.time() - last_task_run > self.task_interval:
+                self._lock.acquire()
+                try:
+                    while True:
+                        task = self.tasks.consume_task()
+                        if task is None:
+                            break
+                        task.fire_callbacks()
+                    stop_flag = self.stop_flag
+                finally:
+                    self._lock.release()
+
+
+SENDER = """
+import socket, time
+s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+data = 'd1:ad2:id20:' + 'x' * 20 + 'e1:q4:ping1:t2:aa1:y1:qe'
+end = time.time() + %f
+sent = 0
+while time.time() < end:
+    for _ in xrange(100):
+        s.sendto(data, ('127.0.0.1', %d))
+    sent += 100
+print sent
+"""
+
+def run_udp(reactor_class):
+    """ Returns the datagrams per second handled by a reactor thread while
+    UDP_SENDERS processes send as fast as they can """
+    count = [0]
+    def datagram_received(data, addr):
+        count[0] += 1
+    r = reactor_class(floodbarrier_active=False)
+    s = r.listen_udp(UDP_PORT, datagram_received)
+    r.start()
+    start = time.time()
+    senders = [subprocess.Popen([sys.executable, '-c',
+                                 SENDER % (UDP_DURATION, UDP_PORT)],
+                                stdout=subprocess.PIPE)
+               for _ in xrange(UDP_SENDERS)]
+    sent = sum([int(sender.communicate()[0]) for sender in senders])
+    received = count[0]
+    elapsed = time.time() - start
+    r.stop()
+    s.close()
+    return received / elapsed, sent / elapsed
+
+def main(num = DATAGRAMS):
+    state_path = tempfile.mkdtemp()
+    try:
+        datagrams = make_datagrams(num)
+        print "Controller, mocked socket"
+        print "%6s %14s %14s" % ("burst", "single pkt/s", "drain pkt/s")
+        for burst in BURSTS:
+            results = []
+            for run, task_m in ((run_single, DictTaskManager()),
+                                (run_drain, TaskManager())):
+                r = make_reactor(state_path, task_m)
+                r.s.queue = datagrams[:]
+                start = time.time()
+                run(r, burst)
+                results.append(num / (time.time() - start))
+            print "%6d %14.0f %14.0f" % (burst, results[0], results[1])
+    finally:
+        shutil.rmtree(state_path)
+    print
+    print "Reactor thread, UDP socket"
+    print "%6s %14s %14s" % ("loop", "received pkt/s", "sent pkt/s")
+    for name, reactor_class in (("old", OldThreadedReactor),
+                                ("new", ThreadedReactor)):
+        received, sent = run_udp(reactor_class)
+        print "%6s %14.0f %14.0f" % (name, received, sent)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        main(int(sys.argv[1]))
+    else:
+        main()
@@ -35,7 +35,7 @@ class Controller:
 
     def __init__(self, dht_addr, state_path,
                  routing_m_mod, lookup_m_mod,
-                 private_dht_name):
+                 private_dht_name, reactor=None):
         #TODO: don't do this evil stuff!!!
         message.private_dht_name = private_dht_name
         
@@ -47,7 +47,9 @@ class Controller:
         self._tracker = tracker.Tracker()
         self._token_m = token_manager.TokenManager()
 
-        self._reactor = ThreadedReactor()
+        if reactor is None:
+            reactor = ThreadedReactor()
+        self._reactor = reactor
         self._reactor.listen_udp(self._my_node.addr[1],
                                  self._on_datagram_received)
         self._querier = Querier(self._my_id)
@@ -110,7 +112,8 @@ class Controller:
             self.loaded_nodes = []
             logger.error('state.dat is corrupted')
         
-    def get_peers(self, lookup_id, info_hash, callback_f, bt_port=0):
+    def get_peers(self, lookup_id, info_hash, callback_f, bt_port=0,
+                  bootstrap_nodes=None, closest_nodes_f=None):
         logger.critical('get_peers %d %r' % (bt_port, info_hash))
         if time.time() > self._next_maintenance_ts + 1:
             logger.critical('minitwisted crashed or stopped!')
@@ -125,8 +128,12 @@ class Controller:
         bootstrap_rnodes = self._routing_m.get_closest_rnodes(log_distance,
                                                               None,
                                                               True)
+        if bootstrap_nodes:
+            # nodes close to info_hash (from an earlier lookup) go first
+            bootstrap_rnodes = list(bootstrap_nodes) + list(bootstrap_rnodes)
         lookup_obj = self._lookup_m.get_peers(lookup_id, info_hash,
                                               callback_f, bt_port)
+        lookup_obj.closest_nodes_f = closest_nodes_f
         lookup_queries_to_send = lookup_obj.start(bootstrap_rnodes)
         self._send_queries(lookup_queries_to_send)
         return len(lookup_queries_to_send)
@@ -137,7 +144,7 @@ class Controller:
     def _main_loop(self):
         current_time = time.time()
         # Routing table
-        if current_time > self._next_maintenance_ts:
+        if current_time >= self._next_maintenance_ts:
             (maintenance_delay,
              queries_to_send,
              maintenance_lookup_target) = self._routing_m.do_maintenance()
@@ -154,7 +161,7 @@ class Controller:
             self._next_maintenance_ts = (current_time
                                          + maintenance_delay)
         # Auto-save routing table
-        if current_time > self._next_save_state_ts:
+        if current_time >= self._next_save_state_ts:
             self.save_state()
             self._next_save_state_ts = current_time + SAVE_STATE_DELAY
 
@@ -205,8 +212,7 @@ class Controller:
                     if peers:
                         related_query.lookup_obj.callback_f(lookup_id, peers)
                     if lookup_done:
-                        self._announce(related_query.lookup_obj)
-                        related_query.lookup_obj.callback_f(lookup_id, None)
+                        self._lookup_done(related_query.lookup_obj)
             # maintenance related tasks
             maintenance_queries_to_send = \
                 self._routing_m.on_response_received(
@@ -228,10 +234,8 @@ class Controller:
                 self._send_queries(lookup_queries_to_send)
                 
             if related_query.lookup_obj.callback_f:
-                lookup_id = related_query.lookup_obj.lookup_id
                 if lookup_done:
-                    self._announce(related_query.lookup_obj)
-                    related_query.lookup_obj.callback_f(lookup_id, None)
+                    self._lookup_done(related_query.lookup_obj)
             # maintenance related tasks
             maintenance_queries_to_send = \
                 self._routing_m.on_error_received(addr)
@@ -254,16 +258,21 @@ class Controller:
             log_distance = msg.info_hash.log_distance(self._my_id)
             rnodes = self._routing_m.get_closest_rnodes(log_distance,
                                                        NUM_NODES, False)
-            peers = self._tracker.get(msg.info_hash)
+            peers = self._tracker.get(msg.info_hash, msg.noseed)
             if peers:
                 logger.debug('RESPONDING with PEERS:\n%r' % peers)
+            bf_seeds = bf_peers = None
+            if msg.scrape:
+                bf_seeds, bf_peers = self._tracker.get_scrape(msg.info_hash)
             return message.OutgoingGetPeersResponse(self._my_id,
                                                     token,
                                                     nodes=rnodes,
-                                                    peers=peers)
+                                                    peers=peers,
+                                                    bf_seeds=bf_seeds,
+                                                    bf_peers=bf_peers)
         elif msg.query == message.ANNOUNCE_PEER:
             peer_addr = (msg.sender_addr[0], msg.bt_port)
-            self._tracker.put(msg.info_hash, peer_addr)
+            self._tracker.put(msg.info_hash, peer_addr, msg.seed)
             return message.OutgoingAnnouncePeerResponse(self._my_id)
         else:
             logger.debug('Invalid QUERY: %r' % (msg.query))
@@ -283,13 +292,19 @@ class Controller:
              ) = related_query.lookup_obj.on_timeout(related_query.dstnode)
             self._send_queries(lookup_queries_to_send)
             if lookup_done and related_query.lookup_obj.callback_f:
-                self._announce(related_query.lookup_obj)
-                lookup_id = related_query.lookup_obj.lookup_id
-                related_query.lookup_obj.callback_f(lookup_id, None)
+                self._lookup_done(related_query.lookup_obj)
         maintenance_queries_to_send = self._routing_m.on_timeout(
             related_query.dstnode)
         self._send_queries(maintenance_queries_to_send)
 
+    def _lookup_done(self, lookup_obj):
+        self._announce(lookup_obj)
+        lookup_id = lookup_obj.lookup_id
+        if lookup_obj.closest_nodes_f:
+            lookup_obj.closest_nodes_f(
+                lookup_id, lookup_obj.get_closest_responded_nodes())
+        lookup_obj.callback_f(lookup_id, None)
+
     def _announce(self, lookup_obj):
         queries_to_send, announce_to_myself = lookup_obj.announce()
         self._send_queries(queries_to_send)
@@ -23,6 +23,8 @@ def testing_setup(module_name):
     # Raul 2010-11-21: this configuration only affects to tests. It does
     # not affect Tribler/NextShare
     logger.setLevel(logging.DEBUG)
+    if not os.path.isdir('test_logs'):
+        os.mkdir('test_logs')
     filename = ''.join((str(module_name), '.log'))
     logger_file = os.path.join('test_logs', filename)
     
@@ -56,6 +56,9 @@ TARGET = 'target' # Target's nodeID (find_node)
 INFO_HASH = 'info_hash' # Torrent's info_hash (get_peers and announce)
 PORT = 'port'     # BitTorrent port (announce)
 TOKEN = 'token'   # Token (announce)
+NOSEED = 'noseed' # Only non-seed peers, please (get_peers, BEP 33)
+SCRAPE = 'scrape' # Bloom filters wanted (get_peers, BEP 33)
+SEED = 'seed'     # The announcing peer is a seed (announce, BEP 33)
 
 # Valid keys for RESPONSE
 ID = 'id'         # Node's nodeID (all replies)
@@ -63,6 +66,8 @@ NODES = 'nodes'   # String of nodes in compact format (find_nodes and get_peers)
 NODES2 = 'nodes2' # Same as previous (with IPv6 support)
 TOKEN = 'token'   # Token (get_peers)
 PEERS = VALUES = 'values' # List of peers in compact format (get_peers)
+BF_SEEDS = 'BFsd' # Bloom filter of seeds' IPs (get_peers, BEP 33)
+BF_PEERS = 'BFpe' # Bloom filter of non-seed peers' IPs (get_peers, BEP 33)
 
 # Valid values for ERROR
 GENERIC_E = [201, 'Generic Error']
@@ -142,20 +147,26 @@ class OutgoingFindNodeQuery(OutgoingQueryBase):
 
 class OutgoingGetPeersQuery(OutgoingQueryBase):
 
-    def __init__(self, sender_id, info_hash):
+    def __init__(self, sender_id, info_hash, noseed=False, scrape=False):
         OutgoingQueryBase.__init__(self, sender_id)
         self._dict[QUERY] = GET_PEERS
         self._dict[ARGS][INFO_HASH] = str(info_hash)
+        if noseed:
+            self._dict[ARGS][NOSEED] = 1
+        if scrape:
+            self._dict[ARGS][SCRAPE] = 1
 
         
 class OutgoingAnnouncePeerQuery(OutgoingQueryBase):
     
-    def __init__(self, sender_id, info_hash, port, token):
+    def __init__(self, sender_id, info_hash, port, token, seed=False):
         OutgoingQueryBase.__init__(self, sender_id)
         self._dict[QUERY] = ANNOUNCE_PEER
         self._dict[ARGS][INFO_HASH] = str(info_hash)
         self._dict[ARGS][PORT] = port
         self._dict[ARGS][TOKEN] = token
+        if seed:
+            self._dict[ARGS][SEED] = 1
 
 ####################
 
@@ -182,7 +193,8 @@ class OutgoingFindNodeResponse(OutgoingResponseBase):
                           
 class OutgoingGetPeersResponse(OutgoingResponseBase):
 
-    def __init__(self, sender_id, token=None, nodes=None, peers=None):
+    def __init__(self, sender_id, token=None, nodes=None, peers=None,
+                 bf_seeds=None, bf_peers=None):
         assert nodes or peers
         OutgoingResponseBase.__init__(self, sender_id)
         if token:
@@ -191,6 +203,10 @@ class OutgoingGetPeersResponse(OutgoingResponseBase):
             self._dict[RESPONSE][NODES] = mt.compact_nodes(nodes)
         if peers:
             self._dict[RESPONSE][VALUES] = mt.compact_peers(peers)
+        if bf_seeds is not None:
+            self._dict[RESPONSE][BF_SEEDS] = str(bf_seeds)
+        if bf_peers is not None:
+            self._dict[RESPONSE][BF_PEERS] = str(bf_peers)
 
             
 class OutgoingAnnouncePeerResponse(OutgoingResponseBase):
@@ -315,9 +331,13 @@ class IncomingMsg(object):
         if self.query in [GET_PEERS, ANNOUNCE_PEER]:
             # info_hash
             self.info_hash = self._get_id(ARGS, INFO_HASH)
+            if self.query == GET_PEERS:
+                self.noseed = self._get_value(ARGS, NOSEED, optional=True) == 1
+                self.scrape = self._get_value(ARGS, SCRAPE, optional=True) == 1
             if self.query == ANNOUNCE_PEER:
                 self.bt_port = self._get_int(ARGS, PORT)
                 self.token = self._get_str(ARGS, TOKEN)
+                self.seed = self._get_value(ARGS, SEED, optional=True) == 1
         elif self.query == FIND_NODE:
             # target
             self.target = self._get_id(ARGS, TARGET)
@@ -351,6 +371,9 @@ class IncomingMsg(object):
         c_peers = self._get_value(RESPONSE, PEERS, optional=True)
         if c_peers:
             self.peers = mt.uncompact_peers(c_peers)
+        # bloom filters (scrape)
+        self.bf_seeds = self._get_str(RESPONSE, BF_SEEDS, optional=True)
+        self.bf_peers = self._get_str(RESPONSE, BF_PEERS, optional=True)
 
     def _sanitize_error(self):
         try:
@@ -6,7 +6,8 @@
 Minitwisted is inspired by the Twisted framework. Although, it is much
 simpler.
 - It can only handle one UDP connection per reactor.
-- Reactor runs in a thread
+- Reactor runs in a thread (ThreadedReactor) or on the event loop of a
+  BitTornado RawServer (RawServerReactor)
 - You can use call_later and call_now to run your code in thread-safe mode
 
 '''
@@ -14,8 +15,11 @@ simpler.
 #from __future__ import with_statement
 
 import sys
+import errno
+import select
 import socket
 import threading
+from heapq import heappush, heappop, heapify
 import ptime as time
 
 import logging
@@ -29,6 +33,14 @@ logger = logging.getLogger('dht')
 
 BUFFER_SIZE = 1024
 
+# Datagrams handled per wakeup at most, so that tasks are not delayed for
+# long when under a flood
+MAX_DATAGRAMS_PER_WAKEUP = 256
+
+# The heap of a TaskManager is cleaned up when more than half of its tasks
+# have been cancelled (and it holds at least this many)
+MIN_CLEANUP_SIZE = 64
+
 
 class Task(object):
     
@@ -49,6 +61,8 @@ class Task(object):
         self.kwds = kwds
         self.call_time = time.time() + self.delay
         self._cancelled = False
+        # the TaskManager holding the task, until it is consumed
+        self._task_m = None
 
     @property
     def cancelled(self):
@@ -70,67 +84,84 @@ class Task(object):
 
     def cancel(self):
         """Cancel a task (callback won't be called when fired)"""
-        self._cancelled = True
+        if not self._cancelled:
+            self._cancelled = True
+            if self._task_m is not None:
+                self._task_m.num_cancelled += 1
         
 
 class TaskManager(object):
 
-    """Manage tasks"""
+    """Manage tasks in a heap ordered by call time. Tasks with the same
+    call time are fired in the order they were added.
+
+    Cancelling is O(1): cancelled tasks stay in the heap until they reach
+    its top, or until they are more than half of it.
+
+    """
 
     def __init__(self):
-        self.tasks = {}
-        self.next_task = None
+        self._heap = []
+        self._counter = 0
+        self.num_cancelled = 0
+
+    def __len__(self):
+        """Return the number of pending tasks (cancelled ones included)"""
+        return len(self._heap)
 
     def add(self, task):
         """Add task to the TaskManager"""
-        
-        ms_delay = int(task.delay * 1000)
-        # we need integers for the dictionary (floats are not hashable)
-        self.tasks.setdefault(ms_delay, []).append(task)
-        if self.next_task is None or task.call_time < self.next_task.call_time:
-            self.next_task = task
-
-#    def __iter__(self):
-#        """Makes (along with next) this objcet iterable"""
-#        return self
-
-    def _get_next_task(self):
-        """Return the task which should be fired next"""
-        
-        next_task = None
-        for _, task_list in self.tasks.items():
-            task = task_list[0]
-            if next_task is None:
-                next_task = task
-            if task.call_time < next_task.call_time:
-                next_task = task
-        return next_task
-                
+        if (self.num_cancelled * 2 > len(self._heap)
+            and len(self._heap) >= MIN_CLEANUP_SIZE):
+            self._cleanup()
+        task._task_m = self
+        self._counter += 1
+        heappush(self._heap, (task.call_time, self._counter, task))
+
+    def _cleanup(self):
+        """Remove cancelled tasks from the heap"""
+        self._heap = [item for item in self._heap if not item[2].cancelled]
+        heapify(self._heap)
+        self.num_cancelled = 0
+
+    def _pop(self):
+        task = heappop(self._heap)[2]
+        task._task_m = None
+        if task.cancelled and self.num_cancelled:
+            self.num_cancelled -= 1
+        return task
 
-    def consume_task(self):
+    def get_next_call_time(self):
+        """Return the call time of the next (not cancelled) task, or None
+        if there are no tasks"""
+        heap = self._heap
+        while heap and heap[0][2].cancelled:
+            self._pop()
+        if heap:
+            return heap[0][0]
+        return None
+
+    def consume_task(self, current_time=None):
         """
         Return the task which should be fire next and removes it from
         TaskManager 
 
+        Pass the time the reactor woke up as current_time, so tasks added
+        by the callbacks being fired wait for the next iteration (a task
+        rescheduling itself with no delay would never let the loop end).
+
         """
-        current_time = time.time()
-        if self.next_task is None:
+        call_time = self.get_next_call_time()
+        if call_time is None:
             # no pending tasks
-            return None #raise StopIteration
-        if self.next_task.call_time > current_time:
+            return None
+        if current_time is None:
+            current_time = time.time()
+        if call_time > current_time:
             # there are pending tasks but it's too soon to fire them
-            return None #raise StopIteration
-        # self.next_task is ready to be fired
-        task = self.next_task
-        # delete  consummed task and get next one (if any)
-        ms_delay = int(self.next_task.delay * 1000)
-        del self.tasks[ms_delay][0]
-        if not self.tasks[ms_delay]:
-            # delete list when it's empty
-            del self.tasks[ms_delay]
-        self.next_task = self._get_next_task()
-        #TODO2: make it yield
-        return task
+            return None
+        return self._pop()
+
                             
 class ThreadedReactor(threading.Thread):
 
@@ -163,45 +194,70 @@ class ThreadedReactor(threading.Thread):
     def _protected_run(self):
         """Main loop activated by calling self.start()"""
         
-        last_task_run = time.time()
         stop_flag = self.stop_flag
         while not stop_flag:
-            timeout_raised = False
             try:
-                data, addr = self.s.recvfrom(BUFFER_SIZE)
+                readable, _, _ = select.select([self.s], [], [],
+                                               self._get_wait_time())
             except (AttributeError):
                 logger.warning('udp_listen has not been called')
                 time.sleep(self.task_interval)
                 #TODO2: try using Event and wait
-                timeout_raised = True
-            except (socket.timeout):
-                timeout_raised = True
-            except (socket.error), e:
+            except (select.error, socket.error), e:
                 logger.warning(
-                    'Got socket.error when receiving data:\n%s' % e)
-                #logger.exception('See critical log above')
+                    'Got socket.error when waiting for data:\n%s' % e)
+                time.sleep(self.task_interval)
             else:
-                ip_is_blocked = self.floodbarrier_active and \
-                                self.floodbarrier.ip_blocked(addr[0])
-                if ip_is_blocked:
-                    logger.warning('%s blocked' % `addr`)
-                else:
-                    self.datagram_received_f(data, addr)
+                if readable:
+                    self._receive_datagrams()
 
-            if timeout_raised or \
-                   time.time() - last_task_run > self.task_interval:
-                #with self._lock:
-                self._lock.acquire()
-                try:
-                    while True:
-                        task = self.tasks.consume_task()
-                        if task is None:
-                            break
-                        task.fire_callbacks()
-                    stop_flag = self.stop_flag
-                finally:
-                    self._lock.release()
+            #with self._lock:
+            current_time = time.time()
+            self._lock.acquire()
+            try:
+                while True:
+                    task = self.tasks.consume_task(current_time)
+                    if task is None:
+                        break
+                    task.fire_callbacks()
+                stop_flag = self.stop_flag
+            finally:
+                self._lock.release()
         logger.debug('Reactor stopped')
+
+    def _get_wait_time(self):
+        """Return how long to wait for data: until the next task is due,
+        task_interval at most (call_later may add an earlier task)"""
+        self._lock.acquire()
+        try:
+            call_time = self.tasks.get_next_call_time()
+        finally:
+            self._lock.release()
+        if call_time is None:
+            return self.task_interval
+        return max(0, min(self.task_interval, call_time - time.time()))
+
+    def _receive_datagrams(self):
+        """Receive and handle all the datagrams waiting in the socket (up
+        to MAX_DATAGRAMS_PER_WAKEUP)"""
+        for _ in xrange(MAX_DATAGRAMS_PER_WAKEUP):
+            try:
+                data, addr = self.s.recvfrom(BUFFER_SIZE)
+            except (socket.error), e:
+                if e[0] not in (errno.EWOULDBLOCK, errno.EAGAIN):
+                    logger.warning(
+                        'Got socket.error when receiving data:\n%s' % e)
+                    #logger.exception('See critical log above')
+                return
+            self._datagram_received(data, addr)
+
+    def _datagram_received(self, data, addr):
+        ip_is_blocked = self.floodbarrier_active and \
+                        self.floodbarrier.ip_blocked(addr[0])
+        if ip_is_blocked:
+            logger.warning('%s blocked' % `addr`)
+        else:
+            self.datagram_received_f(data, addr)
             
     def stop(self):
         """Stop the thread. It cannot be resumed afterwards????"""
@@ -211,8 +267,10 @@ class ThreadedReactor(threading.Thread):
             self.stop_flag = True
         finally:
             self._lock.release()
-        # wait a little for the thread to end
-        time.sleep(self.task_interval)
+        # wait a little for the thread to end (select() may take up to
+        # task_interval to return)
+        if self.isAlive() and threading.currentThread() is not self:
+            self.join(self.task_interval * 2)
 
 
 #     def stop_and_wait(self):
@@ -230,7 +288,8 @@ class ThreadedReactor(threading.Thread):
         self.datagram_received_f = datagram_received_f
         self.s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
         self.s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        self.s.settimeout(self.task_interval)
+        # we wait with select() and then receive what is there
+        self.s.setblocking(0)
         my_addr = ('', port)
         self.s.bind(my_addr)
         return self.s
@@ -277,6 +336,147 @@ class ThreadedReactor(threading.Thread):
             self._lock.release()
 
 
+class RawServerReactor(object):
+
+    """
+    Same interface as ThreadedReactor, but runs on the event loop of a
+    BitTornado RawServer instead of in a thread of its own: datagrams
+    and tasks are handled on the RawServer thread.
+
+    The RawServer receives all the datagrams waiting in the socket at once
+    (see SocketHandler.handle_events) and the next task is scheduled with
+    RawServer.add_task, so there is no polling.
+    
+    """
+    def __init__(self, rawserver, task_interval=0.1, floodbarrier_active=True):
+        self.rawserver = rawserver
+        self.running = False
+        self._lock = threading.RLock()
+        self.task_interval = task_interval
+        self.floodbarrier_active = floodbarrier_active
+        self.tasks = TaskManager()
+        if self.floodbarrier_active:
+            self.floodbarrier = FloodBarrier()
+        self.s = None
+        # call times for which _fire_tasks has been scheduled (heap)
+        self._wakeups = []
+
+    def start(self):
+        self._lock.acquire()
+        try:
+            self.running = True
+            self._schedule()
+        finally:
+            self._lock.release()
+
+    def stop(self):
+        """Stop handling datagrams and tasks"""
+        self._lock.acquire()
+        try:
+            self.running = False
+        finally:
+            self._lock.release()
+        if self.s is not None:
+            self.rawserver.add_task(self._close, 0)
+
+    def _close(self):
+        self.rawserver.stop_listening_udp(self.s)
+        self.s.close()
+
+    def listen_udp(self, port, datagram_received_f):
+        """Listen on given port and call the given callback when data is
+        received.
+
+        """
+        self.datagram_received_f = datagram_received_f
+        self.s = self.rawserver.create_udpsocket(port, '')
+        self.rawserver.start_listening_udp(self.s, self)
+        return self.s
+
+    def data_came_in(self, packets):
+        """Called by the RawServer with the datagrams received"""
+        if not self.running:
+            return
+        for addr, data in packets:
+            ip_is_blocked = self.floodbarrier_active and \
+                            self.floodbarrier.ip_blocked(addr[0])
+            if ip_is_blocked:
+                logger.warning('%s blocked' % `addr`)
+            else:
+                try:
+                    self.datagram_received_f(data, addr)
+                except:
+                    logger.exception('Exception handling datagram')
+        
+    def call_later(self, delay, callback_fs, *args, **kwds):
+        """Call the given callback with given arguments in the future (delay
+        seconds).
+
+        """
+        self._lock.acquire()
+        try:
+            task = Task(delay, callback_fs, *args, **kwds)
+            self.tasks.add(task)
+            self._schedule()
+        finally:
+            self._lock.release()
+        return task
+
+    def call_now(self, callback_f, *args, **kwds):
+        """Same as call_later with delay 0 seconds."""
+        return self.call_later(0, callback_f, *args, **kwds)
+
+    def _schedule(self):
+        """Have the RawServer call _fire_tasks when the next task is due,
+        unless it will be called before then anyway. Holds the lock."""
+        if not self.running:
+            return
+        call_time = self.tasks.get_next_call_time()
+        if call_time is None:
+            return
+        if self._wakeups and self._wakeups[0] <= call_time:
+            return
+        heappush(self._wakeups, call_time)
+        self.rawserver.add_task(self._fire_tasks,
+                                max(0, call_time - time.time()))
+
+    def _fire_tasks(self):
+        self._lock.acquire()
+        try:
+            # the RawServer runs its tasks in order of their call time
+            if self._wakeups:
+                heappop(self._wakeups)
+            if not self.running:
+                return
+            current_time = time.time()
+            while True:
+                task = self.tasks.consume_task(current_time)
+                if task is None:
+                    break
+                try:
+                    task.fire_callbacks()
+                except:
+                    logger.exception('Exception firing task')
+            self._schedule()
+        finally:
+            self._lock.release()
+
+    def sendto(self, data, addr):
+        """Send data to addr using the UDP port used by listen_udp."""
+        try:
+            bytes_sent = self.s.sendto(data, addr)
+            if bytes_sent != len(data):
+                logger.critical(
+                    'Just %d bytes sent out of %d (Data follows)' % (
+                        bytes_sent,
+                        len(data)))
+                logger.critical('Data: %s' % data)
+        except (socket.error):
+            logger.warning(
+                'Got socket.error when sending data to %r\n%r' % (addr,
+                                                                  data))
+
+
 class ThreadedReactorSocketError(ThreadedReactor):
 
     def listen_udp(self, delay, callback_f, *args, **kwds):
@@ -309,6 +509,9 @@ class ThreadedReactorMock(object):
     
 class _SocketMock(object):
 
+    def fileno(self):
+        raise socket.error
+
     def sendto(self, data, addr):
         if len(data) > BUFFER_SIZE:
             return BUFFER_SIZE
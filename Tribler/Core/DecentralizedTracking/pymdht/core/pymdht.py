@@ -26,17 +26,20 @@ class Pymdht:
     - logs_path: a string containing the path to the log files.
     - routing_m_mod: the module implementing routing management.
     - lookup_m_mod: the module implementing lookup management.
+    - reactor: (optional) the minitwisted reactor to use. By default a
+    ThreadedReactor, running in its own thread.
 
     """
     def __init__(self, dht_addr, conf_path,
                  routing_m_mod, lookup_m_mod,
                  private_dht_name,
-                 debug_level):
+                 debug_level, reactor=None):
         logging_conf.setup(conf_path, debug_level)
         self.controller = controller.Controller(dht_addr, conf_path,
                                                 routing_m_mod,
                                                 lookup_m_mod,
-                                                private_dht_name)
+                                                private_dht_name,
+                                                reactor)
         self.controller.start()
 
     def stop(self):
@@ -44,7 +47,8 @@ class Pymdht:
         self.controller.stop()
         time.sleep(.1) # Give time for the controller (reactor) to stop
     
-    def get_peers(self, lookup_id, info_hash, callback_f, bt_port=0):
+    def get_peers(self, lookup_id, info_hash, callback_f, bt_port=0,
+                  bootstrap_nodes=None, closest_nodes_f=None):
         """ Start a get peers lookup. Return a Lookup object.
         
         The info_hash must be an identifier.Id object.
@@ -56,9 +60,18 @@ class Pymdht:
         The bt_port parameter is optional. When provided, ANNOUNCE messages
         will be send using the provided port number.
 
+        The bootstrap_nodes parameter is optional. Nodes (with Id) known to
+        be close to info_hash, the lookup starts from them (and from the
+        routing table).
+
+        The closest_nodes_f parameter is optional. When the lookup is done
+        (before callback_f is called with None), it is called with the
+        lookup_id and the nodes closest to info_hash that responded.
+
         """
         return self.controller.get_peers(lookup_id, info_hash,
-                                         callback_f, bt_port)
+                                         callback_f, bt_port,
+                                         bootstrap_nodes, closest_nodes_f)
 
     def remove_torrent(self, info_hash):
         return
@@ -0,0 +1,521 @@
+# Copyright (C) 2009-2010 Raul Jimenez
+# Released under GNU LGPL 2.1
+# See LICENSE.txt for more information
+
+'''
+A whole DHT in one process, on a virtual clock.
+
+Hundreds (or thousands) of Controllers exchange datagrams through an
+in-memory Network instead of UDP sockets. Each node has an access delay
+(the one-way delay of a datagram is the sum of both ends' plus jitter) and
+datagrams are lost with a given probability. All the tasks (datagram
+deliveries, timeouts and the Controllers' main loops) share one
+TaskManager: the simulation jumps from task to task, so minutes of DHT
+time take seconds and nothing depends on the load of the machine.
+
+A Simulation (for a routing and a lookup plug-in) bootstraps the nodes,
+lets their routing tables settle and replays a workload of announces and
+lookups. The report includes lookup latency (to the first peers and to the
+end of the lookup), queries and hops per lookup (hop 1: nodes from the
+routing table, hop n+1: nodes returned by hop n) and the maintenance
+cost (queries that are not part of lookups or announces).
+
+Given the same seed, network and workload, a simulation always gives the
+same report. The node ids, delays and workload come from the seed only,
+so different plug-ins are compared on the same network.
+
+See simulate_dht.py (command line).
+
+'''
+
+import os
+import random
+import shutil
+import tempfile
+
+import ptime
+import logging, logging_conf
+
+import identifier
+from identifier import Id
+import message
+import controller
+from minitwisted import Task, TaskManager
+from querier import Querier
+
+logger = logging.getLogger('dht')
+
+PORT = 7000
+BT_PORT = 6881
+
+NUM_NODES = 500
+NUM_BOOTSTRAP_NODES = 4 # known by each node when it joins
+JOIN_PERIOD = 60        # nodes join during the first minute
+WARMUP_PERIOD = 5 * 60  # then the routing tables settle
+MIN_DELAY = .01         # access (one-way) delay of a node
+MAX_DELAY = .15
+JITTER = .01
+LOSS = 0.
+
+NUM_TORRENTS = 50
+NUM_ANNOUNCES = 5       # per torrent
+ANNOUNCE_PERIOD = 60
+NUM_LOOKUPS = 200
+LOOKUP_PERIOD = 5 * 60  # lookups start after the announce period
+DRAIN_PERIOD = 60       # for the last lookups to end
+
+
+class SimClock(object):
+
+    """The virtual time (seconds since the simulation started), which
+    ptime returns while the simulation runs"""
+
+    def __init__(self):
+        self.now = 0.
+
+    def time(self):
+        return self.now
+
+    def sleep(self, delay):
+        self.now += delay
+
+
+class Network(object):
+
+    """Datagrams between the nodes' reactors, with delay and loss"""
+
+    def __init__(self, seed=0, min_delay=MIN_DELAY, max_delay=MAX_DELAY,
+                 jitter=JITTER, loss=LOSS):
+        self.clock = SimClock()
+        self.tasks = TaskManager()
+        self._rand = random.Random(seed)
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.jitter = jitter
+        self.loss = loss
+        self._delays = {}   # addr -> access delay
+        self._receivers = {} # addr -> datagram_received_f
+        self.num_datagrams = 0
+        self.num_bytes = 0
+        self.num_lost = 0
+        self.num_undelivered = 0 # nobody listening
+
+    def add_node(self, addr):
+        self._delays[addr] = self._rand.uniform(self.min_delay,
+                                                self.max_delay)
+
+    def listen(self, addr, datagram_received_f):
+        self._receivers[addr] = datagram_received_f
+
+    def unlisten(self, addr):
+        self._receivers.pop(addr, None)
+
+    def call_later(self, delay, callback_f, *args, **kwds):
+        task = Task(delay, callback_f, *args, **kwds)
+        # on the virtual clock, whether ptime is patched or not
+        task.call_time = self.clock.now + delay
+        self.tasks.add(task)
+        return task
+
+    def sendto(self, src_addr, data, dst_addr):
+        self.num_datagrams += 1
+        self.num_bytes += len(data)
+        if self.loss and self._rand.random() < self.loss:
+            self.num_lost += 1
+            return
+        # addresses not in the network (BOOTSTRAP_NODES) get the maximum
+        delay = (self._delays.get(src_addr, self.max_delay)
+                 + self._delays.get(dst_addr, self.max_delay)
+                 + self._rand.uniform(0, self.jitter))
+        self.call_later(delay, self._deliver, src_addr, data, dst_addr)
+
+    def _deliver(self, src_addr, data, dst_addr):
+        datagram_received_f = self._receivers.get(dst_addr)
+        if datagram_received_f is None:
+            self.num_undelivered += 1
+            return
+        datagram_received_f(data, src_addr)
+
+    def run(self, until):
+        """Fire the tasks due until then (virtual time)"""
+        tasks = self.tasks
+        clock = self.clock
+        while True:
+            call_time = tasks.get_next_call_time()
+            if call_time is None or call_time > until:
+                break
+            clock.now = max(clock.now, call_time)
+            task = tasks.consume_task(clock.now)
+            task.fire_callbacks()
+        clock.now = max(clock.now, until)
+
+
+class SimReactor(object):
+
+    """A node's reactor (same interface as ThreadedReactor) on the
+    Network"""
+
+    def __init__(self, network, addr):
+        self.network = network
+        self.addr = addr
+
+    def listen_udp(self, port, datagram_received_f):
+        self.network.listen(self.addr, datagram_received_f)
+
+    def start(self):
+        pass
+
+    def stop(self):
+        self.network.unlisten(self.addr)
+
+    def call_later(self, delay, callback_f, *args, **kwds):
+        return self.network.call_later(delay, callback_f, *args, **kwds)
+
+    def call_now(self, callback_f, *args, **kwds):
+        return self.network.call_later(0, callback_f, *args, **kwds)
+
+    def sendto(self, data, addr):
+        self.network.sendto(self.addr, data, addr)
+
+
+class _LookupRecord(object):
+
+    """What happened to a lookup of the workload"""
+
+    def __init__(self, node_index, info_hash, bt_port, start_ts):
+        self.node_index = node_index
+        self.info_hash = info_hash
+        self.bt_port = bt_port
+        self.start_ts = start_ts
+        self.first_peers_ts = None
+        self.end_ts = None
+        self.peers = set()
+        self.num_queries = 0
+        self.hops = {} # addr -> hop
+        self.max_hop = 0
+        self.first_peers_hop = None
+
+
+class _SimQuerier(Querier):
+
+    """Querier telling the Simulation about the queries sent and the
+    responses received"""
+
+    def __init__(self, my_id, sim):
+        Querier.__init__(self, my_id)
+        self._sim = sim
+
+    def register_query(self, query, timeout_task):
+        self._sim._on_query_sent(query)
+        return Querier.register_query(self, query, timeout_task)
+
+    def on_response_received(self, response_msg, addr):
+        query = Querier.on_response_received(self, response_msg, addr)
+        if query is not None:
+            self._sim._on_response_received(query, response_msg)
+        return query
+
+
+class _SimController(controller.Controller):
+
+    def __init__(self, sim, *args):
+        controller.Controller.__init__(self, *args)
+        self._querier = _SimQuerier(self._my_id, sim)
+
+    def save_state(self):
+        # nothing reads it, and writing thousands of files is slow
+        pass
+
+
+def make_workload(num_nodes, seed=0, num_torrents=NUM_TORRENTS,
+                  num_announces=NUM_ANNOUNCES,
+                  announce_period=ANNOUNCE_PERIOD,
+                  num_lookups=NUM_LOOKUPS, lookup_period=LOOKUP_PERIOD):
+    """Return a workload: a list of (ts, node_index, info_hash, bt_port)
+    sorted by ts (seconds since the end of the warmup). First the
+    torrents are announced (bt_port), then looked up (bt_port 0) by nodes
+    that did not announce them"""
+    rand = random.Random(seed)
+    info_hashes = [_random_id(rand) for _ in xrange(num_torrents)]
+    workload = []
+    announcers = {}
+    for info_hash in info_hashes:
+        announcers[info_hash] = rand.sample(xrange(num_nodes),
+                                            min(num_announces, num_nodes))
+        for node_index in announcers[info_hash]:
+            workload.append((rand.uniform(0, announce_period), node_index,
+                             info_hash, BT_PORT))
+    for _ in xrange(num_lookups):
+        info_hash = rand.choice(info_hashes)
+        node_index = rand.randrange(num_nodes)
+        while (node_index in announcers[info_hash]
+               and len(announcers[info_hash]) < num_nodes):
+            node_index = rand.randrange(num_nodes)
+        workload.append((announce_period + rand.uniform(0, lookup_period),
+                         node_index, info_hash, 0))
+    workload.sort()
+    return workload
+
+def save_workload(workload, filename):
+    """One line per lookup: ts node_index info_hash bt_port"""
+    f = open(filename, 'w')
+    for ts, node_index, info_hash, bt_port in workload:
+        f.write('%f\t%d\t%r\t%d\n' % (ts, node_index, info_hash, bt_port))
+    f.close()
+
+def load_workload(filename):
+    workload = []
+    f = open(filename)
+    for line in f:
+        if not line.strip() or line.startswith('#'):
+            continue
+        ts, node_index, hex_id, bt_port = line.split()
+        workload.append((float(ts), int(node_index), Id(hex_id),
+                         int(bt_port)))
+    f.close()
+    workload.sort()
+    return workload
+
+def _random_id(rand):
+    return Id(''.join([chr(rand.randint(0, 255))
+                       for _ in xrange(identifier.ID_SIZE_BYTES)]))
+
+def _node_addr(node_index):
+    i = node_index + 1
+    return ('10.%d.%d.%d' % (i >> 16 & 255, i >> 8 & 255, i & 255), PORT)
+
+
+class Simulation(object):
+
+    def __init__(self, routing_m_mod, lookup_m_mod, num_nodes=NUM_NODES,
+                 seed=0, num_bootstrap_nodes=NUM_BOOTSTRAP_NODES,
+                 join_period=JOIN_PERIOD, warmup_period=WARMUP_PERIOD,
+                 **network_kwds):
+        self.routing_m_mod = routing_m_mod
+        self.lookup_m_mod = lookup_m_mod
+        self.num_nodes = num_nodes
+        self.seed = seed
+        self.num_bootstrap_nodes = num_bootstrap_nodes
+        self.join_period = join_period
+        self.warmup_period = warmup_period
+        self.network = Network(seed, **network_kwds)
+        self.controllers = []
+        self.lookups = []
+        # queries sent by all the nodes
+        self.num_lookup_queries = 0
+        self.num_announce_queries = 0
+        self.num_maintenance_queries = 0
+        self._warmup_maintenance_queries = 0
+
+    def run(self, workload):
+        """Bootstrap the nodes, warm up and replay the workload. Return
+        the report (a dict)"""
+        # the plug-ins use random too
+        random.seed(self.seed)
+        real_time, real_sleep = ptime.time, ptime.sleep
+        ptime.time = self.network.clock.time
+        ptime.sleep = self.network.clock.sleep
+        state_path = tempfile.mkdtemp()
+        try:
+            self._create_nodes(state_path)
+            self.network.run(self.join_period + self.warmup_period)
+            self._warmup_maintenance_queries = self.num_maintenance_queries
+            self.measure_start_ts = self.network.clock.now
+            for ts, node_index, info_hash, bt_port in workload:
+                self.network.call_later(ts, self._get_peers,
+                                        node_index, info_hash, bt_port)
+            last_ts = max([0] + [event[0] for event in workload])
+            self.network.run(self.measure_start_ts + last_ts
+                             + DRAIN_PERIOD)
+            self.measure_end_ts = self.network.clock.now
+            for c in self.controllers:
+                c.stop()
+        finally:
+            ptime.time, ptime.sleep = real_time, real_sleep
+            shutil.rmtree(state_path)
+        return self.get_report()
+
+    def _create_nodes(self, state_path):
+        rand = random.Random(self.seed)
+        node_ids = [_random_id(rand) for _ in xrange(self.num_nodes)]
+        for node_index in xrange(self.num_nodes):
+            addr = _node_addr(node_index)
+            self.network.add_node(addr)
+            # what the node knows is in its state.dat
+            node_path = os.path.join(state_path, str(node_index))
+            os.mkdir(node_path)
+            others = [i for i in rand.sample(
+                    xrange(self.num_nodes),
+                    min(self.num_bootstrap_nodes + 1, self.num_nodes))
+                      if i != node_index][:self.num_bootstrap_nodes]
+            f = open(os.path.join(node_path, controller.STATE_FILENAME), 'w')
+            f.write('%r\n' % node_ids[node_index])
+            for i in others:
+                ip, port = _node_addr(i)
+                f.write('%d\t%r\t%s\t%d\t%f\n' % (
+                        node_ids[node_index].log_distance(node_ids[i]),
+                        node_ids[i], ip, port, 0.))
+            f.close()
+            join_ts = rand.uniform(0, self.join_period)
+            self.network.call_later(join_ts, self._start_node,
+                                    node_index, addr, node_path)
+        # controllers are in node_index order
+        self.controllers = [None] * self.num_nodes
+
+    def _start_node(self, node_index, addr, node_path):
+        c = _SimController(self, addr, node_path,
+                           self.routing_m_mod, self.lookup_m_mod,
+                           None, SimReactor(self.network, addr))
+        self.controllers[node_index] = c
+        c.start()
+
+    def _get_peers(self, node_index, info_hash, bt_port):
+        lookup_id = len(self.lookups)
+        record = _LookupRecord(node_index, info_hash, bt_port,
+                               self.network.clock.now)
+        self.lookups.append(record)
+        c = self.controllers[node_index]
+        if c is None or not c.get_peers(lookup_id, info_hash,
+                                        self._on_peers_found, bt_port):
+            # no queries sent, this lookup won't end
+            record.end_ts = record.start_ts
+
+    def _on_peers_found(self, lookup_id, peers):
+        record = self.lookups[lookup_id]
+        if peers:
+            if record.first_peers_ts is None:
+                record.first_peers_ts = self.network.clock.now
+            record.peers.update(peers)
+        else:
+            record.end_ts = self.network.clock.now
+
+    def _get_record(self, query):
+        lookup_obj = query.lookup_obj
+        if lookup_obj is None or lookup_obj.callback_f is None:
+            # maintenance lookup
+            return None
+        return self.lookups[lookup_obj.lookup_id]
+
+    def _on_query_sent(self, query):
+        query_type = query.msg.query
+        if query_type == message.ANNOUNCE_PEER:
+            self.num_announce_queries += 1
+            return
+        record = None
+        if query_type == message.GET_PEERS:
+            record = self._get_record(query)
+        if record is None:
+            self.num_maintenance_queries += 1
+            return
+        self.num_lookup_queries += 1
+        record.num_queries += 1
+        # nodes not returned by other nodes come from the routing table
+        hop = record.hops.setdefault(query.dstnode.addr, 1)
+        record.max_hop = max(record.max_hop, hop)
+
+    def _on_response_received(self, query, response_msg):
+        if query.msg.query != message.GET_PEERS:
+            return
+        record = self._get_record(query)
+        if record is None:
+            return
+        hop = record.hops.get(query.dstnode.addr, 1)
+        for node_ in response_msg.all_nodes:
+            record.hops.setdefault(node_.addr, hop + 1)
+        if response_msg.peers and record.first_peers_hop is None:
+            record.first_peers_hop = hop
+
+    def get_report(self):
+        """Return a dict with the results of the lookups that did not
+        announce (times in seconds)"""
+        announcers = {}
+        for record in self.lookups:
+            if record.bt_port:
+                announcers.setdefault(record.info_hash, set()).add(
+                    _node_addr(record.node_index)[0])
+        records = [record for record in self.lookups if not record.bt_port]
+        successful = []
+        for record in records:
+            expected = announcers.get(record.info_hash, set())
+            if [peer for peer in record.peers if peer[0] in expected]:
+                successful.append(record)
+        ended = [record for record in records if record.end_ts is not None]
+        measure_minutes = (self.measure_end_ts - self.measure_start_ts) / 60
+        warmup_minutes = (self.join_period + self.warmup_period) / 60.
+        num_maintenance = (self.num_maintenance_queries
+                           - self._warmup_maintenance_queries)
+        return {
+            'routing_m': self.routing_m_mod.__name__.split('.')[-1],
+            'lookup_m': self.lookup_m_mod.__name__.split('.')[-1],
+            'nodes': self.num_nodes,
+            'lookups': len(records),
+            'successful': len(successful),
+            'success_rate': _ratio(len(successful), len(records)),
+            'first_peers_time': _stats(
+                [r.first_peers_ts - r.start_ts for r in successful]),
+            'lookup_time': _stats([r.end_ts - r.start_ts for r in ended]),
+            'queries': _stats([r.num_queries for r in records]),
+            'hops_to_peers': _stats([r.first_peers_hop for r in successful
+                                     if r.first_peers_hop]),
+            'max_hops': _stats([r.max_hop for r in records]),
+            'lookup_queries': self.num_lookup_queries,
+            'announce_queries': self.num_announce_queries,
+            'maintenance_queries': num_maintenance,
+            'maintenance_per_node_min': _ratio(
+                num_maintenance, self.num_nodes * measure_minutes),
+            'warmup_maintenance_per_node_min': _ratio(
+                self._warmup_maintenance_queries,
+                self.num_nodes * warmup_minutes),
+            'datagrams': self.network.num_datagrams,
+            'bytes': self.network.num_bytes,
+            'lost': self.network.num_lost,
+            }
+
+def _ratio(total, num):
+    if not num:
+        return None
+    return float(total) / num
+
+def _stats(values):
+    """Return (average, median, 90th percentile) or Nones"""
+    if not values:
+        return None, None, None
+    values = sorted(values)
+    return (_ratio(sum(values), len(values)),
+            values[len(values) / 2],
+            values[min(len(values) - 1, int(len(values) * .9))])
+
+REPORT_COLUMNS = (
+    # title, key, stat index (or None), format
+    ('routing_m', 'routing_m', None, '%s'),
+    ('lookup_m', 'lookup_m', None, '%s'),
+    ('found', 'success_rate', None, '%.2f'),
+    ('peers avg', 'first_peers_time', 0, '%.3f'),
+    ('peers 90%', 'first_peers_time', 2, '%.3f'),
+    ('end avg', 'lookup_time', 0, '%.3f'),
+    ('queries', 'queries', 0, '%.1f'),
+    ('hops', 'hops_to_peers', 0, '%.2f'),
+    ('max hops', 'max_hops', 0, '%.2f'),
+    ('maint/node/min', 'maintenance_per_node_min', None, '%.2f'),
+    ('datagrams', 'datagrams', None, '%d'),
+    )
+
+def format_reports(reports):
+    """Return a table with a line per report"""
+    rows = [[title for title, _, _, _ in REPORT_COLUMNS]]
+    for report in reports:
+        row = []
+        for _, key, index, format in REPORT_COLUMNS:
+            value = report[key]
+            if index is not None:
+                value = value[index]
+            if value is None:
+                row.append('-')
+            else:
+                row.append(format % value)
+        rows.append(row)
+    widths = [max([len(row[i]) for row in rows])
+              for i in xrange(len(REPORT_COLUMNS))]
+    return '\n'.join(['  '.join([cell.rjust(width)
+                                 for cell, width in zip(row, widths)])
+                      for row in rows])
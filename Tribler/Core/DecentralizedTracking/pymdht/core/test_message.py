@@ -11,6 +11,7 @@ import test_const as tc
 import bencode
 import message as m
 import message_tools as mt
+import tracker
 
 logging_conf.testing_setup(__name__)
 logger = logging.getLogger('dht')
@@ -278,6 +279,35 @@ class TestEvilIncomingQueries: #aka invalid bencode messages
             assert p1[0] == p2[0]
             assert p1[1] == p2[1]
 
+    def test_get_peers_scrape(self):
+        #client
+        outgoing_query = m.OutgoingGetPeersQuery(tc.CLIENT_ID, tc.INFO_HASH,
+                                                 noseed=True, scrape=True)
+        data = outgoing_query.encode(tc.TID)
+        #server
+        incoming_query = m.IncomingMsg(data, tc.CLIENT_ADDR)
+        ok_(incoming_query.noseed)
+        ok_(incoming_query.scrape)
+        bf_seeds, bf_peers = tracker.BloomFilter(), tracker.BloomFilter()
+        bf_seeds.insert(tc.PEERS[0][0])
+        outgoing_response = m.OutgoingGetPeersResponse(tc.SERVER_ID,
+                                                       tc.TOKEN,
+                                                       tc.NODES,
+                                                       bf_seeds=bf_seeds,
+                                                       bf_peers=bf_peers)
+        data = outgoing_response.encode(incoming_query.tid)
+        #client
+        incoming_response = m.IncomingMsg(data, tc.SERVER_ADDR)
+        eq_(incoming_response.bf_seeds, str(bf_seeds))
+        eq_(incoming_response.bf_peers, str(bf_peers))
+        eq_(tracker.BloomFilter(incoming_response.bf_seeds).estimate_size(), 1)
+        # no scrape by default
+        incoming_query = m.IncomingMsg(
+            m.OutgoingGetPeersQuery(tc.CLIENT_ID, tc.INFO_HASH).encode(tc.TID),
+            tc.CLIENT_ADDR)
+        ok_(not incoming_query.noseed)
+        ok_(not incoming_query.scrape)
+
     def test_get_peers_peers_error(self):
         assert 1
 
@@ -292,6 +322,7 @@ class TestEvilIncomingQueries: #aka invalid bencode messages
         #server
         incoming_query = m.IncomingMsg(data, tc.CLIENT_ADDR)
         assert incoming_query.type is m.QUERY
+        ok_(not incoming_query.seed)
         outgoing_response = m.OutgoingAnnouncePeerResponse(tc.SERVER_ID)
         data = outgoing_response.encode(incoming_query.tid)
         #client
@@ -299,6 +330,16 @@ class TestEvilIncomingQueries: #aka invalid bencode messages
         assert incoming_response.type is m.RESPONSE
         #incoming_response.sanitize_response(outgoing_query.query)
 
+    def test_announce_peer_seed(self):
+        outgoing_query = m.OutgoingAnnouncePeerQuery(tc.CLIENT_ID,
+                                                   tc.INFO_HASH,
+                                                   tc.BT_PORT,
+                                                   tc.TOKEN,
+                                                   seed=True)
+        data = outgoing_query.encode(tc.TID)
+        incoming_query = m.IncomingMsg(data, tc.CLIENT_ADDR)
+        ok_(incoming_query.seed)
+
     def test_announce_peer_error(self):
         assert 1
     '''
@@ -4,6 +4,7 @@
 
 from __future__ import with_statement
 import threading
+import socket
 import ptime as time
 
 import logging, logging_conf
@@ -20,12 +21,16 @@ logger = logging.getLogger('dht')
 import minitwisted
 from minitwisted import Task, TaskManager, \
      ThreadedReactor, ThreadedReactorMock, \
-     ThreadedReactorSocketError
+     ThreadedReactorSocketError, RawServerReactor
 
 
 ADDRS= (tc.CLIENT_ADDR, tc.SERVER_ADDR)
 DATA = 'testing...'
 
+# not used by other tests, whose sockets may still be bound
+FLOOD_CLIENT_ADDR = ('127.0.0.1', 6010)
+FLOOD_SERVER_ADDR = ('127.0.0.1', 6011)
+
 
 class TestTaskManager:
     
@@ -137,6 +142,68 @@ class TestTaskManager:
         self.task_m.consume_task().fire_callbacks()
         eq_(self.callback_order, [1,2])
 
+    def test_same_call_time(self):
+        tasks = [Task(.1, self.callback_f, i) for i in xrange(5)]
+        for task in tasks:
+            task.call_time = tasks[0].call_time
+            self.task_m.add(task)
+        time.sleep(.1)
+        while True:
+            task = self.task_m.consume_task()
+            if task is None:
+                break
+            task.fire_callbacks()
+        eq_(self.callback_order, range(5))
+
+    def test_cleanup_cancelled(self):
+        tasks = [Task(1, self.callback_f, i) for i in xrange(100)]
+        for task in tasks:
+            self.task_m.add(task)
+        for task in tasks[:80]:
+            task.cancel()
+        task.cancel() # twice
+        eq_(self.task_m.num_cancelled, 80)
+        self.task_m.add(Task(.5, self.callback_f, 'a'))
+        # cancelled tasks have been removed
+        eq_(len(self.task_m), 21)
+        eq_(self.task_m.num_cancelled, 0)
+        time.sleep(1)
+        while True:
+            task = self.task_m.consume_task()
+            if task is None:
+                break
+            task.fire_callbacks()
+        eq_(self.callback_order, ['a'] + range(80, 100))
+        eq_(len(self.task_m), 0)
+
+    def test_next_call_time(self):
+        eq_(self.task_m.get_next_call_time(), None)
+        task1 = Task(.1, self.callback_f, 1)
+        task2 = Task(.2, self.callback_f, 2)
+        self.task_m.add(task2)
+        self.task_m.add(task1)
+        eq_(self.task_m.get_next_call_time(), task1.call_time)
+        task1.cancel()
+        eq_(self.task_m.get_next_call_time(), task2.call_time)
+        eq_(self.task_m.num_cancelled, 0)
+
+    def test_task_added_while_firing(self):
+        # a task rescheduling itself with no delay is fired once per loop
+        def reschedule(i):
+            self.callback_order.append(i)
+            self.task_m.add(Task(0, reschedule, i + 1))
+        self.task_m.add(Task(0, reschedule, 0))
+        time.sleep(.01)
+        for _ in xrange(3):
+            current_time = time.time()
+            while True:
+                task = self.task_m.consume_task(current_time)
+                if task is None:
+                    break
+                task.fire_callbacks()
+            time.sleep(.01)
+        eq_(self.callback_order, [0, 1, 2])
+
     def teardown(self):
         global time
         time = minitwisted.time = time.actual_time
@@ -278,6 +345,131 @@ class TestMinitwisted:
             self.callback_order.append(callback_id)
 
 
+class TestReceiveAll:
+
+    def setup(self):
+        self.lock = threading.Lock()
+        self.datagrams_received = []
+        self.client_r = ThreadedReactor(task_interval=tc.TASK_INTERVAL)
+        self.server_r = ThreadedReactor(task_interval=tc.TASK_INTERVAL,
+                                        floodbarrier_active=False)
+        self.client_r.listen_udp(FLOOD_CLIENT_ADDR[1], lambda x,y:None)
+        server_s = self.server_r.listen_udp(FLOOD_SERVER_ADDR[1],
+                                            self.on_datagram_received)
+        # the kernel must not drop any datagrams
+        server_s.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 2**20)
+        self.server_r.start()
+
+    def test_receive_all(self):
+        # more datagrams than handled per wakeup
+        num_datagrams = minitwisted.MAX_DATAGRAMS_PER_WAKEUP + 10
+        for i in xrange(num_datagrams):
+            self.client_r.sendto(str(i), FLOOD_SERVER_ADDR)
+        for _ in xrange(100):
+            with self.lock:
+                if len(self.datagrams_received) == num_datagrams:
+                    break
+            time.sleep(tc.TASK_INTERVAL)
+        with self.lock:
+            eq_([data for data, addr in self.datagrams_received],
+                [str(i) for i in xrange(num_datagrams)])
+
+    def teardown(self):
+        self.server_r.stop()
+        self.client_r.s.close()
+        self.server_r.s.close()
+
+    def on_datagram_received(self, data, addr):
+        with self.lock:
+            self.datagrams_received.append((data, addr))
+
+
+class RawServerMock(object):
+
+    def __init__(self):
+        self.tasks = []
+        self.udp_handlers = {}
+
+    def add_task(self, func, delay=0):
+        self.tasks.append((time.time() + delay, func))
+
+    def run_tasks(self):
+        self.tasks.sort()
+        while self.tasks and self.tasks[0][0] <= time.time():
+            self.tasks.pop(0)[1]()
+
+    def create_udpsocket(self, port, host):
+        s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        s.bind((host, port))
+        return s
+
+    def start_listening_udp(self, s, handler):
+        self.udp_handlers[s] = handler
+
+    def stop_listening_udp(self, s):
+        del self.udp_handlers[s]
+
+
+class TestRawServerReactor:
+
+    def setup(self):
+        global time
+        time = minitwisted.time = MockTime()
+        self.callback_order = []
+        self.datagrams_received = []
+        self.rawserver = RawServerMock()
+        self.r = RawServerReactor(self.rawserver)
+        self.s = self.r.listen_udp(0, self.on_datagram_received)
+        self.r.start()
+
+    def test_datagrams(self):
+        handler = self.rawserver.udp_handlers[self.s]
+        handler.data_came_in([(tc.SERVER_ADDR, DATA),
+                              (tc.SERVER_ADDR, DATA + DATA)])
+        eq_(self.datagrams_received, [(DATA, tc.SERVER_ADDR),
+                                      (DATA + DATA, tc.SERVER_ADDR)])
+
+    def test_call_later(self):
+        self.r.call_later(.2, self.callback_f, 2)
+        eq_(len(self.rawserver.tasks), 1)
+        # a later task does not need another wakeup, an earlier one does
+        self.r.call_later(.3, self.callback_f, 3)
+        eq_(len(self.rawserver.tasks), 1)
+        self.r.call_later(.1, self.callback_f, 1)
+        task4 = self.r.call_later(.1, self.callback_f, 4)
+        eq_(len(self.rawserver.tasks), 2)
+        task4.cancel()
+        time.sleep(.1)
+        self.rawserver.run_tasks()
+        eq_(self.callback_order, [1])
+        time.sleep(.1)
+        self.rawserver.run_tasks()
+        eq_(self.callback_order, [1, 2])
+        time.sleep(.1)
+        self.rawserver.run_tasks()
+        eq_(self.callback_order, [1, 2, 3])
+        eq_(self.rawserver.tasks, [])
+
+    def test_stop(self):
+        self.r.call_later(.1, self.callback_f, 1)
+        self.r.stop()
+        time.sleep(.1)
+        self.rawserver.run_tasks()
+        eq_(self.callback_order, [])
+        ok_(self.s not in self.rawserver.udp_handlers)
+
+    def teardown(self):
+        global time
+        time = minitwisted.time = time.actual_time
+        self.s.close()
+
+    def on_datagram_received(self, data, addr):
+        self.datagrams_received.append((data, addr))
+
+    def callback_f(self, callback_id):
+        self.callback_order.append(callback_id)
+
+
 class TestSocketErrors:
 
     def _callback(self, *args, **kwargs):
@@ -0,0 +1,108 @@
+# Copyright (C) 2009-2010 Raul Jimenez
+# Released under GNU LGPL 2.1
+# See LICENSE.txt for more information
+
+import os
+import tempfile
+
+from nose.tools import eq_, ok_
+
+import ptime as time
+import logging, logging_conf
+
+logging_conf.testing_setup(__name__)
+logger = logging.getLogger('dht')
+
+import test_const as tc
+
+import simulation
+from simulation import Network, Simulation
+
+import Tribler.Core.DecentralizedTracking.pymdht.plugins.routing_nice_rtt \
+    as routing_m_mod
+import Tribler.Core.DecentralizedTracking.pymdht.plugins.lookup_a16 \
+    as lookup_m_mod
+
+NUM_NODES = 30
+
+
+class TestNetwork:
+
+    def setup(self):
+        self.received = []
+
+    def _on_datagram_received(self, data, addr):
+        self.received.append((self.network.clock.now, data, addr))
+
+    def test_delay(self):
+        self.network = Network(min_delay=.1, max_delay=.2, jitter=.01)
+        for addr in tc.CLIENT_ADDR, tc.SERVER_ADDR:
+            self.network.add_node(addr)
+        self.network.listen(tc.SERVER_ADDR, self._on_datagram_received)
+        self.network.sendto(tc.CLIENT_ADDR, 'data', tc.SERVER_ADDR)
+        self.network.run(.1)
+        eq_(self.received, [])
+        self.network.run(1)
+        eq_(len(self.received), 1)
+        ts, data, addr = self.received[0]
+        ok_(.2 <= ts <= .41)
+        eq_((data, addr), ('data', tc.CLIENT_ADDR))
+        eq_(self.network.clock.now, 1)
+        # nobody listening
+        self.network.sendto(tc.SERVER_ADDR, 'data', tc.CLIENT_ADDR)
+        self.network.run(2)
+        eq_(self.network.num_undelivered, 1)
+
+    def test_loss(self):
+        self.network = Network(loss=1)
+        self.network.listen(tc.SERVER_ADDR, self._on_datagram_received)
+        self.network.sendto(tc.CLIENT_ADDR, 'data', tc.SERVER_ADDR)
+        self.network.run(10)
+        eq_(self.received, [])
+        eq_(self.network.num_lost, 1)
+
+
+class TestSimulation:
+
+    def setup(self):
+        self.workload = simulation.make_workload(
+            NUM_NODES, num_torrents=5, num_announces=3,
+            num_lookups=10, lookup_period=60)
+
+    def _run(self):
+        sim = Simulation(routing_m_mod, lookup_m_mod, NUM_NODES,
+                         warmup_period=60)
+        return sim.run(self.workload)
+
+    def test_run(self):
+        real_time = time.time
+        report = self._run()
+        # the real clock is back
+        eq_(time.time, real_time)
+        eq_(report['nodes'], NUM_NODES)
+        eq_(report['lookups'], 10)
+        ok_(report['success_rate'] > .5)
+        avg_time, _, _ = report['first_peers_time']
+        ok_(0 < avg_time < 2)
+        avg_hops, _, _ = report['hops_to_peers']
+        ok_(avg_hops >= 1)
+        ok_(report['lookup_queries'] > 0)
+        ok_(report['announce_queries'] > 0)
+        ok_(report['maintenance_per_node_min'] > 0)
+        ok_(simulation.format_reports([report]))
+
+    def test_reproducible(self):
+        eq_(self._run(), self._run())
+
+    def test_save_workload(self):
+        fd, filename = tempfile.mkstemp()
+        os.close(fd)
+        try:
+            simulation.save_workload(self.workload, filename)
+            workload = simulation.load_workload(filename)
+        finally:
+            os.remove(filename)
+        eq_(len(workload), len(self.workload))
+        for event, loaded_event in zip(self.workload, workload):
+            eq_(event[1:], loaded_event[1:])
+            ok_(abs(event[0] - loaded_event[0]) < 1e-5)
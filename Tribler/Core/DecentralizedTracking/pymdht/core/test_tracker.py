@@ -160,7 +160,95 @@ class TestTracker(object):
         # cleaning ... 2,3,4,5,6,7 out
         eq_(self.t.num_peers, 3)
 
-            
+
+    def test_reannounce_does_not_expire(self):
+        self.t.put(KEYS[0], PEERS[0])
+        time.sleep(20)
+        self.t.put(KEYS[0], PEERS[0])
+        time.sleep(20)
+        # the first announce has expired, the second one has not
+        eq_(self.t.get(KEYS[0]), [PEERS[0]])
+        eq_(self.t.num_peers, 1)
+
+    def test_get_most_recent_peers(self):
+        for i in range(tracker.MAX_PEERS + 10):
+            self.t.put(KEYS[0], ('1.2.3.4', i))
+        eq_(self.t.get(KEYS[0]),
+            [('1.2.3.4', i) for i in range(10, tracker.MAX_PEERS + 10)])
+
+    def test_noseed(self):
+        self.t.put(KEYS[0], PEERS[0], seed=True)
+        self.t.put(KEYS[0], PEERS[1])
+        eq_(self.t.get(KEYS[0]), PEERS[0:2])
+        eq_(self.t.get(KEYS[0], noseed=True), PEERS[1:2])
+
+    def test_max_peers_per_key(self):
+        t = tracker.Tracker(VALIDITY_PERIOD, CLEANUP_COUNTER,
+                            max_peers_per_key=3)
+        for i in range(5):
+            t.put(KEYS[0], PEERS[i])
+            time.sleep(1)
+        eq_(t.num_peers, 3)
+        eq_(t.get(KEYS[0]), PEERS[2:5])
+
+    def test_evict_least_popular(self):
+        t = tracker.Tracker(VALIDITY_PERIOD, CLEANUP_COUNTER,
+                            max_stored_peers=5)
+        for i in range(3):
+            t.put(KEYS[0], PEERS[i])
+        t.put(KEYS[1], PEERS[0])
+        t.put(KEYS[2], PEERS[0])
+        eq_(t.num_keys, 3)
+        # one peer too many: KEYS[1] or KEYS[2] goes, KEYS[0] stays
+        t.put(KEYS[0], PEERS[3])
+        eq_(t.num_keys, 2)
+        eq_(t.num_peers, 5)
+        eq_(t.get(KEYS[0]), PEERS[0:4])
+        # the key being put is not evicted
+        t.put('new', PEERS[0])
+        eq_(t.num_keys, 2)
+        eq_(t.get('new'), PEERS[0:1])
+        eq_(t.get(KEYS[0]), PEERS[0:4])
+
+    def test_heap_compaction(self):
+        for i in range(tracker.MIN_HEAP_SIZE * 3):
+            self.t.put(KEYS[0], PEERS[0])
+        eq_(self.t.num_peers, 1)
+        ok_(len(self.t._heap) <= tracker.MIN_HEAP_SIZE + 1)
+        eq_(self.t.get(KEYS[0]), PEERS[0:1])
+
+    def test_scrape(self):
+        bf_seeds, bf_peers = self.t.get_scrape(KEYS[0])
+        eq_(bf_seeds.estimate_size(), 0)
+        eq_(bf_peers.estimate_size(), 0)
+        for i in range(20):
+            self.t.put(KEYS[0], ('1.2.3.%d' % i, 6881), seed=i < 5)
+        # the same IP, different port
+        self.t.put(KEYS[0], ('1.2.3.19', 6882))
+        bf_seeds, bf_peers = self.t.get_scrape(KEYS[0])
+        eq_(len(str(bf_seeds)), 256)
+        eq_(bf_seeds.estimate_size(), 5)
+        eq_(bf_peers.estimate_size(), 15)
+        # kept up to date on put
+        self.t.put(KEYS[0], ('1.2.3.100', 6881))
+        eq_(self.t.get_scrape(KEYS[0])[1].estimate_size(), 16)
+        # rebuilt when peers go
+        time.sleep(VALIDITY_PERIOD + 1)
+        self.t.put(KEYS[0], ('1.2.3.200', 6881), seed=True)
+        bf_seeds, bf_peers = self.t.get_scrape(KEYS[0])
+        eq_(bf_seeds.estimate_size(), 1)
+        eq_(bf_peers.estimate_size(), 0)
+
+    def test_bloom_filter(self):
+        # test vector from BEP 33: 2001:DB8::0 to 2001:DB8::3E7 and
+        # 192.0.2.0 to 192.0.2.255, estimated size 1224.93
+        bf = tracker.BloomFilter()
+        for i in range(0x3e8):
+            bf.insert('2001:db8::%x' % i)
+        for i in range(256):
+            bf.insert('192.0.2.%d' % i)
+        eq_(bf.estimate_size(), 1225)
+
     def teardown(self):
         global time
         time.unmock()
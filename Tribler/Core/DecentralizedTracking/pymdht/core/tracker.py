@@ -2,60 +2,245 @@
 # Released under GNU LGPL 2.1
 # See LICENSE.txt for more information
 
+"""
+The peers announced to this node, per info_hash.
+
+Each key (info_hash) has a dictionary of its peers, so a re-announce
+replaces the peer in O(1). A single heap of (timestamp, seq, key, peer)
+entries orders all the peers by age: expired peers are popped from it,
+without sweeping every key. Entries for peers that were re-announced or
+removed are not searched for; they are recognized when popped (their seq
+does not match the peer's anymore) and dropped.
+
+Memory is bounded: no key keeps more than MAX_PEERS_PER_KEY peers (the
+oldest one makes room) and when more than MAX_STORED_PEERS peers are
+stored, the least popular keys (those with the fewest peers) are evicted.
+
+For BEP 33 (DHT scrapes) the peers are flagged as seeds or not and the
+seed and peer bloom filters of a key are built when first asked for and
+kept up to date while peers are only added.
+
+"""
+
+import heapq
+import math
+import socket
+from array import array
+try:
+    from hashlib import sha1
+except ImportError:
+    from sha import sha as sha1
+
 import ptime as time
 
 VALIDITY_PERIOD = 30 * 60 #30 minutes
 CLEANUP_COUNTER = 100
 
 MAX_PEERS = 50 # Avoids way too long get_peers respoonses (longer than UDP
+MAX_PEERS_PER_KEY = 2 * MAX_PEERS
+MAX_STORED_PEERS = 100000
+MIN_HEAP_SIZE = 1000 # don't compact the heap below this size
+
+BLOOM_FILTER_BITS = 2048 # BEP 33: m = 256 bytes, k = 2 hashes
+BLOOM_FILTER_HASHES = 2
+
+
+class BloomFilter(object):
+
+    """The seed (BFsd) or peer (BFpe) bloom filter of BEP 33"""
+
+    def __init__(self, bits=None):
+        if bits is None:
+            self._bits = array('B', [0] * (BLOOM_FILTER_BITS / 8))
+        else:
+            self._bits = array('B', bits)
+
+    def insert(self, ip):
+        try:
+            c_ip = socket.inet_aton(ip)
+        except (socket.error):
+            c_ip = socket.inet_pton(socket.AF_INET6, ip)
+        h = sha1(c_ip).digest()
+        for i in (0, 2):
+            index = (ord(h[i]) | ord(h[i + 1]) << 8) % BLOOM_FILTER_BITS
+            self._bits[index / 8] |= 1 << (index % 8)
+
+    def estimate_size(self):
+        """Number of different IPs inserted (estimated)"""
+        zeros = BLOOM_FILTER_BITS - sum(
+            [bin(byte).count('1') for byte in self._bits])
+        # all bits set: the filter is saturated
+        zeros = max(zeros, 1)
+        m = float(BLOOM_FILTER_BITS)
+        return int(round(math.log(zeros / m) /
+                         (BLOOM_FILTER_HASHES * math.log(1 - 1 / m))))
+
+    def __str__(self):
+        return self._bits.tostring()
+
+
+class _Swarm(object):
+
+    """The peers of a key: {peer: (timestamp, seq, seed)}. The bloom
+    filters are None until a scrape needs them"""
+
+    __slots__ = ('peers', 'bf_seeds', 'bf_peers')
+
+    def __init__(self):
+        self.peers = {}
+        self.bf_seeds = None
+        self.bf_peers = None
+
 
 class Tracker(object):
 
     def __init__(self, validity_period=VALIDITY_PERIOD,
-                 cleanup_counter=CLEANUP_COUNTER):
+                 cleanup_counter=CLEANUP_COUNTER,
+                 max_stored_peers=MAX_STORED_PEERS,
+                 max_peers_per_key=MAX_PEERS_PER_KEY):
         self._tracker_dict = {}
+        self._heap = []
+        self._seq = 0
+        # _keys_by_size[n]: the keys with n peers
+        self._keys_by_size = [set() for _ in xrange(max_peers_per_key + 1)]
         self.validity_period = validity_period
         self.cleanup_counter = cleanup_counter
+        self.max_stored_peers = max_stored_peers
+        self.max_peers_per_key = max_peers_per_key
         self._put_counter = 0
         self.num_keys = 0
         self.num_peers = 0
-        
-    def put(self, k, peer):
+
+    def put(self, k, peer, seed=False):
         #Clean up every n puts
         self._put_counter += 1
         if self._put_counter == self.cleanup_counter:
             self._put_counter = 0
-            for k_ in self._tracker_dict.keys():
-                ts_peers = self._tracker_dict[k_]
-                self._cleanup_key(k_)
-                if not ts_peers: #empty list. Delete key
-                    del self._tracker_dict[k_]
-                    self.num_keys -= 1
-        
-        ts_peers = self._tracker_dict.setdefault(k,[])
-        if not ts_peers:
+            self._cleanup()
+
+        swarm = self._tracker_dict.get(k)
+        if swarm is None:
+            swarm = self._tracker_dict[k] = _Swarm()
             self.num_keys += 1
-        else:
-            # let's see whether the peer is already there
-            for i in range(len(ts_peers)):
-                if ts_peers[i][1] == peer:
-                    self.num_peers -= 1
-                    del ts_peers[i]
-                    break
-        ts_peers.append((time.time(), peer))
-        self.num_peers += 1
-
-    def get(self, k):
-        ts_peers = self._tracker_dict.get(k, [])
-        self._cleanup_key(k)
-        return [ts_peer[1] for ts_peer in ts_peers[-MAX_PEERS:]]
-
-    def _cleanup_key(self, k):
+        peers = swarm.peers
+        size = len(peers)
+        if peer in peers:
+            # re-announce: the old heap entry is left behind (stale)
+            if peers[peer][2] != seed:
+                # a leecher became a seed
+                swarm.bf_seeds = swarm.bf_peers = None
+        elif size == self.max_peers_per_key:
+            # make room, the oldest peer goes
+            self._remove_peer(swarm, min(peers, key=peers.get))
+        ts = time.time()
+        self._seq += 1
+        peers[peer] = (ts, self._seq, seed)
+        heapq.heappush(self._heap, (ts, self._seq, k, peer))
+        if swarm.bf_seeds is not None:
+            if seed:
+                swarm.bf_seeds.insert(peer[0])
+            else:
+                swarm.bf_peers.insert(peer[0])
+        self._resized(k, size, len(peers))
+
+        while self.num_peers > self.max_stored_peers:
+            if not self._evict(k):
+                break
+        if len(self._heap) > max(MIN_HEAP_SIZE, 2 * self.num_peers):
+            self._compact()
+
+    def get(self, k, noseed=False):
+        self._cleanup()
+        swarm = self._tracker_dict.get(k)
+        if swarm is None:
+            return []
+        items = swarm.peers.items()
+        if noseed:
+            items = [item for item in items if not item[1][2]]
+        # the most recent peers (oldest first)
+        items = heapq.nlargest(MAX_PEERS, items, key=lambda item: item[1])
+        items.reverse()
+        return [peer for peer, _ in items]
+
+    def get_scrape(self, k):
+        """Return the seed and peer bloom filters (BEP 33) of the key"""
+        self._cleanup()
+        swarm = self._tracker_dict.get(k)
+        if swarm is None:
+            return BloomFilter(), BloomFilter()
+        if swarm.bf_seeds is None:
+            swarm.bf_seeds = BloomFilter()
+            swarm.bf_peers = BloomFilter()
+            for peer, (_, _, seed) in swarm.peers.iteritems():
+                if seed:
+                    swarm.bf_seeds.insert(peer[0])
+                else:
+                    swarm.bf_peers.insert(peer[0])
+        return swarm.bf_seeds, swarm.bf_peers
+
+    def _cleanup(self):
         '''
-        Clean up the list as side effect.
+        Remove the expired peers (oldest first) and the stale entries in
+        front of the heap.
         '''
-        ts_peers = self._tracker_dict.get(k, None)
+        heap = self._heap
         oldest_valid_ts = time.time() - self.validity_period
-        while ts_peers and  ts_peers[0][0] < oldest_valid_ts:
-            del ts_peers[0]
-            self.num_peers -= 1
+        while heap and heap[0][0] < oldest_valid_ts:
+            _, seq, k, peer = heapq.heappop(heap)
+            swarm = self._tracker_dict.get(k)
+            if swarm is None:
+                continue # evicted key
+            value = swarm.peers.get(peer)
+            if value is None or value[1] != seq:
+                continue # removed or re-announced peer
+            size = len(swarm.peers)
+            self._remove_peer(swarm, peer)
+            self._resized(k, size, size - 1)
+
+    def _remove_peer(self, swarm, peer):
+        # the caller updates the counters (see _resized)
+        del swarm.peers[peer]
+        # bloom filters can't remove, they are rebuilt when needed
+        swarm.bf_seeds = swarm.bf_peers = None
+
+    def _resized(self, k, old_size, new_size):
+        self.num_peers += new_size - old_size
+        self._keys_by_size[old_size].discard(k)
+        if new_size:
+            self._keys_by_size[new_size].add(k)
+        else:
+            del self._tracker_dict[k]
+            self.num_keys -= 1
+
+    def _evict(self, current_k):
+        '''
+        Evict the key with the fewest peers (but not the key being put).
+        '''
+        for keys in self._keys_by_size[1:]:
+            if not keys or (len(keys) == 1 and current_k in keys):
+                continue
+            # set.pop() is O(1), iterating a set after many removals is not
+            k = keys.pop()
+            if k == current_k:
+                k = keys.pop()
+                keys.add(current_k)
+            swarm = self._tracker_dict.pop(k)
+            self.num_keys -= 1
+            self.num_peers -= len(swarm.peers)
+            return True
+        return False
+
+    def _compact(self):
+        '''
+        Drop the stale heap entries (re-announced or evicted peers).
+        '''
+        heap = []
+        for entry in self._heap:
+            swarm = self._tracker_dict.get(entry[2])
+            if swarm is None:
+                continue
+            value = swarm.peers.get(entry[3])
+            if value is not None and value[1] == entry[1]:
+                heap.append(entry)
+        heapq.heapify(heap)
+        self._heap = heap
@@ -132,17 +132,18 @@ class GetPeersLookup(object):
     Variables without leading underscore are thread-safe.
 
     All nodes in bootstrap_nodes MUST have ID.
+
+    Other lookup plug-ins subclass it with their own alpha and m values.
     """
+    bootstrap_alpha = 16
+    normal_alpha = 16
+    normal_m = 1
+    slowdown_alpha = 4
+    slowdown_m = 1
 
     def __init__(self, my_id,
                  lookup_id, info_hash,
                  callback_f, bt_port=0):
-        self.bootstrap_alpha = 16
-        self.normal_alpha = 16
-        self.normal_m = 1
-        self.slowdown_alpha = 4
-        self.slowdown_m = 1
-        
         logger.debug('New lookup (info_hash: %r)' % info_hash)
         self._my_id = my_id
         self.lookup_id = lookup_id
@@ -261,33 +262,39 @@ class GetPeersLookup(object):
             queries_to_send.append(Query(msg, qnode.node, self))
         return queries_to_send, announce_to_myself
 
+    def get_closest_responded_nodes(self):
+        """Return the nodes that responded, closest to info_hash first"""
+        return [qnode.node for qnode in self._lookup_queue.responded_qnodes]
+
             
 class MaintenanceLookup(GetPeersLookup):
+    bootstrap_alpha = 4
+    normal_alpha = 4
+    normal_m = 1
+    slowdown_alpha = 4
+    slowdown_m = 1
 
     def __init__(self, my_id, target):
         GetPeersLookup.__init__(self, my_id,
                                 None, target, None, 0)
-        self.bootstrap_alpha = 4
-        self.normal_alpha = 4
-        self.normal_m = 1
-        self.slowdown_alpha = 4
-        self.slowdown_m = 1
         self._get_peers_msg = message.OutgoingFindNodeQuery(my_id,
                                                             target)
             
         
 class LookupManager(object):
+    get_peers_lookup_class = GetPeersLookup
+    maintenance_lookup_class = MaintenanceLookup
 
     def __init__(self, my_id):
         self.my_id = my_id
 
     def get_peers(self, lookup_id, info_hash, callback_f, bt_port=0):
-        lookup_q = GetPeersLookup(self.my_id,
-                                  lookup_id, info_hash,
-                                  callback_f, bt_port)
+        lookup_q = self.get_peers_lookup_class(self.my_id,
+                                               lookup_id, info_hash,
+                                               callback_f, bt_port)
         return lookup_q
 
     def maintenance_lookup(self, target=None):
         target = target or self.my_id
-        lookup_q = MaintenanceLookup(self.my_id, target)
+        lookup_q = self.maintenance_lookup_class(self.my_id, target)
         return lookup_q
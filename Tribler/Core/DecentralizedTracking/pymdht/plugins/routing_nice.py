@@ -13,17 +13,26 @@ This module intends to implement the routing policy specified in NICE:
 
 
 import random
-import core.ptime as time
 import heapq
 
 import logging
 
-import core.identifier as identifier
-import core.message as message
-from core.querier import Query
-import core.node as node
-from core.node import Node, RoutingNode
-from core.routing_table import RoutingTable
+try:
+    import core.ptime as time
+    import core.identifier as identifier
+    import core.message as message
+    from core.querier import Query
+    import core.node as node
+    from core.node import Node, RoutingNode
+    from core.routing_table import RoutingTable
+except (ImportError):
+    import Tribler.Core.DecentralizedTracking.pymdht.core.ptime as time
+    import Tribler.Core.DecentralizedTracking.pymdht.core.identifier as identifier
+    import Tribler.Core.DecentralizedTracking.pymdht.core.message as message
+    from Tribler.Core.DecentralizedTracking.pymdht.core.querier import Query
+    import Tribler.Core.DecentralizedTracking.pymdht.core.node as node
+    from Tribler.Core.DecentralizedTracking.pymdht.core.node import Node, RoutingNode
+    from Tribler.Core.DecentralizedTracking.pymdht.core.routing_table import RoutingTable
 
 logger = logging.getLogger('dht')
 
@@ -268,7 +277,7 @@ class RoutingManager(object):
             self._update_rnode_on_response_received(rnode, rtt)
         return
         
-    def on_error_received(self, node_):
+    def on_error_received(self, node_addr):
         pass
     
     def on_timeout(self, node_):
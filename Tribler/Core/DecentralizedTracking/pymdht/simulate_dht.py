@@ -0,0 +1,108 @@
+#! /usr/bin/env python
+
+# Copyright (C) 2009-2010 Raul Jimenez
+# Released under GNU LGPL 2.1
+# See LICENSE.txt for more information
+
+"""
+Compare routing and lookup plug-ins on a simulated DHT (core/simulation.py).
+
+Every combination of the given plug-ins runs on the same network (nodes,
+delays) and replays the same workload. For instance:
+
+python simulate_dht.py -n 1000 \
+    -r plugins/routing_nice.py,plugins/routing_nice_rtt.py \
+    -l plugins/lookup_a4.py,plugins/lookup_a8.py,plugins/lookup_m3.py
+
+"""
+
+import os
+from optparse import OptionParser
+
+import core.ptime as time
+import core.simulation as simulation
+
+
+def _import_plugin(filename):
+    name = '.'.join(os.path.split(filename))[:-3]
+    return __import__(name, fromlist=[''])
+
+def main(options, args):
+    if options.workload_file:
+        workload = simulation.load_workload(options.workload_file)
+    else:
+        workload = simulation.make_workload(
+            options.num_nodes, options.seed,
+            num_torrents=options.num_torrents,
+            num_announces=options.num_announces,
+            num_lookups=options.num_lookups)
+    if options.save_workload_file:
+        simulation.save_workload(workload, options.save_workload_file)
+
+    reports = []
+    for routing_m_file in options.routing_m_files.split(','):
+        for lookup_m_file in options.lookup_m_files.split(','):
+            sim = simulation.Simulation(
+                _import_plugin(routing_m_file),
+                _import_plugin(lookup_m_file),
+                options.num_nodes, options.seed,
+                min_delay=options.min_delay, max_delay=options.max_delay,
+                loss=options.loss)
+            start_ts = time.time()
+            reports.append(sim.run(workload))
+            print '%s %s: %.1f seconds' % (routing_m_file, lookup_m_file,
+                                            time.time() - start_ts)
+    print
+    print 'nodes: %d, seed: %d, delay: %.3f-%.3f, loss: %.2f' % (
+        options.num_nodes, options.seed,
+        options.min_delay, options.max_delay, options.loss)
+    print simulation.format_reports(reports)
+
+
+if __name__ == '__main__':
+    parser = OptionParser()
+    parser.add_option("-n", "--nodes", dest="num_nodes", type='int',
+                      metavar='INT', default=simulation.NUM_NODES,
+                      help="number of nodes")
+    parser.add_option("-s", "--seed", dest="seed", type='int',
+                      metavar='INT', default=0,
+                      help="random seed (network and workload)")
+    parser.add_option("-r", "--routing-plug-ins", dest="routing_m_files",
+                      metavar='FILES',
+                      default='plugins/routing_nice.py,'
+                      'plugins/routing_nice_rtt.py',
+                      help="routing_manager files (comma separated)")
+    parser.add_option("-l", "--lookup-plug-ins", dest="lookup_m_files",
+                      metavar='FILES',
+                      default='plugins/lookup_a4.py,plugins/lookup_a8.py,'
+                      'plugins/lookup_m3.py',
+                      help="lookup_manager files (comma separated)")
+    parser.add_option("--min-delay", dest="min_delay", type='float',
+                      metavar='SECONDS', default=simulation.MIN_DELAY,
+                      help="minimum access (one-way) delay of a node")
+    parser.add_option("--max-delay", dest="max_delay", type='float',
+                      metavar='SECONDS', default=simulation.MAX_DELAY,
+                      help="maximum access (one-way) delay of a node")
+    parser.add_option("--loss", dest="loss", type='float',
+                      metavar='FLOAT', default=simulation.LOSS,
+                      help="probability of a datagram being lost")
+    parser.add_option("-t", "--torrents", dest="num_torrents", type='int',
+                      metavar='INT', default=simulation.NUM_TORRENTS,
+                      help="torrents in the workload")
+    parser.add_option("-a", "--announces", dest="num_announces",
+                      type='int', metavar='INT',
+                      default=simulation.NUM_ANNOUNCES,
+                      help="announces per torrent")
+    parser.add_option("-k", "--lookups", dest="num_lookups", type='int',
+                      metavar='INT', default=simulation.NUM_LOOKUPS,
+                      help="lookups in the workload")
+    parser.add_option("-w", "--workload", dest="workload_file",
+                      metavar='FILE',
+                      help="replay this workload (ts node info_hash bt_port)")
+    parser.add_option("--save-workload", dest="save_workload_file",
+                      metavar='FILE',
+                      help="save the workload to this file")
+
+    (options, args) = parser.parse_args()
+
+    main(options, args)
@@ -598,6 +598,48 @@ class DownloadConfigInterface:
         """
         return self.dlconfig['write_buffer_size']
 
+    def set_disk_io_threads(self,value):
+        """ The number of threads that read and write the data of this
+        Download, so a slow disk does not block the network thread 
+        (0 = disabled, disk I/O is done by the network thread).
+        @param value A number of threads.
+        """
+        self.dlconfig['disk_io_threads'] = value
+
+    def get_disk_io_threads(self):
+        """ Returns the number of disk I/O threads.
+        @return A number of threads.
+        """
+        return self.dlconfig['disk_io_threads']
+
+    def set_disk_io_queue_size(self,value):
+        """ The maximum number of reads, and of writes, that may be queued
+        for the disk I/O threads. Beyond that the network thread waits.
+        @param value A number of operations.
+        """
+        self.dlconfig['disk_io_queue_size'] = value
+
+    def get_disk_io_queue_size(self):
+        """ Returns the maximum number of queued disk operations.
+        @return A number of operations.
+        """
+        return self.dlconfig['disk_io_queue_size']
+
+    def set_mmap_cache_size(self,value):
+        """ The maximum total size of the files of this Download that may be
+        memory mapped at a time to serve uploads without copying the data
+        (0 = disabled, uploaded data is read from the files). Files that are
+        being written to are never mapped.
+        @param value A number of megabytes.
+        """
+        self.dlconfig['mmap_cache_size'] = value
+
+    def get_mmap_cache_size(self):
+        """ Returns the maximum size of the memory-mapped files.
+        @return A number of megabytes.
+        """
+        return self.dlconfig['mmap_cache_size']
+
     def set_breakup_seed_bitfield(self,value):
         """ Whether to send an incomplete BITFIELD and then fills with HAVE
         messages, in order to get around intellectually-challenged Internet
@@ -0,0 +1,711 @@
+# see LICENSE.txt for license information
+#
+# ChessBoard that keeps the position in 64-bit bitboards, one per piece type
+# and colour, instead of an 8x8 list of characters. The squares attacked by
+# knights, kings and pawns are looked up in tables computed when the module
+# is loaded, those attacked by sliding pieces are found with the rays of
+# each direction up to the first blocker. Positions are compared for the
+# three repetitions rule by their Zobrist hash.
+#
+# The rules are exactly those of ChessBoard, also where they differ from the
+# rules of chess, so that peers agree on every move whichever board they
+# use: a rook leaving the a- or h-file on any rank removes the castling
+# right of its side, the castling rights are not removed when a rook is
+# captured, the en passant capture does not check whether the captured pawn
+# was pinning the king, and the three repetitions rule is applied to the
+# position before a move and does not look at the side to move.
+#
+# Squares are numbered y*8+x in the coordinates of ChessBoard, so square 0
+# is a8 and square 63 is h1.
+#
+
+from random import Random
+
+from Tribler.Core.GameCast.ChessBoard import ChessBoard
+
+WHITE = ChessBoard.WHITE
+BLACK = ChessBoard.BLACK
+
+# Piece types, the bitboard of a piece is at colour*6 + type
+PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING = range(6)
+PIECES = 'PNBRQKpnbrqk'
+PIECE_INDEX = dict([(p, i) for i, p in enumerate(PIECES)])
+PROMOTIONS = ['QRNB', 'qrnb']
+
+BIT = [1L << sq for sq in xrange(64)]
+BIT_INDEX = dict([(BIT[sq], sq) for sq in xrange(64)])
+MSB8 = [0] * 256
+for _i in xrange(2, 256):
+    MSB8[_i] = MSB8[_i >> 1] + 1
+
+
+def lsb(bb):
+    """ Returns the lowest square in bitboard bb, which must not be empty """
+    return BIT_INDEX[bb & -bb]
+
+def msb(bb):
+    """ Returns the highest square in bitboard bb, which must not be empty """
+    n = 0
+    if bb >> 32:
+        bb >>= 32
+        n = 32
+    if bb >> 16:
+        bb >>= 16
+        n += 16
+    if bb >> 8:
+        bb >>= 8
+        n += 8
+    return n + MSB8[bb]
+
+def squares(bb):
+    """ Returns the squares in bitboard bb, lowest first """
+    result = []
+    while bb:
+        b = bb & -bb
+        result.append(BIT_INDEX[b])
+        bb ^= b
+    return result
+
+
+def _steps(sq, offsets):
+    x, y = sq & 7, sq >> 3
+    bb = 0
+    for dx, dy in offsets:
+        if 0 <= x + dx < 8 and 0 <= y + dy < 8:
+            bb |= BIT[(y + dy) * 8 + x + dx]
+    return bb
+
+def _ray(sq, dx, dy):
+    x, y = (sq & 7) + dx, (sq >> 3) + dy
+    bb = 0
+    while 0 <= x < 8 and 0 <= y < 8:
+        bb |= BIT[y * 8 + x]
+        x += dx
+        y += dy
+    return bb
+
+KNIGHT_ATTACKS = [_steps(sq, ((1,2),(2,1),(2,-1),(1,-2),(-1,2),(-2,1),(-1,-2),(-2,-1))) for sq in xrange(64)]
+KING_ATTACKS = [_steps(sq, ((1,0),(-1,0),(0,1),(0,-1),(1,1),(-1,1),(1,-1),(-1,-1))) for sq in xrange(64)]
+# The squares attacked by a pawn of each colour, white pawns move to y-1
+PAWN_ATTACKS = [[_steps(sq, ((1,-1),(-1,-1))) for sq in xrange(64)],
+                [_steps(sq, ((1,1),(-1,1))) for sq in xrange(64)]]
+
+# [(rays, positive)]: the rays of a direction from every square, and whether
+# the direction goes to higher squares, so that the first blocker is the
+# lowest square on the ray
+ROOK_RAYS = [([_ray(sq, dx, dy) for sq in xrange(64)], dy > 0 or (dy == 0 and dx > 0))
+             for dx, dy in ((1,0),(0,1),(-1,0),(0,-1))]
+BISHOP_RAYS = [([_ray(sq, dx, dy) for sq in xrange(64)], dy > 0)
+               for dx, dy in ((1,1),(-1,1),(-1,-1),(1,-1))]
+
+def slide(sq, occ, directions):
+    """ Returns the squares attacked from sq in the directions, up to and
+    including the first occupied square """
+    attacks = 0
+    for rays, positive in directions:
+        ray = rays[sq]
+        blockers = ray & occ
+        if blockers:
+            if positive:
+                ray ^= rays[lsb(blockers)]
+            else:
+                ray ^= rays[msb(blockers)]
+        attacks |= ray
+    return attacks
+
+# Zobrist keys, the same in every run
+_random = Random(20100601)
+ZOBRIST = [[_random.getrandbits(64) for sq in xrange(64)] for p in PIECES]
+ZOBRIST_CASTLE = [_random.getrandbits(64) for i in xrange(16)]
+ZOBRIST_EP = [_random.getrandbits(64) for sq in xrange(64)]
+del _random
+
+
+class BitboardChessBoard(ChessBoard):
+    """
+    ChessBoard with the position in bitboards. The methods that look at the
+    position are replaced, those on the text moves and on the stack of
+    states (undo, redo, gotoMove etc.) are those of ChessBoard. The helpers
+    of ChessBoard that work on its 8x8 board (movePawn, traceValidMoves,
+    checkKingGuard etc.) cannot be used.
+    """
+
+    def __init__(self):
+        self._bb = [0] * 12
+        self._occ = [0, 0]
+        self._squares = ['.'] * 64
+        self._hash = 0
+        ChessBoard.__init__(self)
+
+    #
+    # The position
+    #
+    def _put(self, sq, p):
+        i = PIECE_INDEX[p]
+        b = BIT[sq]
+        self._bb[i] |= b
+        self._occ[i >= 6] |= b
+        self._hash ^= ZOBRIST[i][sq]
+        self._squares[sq] = p
+
+    def _remove(self, sq):
+        p = self._squares[sq]
+        if p != '.':
+            i = PIECE_INDEX[p]
+            b = BIT[sq]
+            self._bb[i] ^= b
+            self._occ[i >= 6] ^= b
+            self._hash ^= ZOBRIST[i][sq]
+            self._squares[sq] = '.'
+
+    def _setPosition(self, board):
+        """ Sets the pieces from a string of 64 characters """
+        self._bb = [0] * 12
+        self._occ = [0, 0]
+        self._squares = ['.'] * 64
+        self._hash = 0
+        for sq in xrange(64):
+            if board[sq] != '.':
+                self._put(sq, board[sq])
+
+    def _kingSquare(self, colour):
+        kings = self._bb[colour * 6 + KING]
+        if kings:
+            return msb(kings)
+        return 0
+
+    def _key(self):
+        """ The Zobrist hash of the position for the three repetitions rule """
+        castle = (int(self._white_king_castle) | int(self._white_queen_castle) << 1 |
+                  int(self._black_king_castle) << 2 | int(self._black_queen_castle) << 3)
+        return self._hash ^ ZOBRIST_CASTLE[castle] ^ ZOBRIST_EP[self._ep[1] * 8 + self._ep[0]]
+
+    def _attacked(self, sq, colour, occ, removed = 0):
+        """ Returns whether sq is attacked by the opponent of colour, with
+        the squares occ occupied and the opponent's pieces on the squares
+        removed taken off the board """
+        bb = self._bb
+        o = (1 - colour) * 6
+        keep = ~removed
+        if PAWN_ATTACKS[colour][sq] & bb[o + PAWN] & keep:
+            return True
+        if KNIGHT_ATTACKS[sq] & bb[o + KNIGHT] & keep:
+            return True
+        if KING_ATTACKS[sq] & bb[o + KING] & keep:
+            return True
+        rq = (bb[o + ROOK] | bb[o + QUEEN]) & keep
+        if rq and slide(sq, occ, ROOK_RAYS) & rq:
+            return True
+        bq = (bb[o + BISHOP] | bb[o + QUEEN]) & keep
+        if bq and slide(sq, occ, BISHOP_RAYS) & bq:
+            return True
+        return False
+
+    def _pieceMoves(self, sq):
+        """ Returns the squares the piece of the player to move on sq can
+        move to, as a bitboard, and {square: special move} """
+        turn = self._turn
+        own = self._occ[turn]
+        occ = own | self._occ[1 - turn]
+        special = {}
+        p = self._squares[sq].upper()
+
+        if p == 'K':
+            # The king is taken off the board to see which squares are safe
+            occ_without = occ ^ BIT[sq]
+            moves = 0
+            for t in squares(KING_ATTACKS[sq] & ~own):
+                if not self._attacked(t, turn, occ_without):
+                    moves |= BIT[t]
+            if turn == WHITE:
+                row = 56
+                c_king = self._white_king_castle
+                c_queen = self._white_queen_castle
+            else:
+                row = 0
+                c_king = self._black_king_castle
+                c_queen = self._black_queen_castle
+            board = self._squares
+            if c_king and board[row+5] == '.' and board[row+6] == '.' and board[row+7] in ('R', 'r'):
+                if not (self._attacked(row+4, turn, occ_without) or self._attacked(row+5, turn, occ_without) or
+                        self._attacked(row+6, turn, occ_without)):
+                    moves |= BIT[row+6]
+                    special[row+6] = self.KING_CASTLE_MOVE
+            if c_queen and board[row+3] == '.' and board[row+2] == '.' and board[row+1] == '.' and board[row] in ('R', 'r'):
+                if not (self._attacked(row+4, turn, occ_without) or self._attacked(row+3, turn, occ_without) or
+                        self._attacked(row+2, turn, occ_without)):
+                    moves |= BIT[row+2]
+                    special[row+2] = self.QUEEN_CASTLE_MOVE
+            return moves, special
+
+        if p == 'P':
+            x, y = sq & 7, sq >> 3
+            if turn == WHITE:
+                step, startrow, eprow = -8, 6, 3
+            else:
+                step, startrow, eprow = 8, 1, 4
+            moves = PAWN_ATTACKS[turn][sq] & self._occ[1 - turn]
+            one = sq + step
+            if 0 <= one < 64 and not occ & BIT[one]:
+                moves |= BIT[one]
+                if y == startrow and not occ & BIT[one + step]:
+                    moves |= BIT[one + step]
+                    special[one + step] = self.EP_MOVE
+            epx, epy = self._ep
+            if y == eprow and epy != 0 and (epx == x + 1 or epx == x - 1):
+                t = one + epx - x
+                moves |= BIT[t]
+                special[t] = self.EP_CAPTURE_MOVE
+        elif p == 'N':
+            moves = KNIGHT_ATTACKS[sq] & ~own
+        elif p == 'B':
+            moves = slide(sq, occ, BISHOP_RAYS) & ~own
+        elif p == 'R':
+            moves = slide(sq, occ, ROOK_RAYS) & ~own
+        elif p == 'Q':
+            moves = (slide(sq, occ, ROOK_RAYS) | slide(sq, occ, BISHOP_RAYS)) & ~own
+        else:
+            return 0, special
+
+        # Keep the moves that do not leave the king in check. As in
+        # ChessBoard, they all do if the king is safe without the piece.
+        if not moves:
+            return moves, special
+        ksq = self._kingSquare(turn)
+        occ_without = occ ^ BIT[sq]
+        if not self._attacked(ksq, turn, occ_without):
+            return moves, special
+        legal = 0
+        for t in squares(moves):
+            b = BIT[t]
+            if special.get(t) == self.EP_CAPTURE_MOVE:
+                epsq = self._ep[1] * 8 + self._ep[0]
+                removed = b | BIT[epsq]
+                board_occ = (occ_without | b) & ~BIT[epsq]
+            else:
+                removed = b
+                board_occ = occ_without | b
+            if not self._attacked(ksq, turn, board_occ, removed):
+                legal |= b
+        return legal, special
+
+    def _hasAnyMoves(self):
+        for sq in squares(self._occ[self._turn]):
+            if self._pieceMoves(sq)[0]:
+                return True
+        return False
+
+    #
+    # The states, see ChessBoard.pushState
+    #
+    def loadCurState(self):
+        s = self._state_stack[self._state_stack_pointer-1]
+        (board, self._turn, self._white_king_castle, self._white_queen_castle,
+         self._black_king_castle, self._black_queen_castle, epx, epy,
+         self._game_result, self._fifty) = s
+        self._ep = [epx, epy]
+        self._setPosition(board)
+
+    def pushState(self):
+        if self._state_stack_pointer != len(self._state_stack):
+            del self._state_stack[self._state_stack_pointer:]
+            del self._three_rep_stack[self._state_stack_pointer:]
+            del self._moves[self._state_stack_pointer-1:]
+
+        self._three_rep_stack.append(self._key())
+        self._state_stack.append((''.join(self._squares), self._turn,
+                                  self._white_king_castle, self._white_queen_castle,
+                                  self._black_king_castle, self._black_queen_castle,
+                                  self._ep[0], self._ep[1], self._game_result, self._fifty))
+        self._state_stack_pointer = len(self._state_stack)
+
+    def threeRepetitions(self):
+        n = self._state_stack_pointer
+        if not n:
+            return False
+        ts = self._three_rep_stack
+        last = ts[n-1]
+        # Positions before the last pawn move or capture cannot be the same
+        start = max(0, n - 1 - self._state_stack[n-1][9])
+        return ts[start:n].count(last) == 3
+
+    def updateKingLocations(self):
+        x = self._kingSquare(WHITE)
+        self._white_king_location = (x & 7, x >> 3)
+        x = self._kingSquare(BLACK)
+        self._black_king_location = (x & 7, x >> 3)
+
+    #
+    # The methods of ChessBoard that look at the position
+    #
+    def isFree(self, x, y):
+        return self._squares[y*8+x] == '.'
+
+    def getColor(self, x, y):
+        p = self._squares[y*8+x]
+        if p == '.':
+            return self.NOCOLOR
+        elif p.isupper():
+            return self.WHITE
+        return self.BLACK
+
+    def isThreatened(self, lx, ly, player = None):
+        if player == None:
+            player = self._turn
+        return self._attacked(ly*8+lx, player, self._occ[0] | self._occ[1])
+
+    def hasAnyValidMoves(self, player = None):
+        if player == None or player == self._turn:
+            return self._hasAnyMoves()
+        turn = self._turn
+        self._turn = player
+        try:
+            return self._hasAnyMoves()
+        finally:
+            self._turn = turn
+
+    def _formatTextMove(self, move, format):
+        # ChessBoard looks at its 8x8 board for the moves of the other pieces
+        self._board = self.getBoard()
+        try:
+            return ChessBoard._formatTextMove(self, move, format)
+        finally:
+            self._board = None
+
+    def resetBoard(self):
+        """
+        Resets the chess board and all states.
+        """
+        self._setPosition('rnbqkbnr' + 'p' * 8 + '.' * 32 + 'P' * 8 + 'RNBQKBNR')
+        self._turn = self.WHITE
+        self._white_king_castle = True
+        self._white_queen_castle = True
+        self._black_king_castle = True
+        self._black_queen_castle = True
+        self._ep = [0,0]
+        self._fifty = 0
+        self._three_rep_stack = []
+        self._state_stack = []
+        self._state_stack_pointer = 0
+        self._moves = []
+        self._reason = 0
+        self._game_result = 0
+        self.pushState()
+        self.updateKingLocations()
+
+    def setFEN(self, fen):
+        """
+        Sets the board and states accoring from a Forsyth-Edwards Notation string.
+        Ex. 'rnbqkbnr/pp1ppppp/8/2p5/4P3/5N2/PPPP1PPP/RNBQKB1R b KQkq - 1 2'
+        """
+        self._three_rep_stack = []
+        self._state_stack = []
+        self._state_stack_pointer = 0
+        self._moves = []
+        self._reason = 0
+        self._game_result = 0
+
+        fparts = fen.split()
+        board = ""
+        for c in fparts[0]:
+            if c in "kqrnbpKQRNBP":
+                board += c
+            elif c in "12345678":
+                board += '.' * int(c)
+        self._setPosition(board)
+        self._turn = "wb".index(fparts[1])
+        self._white_king_castle = int("K" in fparts[2])
+        self._white_queen_castle = int("Q" in fparts[2])
+        self._black_king_castle = int("k" in fparts[2])
+        self._black_queen_castle = int("q" in fparts[2])
+        if len(fparts[3]) == 2:
+            self._ep = ["abcdefgh".index(fparts[3][0].lower()), "87654321".index(fparts[3][1])]
+        else:
+            self._ep = [0,0]
+        self._fifty = int(fparts[4])
+        self.pushState()
+        self.updateKingLocations()
+
+    def getFEN(self):
+        """
+        Returns the current state as Forsyth-Edwards Notation string.
+        """
+        rows = []
+        for y in range(8):
+            cnt = 0; res = ""
+            for c in self._squares[y*8:(y+1)*8]:
+                if c == ".":
+                    cnt += 1
+                else:
+                    if cnt:
+                        res += str(cnt)
+                        cnt = 0
+                    res += c
+            if cnt:
+                res += str(cnt)
+            rows.append(res)
+        board = "/".join(rows)
+
+        turn = (["w","b"])[self._turn]
+
+        kq = ""
+        if self._white_king_castle: kq+="K"
+        if self._white_queen_castle: kq+="Q"
+        if self._black_king_castle: kq+="k"
+        if self._black_queen_castle: kq+="q"
+        if not kq:
+            kq = "-"
+
+        x, y = self._ep
+        ep = "-"
+        if not (x == 0 and y == 0):
+            b = self._squares
+            if turn == "b" and ((x > 0 and b[y*8+x-1] == 'p') or (x < 7 and b[y*8+x+1] == 'p')):
+                ep = "%s%s" % ( ("abcdefgh")[x], ("87654321")[y+1])
+            elif turn == "w" and ((x > 0 and b[y*8+x-1] == 'P') or (x < 7 and b[y*8+x+1] == 'P')):
+                ep = "%s%s" % ( ("abcdefgh")[x], ("87654321")[y-1])
+
+        move = (self._state_stack_pointer+1)/2
+
+        return "%s %s %s %s %s %d" % (board,turn,kq,ep,self._fifty,move)
+
+    def isCheck(self):
+        """
+        Returns True if the current players king is checked.
+        """
+        return self._attacked(self._kingSquare(self._turn), self._turn, self._occ[0] | self._occ[1])
+
+    def getBoard(self):
+        """
+        Returns a copy of the current board layout. Uppercase letters for white, lowercase for black.
+        K=King, Q=Queen, B=Bishop, N=Night, R=Rook, P=Pawn.
+        Empty squares are marked with a period (.)
+        """
+        b = self._squares
+        return [b[y*8:(y+1)*8] for y in range(8)]
+
+    def getValidMoves(self, location):
+        """
+        Returns a list of valid moves. (ex [ [3,4],[3,5],[3,6] ... ] ) If there isn't a valid piece on that location or the piece on the selected
+        location hasn't got any valid moves an empty list is returned.
+        The location argument must be a tuple containing an x,y value Ex. (3,3)
+        """
+        if self._game_result:
+            return []
+
+        x,y = location
+
+        if x < 0 or x > 7 or y < 0 or y > 7:
+            return False
+
+        if self.getColor(x,y) != self._turn:
+            return []
+
+        moves, special = self._pieceMoves(y*8+x)
+        return [(t & 7, t >> 3) for t in squares(moves)]
+
+    def addMove(self, fromPos, toPos):
+        """
+        Tries to move the piece located om fromPos to toPos. Returns True if that was a valid move.
+        The position arguments must be tuples containing x,y value Ex. (4,6).
+        This method also detects game over.
+
+        If this method returns False you can use the getReason method to determin why.
+        """
+        self._reason = 0
+        #                piece,from,to,take,promotion,check,specialmove
+        self._cur_move = [None,None,None,False,None,None,self.NORMAL_MOVE]
+
+        if self._game_result:
+            return False
+
+        fx,fy = fromPos
+        tx,ty = toPos
+
+        self._cur_move[1]=fromPos
+        self._cur_move[2]=toPos
+
+        #check invalid coordinates
+        if fx < 0 or fx > 7 or fy < 0 or fy > 7:
+            self._reason = self.INVALID_FROM_LOCATION
+            return False
+
+        #check invalid coordinates
+        if tx < 0 or tx > 7 or ty < 0 or ty > 7:
+            self._reason = self.INVALID_TO_LOCATION
+            return False
+
+        #check if any move at all
+        if fx==tx and fy==ty:
+            self._reason = self.INVALID_TO_LOCATION
+            return False
+
+        #check if piece on location
+        if self.isFree(fx,fy):
+            self._reason = self.INVALID_FROM_LOCATION
+            return False
+
+        #check color of piece
+        if self.getColor(fx,fy) != self._turn:
+            self._reason = self.INVALID_COLOR
+            return False
+
+        f = fy*8+fx
+        t = ty*8+tx
+        piece = self._squares[f]
+        p = piece.upper()
+        self._cur_move[0]=p
+        moves, special = self._pieceMoves(f)
+        if not moves & BIT[t]:
+            self._reason = self.INVALID_MOVE
+            return False
+        st = special.get(t, 0)
+
+        if p == 'P':
+            if ty == (0, 7)[self._turn]:
+                pv = self._promotion_value
+                if pv == 0:
+                    self._reason = self.MUST_SET_PROMOTION
+                    return False
+                piece = PROMOTIONS[self._turn][pv-1]
+                self._cur_move[4]=piece
+                self._cur_move[6]=self.PROMOTION_MOVE
+            if st == self.EP_CAPTURE_MOVE:
+                self._remove(self._ep[1]*8 + self._ep[0])
+                self._cur_move[3]=True
+                self._cur_move[6]=self.EP_CAPTURE_MOVE
+            if st == self.EP_MOVE:
+                self.setEP(toPos)
+                self._cur_move[6]=self.EP_MOVE
+            else:
+                self.clearEP()
+            self._fifty = 0
+        else:
+            self.clearEP()
+            if p == 'K':
+                if self._turn == self.WHITE:
+                    self._white_king_castle = False
+                    self._white_queen_castle = False
+                else:
+                    self._black_king_castle = False
+                    self._black_queen_castle = False
+            elif p == 'R':
+                if self._turn == self.WHITE:
+                    if fx == 0:
+                        self._white_queen_castle = False
+                    if fx == 7:
+                        self._white_king_castle = False
+                else:
+                    if fx == 0:
+                        self._black_queen_castle = False
+                    if fx == 7:
+                        self._black_king_castle = False
+            if self._squares[t] == '.':
+                self._fifty+=1
+            else:
+                self._fifty=0
+
+        if st == self.KING_CASTLE_MOVE or st == self.QUEEN_CASTLE_MOVE:
+            row = ty*8
+            rook = PIECES[self._turn*6 + ROOK]
+            if st == self.KING_CASTLE_MOVE:
+                rf, rt = row+7, row+5
+            else:
+                rf, rt = row, row+3
+            self._remove(row+4)
+            self._remove(rf)
+            self._remove(t)
+            self._remove(rt)
+            self._put(t, piece)
+            self._put(rt, rook)
+            self._cur_move[6] = st
+        else:
+            if self._squares[t] != '.':
+                self._cur_move[3]=True
+            self._remove(f)
+            self._remove(t)
+            self._put(t, piece)
+
+        if self._turn == self.WHITE:
+            self._turn = self.BLACK
+        else:
+            self._turn = self.WHITE
+
+        if self.isCheck():
+            self._cur_move[5]="+"
+
+        if not self._hasAnyMoves():
+            if self.isCheck():
+                self._cur_move[5]="#"
+                if self._turn == self.WHITE:
+                    self.endGame(self.BLACK_WIN)
+                else:
+                    self.endGame(self.WHITE_WIN)
+            else:
+                self.endGame(self.STALEMATE)
+        else:
+            if self._fifty == 100:
+                self.endGame(self.FIFTY_MOVES_RULE)
+            elif self.threeRepetitions():
+                self.endGame(self.THREE_REPETITION_RULE)
+
+        self.pushState()
+        self.pushMove()
+        self.updateKingLocations()
+
+        return True
+
+    def addTextMove(self, txt):
+        """
+        Adds a move using several different standards of the Algebraic chess notation.
+        AN Examples: 'e2e4' 'f1d1' 'd7-d8' 'g1-f3'
+        SAN Examples: 'e4' 'Rfxd1' 'd8=Q' 'Nxf3+'
+        LAN Examples: 'Pe2e4' 'Rf1xd1' 'Pd7d8=Q' 'Ng1xf3+'
+        """
+        res = self._parseTextMove(txt)
+        if not res:
+            self._reason = self.INVALID_MOVE
+            return False
+        else:
+            piece,fx,fy,tx,ty,promo = res
+
+        if promo:
+            self.setPromotion(promo)
+
+        if not piece:
+            return self.addMove((fx,fy),(tx,ty))
+
+        if self._turn == self.BLACK:
+            piece = piece.lower()
+
+        move_from = None
+        if not self._game_result:
+            t = BIT[ty*8+tx]
+            for sq in squares(self._bb[PIECE_INDEX[piece]]):
+                if fx > -1 and fx != sq & 7:
+                    continue
+                if fy > -1 and fy != sq >> 3:
+                    continue
+                if self._pieceMoves(sq)[0] & t:
+                    if move_from is not None:
+                        self._reason = self.AMBIGUOUS_MOVE
+                        return False
+                    move_from = (sq & 7, sq >> 3)
+
+        if move_from is not None:
+            return self.addMove(move_from,(tx,ty))
+
+        self._reason = self.INVALID_MOVE
+        return False
+
+    def printBoard(self):
+        """
+        Print the current board layout.
+        """
+        print "  +-----------------+"
+        rank = 8
+        for l in self.getBoard():
+            print "%d | %s %s %s %s %s %s %s %s |" % (rank,l[0],l[1],l[2],l[3],l[4],l[5],l[6],l[7])
+            rank-=1
+        print "  +-----------------+"
+        print "    A B C D E F G H"
@@ -86,11 +86,23 @@ class ChessBoard:
     def __init__(self):
         self.resetBoard()
 
-    def state2str(self):
+    def board2str(self):
+        return "".join(["".join(l) for l in self._board])
 
-        b = ""
-        for l in self._board:
-            b += "%s%s%s%s%s%s%s%s" % (l[0],l[1],l[2],l[3],l[4],l[5],l[6],l[7])
+    def three2str(self,b):
+        # compact, hashable state for the three repetitions rule
+        return "%s%d%d%d%d%d%d" % (b,
+        self._white_king_castle,
+        self._white_queen_castle, 
+        self._black_king_castle,
+        self._black_queen_castle,
+        self._ep[0],
+        self._ep[1])
+
+    def state2str(self,b=None):
+
+        if b is None:
+            b = self.board2str()
         
         d = (b,
         self._turn,
@@ -138,21 +150,16 @@ class ChessBoard:
             self._three_rep_stack =  self._three_rep_stack[:self._state_stack_pointer]
             self._moves = self._moves[:self._state_stack_pointer-1]    
 
-        three_state = [self._white_king_castle,
-            self._white_queen_castle,
-            self._black_king_castle,
-            self._black_queen_castle,
-            deepcopy(self._board),
-            deepcopy(self._ep)]                 
-        self._three_rep_stack.append(three_state)
+        b = self.board2str()
+        self._three_rep_stack.append(self.three2str(b))
               
-        state_str = self.state2str()
+        state_str = self.state2str(b)
         self._state_stack.append(state_str)
 
         self._state_stack_pointer = len(self._state_stack)            
 
     def pushMove(self):
-        self._moves.append(deepcopy(self._cur_move))
+        self._moves.append(list(self._cur_move))
                
     def threeRepetitions(self):
             
@@ -875,14 +882,7 @@ class ChessBoard:
         self._state_stack_pointer = 1        
         self.loadCurState()
 
-        three_state = [self._white_king_castle,
-            self._white_queen_castle,
-            self._black_king_castle,
-            self._black_queen_castle,
-            deepcopy(self._board),
-            deepcopy(self._ep)]                 
-
-        self._three_rep_stack.append(three_state)              
+        self._three_rep_stack.append(self.three2str(self.board2str()))
 
         self.updateKingLocations()
 
@@ -69,6 +69,7 @@ MSG_EXPIRE_TIME     = 15*60  # If a message has not been send within this time,
 MSG_POSTPONE_TIME   = 15*60  # If a message has not been delivered within this time, discard
 RETRY_INCOMING_TIME = 30     # Interval in which the retryIncoming method should be executed
 RETRY_OUTGOING_TIME = 30     # Interval in which the retryOutgoing method should be executed
+MAX_BOARDS          = 100    # Maximum number of games for which the board is kept, see getGameBoard
 
 
 class GameCast:
@@ -95,6 +96,8 @@ class GameCast:
         self.messages_in          = {}  # {permid: {game_id: [(msg_payload, exp_time)]}}
         self.request_cache        = {}  # {(game_id, CMD_..): {permid: timestamp})
         self.request_record       = {}
+        self.boards               = {}  # {(owner_id, game_id): [board, [move], last_used]}
+        self.boards_used          = 0
 
         self.regExpressions       = [REG_SEEK, REG_MATCH, REG_PLAY, REG_UNSEEK, REG_ACCEPT, REG_DECLINE, REG_START, REG_MOVE, REG_DISCUSS]
         self.inviteCommands       = [CMD_SEEK, CMD_MATCH, CMD_PLAY, CMD_UNSEEK, CMD_ACCEPT, CMD_DECLINE]
@@ -1643,34 +1646,64 @@ class GameCast:
         else:
             return None
 
-    def getGameState(self, game, nextmove):
-        moves = [move for colour, move, clock in game['moves']] + [nextmove]
+    def getGameBoard(self, game, nextmove = None):
+        # Returns the board of a chess game after its moves and nextmove, or None if one of them is illegal.
+        # The boards of the last MAX_BOARDS games are kept, together with the moves played on them, so that
+        # validating a new move only plays that move instead of the whole game.
+        if game['gamename'] != 'chess':
+            return None
+        moves = game['moves']
+        key = (game['owner_id'], game['game_id'])
+        entry = self.boards.get(key, None)
+        if entry:
+            cb, played = entry[0], entry[1]
+            # The board may hold a move that was validated but not added to the game, or the moves may
+            # have changed since (another game with the same key), in which case the game is replayed
+            if len(played) == len(moves)+1 and (nextmove is None or played[-1] != nextmove):
+                cb.undo()
+                played.pop()
+            if len(played) > len(moves)+1 or (played and len(played) <= len(moves) and played[-1] != moves[len(played)-1][1]):
+                entry = None
+        if not entry:
+            from Tribler.Core.GameCast.BitboardChessBoard import BitboardChessBoard
+            cb, played = BitboardChessBoard(), []
+            if len(self.boards) >= MAX_BOARDS:
+                lru_key = min(self.boards.keys(), key = lambda k: self.boards[k][2])
+                del self.boards[lru_key]
+            entry = self.boards[key] = [cb, played, 0]
+        self.boards_used += 1
+        entry[2] = self.boards_used
+
+        for colour, move, clock in moves[len(played):]:
+            if not self.addChessMove(cb, move):
+                del self.boards[key]
+                return None
+            played.append(move)
+        if nextmove is not None and len(played) == len(moves):
+            if not self.addChessMove(cb, nextmove):
+                return None
+            played.append(nextmove)
+        return cb
+
+    def addChessMove(self, cb, move):
+        retval = cb.addTextMove(move)
+        if not retval and cb.getReason() == cb.MUST_SET_PROMOTION:
+            cb.setPromotion(cb.QUEEN)
+            retval = cb.addTextMove(move)
+        return retval
 
-        if game['gamename'] == 'chess':
-            from Tribler.Core.GameCast.ChessBoard import ChessBoard
-            cb = ChessBoard()
-            for move in moves:
-                retval = cb.addTextMove(move)
-                if not retval and cb.getReason() == cb.MUST_SET_PROMOTION:
-                    cb.setPromotion(cb.QUEEN)
-                    retval = cb.addTextMove(move)
-                if not retval:
-                    return -1
+    def getGameState(self, game, nextmove):
+        cb = self.getGameBoard(game, nextmove)
+        if cb:
             return int(cb.isGameOver())
         return -1
 
     def getGameWinner(self, game, nextmove):
-        moves = [move for colour, move, clock in game['moves']] + [nextmove]
         players = game['players']
 
-        if game['gamename'] == 'chess':
+        cb = self.getGameBoard(game, nextmove)
+        if cb:
             from Tribler.Core.GameCast.ChessBoard import ChessBoard
-            cb = ChessBoard()
-            for move in moves:
-                retval = cb.addTextMove(move)
-                if not retval and cb.getReason() == cb.MUST_SET_PROMOTION:
-                    cb.setPromotion(cb.QUEEN)
-                    retval = cb.addTextMove(move)
             gr = cb.getGameResult()
             players_rev = dict((value,key) for (key,value) in players.items())
             if gr == ChessBoard.WHITE_WIN:
@@ -0,0 +1,130 @@
+# see LICENSE.txt for license information
+#
+# Dispatches the overlay messages received by the OverlayThreadingBridge to
+# a pool of worker TimedTaskQueues. The messages of a peer always go to the
+# same worker, by the hash of its permid, so they are handled in the order
+# they were received, while the messages of other peers may be handled by
+# other workers at the same time.
+#
+# The gossip message types, which peers send again periodically, have a
+# maximum number of messages waiting to be handled. When it is reached, the
+# oldest message of that type is dropped, see MAX_PENDING. Messages of the
+# other types change state that is not sent again, they are never dropped.
+# For each message type it keeps a histogram of the time between receiving
+# and handling a message.
+#
+
+import sys
+from threading import Lock
+from time import time
+
+from Tribler.Core.BitTornado.BT1.MessageID import *
+
+DEBUG = False
+
+# Maximum number of messages of a gossip type that wait to be handled. The
+# oldest is dropped when too many are waiting, as a newer message of a peer
+# replaces it. The number of messages of other types is not limited.
+MAX_PENDING = dict.fromkeys([BUDDYCAST, CHANNELCAST, VOTECAST, BARTERCAST, KEEP_ALIVE], 1000)
+
+# Upper bounds of the latency histogram buckets in seconds, the last bucket
+# has all latencies above 4 seconds
+LATENCY_BUCKETS = [0.001 * 2 ** i for i in range(13)]
+
+
+class MessageType:
+    """ Bookkeeping of the messages of one type """
+    def __init__(self, max_pending):
+        self.max_pending = max_pending # None if not limited
+        self.waiting = 0 # number of messages waiting to be handled
+        # For the limited types: {sequence number:task handle} of the
+        # waiting messages, in the order they arrived
+        self.pending = {}
+        self.next = 0 # sequence number of the next message
+        self.oldest = 0 # no waiting message has a lower sequence number
+        self.handled = 0
+        self.dropped = 0
+        self.histogram = [0] * (len(LATENCY_BUCKETS) + 1)
+
+
+class MessageDispatcher:
+
+    def __init__(self, workers):
+        """ workers is a list of TimedTaskQueues that handle the messages """
+        self.workers = workers
+        self.types = {}
+        self.lock = Lock()
+
+    def dispatch(self, permid, message, func):
+        """ Called by NetworkThread. Queues func to handle message from
+        permid """
+        msgtype = message[0]
+        worker = self.workers[hash(permid) % len(self.workers)]
+        arrival = time()
+
+        def dispatcher_handle_func():
+            # Called by a worker
+            self.lock.acquire()
+            try:
+                stats.waiting -= 1
+                stats.pending.pop(seq, None)
+            finally:
+                self.lock.release()
+            try:
+                func()
+            finally:
+                self._record(stats, time() - arrival)
+
+        self.lock.acquire()
+        try:
+            stats = self.types.get(msgtype)
+            if stats is None:
+                stats = MessageType(MAX_PENDING.get(msgtype))
+                self.types[msgtype] = stats
+
+            if stats.max_pending is not None and len(stats.pending) >= stats.max_pending:
+                if DEBUG:
+                    print >>sys.stderr, "dispatcher: too many messages, dropping oldest", getMessageName(msgtype)
+                while stats.oldest not in stats.pending:
+                    stats.oldest += 1
+                # The oldest may just have been started by its worker
+                if stats.pending.pop(stats.oldest).cancel():
+                    stats.dropped += 1
+                    stats.waiting -= 1
+
+            seq = stats.next
+            stats.next += 1
+            handle = worker.add_task(dispatcher_handle_func, 0)
+            stats.waiting += 1
+            if stats.max_pending is not None:
+                stats.pending[seq] = handle
+        finally:
+            self.lock.release()
+
+    def _record(self, stats, latency):
+        """ Called by a worker when it handled a message """
+        bucket = 0
+        while bucket < len(LATENCY_BUCKETS) and latency > LATENCY_BUCKETS[bucket]:
+            bucket += 1
+        self.lock.acquire()
+        try:
+            stats.handled += 1
+            stats.histogram[bucket] += 1
+        finally:
+            self.lock.release()
+
+    def get_stats(self):
+        """ Returns a dictionary with, for each message name, the number of
+        messages waiting, handled and dropped and the histogram of the
+        latencies of the handled messages, see LATENCY_BUCKETS """
+        self.lock.acquire()
+        try:
+            result = {}
+            for msgtype, stats in self.types.iteritems():
+                result[getMessageName(msgtype)] = {'pending': stats.waiting,
+                                                   'handled': stats.handled,
+                                                   'dropped': stats.dropped,
+                                                   'histogram': stats.histogram[:]}
+            return result
+        finally:
+            self.lock.release()
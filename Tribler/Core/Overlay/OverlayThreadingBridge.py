@@ -14,11 +14,18 @@ from traceback import print_exc
 from Tribler.Core.Overlay.SecureOverlay import CloseException
 from Tribler.Core.BitTornado.BT1.MessageID import *
 from Tribler.Core.Utilities.utilities import show_permid_short
+from Tribler.Core.Overlay.MessageDispatcher import MessageDispatcher
 from Tribler.Utilities.TimedTaskQueue import TimedTaskQueue
 import threading
 
 DEBUG = False
 
+# Number of threads that handle overlay messages. The first is the
+# OverlayThread. The messages of a peer are always handled by the same 
+# thread. The overlay apps share their state with the tasks they run on the 
+# OverlayThread, so more workers are only safe when their handlers are.
+OVERLAY_WORKERS = 1
+
 class OverlayThreadingBridge:
 
     __single = None
@@ -34,9 +41,15 @@ class OverlayThreadingBridge:
         self.olappsmsghandler = None
         self.olappsconnhandler = None
 
-        # Current impl of wrapper: single thread
+        # Current impl of wrapper: single thread, and OVERLAY_WORKERS-1 extra
+        # threads for messages
         self.tqueue = TimedTaskQueue(nameprefix="Overlay")
         self.gcqueue = TimedTaskQueue(nameprefix="GameCast")
+        workers = [self.tqueue]
+        for i in range(1,OVERLAY_WORKERS):
+            workers.append(TimedTaskQueue(nameprefix="OverlayWorker%d" % i))
+        self.dispatcher = MessageDispatcher(workers)
+        self.gcdispatcher = MessageDispatcher([self.gcqueue])
 
     def getInstance(*args, **kw):
         # Singleton pattern with double-checking
@@ -144,12 +157,21 @@ class OverlayThreadingBridge:
                     print >>sys.stderr,"olbridge: olbridge_handle_msg_func closing!",show_permid_short(permid),selversion,getMessageName(message[0]),currentThread().getName()
                 self.close(permid)
 
+        # A message dropped because too many are waiting does not close the 
+        # connection
         if message[0] in GameCastMessages:
-            self.gcqueue.add_task(olbridge_handle_msg_func,0)
+            self.gcdispatcher.dispatch(permid,message,olbridge_handle_msg_func)
         else:
-            self.tqueue.add_task(olbridge_handle_msg_func,0)
+            self.dispatcher.dispatch(permid,message,olbridge_handle_msg_func)
         return True
 
+    def get_dispatch_stats(self):
+        """ Returns the statistics of the overlay messages per message type,
+        see MessageDispatcher.get_stats() """
+        stats = self.dispatcher.get_stats()
+        stats.update(self.gcdispatcher.get_stats())
+        return stats
+
 
     def connect_dns(self,dns,callback):
         """ Called by OverlayThread/NetworkThread """
@@ -219,11 +241,11 @@ class OverlayThreadingBridge:
         self.secover.close(permid)
 
     def add_task(self,task,t=0,ident=None, gamecast = False):
-        """ Called by OverlayThread """
+        """ Called by OverlayThread, returns a handle to cancel the task """
         if gamecast:
-            self.gcqueue.add_task(task,t,ident)
+            return self.gcqueue.add_task(task,t,ident)
         else:
-            self.tqueue.add_task(task,t,ident)
+            return self.tqueue.add_task(task,t,ident)
 
 #===============================================================================
 #    # Jie: according to Arno's suggestion, commit on demand instead of periodically
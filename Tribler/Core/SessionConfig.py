@@ -184,6 +184,61 @@ class SessionConfigInterface:
         @return A number of seconds. """
         return self.sessconfig['timeout_check_interval']
 
+    def set_reactor_backend(self,value):
+        """ Set the mechanism the network thread uses to wait for socket
+        events:
+        <pre>
+         * REACTOR_POLL: poll(), or select() where poll() is not available.
+         * REACTOR_EPOLL: Edge-triggered epoll() (Linux only). Scales much 
+           better to thousands of connections. Falls back to REACTOR_POLL 
+           when not available.
+        </pre>
+        @param value REACTOR_* 
+        """
+        self.sessconfig['reactor_backend'] = value
+
+    def get_reactor_backend(self):
+        """ Returns the network event loop backend. 
+        @return REACTOR_* """
+        return self.sessconfig['reactor_backend']
+
+    def set_hashcheck_threads(self,value):
+        """ Set the number of threads that check the data of Downloads on 
+        disk when they are started (0 = disabled, the data is checked by the
+        network thread, one Download at a time).
+        @param value A number of threads.
+        """
+        self.sessconfig['hashcheck_threads'] = value
+
+    def get_hashcheck_threads(self):
+        """ Returns the number of hash check threads.
+        @return A number of threads. """
+        return self.sessconfig['hashcheck_threads']
+
+    def set_hashcheck_max_downloads(self,value):
+        """ Set the number of Downloads whose data is checked at the same 
+        time by the hash check threads.
+        @param value A number of Downloads.
+        """
+        self.sessconfig['hashcheck_max_downloads'] = value
+
+    def get_hashcheck_max_downloads(self):
+        """ Returns the number of Downloads checked at the same time.
+        @return A number of Downloads. """
+        return self.sessconfig['hashcheck_max_downloads']
+
+    def set_hashcheck_io_budget(self,value):
+        """ Set the maximum amount of data read from disk by the hash check
+        threads and not yet checked, for all Downloads together.
+        @param value A number of megabytes.
+        """
+        self.sessconfig['hashcheck_io_budget'] = value
+
+    def get_hashcheck_io_budget(self):
+        """ Returns the hash check I/O budget.
+        @return A number of megabytes. """
+        return self.sessconfig['hashcheck_io_budget']
+
     #
     # Enable/disable Tribler features 
     #
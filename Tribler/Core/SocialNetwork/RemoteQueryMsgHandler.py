@@ -540,7 +540,7 @@ class RemoteQueryMsgHandler:
         if DEBUG:
             print >>sys.stderr,"rquery: search for torrents matching",`kws`
         
-        allhits = self.torrent_db.searchNames(kws,local=False)
+        allhits = self.torrent_db.searchNameRows(kws,local=False)
         if maxhits is None:
             hits = allhits
         else:
@@ -50,6 +50,10 @@ sessdefaults['ipv6_binds_v4'] = None  # set if an IPv6 server socket won't also
 sessdefaults['upnp_nat_access'] = UPNPMODE_UNIVERSAL_DIRECT
 sessdefaults['timeout'] = 300.0
 sessdefaults['timeout_check_interval'] = 60.0
+sessdefaults['reactor_backend'] = REACTOR_POLL
+sessdefaults['hashcheck_threads'] = 0 # 0 = check on the network thread, one download at a time
+sessdefaults['hashcheck_max_downloads'] = 4
+sessdefaults['hashcheck_io_budget'] = 32 # MB
 sessdefaults['eckeypairfilename'] = None
 sessdefaults['megacache'] = True
 sessdefaults['overlay'] = True
@@ -167,7 +171,9 @@ sessdefaults.update(trackerdefaults)
 #  Version 2: as released in Tribler 4.5.0
 #  Version 3:
 #  Version 4: allow users to specify a download directory every time
-DLDEFAULTS_VERSION = 5
+#  Version 6: asynchronous disk I/O
+#  Version 7: memory-mapped reads for seeding
+DLDEFAULTS_VERSION = 7
 dldefaults = {}
 dldefaults['version'] = DLDEFAULTS_VERSION
 dldefaults['max_uploads'] = 7
@@ -239,6 +245,11 @@ dldefaults['ut_pex_max_addrs_from_peer'] = 50
 # Version 3:
 dldefaults['same_nat_try_internal'] = 0
 dldefaults['unchoke_bias_for_internal'] = 0
+# Version 6:
+dldefaults['disk_io_threads'] = 0  # 0 = read and write on the network thread
+dldefaults['disk_io_queue_size'] = 256
+# Version 7:
+dldefaults['mmap_cache_size'] = 0  # MB, 0 = read uploaded data with read()
 
 tdefdictdefaults = {}
 tdefdictdefaults['comment'] = None
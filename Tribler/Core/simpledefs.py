@@ -117,6 +117,10 @@ UPNPMODE_WIN32_HNetCfg_NATUPnP = 1
 UPNPMODE_WIN32_UPnP_UPnPDeviceFinder = 2
 UPNPMODE_UNIVERSAL_DIRECT = 3
 
+# Network event loop backends, see SessionConfig.set_reactor_backend
+REACTOR_POLL = 'poll'
+REACTOR_EPOLL = 'epoll'
+
 # Buddycast Collecting Policy parameters
 BCCOLPOLICY_SIMPLE = 1
 # BCCOLPOLICY_T4T = 2 # Future work
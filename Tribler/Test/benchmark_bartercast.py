@@ -0,0 +1,106 @@
+# see LICENSE.txt for license information
+#
+# Throughput of the BarterCast statistics on a synthetic graph. It computes
+# the top N peers as getTopNPeers did, by scanning all records, and with the
+# totals BarterGraph keeps up to date. It also times updating records as
+# BarterCast messages and transfers do, and the maxflow reputations, with
+# Network over the whole graph and with the bounded depth of BarterGraph.
+#
+# Not a unittest, run as: python benchmark_bartercast.py [records] [peers]
+#
+
+import sys
+import time
+from random import Random
+
+from Tribler.Core.CacheDB.bartergraph import BarterGraph
+from Tribler.Core.CacheDB.maxflow import Network
+
+NRECORDS = 100000
+NPEERS = 5000
+MY_ID = 1
+TOPN = 10
+
+
+def scan_top(records, n):
+    """ The top N peers as getTopNPeers computed them """
+    total_up = {}
+    total_down = {}
+    processed = set()
+    for peer_id_from, peer_id_to, uploaded, downloaded in records:
+        if (peer_id_to, peer_id_from) in processed or peer_id_to == peer_id_from:
+            continue
+        processed.add((peer_id_from, peer_id_to))
+        total_up[peer_id_from] = total_up.get(peer_id_from, 0) + uploaded
+        total_down[peer_id_from] = total_down.get(peer_id_from, 0) + downloaded
+        total_up[peer_id_to] = total_up.get(peer_id_to, 0) + downloaded
+        total_down[peer_id_to] = total_down.get(peer_id_to, 0) + uploaded
+    top = [(up, peer_id) for peer_id, up in total_up.iteritems() if peer_id != MY_ID]
+    top.sort(reverse=True)
+    return top[:n]
+
+
+def main():
+    nrecords = NRECORDS
+    npeers = NPEERS
+    if len(sys.argv) > 1:
+        nrecords = int(sys.argv[1])
+    if len(sys.argv) > 2:
+        npeers = int(sys.argv[2])
+
+    rand = Random(0)
+    keys = {}
+    # I had many interactions, the others a few each
+    while len(keys) < min(nrecords / 10, npeers / 2):
+        keys[(MY_ID, rand.randint(2, npeers))] = True
+    while len(keys) < nrecords:
+        keys[(rand.randint(2, npeers), rand.randint(2, npeers))] = True
+    records = [key + (rand.randint(0, 100000), rand.randint(0, 100000)) for key in keys]
+    print "%d records between %d peers" % (len(records), npeers)
+
+    start = time.time()
+    expected = scan_top(records, TOPN)
+    print "%-40s %8.3f s" % ("scan top %d" % TOPN, time.time() - start)
+
+    start = time.time()
+    graph = BarterGraph(MY_ID)
+    for record in records:
+        graph.setRecord(*record)
+    print "%-40s %8.3f s" % ("load BarterGraph", time.time() - start)
+
+    start = time.time()
+    top = graph.getTopNPeers(TOPN)
+    print "%-40s %8.6f s" % ("BarterGraph top %d" % TOPN, time.time() - start)
+    if [up for up, peer_id in expected] != [up for peer_id, up, down in top]:
+        print "the top peers do not agree"
+
+    updates = 10000
+    start = time.time()
+    for i in xrange(updates):
+        peer_id_from, peer_id_to, uploaded, downloaded = records[rand.randint(0, len(records) - 1)]
+        graph.setRecord(peer_id_from, peer_id_to, uploaded + rand.randint(0, 100), downloaded)
+    print "%-40s %8.0f /s" % ("BarterGraph record updates", updates / (time.time() - start))
+
+    peer_ids = rand.sample(xrange(2, npeers + 1), 100)
+    start = time.time()
+    for peer_id in peer_ids:
+        graph.getReputation(peer_id, 0.001)
+    print "%-40s %8.0f /s" % ("BarterGraph reputations", len(peer_ids) / (time.time() - start))
+
+    start = time.time()
+    for peer_id in peer_ids:
+        graph.getReputation(peer_id, 0.001)
+    print "%-40s %8.0f /s" % ("BarterGraph cached reputations", len(peer_ids) / (time.time() - start))
+
+    arcs = {}
+    for peer_id, capacities in graph.arcs.iteritems():
+        arcs[peer_id] = dict([(next, {'cap': capacity, 'flow': 0}) for next, capacity in capacities.iteritems() if capacity > 0])
+    network = Network(arcs)
+    start = time.time()
+    network.maxflow(peer_ids[0], MY_ID, 2)
+    network.maxflow(MY_ID, peer_ids[0], 2)
+    print "%-40s %8.3f s" % ("Network reputation of one peer", time.time() - start)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+# see LICENSE.txt for license information
+#
+# Benchmark of the bencode decoder on a corpus of torrent files and DHT
+# messages. For each item of the corpus it measures the time per decode of
+#  - bdecode: the complete decode,
+#  - lazy: bdecode_lazy() and the access of a single key, for torrents the
+#    'info' dictionary as bencoded in the file, and
+#  - reencode: bdecode() and bencode() of the 'info' dictionary of torrents,
+#    the way the input of the infohash was obtained before.
+# The SHA1 hash of the info dictionary itself is the same for both ways and
+# not included.
+#
+# The corpus consists of the .torrent files of the test directories and
+# generated torrents and DHT messages of typical sizes.
+#
+# Not a unittest, run as: python benchmark_bencode.py [seconds per item]
+#
+
+import sys
+import os
+import glob
+import time
+from random import Random
+
+from Tribler.Core.BitTornado.bencode import bencode, bdecode, bdecode_lazy
+
+SECONDS = 0.5
+
+
+def make_torrent(rand, numfiles, numpieces):
+    info = {'name': 'benchmark', 'piece length': 2 ** 18,
+            'pieces': ''.join([chr(rand.randint(0, 255)) for i in xrange(20)]) * numpieces}
+    if numfiles == 1:
+        info['length'] = numpieces * 2 ** 18
+    else:
+        info['files'] = [{'path': ['dir%d' % (i / 50), 'file%d.dat' % i],
+                          'length': rand.randint(0, 2 ** 32)} for i in xrange(numfiles)]
+    return bencode({'announce': 'http://tracker.example.com:6969/announce',
+                    'announce-list': [['http://tracker.example.com:6969/announce'],
+                                      ['udp://tracker.example.org:80']],
+                    'creation date': 1270000000, 'comment': 'benchmark corpus',
+                    'info': info})
+
+
+def make_dht_messages(rand):
+    id = lambda: ''.join([chr(rand.randint(0, 255)) for i in xrange(20)])
+    return [
+        ('dht ping', bencode({'t': 'aa', 'y': 'q', 'q': 'ping', 'a': {'id': id()}})),
+        ('dht find_node response', bencode({'t': 'aa', 'y': 'r',
+                                            'r': {'id': id(), 'nodes': id()[:26] * 8}})),
+        ('dht get_peers response', bencode({'t': 'aa', 'y': 'r',
+                                            'r': {'id': id(), 'token': 'abcd',
+                                                  'values': [id()[:6] for i in xrange(50)]}})),
+        ('dht error', bencode({'t': 'aa', 'y': 'e', 'e': [201, 'A Generic Error Ocurred']})),
+        ]
+
+
+def corpus():
+    rand = Random(0)
+    items = []
+    testdir = os.path.dirname(os.path.abspath(__file__))
+    for filename in sorted(glob.glob(os.path.join(testdir, '*', '*.torrent'))):
+        f = open(filename, 'rb')
+        items.append((os.path.basename(filename), f.read()))
+        f.close()
+    items.append(('torrent 1 file, 1000 pieces', make_torrent(rand, 1, 1000)))
+    items.append(('torrent 100 files, 4000 pieces', make_torrent(rand, 100, 4000)))
+    items.append(('torrent 5000 files, 20000 pieces', make_torrent(rand, 5000, 20000)))
+    items.extend(make_dht_messages(rand))
+    return items
+
+
+def measure(func, seconds):
+    """ Returns the time per call of func in microseconds """
+    count = 0
+    start = time.time()
+    end = start + seconds
+    while True:
+        func()
+        count += 1
+        now = time.time()
+        if now >= end:
+            return (now - start) / count * 1000000
+
+
+def main():
+    seconds = SECONDS
+    if len(sys.argv) > 1:
+        seconds = float(sys.argv[1])
+    print "%-34s %8s %12s %12s %12s" % ("corpus item", "bytes", "bdecode us", "lazy us", "reencode us")
+    for name, data in corpus():
+        full = measure(lambda: bdecode(data), seconds)
+        if bdecode(data).has_key('info'):
+            lazy = measure(lambda: bdecode_lazy(data).get_raw('info'), seconds)
+            reencode = measure(lambda: bencode(bdecode(data)['info']), seconds)
+            print "%-34s %8d %12.1f %12.1f %12.1f" % (name, len(data), full, lazy, reencode)
+        else:
+            lazy = measure(lambda: bdecode_lazy(data)['y'], seconds)
+            print "%-34s %8d %12.1f %12.1f %12s" % (name, len(data), full, lazy, "-")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+# see LICENSE.txt for license information
+#
+# Correctness and throughput of the chess boards of GameCast, ChessBoard and
+# BitboardChessBoard. For a number of positions it counts the positions at
+# each depth, by playing all moves (perft), with both boards and prints the
+# counts and the number of moves played per second. The counts of both
+# boards must be the same. They are those of the rules of chess, except
+# where ChessBoard differs from them: in position 3 it allows en passant
+# captures that leave the king in check.
+#
+# It also replays random games, as GameCast does when it validates moves,
+# and prints the number of text moves added per second.
+#
+# Not a unittest, run as: python benchmark_chessboard.py [max depth]
+#
+
+import sys
+import time
+from random import Random
+
+from Tribler.Core.GameCast.ChessBoard import ChessBoard
+from Tribler.Core.GameCast.BitboardChessBoard import BitboardChessBoard
+
+MAX_DEPTH = 3
+GAMES = 20
+
+# (name, FEN or None for the initial position, [count at depth 1, 2, ...])
+POSITIONS = [
+    ('initial', None, [20, 400, 8902, 197281]),
+    ('kiwipete', 'r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1', [48, 2039, 97862]),
+    ('position 3', '8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1', [14, 191, 2812, 43238]),
+    ('position 4', 'r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1', [6, 264, 9467]),
+    ]
+
+
+def perft(cb, depth):
+    """ Returns the number of positions after depth moves """
+    count = 0
+    board = cb.getBoard()
+    for y in range(8):
+        for x in range(8):
+            if board[y][x] == '.':
+                continue
+            for tx, ty in cb.getValidMoves((x, y)):
+                if board[y][x] in ('P', 'p') and ty in (0, 7):
+                    promotions = (cb.QUEEN, cb.ROOK, cb.KNIGHT, cb.BISHOP)
+                else:
+                    promotions = (cb.QUEEN,)
+                for promotion in promotions:
+                    if depth == 1:
+                        count += 1
+                        continue
+                    cb.setPromotion(promotion)
+                    cb.addMove((x, y), (tx, ty))
+                    count += perft(cb, depth - 1)
+                    cb.undo()
+    return count
+
+
+def random_games(rand, number):
+    """ Returns the moves of random games, in SAN """
+    games = []
+    for i in xrange(number):
+        cb = BitboardChessBoard()
+        cb.setPromotion(cb.QUEEN)
+        while not cb.isGameOver():
+            moves = []
+            for y in range(8):
+                for x in range(8):
+                    moves.extend([((x, y), to) for to in cb.getValidMoves((x, y))])
+            cb.addMove(*rand.choice(moves))
+        games.append(cb.getAllTextMoves(cb.SAN))
+    return games
+
+
+def replay(cls, games):
+    """ Returns the number of moves added per second """
+    count = 0
+    start = time.time()
+    for moves in games:
+        cb = cls()
+        for move in moves:
+            if not cb.addTextMove(move) and cb.getReason() == cb.MUST_SET_PROMOTION:
+                cb.setPromotion(cb.QUEEN)
+                cb.addTextMove(move)
+            count += 1
+    return count / (time.time() - start)
+
+
+def main():
+    max_depth = MAX_DEPTH
+    if len(sys.argv) > 1:
+        max_depth = int(sys.argv[1])
+    boards = (ChessBoard, BitboardChessBoard)
+    print "%-12s %5s %9s %9s %9s %12s %12s" % ("position", "depth", "expected", "ChessBoard", "Bitboard", "moves/s", "moves/s")
+    for name, fen, expected in POSITIONS:
+        for depth in xrange(1, min(max_depth, len(expected)) + 1):
+            counts = []
+            speeds = []
+            for cls in boards:
+                cb = cls()
+                if fen:
+                    cb.setFEN(fen)
+                start = time.time()
+                counts.append(perft(cb, depth))
+                speeds.append(counts[-1] / max(time.time() - start, 0.000001))
+            if counts[0] != counts[1]:
+                print "%-12s %5d: the boards do not agree" % (name, depth)
+            print "%-12s %5d %9d %9d %9d %12.0f %12.0f" % (name, depth, expected[depth-1], counts[0], counts[1], speeds[0], speeds[1])
+
+    games = random_games(Random(0), GAMES)
+    print
+    print "replay of %d random games, %d moves" % (GAMES, sum([len(moves) for moves in games]))
+    for cls in boards:
+        print "%-20s %8.0f moves/s" % (cls.__name__, replay(cls, games))
+
+
+if __name__ == '__main__':
+    main()
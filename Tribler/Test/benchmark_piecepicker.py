@@ -0,0 +1,111 @@
+# see LICENSE.txt for license information
+#
+# Benchmark of PiecePicker piece selection. It replays a synthetic swarm
+# trace: peers join with have-sets of varying size (most joining peers have
+# few pieces), send HAVE messages as they progress, and we ask for the next
+# piece to request from a random peer and complete it.
+#
+# The trace is replayed with the plain interest level scan that _next does
+# for have-sets that are not a Bitfield ("scan"), and with the default
+# selection, which stops scanning and visits the pieces of the peer when
+# that is cheaper ("adaptive").
+#
+# Not a unittest, run as: python benchmark_piecepicker.py [events]
+#
+
+import sys
+import time
+from random import Random, seed
+
+from Tribler.Core.BitTornado.bitfield import Bitfield
+from Tribler.Core.BitTornado.BT1.PiecePicker import PiecePicker
+
+NUMPIECES = [1000, 10000, 100000]
+NUMPEERS = 50
+EVENTS = 4000
+
+
+class PlainHaves:
+    def __init__(self, have):
+        self.have = have
+
+    def __getitem__(self, piece):
+        return self.have[piece]
+
+    def complete(self):
+        return self.have.complete()
+
+
+def make_trace(numpieces, numevents, rand):
+    """ Returns the have-sets of the initial peers and a list of events """
+    peers = []
+    for i in xrange(NUMPEERS):
+        if rand.random() < 0.2:
+            # a nearly finished peer
+            fraction = rand.uniform(0.5, 0.99)
+        else:
+            fraction = rand.uniform(0.0, 0.02)
+        peers.append(rand.sample(xrange(numpieces), int(numpieces * fraction)))
+
+    events = []
+    for i in xrange(numevents):
+        peer = rand.randrange(NUMPEERS)
+        if rand.random() < 0.5:
+            events.append(('have', peer, rand.randrange(numpieces)))
+        else:
+            events.append(('next', peer, None))
+    return peers, events
+
+def replay(numpieces, peers, events, adaptive):
+    """ Returns the time spent selecting pieces, the number of selections
+    and the number of pieces picked """
+    seed(1)
+    picker = PiecePicker(numpieces)
+    picker.fast_initialize(False)
+
+    bitfields = []
+    for pieces in peers:
+        have = Bitfield(numpieces)
+        for piece in pieces:
+            have[piece] = True
+            picker.got_have(piece)
+        bitfields.append(have)
+    if adaptive:
+        haves = bitfields
+    else:
+        haves = [PlainHaves(have) for have in bitfields]
+
+    elapsed = 0.0
+    selections = 0
+    picked = 0
+    wantfunc = lambda piece: not picker.has[piece]
+    for event, peer, piece in events:
+        if event == 'have':
+            have = bitfields[peer]
+            if not have[piece]:
+                have[piece] = True
+                picker.got_have(piece)
+        else:
+            start = time.time()
+            piece = picker._next(haves[peer], wantfunc, False)
+            elapsed += time.time() - start
+            selections += 1
+            if piece is not None:
+                picker.complete(piece)
+                picked += 1
+    return elapsed, selections, picked
+
+def main(numevents = EVENTS):
+    print "%-9s %9s %12s %14s %8s" % ("strategy", "pieces", "select s", "us/selection", "picked")
+    for numpieces in NUMPIECES:
+        peers, events = make_trace(numpieces, numevents, Random(numpieces))
+        for name, adaptive in (("scan", False), ("adaptive", True)):
+            elapsed, selections, picked = replay(numpieces, peers, events, adaptive)
+            print "%-9s %9d %12.3f %14.1f %8d" % (name, numpieces, elapsed, elapsed * 1e6 / selections, picked)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        main(int(sys.argv[1]))
+    else:
+        main()
@@ -0,0 +1,115 @@
+# see LICENSE.txt for license information
+#
+# Benchmark of the network event loop overhead of SocketHandler for the
+# available reactor backends (see SessionConfig.set_reactor_backend).
+#
+# For 100, 1,000 and 10,000 connections it measures the time per loop
+# iteration (do_poll + handle_events) when
+#  - idle: no connection has data pending, and
+#  - active: every connection received a small message since the last round.
+#
+# Not a unittest, run as: python benchmark_reactor.py [rounds]
+#
+
+import sys
+import socket
+import time
+
+from Tribler.Core.simpledefs import REACTOR_POLL, REACTOR_EPOLL
+from Tribler.Core.BitTornado import epollpoll
+from Tribler.Core.BitTornado.SocketHandler import SocketHandler, SingleSocket, POLLIN
+
+CONNECTIONS = [100, 1000, 10000]
+ROUNDS = 200
+
+
+class CountingHandler:
+    def __init__(self):
+        self.count = 0
+
+    def data_came_in(self, s, data):
+        self.count += 1
+
+    def connection_flushed(self, s):
+        pass
+
+    def connection_lost(self, s):
+        pass
+
+
+def raise_fd_limit(needed):
+    """ Returns the number of file descriptors we may use """
+    try:
+        import resource
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        if soft < needed:
+            if hard == resource.RLIM_INFINITY or hard > needed:
+                resource.setrlimit(resource.RLIMIT_NOFILE, (needed, hard))
+            else:
+                resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+        return resource.getrlimit(resource.RLIMIT_NOFILE)[0]
+    except (ImportError, ValueError):
+        return 1024
+
+
+def setup(backend, nconns):
+    sh = SocketHandler(300, False, 100000, backend)
+    handler = CountingHandler()
+    pairs = []
+    for i in xrange(nconns):
+        a, b = socket.socketpair()
+        a.setblocking(0)
+        ss = SingleSocket(sh, a, handler)
+        ss.connected = True
+        sh.single_sockets[a.fileno()] = ss
+        sh.poll.register(a, POLLIN)
+        pairs.append((a, b))
+    return sh, handler, pairs
+
+def teardown(pairs):
+    for a, b in pairs:
+        a.close()
+        b.close()
+
+def run_idle(sh, rounds):
+    start = time.time()
+    for i in xrange(rounds):
+        sh.handle_events(sh.do_poll(0))
+    return (time.time() - start) / rounds
+
+def run_active(sh, pairs, rounds):
+    elapsed = 0.0
+    for i in xrange(rounds):
+        for a, b in pairs:
+            b.send("x")
+        start = time.time()
+        sh.handle_events(sh.do_poll(0))
+        elapsed += time.time() - start
+    return elapsed / rounds
+
+def main(rounds = ROUNDS):
+    backends = [REACTOR_POLL]
+    if epollpoll.available():
+        backends.append(REACTOR_EPOLL)
+    maxfds = raise_fd_limit(2 * max(CONNECTIONS) + 100)
+
+    print "%-8s %8s %14s %14s" % ("backend", "conns", "idle us/loop", "active us/loop")
+    for nconns in CONNECTIONS:
+        if 2 * nconns + 50 > maxfds:
+            print "skipping %d connections, file descriptor limit is %d" % (nconns, maxfds)
+            continue
+        for backend in backends:
+            sh, handler, pairs = setup(backend, nconns)
+            try:
+                idle = run_idle(sh, rounds)
+                active = run_active(sh, pairs, max(1, rounds / 10))
+            finally:
+                teardown(pairs)
+            print "%-8s %8d %14.1f %14.1f" % (backend, nconns, idle * 1e6, active * 1e6)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        main(int(sys.argv[1]))
+    else:
+        main()
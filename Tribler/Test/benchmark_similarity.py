@@ -0,0 +1,80 @@
+# see LICENSE.txt for license information
+#
+# Throughput of the similarity computation of BuddyCast. It computes the
+# similarities of all peers to my preferences with PreferenceMatrix, and as
+# before, by computing the overlap of each peer with my preferences (which
+# the database did with a JOIN). It also times adding the preferences of a
+# peer and updating its similarity, as when a BuddyCast message arrives.
+#
+# Not a unittest, run as: python benchmark_similarity.py [peers] [preferences]
+#
+
+import sys
+import time
+from random import Random
+
+from Tribler.Core.BuddyCast.similarity import P2PSim_Full, PreferenceMatrix
+
+NPEERS = 10000
+NPREFS = 50
+NTORRENTS = 50000
+NMYPREFS = 50
+
+
+def overlap_rows(prefs, nprefs, myprefs):
+    """ Returns the rows of SimilarityDBHandler.getPeersWithOverlap """
+    rows = []
+    for peer_id, peer_prefs in prefs.iteritems():
+        overlap = len([tid for tid in peer_prefs if tid in myprefs])
+        if overlap:
+            rows.append((peer_id, nprefs[peer_id], overlap))
+    return rows
+
+
+def main():
+    npeers = NPEERS
+    nprefs = NPREFS
+    if len(sys.argv) > 1:
+        npeers = int(sys.argv[1])
+    if len(sys.argv) > 2:
+        nprefs = int(sys.argv[2])
+
+    rand = Random(0)
+    torrents = xrange(1, NTORRENTS + 1)
+    # Popular torrents are in more preferences
+    popular = range(1, NTORRENTS / 100 + 1)
+    prefs = {}
+    for peer_id in xrange(1, npeers + 1):
+        prefs[peer_id] = list(set(rand.sample(torrents, nprefs / 2) + rand.sample(popular, nprefs / 2)))
+    num_prefs = dict([(peer_id, len(peer_prefs)) for peer_id, peer_prefs in prefs.iteritems()])
+    myprefs = dict.fromkeys(rand.sample(popular, NMYPREFS / 2) + rand.sample(torrents, NMYPREFS / 2), True)
+    print "%d peers with %d preferences, %d preferences of mine" % (npeers, nprefs, len(myprefs))
+
+    start = time.time()
+    expected = P2PSim_Full(overlap_rows(prefs, num_prefs, myprefs), len(myprefs))
+    print "%-40s %8.3f s" % ("overlap per peer", time.time() - start)
+
+    start = time.time()
+    matrix = PreferenceMatrix()
+    for peer_id, peer_prefs in prefs.iteritems():
+        matrix.addPeerPreferences(peer_id, peer_prefs, num_prefs[peer_id])
+    print "%-40s %8.3f s" % ("load PreferenceMatrix", time.time() - start)
+
+    start = time.time()
+    matrix.setMyPreferences(myprefs.keys())
+    similarities = matrix.getSimilarities()
+    print "%-40s %8.3f s" % ("PreferenceMatrix all similarities", time.time() - start)
+    if similarities != expected:
+        print "the similarities do not agree"
+
+    updates = 1000
+    start = time.time()
+    for i in xrange(updates):
+        peer_id = rand.randint(1, npeers)
+        matrix.addPeerPreferences(peer_id, rand.sample(torrents, 5))
+        matrix.getSimilarity(peer_id)
+    print "%-40s %8.0f /s" % ("PreferenceMatrix incremental updates", updates / (time.time() - start))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+# see LICENSE.txt for license information
+#
+# Cost of the torrent results of TorrentDBHandler on a large database. It
+# times getTorrents() and searchNames(), which return a dict per torrent,
+# against getTorrentRows() and searchNameRows(), which return a
+# TorrentResultSet that decodes the fields of a torrent when they are read.
+# For the result sets it also times sorting on num_seeders and reading the
+# fields of the first page of torrents, as a GUI list does.
+#
+# Not a unittest, run from Tribler/Test as: python benchmark_torrentrows.py [torrents]
+#
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+from random import Random
+
+from Tribler.Core.CacheDB.sqlitecachedb import SQLiteCacheDB, CURRENT_MAIN_DB_VERSION, bin2str
+from Tribler.Core.CacheDB.SqliteCacheDBHandler import TorrentDBHandler
+from Tribler.Category.Category import Category
+
+CREATE_SQL_FILE = os.path.join('..', 'schema_sdb_v' + str(CURRENT_MAIN_DB_VERSION) + '.sql')
+NTORRENTS = 200000
+NWORDS = 2000
+PAGE = 50
+
+
+def fill(db, torrent_db, ntorrents):
+    rand = Random(0)
+    words = ['word%d' % i for i in range(NWORDS)]
+    category_ids = torrent_db.id2category.keys()
+    torrents = []
+    keywords = []
+    for torrent_id in xrange(1, ntorrents + 1):
+        # Every torrent has the word 'common'
+        name = ['common'] + rand.sample(words, 3)
+        torrents.append((torrent_id, bin2str('%020d' % torrent_id), u' '.join(name), 'file%d.torrent' % torrent_id,
+                         rand.randint(1, 1 << 32), 0, 1, 0, 0, 0, 0, 1, rand.choice(category_ids), 1,
+                         rand.randint(0, 1000), rand.randint(0, 1000)))
+        keywords.extend([(word, torrent_id) for word in name])
+    db.executemany(u"""INSERT INTO Torrent (torrent_id, infohash, name, torrent_file_name, length, creation_date,
+                       num_files, thumbnail, insert_time, secret, relevance, source_id, category_id, status_id,
+                       num_seeders, num_leechers) VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)""", torrents, commit=False)
+    db.executemany(u"INSERT INTO InvertedIndex (word, torrent_id) VALUES (?,?)", keywords, commit=False)
+    if torrent_db.fts:
+        db.executemany(u"INSERT INTO TorrentFTS (docid, keywords) VALUES (?,?)",
+                       [(torrent[0], torrent[2]) for torrent in torrents], commit=False)
+    db.commit()
+
+
+def timeit(name, func):
+    start = time.time()
+    result = func()
+    print "%-40s %8.3f s" % (name, time.time() - start)
+    return result
+
+def read_page(torrents):
+    for i in xrange(min(PAGE, len(torrents))):
+        torrent = torrents[i]
+        (torrent['name'], torrent['infohash'], torrent['category'], torrent['num_seeders'])
+
+
+def main():
+    ntorrents = NTORRENTS
+    if len(sys.argv) > 1:
+        ntorrents = int(sys.argv[1])
+
+    db_dir = tempfile.mkdtemp()
+    try:
+        db = SQLiteCacheDB.getInstance()
+        db.initDB(os.path.join(db_dir, 'tribler.sdb'), CREATE_SQL_FILE)
+        torrent_db = TorrentDBHandler.getInstance()
+        torrent_db.register(Category.getInstance('..'), '.')
+        fill(db, torrent_db, ntorrents)
+        print "%d torrents" % ntorrents
+
+        timeit("getTorrents", torrent_db.getTorrents)
+        rows = timeit("getTorrentRows", torrent_db.getTorrentRows)
+        timeit("sort on num_seeders", lambda: rows.sort('num_seeders', reverse = True))
+        timeit("read a page", lambda: read_page(rows))
+        rows = None
+
+        kws = ['common']
+        timeit("searchNames", lambda: torrent_db.searchNames(kws))
+        rows = timeit("searchNameRows", lambda: torrent_db.searchNameRows(kws))
+        timeit("read a page", lambda: read_page(rows))
+    finally:
+        SQLiteCacheDB.getInstance().close()
+        shutil.rmtree(db_dir, ignore_errors = True)
+
+
+if __name__ == '__main__':
+    main()
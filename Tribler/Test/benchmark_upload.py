@@ -0,0 +1,171 @@
+# see LICENSE.txt for license information
+#
+# Benchmark of the upload path: the way Connecter.send_partial() hands
+# PIECE messages to SingleSocket and SingleSocket.try_write() sends them.
+#
+# For 10, 100 and 500 unchoked peers it uploads 128 KiB to every peer each
+# round, in 16 KiB or 128 KiB blocks (see max_slice_length), over socket
+# pairs with a small send buffer, so that sends are partial as they are at
+# high upload rates, and prints the CPU time per MiB
+#  - copy: the PIECE message is joined with piece.tostring() and the
+#          unsent rest of the buffer is sliced off after a partial send,
+#          as before, and
+#  - vector: the header and the piece are queued with write_vector() and
+#          sent from an offset, without copying the piece.
+# Each block is sent whole (no upload limit) or in 4 KiB slices (rate
+# limited). As Python has no writev() the vector path costs an extra send()
+# per block, so it only pays off for larger blocks.
+#
+# Not a unittest, run as: python benchmark_upload.py [rounds]
+#
+
+import sys
+import socket
+import time
+from array import array
+
+from Tribler.Core.BitTornado.SocketHandler import SingleSocket, SOCKET_BLOCK_ERRORCODE, POLLIN, all
+from Tribler.Core.BitTornado.BT1.convert import tobinary
+from Tribler.Core.BitTornado.BT1.MessageID import PIECE
+
+PEERS = [10, 100, 500]
+ROUNDS = 20
+BLOCKS = [2 ** 14, 2 ** 17]
+ROUND_SIZE = 2 ** 17
+SNDBUF = 2 ** 13
+
+
+class FakePoll:
+    def register(self, s, events):
+        pass
+
+class FakeSocketHandler:
+    def __init__(self):
+        self.poll = FakePoll()
+        self.dead_from_write = []
+
+class NullHandler:
+    pass
+
+
+class CopyingSingleSocket(SingleSocket):
+    """ SingleSocket writing the way it did before write_vector() """
+    def try_write(self):
+        if self.connected:
+            dead = False
+            try:
+                while self.buffer:
+                    buf = self.buffer[0]
+                    amount = self.socket.send(buf)
+                    self.data_sent += amount
+                    if amount == 0:
+                        self.skipped += 1
+                        break
+                    self.skipped = 0
+                    if amount != len(buf):
+                        self.buffer[0] = buf[amount:]
+                        break
+                    del self.buffer[0]
+            except socket.error, e:
+                blocked = (e[0] == SOCKET_BLOCK_ERRORCODE)
+                dead = not blocked
+                if not blocked:
+                    self.skipped += 1
+            if self.skipped >= 5:
+                dead = True
+            if dead:
+                self.socket_handler.dead_from_write.append(self)
+                return
+        if self.buffer:
+            self.socket_handler.poll.register(self.socket, all)
+        else:
+            self.socket_handler.poll.register(self.socket, POLLIN)
+
+
+def send_copy(ss, index, begin, piece, quantum):
+    msg = ''.join((tobinary(len(piece) + 9), PIECE, tobinary(index),
+                   tobinary(begin), piece.tostring()))
+    while msg:
+        ss.write(buffer(msg, 0, quantum))
+        msg = buffer(msg, quantum)
+
+def send_vector(ss, index, begin, piece, quantum):
+    out = [''.join((tobinary(len(piece) + 9), PIECE, tobinary(index),
+                    tobinary(begin)))]
+    msg = piece
+    while msg:
+        out.append(buffer(msg, 0, quantum))
+        ss.write_vector(out)
+        msg = buffer(msg, quantum)
+        out = []
+
+
+def setup(sockclass, npeers):
+    sh = FakeSocketHandler()
+    peers = []
+    for i in xrange(npeers):
+        a, b = socket.socketpair()
+        a.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, SNDBUF)
+        a.setblocking(0)
+        b.setblocking(0)
+        ss = sockclass(sh, a, NullHandler())
+        ss.connected = True
+        peers.append((ss, a, b))
+    return peers
+
+def teardown(peers):
+    for ss, a, b in peers:
+        a.close()
+        b.close()
+
+def drain(b):
+    try:
+        while b.recv(2 ** 16):
+            pass
+    except socket.error:
+        pass
+
+def run(sockclass, sendfunc, npeers, rounds, block, quantum):
+    """ Returns the CPU time per MiB uploaded """
+    peers = setup(sockclass, npeers)
+    piece = array('c', 'x' * block)
+    nblocks = ROUND_SIZE / block
+    elapsed = 0.0
+    try:
+        for r in xrange(rounds):
+            for ss, a, b in peers:
+                start = time.clock()
+                for i in xrange(nblocks):
+                    sendfunc(ss, r, i * block, piece[:], quantum)
+                elapsed += time.clock() - start
+            # the peers read what we sent, we send the rest
+            while True:
+                pending = False
+                for ss, a, b in peers:
+                    drain(b)
+                    if not ss.is_flushed():
+                        start = time.clock()
+                        ss.try_write()
+                        elapsed += time.clock() - start
+                        pending = True
+                if not pending:
+                    break
+    finally:
+        teardown(peers)
+    return elapsed / (npeers * rounds * ROUND_SIZE / float(2 ** 20))
+
+def main(rounds = ROUNDS):
+    print "%6s %8s %8s %16s %16s" % ("peers", "block", "slice", "copy ms/MiB", "vector ms/MiB")
+    for npeers in PEERS:
+        for block in BLOCKS:
+            for quantum in (block + 13, 2 ** 12):
+                copy = run(CopyingSingleSocket, send_copy, npeers, rounds, block, quantum)
+                vector = run(SingleSocket, send_vector, npeers, rounds, block, quantum)
+                print "%6d %8d %8d %16.2f %16.2f" % (npeers, block, quantum, copy * 1e3, vector * 1e3)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        main(int(sys.argv[1]))
+    else:
+        main()
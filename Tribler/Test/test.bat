@@ -7,27 +7,45 @@ REM python test_friend.py # Arno, 2008-10-17: need to convert to new DB structur
 REM python test_torrentcollecting.py # currently not working due to missing functions, 2009-12-04
 python test_TimedTaskQueue.py
 python test_bartercast.py
+python test_bartergraph.py
+python test_bencode.py
+python test_bitfield.py
 python test_buddycast2_datahandler.py
 python test_cachingstream.py
+python test_channelcast_db.py
+python test_chessboard.py
 python test_closedswarm.py
 python test_connect_overlay.py singtest_connect_overlay
 python test_crawler.py
 python test_dialback_request.py
+python test_diskio.py
 python test_extend_hs.py
 python test_friendship_crawler.py
 python test_g2g.py
+python test_gamecast.py
 python test_gui_server.py
+python test_hashcheck.py
+python test_mainlineDHTLookups.py
 python test_merkle.py
+python test_message_dispatcher.py
+python test_mmap_upload.py
 python test_multicast.py
+python test_notifier.py
 python test_osutils.py
 python test_permid.py
 python test_permid_response1.py
+python test_piecepicker.py
+python test_reactor.py
 python test_remote_query.py
+python test_resume.py
 python test_seeding_stats.py
+python test_similarity.py
 python test_social_overlap.py
 python test_sqlitecachedb.py
 python test_status.py
 python test_superpeers.py 
+python test_torrentrows.py
+python test_trackerclient.py
 python test_url.py
 python test_url_metadata.py
 python test_ut_pex.py
@@ -72,6 +90,16 @@ REM # python test_buddycast4_stresstest.py
 REM #
 REM # 2010-02-03 Boudewijn: Doesn't look like this was ever a unittest
 REM # python test_tracker_checking.py
+REM #
+REM # Benchmarks, they print timings but do not test anything
+REM # python benchmark_bartercast.py
+REM # python benchmark_bencode.py
+REM # python benchmark_chessboard.py
+REM # python benchmark_piecepicker.py
+REM # python benchmark_reactor.py
+REM # python benchmark_similarity.py
+REM # python benchmark_torrentrows.py
+REM # python benchmark_upload.py
 
 REM ########### Obsolete
 REM #
@@ -64,6 +64,58 @@ class TestTimedTaskQueue(unittest.TestCase):
     def task0d(self):
         assert self.count == 3
         self.count = 4
+
+    def test_cancel(self):
+        self.queue = TimedTaskQueue()
+        self.count = 0
+        handle = self.queue.add_task(self.task2, 0.5)
+        done = self.queue.add_task(self.task_count, 0)
+        self.queue.add_task(self.task_count, 0.5)
+        self.assert_(handle.cancel())
+        self.assertFalse(handle.cancel())
+        sleep(1)
+        self.assertEquals(2, self.count)
+        # a task that ran cannot be cancelled
+        self.assertFalse(done.cancel())
+        self.queue.add_task('stop')
+        del self.queue
+
+    def test_replaceId(self):
+        self.queue = TimedTaskQueue()
+        self.count = 0
+        self.queue.add_task(self.task2, 0.5, id='task')
+        self.queue.add_task(self.task0, 0.5, id='task')
+        sleep(1)
+        # only the last task with the id ran
+        self.assertEquals(1, self.count)
+        self.queue.add_task(self.task0, 0.5, id='task')
+        self.assert_(self.queue.remove_task('task'))
+        self.assertFalse(self.queue.remove_task('task'))
+        sleep(1)
+        self.assertEquals(1, self.count)
+        self.queue.add_task('stop')
+        del self.queue
+
+    def test_stats(self):
+        self.queue = TimedTaskQueue()
+        self.count = 0
+        for i in range(4):
+            self.queue.add_task(self.task_count, 0.5)
+        self.queue.add_task(self.task_count, 0.5).cancel()
+        stats = self.queue.get_stats()
+        self.assertEquals(4, stats['depth'])
+        self.assertEquals(5, stats['max_depth'])
+        sleep(1)
+        stats = self.queue.get_stats()
+        self.assertEquals(0, stats['depth'])
+        self.assertEquals(4, stats['executed'])
+        self.assertEquals(4, self.count)
+        self.assert_(0 <= stats['avg_lag'] <= stats['max_lag'] < 0.5)
+        self.queue.add_task('stop')
+        del self.queue
+
+    def task_count(self):
+        self.count += 1
     
 def test_suite():
     suite = unittest.TestSuite()
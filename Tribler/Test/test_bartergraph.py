@@ -0,0 +1,124 @@
+# see LICENSE.txt for license information
+#
+# Tests for the BarterGraph of BarterCastDBHandler: its totals must be those
+# getTopNPeers computed by scanning the whole BarterCast table, and its
+# cached reputations those of a graph built from scratch.
+#
+
+import unittest
+from random import Random
+
+from Tribler.Core.CacheDB.bartergraph import BarterGraph
+from Tribler.Core.CacheDB.maxflow import Network
+
+MY_ID = 1
+
+
+def scan_totals(records, local_only):
+    """ The totals as getTopNPeers computed them from the rows in table order """
+    totals = {}
+    processed = set()
+    for peer_id_from, peer_id_to, uploaded, downloaded in records:
+        if local_only and not MY_ID in (peer_id_from, peer_id_to):
+            continue
+        if (peer_id_to, peer_id_from) in processed or peer_id_to == peer_id_from:
+            continue
+        processed.add((peer_id_from, peer_id_to))
+        if peer_id_from == -1:
+            peer_id_to = MY_ID
+        if peer_id_to == -1:
+            peer_id_from = MY_ID
+        up, down = totals.get(peer_id_from, (0, 0))
+        totals[peer_id_from] = (up + uploaded, down + downloaded)
+        up, down = totals.get(peer_id_to, (0, 0))
+        totals[peer_id_to] = (up + downloaded, down + uploaded)
+    return totals
+
+def random_records(rand, npeers, nrecords):
+    records = []
+    for i in xrange(nrecords):
+        records.append((rand.randint(-1, npeers), rand.randint(-1, npeers), rand.randint(0, 1000), rand.randint(0, 1000)))
+    return records
+
+def build(records, max_distance = 2):
+    graph = BarterGraph(MY_ID, max_distance)
+    for record in records:
+        graph.setRecord(*record)
+    return graph
+
+
+class TestBarterGraph(unittest.TestCase):
+
+    def setUp(self):
+        rand = Random(0)
+        self.updates = random_records(rand, 40, 1000)
+        self.graph = build(self.updates)
+        # The rows of the table, in the order they were inserted
+        rows = {}
+        order = []
+        for peer_id_from, peer_id_to, uploaded, downloaded in self.updates:
+            key = (peer_id_from, peer_id_to)
+            if key not in rows:
+                order.append(key)
+            rows[key] = (uploaded, downloaded)
+        self.records = [key + rows[key] for key in order]
+
+    def test_totals(self):
+        for local_only in (False, True):
+            totals = scan_totals(self.records, local_only)
+            for peer_id in range(-1, 41):
+                self.assertEquals(totals.get(peer_id, (0, 0)), self.graph.getTotals(peer_id, local_only))
+
+    def test_top(self):
+        for local_only in (False, True):
+            totals = scan_totals(self.records, local_only)
+            expected = sorted([(up, peer_id) for peer_id, (up, down) in totals.iteritems() if peer_id not in (-1, MY_ID)], reverse=True)
+            top = self.graph.getTopNPeers(10, local_only)
+            self.assertEquals([up for up, peer_id in expected[:10]], [up for peer_id, up, down in top])
+            for peer_id, up, down in top:
+                self.assertEquals(totals[peer_id], (up, down))
+
+    def test_flow(self):
+        records = [(2, 1, 10, 0), (2, 3, 5, 0), (3, 1, 7, 0), (2, 4, 8, 0), (4, 5, 8, 0), (5, 1, 8, 0), (1, 3, 0, 4)]
+        graph = build(records)
+        # 2 -> 1 directly and through 3, the path through 4 and 5 is too long
+        self.assertEquals(15, graph.getFlow(2, 1))
+        # 1 reported to download 4 from 3
+        self.assertEquals(7, graph.getFlow(3, 1))
+        self.assertEquals(0, graph.getFlow(1, 2))
+        self.assertEquals(23, build(records, 3).getFlow(2, 1))
+
+    def test_network_flow(self):
+        # Without paths longer than two arcs both agree
+        graph = build([(2, 1, 10, 0), (2, 3, 5, 0), (3, 1, 7, 0), (2, 4, 8, 0), (4, 1, 2, 0), (1, 3, 1, 0)])
+        arcs = {}
+        for peer_id, capacities in graph.arcs.iteritems():
+            arcs[peer_id] = dict([(next, {'cap': capacity, 'flow': 0}) for next, capacity in capacities.iteritems()])
+        self.assertEquals(Network(arcs).maxflow(2, 1), graph.getFlow(2, 1))
+
+    def test_reputation(self):
+        peer_ids = range(2, 41)
+        reputations = [self.graph.getReputation(peer_id, 0.001) for peer_id in peer_ids]
+        self.assertNotEquals([0.0] * len(peer_ids), reputations)
+        # Change some records, the cached reputations must follow
+        rand = Random(1)
+        updates = random_records(rand, 40, 200)
+        for i, record in enumerate(updates):
+            self.graph.setRecord(*record)
+            if i % 20 == 0:
+                fresh = build(self.updates + updates[:i + 1])
+                for peer_id in peer_ids:
+                    self.assertEquals(fresh.getReputation(peer_id, 0.001), self.graph.getReputation(peer_id, 0.001))
+
+
+def test_suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(TestBarterGraph))
+    return suite
+
+def main():
+    unittest.main(defaultTest='test_suite')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+# see LICENSE.txt for license information
+#
+# Tests for the bencode decoder, and its lazy mode: bdecode_lazy() and
+# LazyDict.
+#
+
+import unittest
+import os
+
+from Tribler.Core.Utilities.Crypto import sha
+from Tribler.Core.BitTornado.bencode import bencode, bdecode, bdecode_lazy, LazyDict
+from Tribler.Core.TorrentDef import TorrentDef
+
+TORRENT = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                       'extend_hs_dir', 'dummydata.merkle.torrent')
+
+
+class TestBdecode(unittest.TestCase):
+
+    def test_values(self):
+        self.assertEquals(12345678901234567890L, bdecode('i12345678901234567890e'))
+        self.assertEquals(-10, bdecode('i-10e'))
+        self.assertEquals({'a': ['', 'xy', {}], 'b': {'c': 1}},
+                          bdecode('d1:al0:2:xydee1:bd1:ci1eee'))
+        # Keys that are not sorted are accepted
+        self.assertEquals({'a': '', 'b': ''}, bdecode('d1:b0:1:a0:e'))
+
+    def test_errors(self):
+        for x in ('', 'i-0e', 'i03e', '02:xy', '9999:x', 'l0:', 'd0:', 'd3:fooe',
+                  'di1e0:e', 'i6easd', 'l01:ae', 'i1.5e', 'x'):
+            self.assertRaises(ValueError, bdecode, x)
+        self.assertEquals(6, bdecode('i6easd', sloppy = 1))
+
+    def test_same_as_bencode(self):
+        d = {'info': {'name': 'x' * 100, 'pieces': 'p' * 2000, 'length': 2 ** 40,
+                      'files': [{'path': ['a', 'b'], 'length': i} for i in xrange(20)]},
+             'announce': 'http://127.0.0.1:6969/announce', 'creation date': -1}
+        self.assertEquals(d, bdecode(bencode(d)))
+
+
+class TestLazy(unittest.TestCase):
+
+    def setUp(self):
+        self.metainfo = {'announce': 'http://127.0.0.1/announce',
+                         'info': {'name': 'test', 'piece length': 2 ** 18,
+                                  'pieces': '\x00' * 200, 'length': 12345},
+                         'nodes': [['127.0.0.1', 7762]]}
+        self.data = bencode(self.metainfo)
+
+    def test_access(self):
+        d = bdecode_lazy(self.data)
+        self.assert_(isinstance(d, LazyDict))
+        self.assertEquals(sorted(self.metainfo.keys()), sorted(d.keys()))
+        self.assertEquals(3, len(d))
+        self.assert_('info' in d)
+        self.assertFalse(d.has_key('comment'))
+        self.assertEquals(None, d.get('comment'))
+        self.assertRaises(KeyError, d.__getitem__, 'comment')
+        # Only the accessed values are decoded
+        self.assertEquals({}, d.decoded)
+        self.assertEquals('http://127.0.0.1/announce', d['announce'])
+        self.assertEquals(['announce'], d.decoded.keys())
+        info = d['info']
+        self.assert_(isinstance(info, LazyDict))
+        self.assertEquals(12345, info['length'])
+        self.assertEquals([['127.0.0.1', 7762]], d['nodes'])
+        self.assertEquals(self.metainfo, d.todict())
+        self.assertEquals(self.metainfo['info'], info.todict())
+
+    def test_raw(self):
+        d = bdecode_lazy(self.data)
+        self.assert_(d.is_canonical())
+        self.assert_(d.is_canonical('info'))
+        self.assertEquals(bencode(self.metainfo['info']), d.get_raw('info'))
+        self.assertEquals('i12345e', d['info'].get_raw('length'))
+
+    def test_not_canonical(self):
+        d = bdecode_lazy('d4:infod1:b0:1:a0:e1:xi1ee')
+        self.assertFalse(d.is_canonical())
+        self.assertFalse(d.is_canonical('info'))
+        self.assert_(d.is_canonical('x'))
+        self.assertEquals('d1:b0:1:a0:e', d.get_raw('info'))
+        self.assertEquals({'a': '', 'b': ''}, d['info'].todict())
+
+    def test_errors(self):
+        for x in ('d', 'd3:fooe', 'd0:', 'd1:a9:xe', 'di1e0:e', 'd1:a02:xye'):
+            self.assertRaises(ValueError, bdecode_lazy, x)
+        self.assertRaises(ValueError, bdecode_lazy, self.data + 'x')
+        self.assert_(isinstance(bdecode_lazy(self.data + 'x', sloppy = 1), LazyDict))
+        # Errors in the values are found when they are accessed
+        d = bdecode_lazy('d1:ai03e1:bi3ee')
+        self.assertEquals(3, d['b'])
+        self.assertRaises(ValueError, d.__getitem__, 'a')
+
+    def test_not_dict(self):
+        self.assertEquals([1, 'a'], bdecode_lazy('li1e1:ae'))
+        self.assertRaises(ValueError, bdecode_lazy, '')
+
+    def test_infohash(self):
+        f = open(TORRENT, 'rb')
+        data = f.read()
+        f.close()
+        tdef = TorrentDef.load(TORRENT)
+        self.assertEquals(sha(bencode(bdecode(data)['info'])).digest(), tdef.get_infohash())
+        self.assertEquals(sha(bdecode_lazy(data).get_raw('info')).digest(), tdef.get_infohash())
+
+
+def test_suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(TestBdecode))
+    suite.addTest(unittest.makeSuite(TestLazy))
+    return suite
+
+def main():
+    unittest.main(defaultTest='test_suite')
+
+
+if __name__ == '__main__':
+    main()
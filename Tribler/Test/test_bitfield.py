@@ -0,0 +1,86 @@
+# see LICENSE.txt for license information
+
+import unittest
+import sys
+from random import randint, seed
+
+from Tribler.Core.BitTornado.bitfield import Bitfield, test_bitfield
+
+NUMPIECES = 1000000
+
+
+def random_bitstring(numpieces):
+    s = [chr(randint(0, 255)) for i in xrange((numpieces + 7) / 8)]
+    extra = len(s) * 8 - numpieces
+    if extra:
+        s[-1] = chr(ord(s[-1]) & (0xFF << extra) & 0xFF)
+    return ''.join(s)
+
+
+class TestBitfield(unittest.TestCase):
+
+    def setUp(self):
+        seed(42)
+
+    def test_module(self):
+        test_bitfield()
+
+    def test_against_boollist(self):
+        for length in (1, 7, 8, 9, 63, 64, 65, 1000):
+            bitstring = random_bitstring(length)
+            b = Bitfield(length, bitstring)
+            bools = b.toboollist()
+            self.assertEquals(length, len(bools))
+            self.assertEquals(bools.count(False), b.numfalse)
+            self.assertEquals([i for i in xrange(length) if bools[i]], list(b.iter_true()))
+            self.assertEquals(bitstring, Bitfield(length, fromarray=bools).tostring())
+            self.assertEquals(bools[3:length-2], b[3:length-2])
+            for i in xrange(length):
+                self.assertEquals(bools[i], b[i])
+
+    def test_set_algebra(self):
+        length = 1001
+        a = Bitfield(length, random_bitstring(length))
+        b = Bitfield(length, random_bitstring(length))
+        la, lb = a.toboollist(), b.toboollist()
+        self.assertEquals([x and y for x, y in zip(la, lb)], (a & b).toboollist())
+        self.assertEquals([x or y for x, y in zip(la, lb)], (a | b).toboollist())
+        self.assertEquals([x and not y for x, y in zip(la, lb)], a.andnot(b).toboollist())
+        self.assertEquals(a.andnot(b).numfalse, a.andnot(b).toboollist().count(False))
+        # Operands are left alone
+        self.assertEquals(la, a.toboollist())
+        a |= b
+        self.assertEquals([x or y for x, y in zip(la, lb)], a.toboollist())
+        self.assertRaises(ValueError, a.__iand__, Bitfield(length + 1))
+
+    def test_clear_range(self):
+        length = 100
+        for start, stop in ((0, 100), (3, 5), (3, 61), (8, 16), (90, 200)):
+            b = Bitfield(length, '\xff' * 12 + '\xf0')
+            b.clear_range(start, stop)
+            expected = [not (start <= i < stop) for i in xrange(length)]
+            self.assertEquals(expected, b.toboollist())
+            self.assertEquals(expected.count(False), b.numfalse)
+
+    def test_memory_per_peer(self):
+        """ Memory for the have info of a single peer of a 1M piece torrent """
+        bitstring = random_bitstring(NUMPIECES)
+        b = Bitfield(NUMPIECES, bitstring)
+        packed = sys.getsizeof(b.bits)
+        unpacked = sys.getsizeof(b.toboollist())
+        print >>sys.stderr, "test: Bitfield of %d pieces: %d bytes packed, %d bytes as list" % (NUMPIECES, packed, unpacked)
+        self.assert_(packed < NUMPIECES / 8 + 1024)
+        self.assertEquals(NUMPIECES - b.numfalse, len(list(b.iter_true())))
+
+
+def test_suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(TestBitfield))
+    return suite
+
+def main():
+    unittest.main(defaultTest='test_suite')
+
+
+if __name__ == '__main__':
+    main()
@@ -137,6 +137,26 @@ class TestBuddyCastDataHandler(unittest.TestCase):
         #self.data_handler.postInit()
         self.data_handler.postInit(1,50,0, 50)
         #from time import sleep
+
+    def test_addPeerToCache(self):
+        # A peer that is cached after postInit() brings its stored 
+        # preferences into the PreferenceMatrix
+        dh = self.data_handler
+        dh.postInit(1,50,0, 10, updatesim=False)
+        sql = "SELECT DISTINCT peer_id FROM Preference"
+        peer_ids = [peer_id for peer_id, in dh.pref_db._db.fetchall(sql) if peer_id not in dh.peers]
+        self.assert_(peer_ids)
+        peer_id = peer_ids[0]
+        permid = dh.getPeerPermid(peer_id)
+        prefs = dh.pref_db.getPrefList(permid)
+        dh.myprefs = prefs[:1]
+        dh.pref_matrix.setMyPreferences(dh.myprefs)
+        self.assertEquals(0, dh.pref_matrix.getSimilarity(peer_id))
+
+        dh._addPeerToCache(permid, 0)
+        self.assert_(peer_id in dh.peers)
+        self.assertEquals(sorted(prefs), sorted(dh.pref_matrix.prefs[peer_id]))
+        self.assert_(dh.pref_matrix.getSimilarity(peer_id) > 0)
         
 class TestBuddyCast(unittest.TestCase):
     
@@ -0,0 +1,142 @@
+# see LICENSE.txt for license information
+#
+# Tests for the channels of ChannelCastDBHandler, which come from the
+# ChannelStats table that triggers keep up to date.
+#
+
+import os
+import unittest
+import tempfile
+
+from Tribler.Core.CacheDB.sqlitecachedb import SQLiteCacheDB, CURRENT_MAIN_DB_VERSION, bin2str
+from Tribler.Core.CacheDB.SqliteCacheDBHandler import ChannelCastDBHandler, VoteCastDBHandler
+
+import Tribler.Core.CacheDB.sqlitecachedb
+Tribler.Core.CacheDB.sqlitecachedb.TEST_SQLITECACHEDB_UPGRADE = True
+
+CREATE_SQL_FILE = os.path.join('..', 'schema_sdb_v' + str(CURRENT_MAIN_DB_VERSION) + '.sql')
+MY_PERMID = 'my permid'
+MY_ID = bin2str(MY_PERMID)
+
+
+class FakeSession:
+    def get_permid(self):
+        return MY_PERMID
+
+
+class TestChannelStats(unittest.TestCase):
+
+    db_dir = None
+
+    def setUp(self):
+        if TestChannelStats.db_dir is None:
+            # The handlers are singletons, all tests use the same database
+            TestChannelStats.db_dir = tempfile.mkdtemp()
+            SQLiteCacheDB.getInstance().initDB(os.path.join(self.db_dir, 'tribler.sdb'), CREATE_SQL_FILE)
+            VoteCastDBHandler.getInstance().registerSession(FakeSession())
+            ChannelCastDBHandler.getInstance().registerSession(FakeSession())
+        self.db = SQLiteCacheDB.getInstance()
+        self.channelcast_db = ChannelCastDBHandler.getInstance()
+        self.votecast_db = VoteCastDBHandler.getInstance()
+
+    def tearDown(self):
+        self.db.execute_write("DELETE FROM ChannelCast", commit=False)
+        self.db.execute_write("DELETE FROM VoteCast", commit=True)
+
+    def addTorrent(self, publisher_id, infohash, time_stamp, name=u'channel'):
+        self.channelcast_db.addTorrent((publisher_id, name, infohash, bin2str('torrenthash'), u'torrent', time_stamp, bin2str('signature')))
+
+    def addVote(self, mod_id, voter_id, vote):
+        self.votecast_db.addVote({'mod_id': mod_id, 'voter_id': voter_id, 'vote': vote, 'time_stamp': 0})
+
+    def stats(self):
+        return self.db.fetchall("SELECT publisher_id, nr_torrents, latest_update, nr_favorites, nr_spam FROM ChannelStats WHERE nr_torrents > 0 OR nr_favorites > 0 OR nr_spam > 0 ORDER BY publisher_id")
+
+    def test_aggregates(self):
+        self.addTorrent('a', 'ih1', 10, u'old name')
+        self.addTorrent('a', 'ih2', 30, u'new name')
+        self.addTorrent('a', 'ih2', 40)    # ignored, already in the channel
+        self.addTorrent('b', 'ih1', 20)
+        self.addVote('a', 'voter1', 2)
+        self.addVote('a', 'voter2', 2)
+        self.addVote('a', 'voter3', -1)
+        self.addVote('c', 'voter1', 2)
+        self.assertEquals([('a', 2, 30, 2, 1), ('b', 1, 20, 0, 0), ('c', 0, None, 1, 0)], self.stats())
+        self.assertEquals(('a', u'new name', 30, 2, 2, 1, 0), self.channelcast_db.getChannel('a'))
+        # Only channels with torrents
+        self.assertEquals(None, self.channelcast_db.getChannel('c'))
+
+        # A vote that changes
+        self.addVote('a', 'voter3', 2)
+        self.votecast_db.deleteVote('a', 'voter1')
+        self.db.execute_write("DELETE FROM ChannelCast WHERE publisher_id = 'a' AND infohash = 'ih2'")
+        self.assertEquals([('a', 1, 10, 2, 0), ('b', 1, 20, 0, 0), ('c', 0, None, 1, 0)], self.stats())
+
+        # My votes
+        self.votecast_db.subscribe('b')
+        self.assertEquals(2, self.channelcast_db.getChannel('b')[6])
+        self.assertEquals([('a', 1, 10, 2, 0), ('b', 1, 20, 1, 0), ('c', 0, None, 1, 0)], self.stats())
+        self.votecast_db.spam('b')
+        self.assertEquals(-1, self.channelcast_db.getChannel('b')[6])
+        self.assertEquals([('a', 1, 10, 2, 0), ('b', 1, 20, 0, 1), ('c', 0, None, 1, 0)], self.stats())
+
+    def test_pages(self):
+        for i, publisher_id in enumerate('abcde'):
+            self.addTorrent(publisher_id, 'ih', 100 - i)
+            for voter in range(i):
+                self.addVote(publisher_id, 'voter%d' % voter, 2)
+        self.votecast_db.spam('d')
+        popular = [channel[0] for channel in self.channelcast_db.getAllChannels()]
+        self.assertEquals(['e', 'c', 'b', 'a', 'd'], popular)
+        for offset in range(6):
+            self.assertEquals(popular[offset:offset + 2], [channel[0] for channel in self.channelcast_db.getMostPopularChannels(2, offset)])
+        latest = [channel[0] for channel in self.channelcast_db.getLatestUpdated()]
+        self.assertEquals(['a', 'b', 'c', 'e', 'd'], latest)
+        self.assertEquals(['e', 'd'], [channel[0] for channel in self.channelcast_db.getLatestUpdated(2, 3)])
+
+        self.assertEquals(['a'], [channel[0] for channel in self.channelcast_db.getNewChannels()])
+        self.assertEquals([], self.channelcast_db.getNewChannels(100))
+        self.assertEquals(['c', 'a'], [channel[0] for channel in self.channelcast_db.getChannels(['a', 'c'])])
+        # A literal % in the where clause
+        self.assertEquals(popular, [channel[0] for channel in self.channelcast_db._getChannels("S.publisher_id LIKE '%'")])
+
+    def test_search(self):
+        # search results are binary
+        for i, permid in enumerate(['pa', 'pb', 'pc']):
+            self.addTorrent(bin2str(permid), bin2str('ih'), 100, u'channel %s' % permid)
+            for voter in range(i):
+                self.addVote(bin2str(permid), 'voter%d' % voter, 2)
+        records = self.channelcast_db.searchChannels('k channel')
+        self.assertEquals(['pc', 'pb', 'pa'], [record[0] for record in records])
+        records = self.channelcast_db.searchChannels('k channel pb')
+        self.assertEquals(['pb'], [record[0] for record in records])
+        records = self.channelcast_db.searchChannels('k channel', limit=1, offset=1)
+        self.assertEquals(['pb'], [record[0] for record in records])
+        self.assertEquals([], self.channelcast_db.searchChannels("k notachannel"))
+
+    def test_upgrade(self):
+        # The v9 upgrade fills the table from the existing channels and votes
+        self.addTorrent('a', 'ih1', 10)
+        self.addTorrent('a', 'ih2', 30)
+        self.addVote('a', 'voter1', -1)
+        self.addVote('b', 'voter1', 2)
+        expected = self.stats()
+        self.db.execute_write("DELETE FROM ChannelStats")
+        self.db.updateDB(8, CURRENT_MAIN_DB_VERSION)
+        self.assertEquals(str(CURRENT_MAIN_DB_VERSION), str(self.db.readDBVersion()))
+        self.assertEquals(expected, self.stats())
+        self.addTorrent('a', 'ih3', 40)
+        self.assertEquals(('a', 3, 40, 0, 1), self.stats()[0])
+
+
+def test_suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(TestChannelStats))
+    return suite
+
+def main():
+    unittest.main(defaultTest='test_suite')
+
+
+if __name__ == '__main__':
+    main()
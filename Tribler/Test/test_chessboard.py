@@ -0,0 +1,118 @@
+# see LICENSE.txt for license information
+#
+# Tests for BitboardChessBoard: it must agree with ChessBoard on every move,
+# as peers may use either to validate the moves of GameCast games.
+#
+
+import unittest
+from random import Random
+
+from Tribler.Core.GameCast.ChessBoard import ChessBoard
+from Tribler.Core.GameCast.BitboardChessBoard import BitboardChessBoard
+from Tribler.Test.benchmark_chessboard import perft
+
+KIWIPETE = 'r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1'
+
+
+def valid_moves(cb):
+    moves = []
+    for y in range(8):
+        for x in range(8):
+            moves.extend([((x, y), tuple(to)) for to in cb.getValidMoves((x, y))])
+    return moves
+
+
+class TestBitboardChessBoard(unittest.TestCase):
+
+    def test_perft(self):
+        for fen, counts in ((None, [20, 400]), (KIWIPETE, [48, 2039])):
+            for depth in xrange(1, len(counts) + 1):
+                cb = BitboardChessBoard()
+                if fen:
+                    cb.setFEN(fen)
+                self.assertEquals(counts[depth-1], perft(cb, depth))
+                # All moves were undone
+                if fen:
+                    self.assertEquals(fen, cb.getFEN())
+
+    def test_random_games(self):
+        rand = Random(0)
+        results = {}
+        for game in xrange(10):
+            a = ChessBoard()
+            b = BitboardChessBoard()
+            while True:
+                moves = valid_moves(a)
+                self.assertEquals(sorted(moves), sorted(valid_moves(b)))
+                if not moves:
+                    break
+                move = rand.choice(moves)
+                a.setPromotion(rand.randint(1, 4))
+                b.setPromotion(a.getPromotion())
+                self.assert_(a.addMove(*move))
+                self.assert_(b.addMove(*move))
+                self.assertEquals(a.getBoard(), b.getBoard())
+                self.assertEquals(a.getGameResult(), b.getGameResult())
+                self.assertEquals(a.getLastTextMove(), b.getLastTextMove())
+            results[b.getGameResult()] = True
+            self.assertEquals(a.getAllTextMoves(), b.getAllTextMoves())
+        self.assert_(len(results) > 1)
+
+    def test_text_moves(self):
+        cb = BitboardChessBoard()
+        for move in ['e4', 'd5', 'exd5', 'Nf6', 'Bb5+', 'c6', 'dxc6', 'Qb6', 'cxb7+', 'Nbd7']:
+            self.assert_(cb.addTextMove(move), move)
+        self.assertEquals('Nbd7', cb.getLastTextMove(cb.SAN))
+        self.assertFalse(cb.addTextMove('bxa8'))
+        self.assertEquals(cb.MUST_SET_PROMOTION, cb.getReason())
+        self.assert_(cb.addTextMove('bxa8=N'))
+        self.assertEquals('bxa8=N', cb.getLastTextMove(cb.SAN))
+        self.assertFalse(cb.addTextMove('Nb4'))
+        self.assertEquals(cb.INVALID_MOVE, cb.getReason())
+        self.assertFalse(cb.addMove((0, 0), (1, 2)))
+        self.assertEquals(cb.INVALID_COLOR, cb.getReason())
+        # Undo and play another move
+        self.assert_(cb.undo())
+        self.assert_(cb.addTextMove('bxa8=Q'))
+        self.assertEquals(11, cb.getMoveCount())
+        self.assertEquals('Q', cb.getBoard()[0][0])
+
+    def test_castling(self):
+        cb = BitboardChessBoard()
+        cb.setFEN(KIWIPETE)
+        self.assert_((6, 7) in cb.getValidMoves((4, 7)))
+        self.assert_(cb.addTextMove('O-O'))
+        self.assertEquals(cb.KING_CASTLE_MOVE, cb.getLastMoveType())
+        self.assertEquals('r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R4RK1 b kq - 1 1', cb.getFEN())
+        # The king may not castle through check
+        cb.setFEN('r3k2r/8/8/8/8/8/8/4K1R1 b kq - 0 1')
+        self.assertFalse((6, 0) in cb.getValidMoves((4, 0)))
+        self.assertFalse(cb.addTextMove('O-O'))
+        self.assert_(cb.addTextMove('O-O-O'))
+        self.assertEquals('2kr3r/8/8/8/8/8/8/4K1R1 w - - 1 1', cb.getFEN())
+
+    def test_game_over(self):
+        for moves, result in ((['f3', 'e5', 'g4', 'Qh4'], ChessBoard.BLACK_WIN),
+                              (['Nf3', 'Nf6', 'Ng1', 'Ng8'] * 2 + ['Nf3'], ChessBoard.THREE_REPETITION_RULE)):
+            a = ChessBoard()
+            b = BitboardChessBoard()
+            for move in moves:
+                self.assert_(a.addTextMove(move))
+                self.assert_(b.addTextMove(move))
+                self.assertEquals(a.isGameOver(), b.isGameOver())
+            self.assertEquals(result, b.getGameResult())
+            self.assertFalse(b.addTextMove('e4'))
+            self.assertEquals([], b.getValidMoves((4, 6)))
+
+
+def test_suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(TestBitboardChessBoard))
+    return suite
+
+def main():
+    unittest.main(defaultTest='test_suite')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,281 @@
+# see LICENSE.txt for license information
+#
+# Tests for the asynchronous disk I/O of downloads (BT1/DiskIO.py)
+#
+
+import unittest
+import os
+import time
+import tempfile
+import shutil
+from array import array
+from threading import Event
+
+from Tribler.Core.BitTornado.BT1.Storage import Storage, PieceBuffer
+from Tribler.Core.BitTornado.BT1.DiskIO import DiskIOExecutor, coalesce
+from Tribler.Core.BitTornado.BT1.Uploader import Upload
+
+PIECE_LENGTH = 2 ** 15
+LENGTH = 8 * PIECE_LENGTH
+BLOCK = 2 ** 14
+
+
+class SlowStorage:
+    """ Wraps a Storage, counts the writes and makes them slow """
+    def __init__(self, storage, delay = 0.0):
+        self.storage = storage
+        self.delay = delay
+        self.writes = []
+
+    def write(self, pos, s):
+        time.sleep(self.delay)
+        self.writes.append((pos, len(s)))
+        self.storage.write(pos, s)
+
+    def read(self, pos, amount, flush_first = False):
+        return self.storage.read(pos, amount, flush_first)
+
+
+class TestCoalesce(unittest.TestCase):
+
+    def test_contiguous(self):
+        writes = [(4, 'ef'), (0, 'abcd'), (6, 'g')]
+        self.assertEquals([(0, 'abcdefg')], coalesce(writes))
+
+    def test_gap(self):
+        writes = [(10, 'x'), (0, 'ab'), (2, 'c')]
+        self.assertEquals([(0, 'abc'), (10, 'x')], coalesce(writes))
+
+    def test_overlap_keeps_order(self):
+        writes = [(2, 'zz'), (0, 'abcd')]
+        self.assertEquals(writes, coalesce(writes))
+
+
+class TestDiskIOExecutor(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.dir, 'data')
+        config = {'max_files_open': 50}
+        self.storage = Storage([(self.filename, LENGTH)], PIECE_LENGTH, Event(), config)
+        self.slow = SlowStorage(self.storage)
+        self.scheduled = []
+        self.errors = []
+        self.diskio = DiskIOExecutor(self.slow, 2, 16, self.scheduled.append, self.errors.append)
+
+    def tearDown(self):
+        self.diskio.shutdown()
+        self.storage.close()
+        shutil.rmtree(self.dir)
+
+    def _run_scheduled(self):
+        while self.scheduled:
+            self.scheduled.pop(0)()
+
+    def test_blocks_coalesce(self):
+        self.slow.delay = 0.2
+        # Keep the first flush busy, so the blocks of the piece are
+        # written together by the next one
+        self.diskio.write(LENGTH - 1, 'x')
+        time.sleep(0.05)
+        for begin in xrange(0, PIECE_LENGTH, BLOCK):
+            self.diskio.write(begin, chr(begin / BLOCK + 1) * BLOCK)
+        self.diskio.flush()
+        self.assertEquals([(LENGTH - 1, 1), (0, PIECE_LENGTH)], self.slow.writes)
+        data = self.storage.read(0, PIECE_LENGTH)
+        self.assertEquals('\x01' * BLOCK + '\x02' * BLOCK, data[:].tostring())
+        self.assertEquals([], self.errors)
+
+    def test_read_own_writes(self):
+        self.storage.write(0, chr(0) * 3 * BLOCK)
+        self.slow.delay = 0.2
+        self.diskio.write(0, 'a' * BLOCK)
+        self.diskio.write(BLOCK, 'b' * BLOCK)
+        self.diskio.write(BLOCK / 2, 'c' * 10)
+        expected = 'a' * (BLOCK / 2) + 'c' * 10 + 'a' * (BLOCK / 2 - 10) + 'b' * BLOCK
+        # Served from memory while the writes are pending
+        data = self.diskio.read(0, 2 * BLOCK)
+        self.assertEquals(expected, data[:].tostring())
+        data.release()
+        # Partially covered, the writes are done first
+        data = self.diskio.read(0, 3 * BLOCK)
+        self.assertEquals(expected + chr(0) * BLOCK, data[:].tostring())
+        data.release()
+
+    def test_write_does_not_block(self):
+        self.slow.delay = 0.5
+        start = time.time()
+        for i in xrange(4):
+            self.diskio.write(i * BLOCK, 'x' * BLOCK)
+        self.assert_(time.time() - start < 0.25)
+        self.diskio.flush()
+        self.assert_(time.time() - start >= 0.5)
+
+    def test_queue_task(self):
+        self.diskio.write(0, 'abc')
+        results = []
+        self.diskio.queue_task(self.diskio.read, (0, 3), results.append)
+        self.diskio.flush()
+        deadline = time.time() + 5
+        while not self.scheduled and time.time() < deadline:
+            time.sleep(0.01)
+        self._run_scheduled()
+        self.assertEquals('abc', results[0][:].tostring())
+
+    def test_failure(self):
+        results = []
+        self.diskio.queue_task(self.diskio.read, (LENGTH - 1, 2), results.append)
+        deadline = time.time() + 5
+        while len(self.scheduled) < 2 and time.time() < deadline:
+            time.sleep(0.01)
+        self._run_scheduled()
+        self.assertEquals([None], results)
+        self.assertEquals(1, len(self.errors))
+
+
+class FakeStorage:
+    """ StorageWrapper with disk I/O threads, the reads are completed by
+    the test """
+    def __init__(self):
+        self.diskio = object()
+        self.reads = []
+
+    def get_amount_left(self):
+        return 1
+
+    def do_I_have_anything(self):
+        return False
+
+    def get_piece_async(self, index, begin, length, callback):
+        self.reads.append((index, begin, length, callback))
+
+    def complete_read(self, buffer_reads):
+        index, begin, length, callback = self.reads.pop(0)
+        if length == -1:
+            length = PIECE_LENGTH
+        data = chr(index) * length
+        if buffer_reads:
+            # a PieceBuffer, like StorageWrapper.get_piece(index, 0, -1)
+            piece = PieceBuffer()
+            piece.append(data)
+        else:
+            piece = array('c', data)
+        callback([piece, []])
+
+
+class FakeConnection:
+    def __init__(self):
+        self.next_upload = None
+        self.total_uploaded = 0
+        self.closed = False
+
+    def send_unchoke(self):
+        return True
+
+    def send_choke(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+
+class FakeChoker:
+    def interested(self, connection):
+        pass
+
+    def not_interested(self, connection):
+        pass
+
+
+class FakeRateLimiter:
+    def queue(self, connection):
+        pass
+
+
+class FakeMeasure:
+    def update_rate(self, amount):
+        pass
+
+
+class TestUploadAsync(unittest.TestCase):
+    """ Upload reading its chunks with the disk I/O threads """
+
+    def _upload(self, buffer_reads):
+        config = {'max_slice_length': 2 ** 17, 'max_rate_period': 20.0,
+                  'upload_rate_fudge': 5.0, 'breakup_seed_bitfield': 0,
+                  'buffer_reads': buffer_reads}
+        self.storage = FakeStorage()
+        upload = Upload(FakeConnection(), FakeRateLimiter(), FakeMeasure(),
+                        FakeChoker(), self.storage, None, config)
+        upload.got_interested()
+        upload.unchoke()
+        upload.got_request(1, 0, BLOCK)
+        upload.got_request(1, BLOCK, BLOCK)
+        # the read is started, the data is not in yet
+        self.assertEquals(None, upload.get_upload_chunk())
+        self.assertEquals(1, len(self.storage.reads))
+        return upload
+
+    def _test_upload(self, buffer_reads):
+        upload = self._upload(buffer_reads)
+        self.storage.complete_read(buffer_reads)
+        index, begin, hashlist, piece = upload.get_upload_chunk()
+        self.assertEquals((1, 0), (index, begin))
+        self.assertEquals(chr(1) * BLOCK, piece[:].tostring())
+        self.assertFalse(upload.connection.closed)
+
+    def test_upload(self):
+        self._test_upload(1)
+
+    def test_upload_unbuffered(self):
+        self._test_upload(0)
+
+    def _test_cancel(self, buffer_reads):
+        upload = self._upload(buffer_reads)
+        upload.got_cancel(1, 0, BLOCK)
+        # the chunk read is not consumed
+        self.storage.complete_read(buffer_reads)
+        upload.disconnected()
+        self.assertFalse(upload.connection.closed)
+
+    def test_cancel(self):
+        self._test_cancel(1)
+
+    def test_cancel_unbuffered(self):
+        self._test_cancel(0)
+
+    def _test_not_interested(self, buffer_reads):
+        upload = self._upload(buffer_reads)
+        upload.got_cancel(1, 0, BLOCK)
+        self.storage.complete_read(buffer_reads)
+        if buffer_reads:
+            # the piece is buffered, the next request is served from it
+            self.assert_(upload.get_upload_chunk() is not None)
+        else:
+            # another read, not consumed either
+            self.assertEquals(None, upload.get_upload_chunk())
+            self.storage.complete_read(buffer_reads)
+        upload.got_not_interested()
+        upload.choke()
+        upload.disconnected()
+
+    def test_not_interested(self):
+        self._test_not_interested(1)
+
+    def test_not_interested_unbuffered(self):
+        self._test_not_interested(0)
+
+
+def test_suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(TestCoalesce))
+    suite.addTest(unittest.makeSuite(TestDiskIOExecutor))
+    suite.addTest(unittest.makeSuite(TestUploadAsync))
+    return suite
+
+def main():
+    unittest.main(defaultTest='test_suite')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+# see LICENSE.txt for license information
+#
+# Tests for the validation of chess moves by GameCast, which keeps the
+# boards of the games it validates moves for, see GameCast.getGameBoard().
+#
+
+import unittest
+
+import Tribler.Core.GameCast.GameCast as GameCastModule
+from Tribler.Core.GameCast.GameCast import GameCast
+from Tribler.Core.GameCast.ChessBoard import ChessBoard
+
+WHITE = 'white_permid'
+BLACK = 'black_permid'
+
+
+def new_game(game_id, owner_id = 0):
+    return {'game_id': game_id, 'owner_id': owner_id, 'gamename': 'chess',
+            'players': {WHITE: 'white', BLACK: 'black'}, 'moves': []}
+
+
+class TestGameBoard(unittest.TestCase):
+
+    def setUp(self):
+        self.gc = GameCast.getInstance()
+        self.gc.boards = {}
+
+    def play(self, game, moves):
+        """ Validates and adds the moves, returns the state of the last """
+        for move in moves:
+            state = self.gc.getGameState(game, move)
+            if state < 0:
+                return state
+            game['moves'].append((self.gc.getGameTurn(game), move, 0))
+        return state
+
+    def test_checkmate(self):
+        game = new_game(1)
+        self.assertEquals(0, self.play(game, ['f3', 'e5', 'g4']))
+        self.assertEquals(1, self.gc.getGameState(game, 'Qh4'))
+        self.assertEquals(BLACK, self.gc.getGameWinner(game, 'Qh4'))
+        # The board is kept with the moves played on it
+        cb, played, last_used = self.gc.boards[(0, 1)]
+        self.assertEquals(['f3', 'e5', 'g4', 'Qh4'], played)
+        self.assertEquals(ChessBoard.BLACK_WIN, cb.getGameResult())
+
+    def test_illegal_move(self):
+        game = new_game(1)
+        self.assertEquals(0, self.play(game, ['e4', 'e5']))
+        self.assertEquals(-1, self.gc.getGameState(game, 'e5'))
+        self.assertEquals(-1, self.gc.getGameState(game, 'Ke3'))
+        self.assertEquals(0, self.play(game, ['Nf3', 'Nc6']))
+        self.assertEquals(4, len(self.gc.boards[(0, 1)][1]))
+
+    def test_move_not_added(self):
+        game = new_game(1)
+        self.play(game, ['e4'])
+        # A validated move that is not added to the game is taken back
+        self.assertEquals(0, self.gc.getGameState(game, 'e5'))
+        self.assertEquals(0, self.gc.getGameState(game, 'd5'))
+        self.assertEquals(0, self.play(game, ['d5', 'exd5']))
+        self.assertEquals(['e4', 'd5', 'exd5'], self.gc.boards[(0, 1)][1])
+
+    def test_moves_changed(self):
+        game = new_game(1)
+        self.play(game, ['e4', 'e5'])
+        # Another game with the same key is replayed
+        game = new_game(1)
+        self.play(game, ['d4'])
+        self.assertEquals(-1, self.gc.getGameState(game, 'd4'))
+        self.assertEquals(0, self.gc.getGameState(game, 'd5'))
+        self.assertEquals(['d4', 'd5'], self.gc.boards[(0, 1)][1])
+
+    def test_same_as_replay(self):
+        # Three repetitions end the game, as when the moves are replayed
+        moves = ['Nf3', 'Nf6', 'Ng1', 'Ng8'] * 3
+        cb = ChessBoard()
+        for move in moves:
+            cb.addTextMove(move)
+            if cb.isGameOver():
+                break
+        self.assertEquals(ChessBoard.THREE_REPETITION_RULE, cb.getGameResult())
+        game = new_game(1)
+        self.assertEquals(1, self.play(game, moves[:cb.getMoveCount()]))
+        self.assertEquals(cb.getMoveCount(), len(game['moves']))
+
+    def test_lru(self):
+        games = [new_game(i) for i in xrange(GameCastModule.MAX_BOARDS + 1)]
+        for game in games:
+            self.play(game, ['e4'])
+        self.play(games[0], ['e5'])
+        self.play(games[-1], ['e5'])
+        self.assertEquals(GameCastModule.MAX_BOARDS, len(self.gc.boards))
+        self.assert_((0, 0) in self.gc.boards)
+        self.assertFalse((0, 1) in self.gc.boards)
+        # An evicted game is replayed
+        self.assertEquals(0, self.play(games[1], ['e5']))
+        self.assertEquals(['e4', 'e5'], self.gc.boards[(0, 1)][1])
+
+
+def test_suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(TestGameBoard))
+    return suite
+
+def main():
+    unittest.main(defaultTest='test_suite')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,186 @@
+# see LICENSE.txt for license information
+#
+# Tests for the parallel hash check of the data on disk (BT1/HashChecker.py)
+# The StorageWrapper must find the same pieces as with the serial check.
+#
+
+import unittest
+import os
+import time
+import tempfile
+import shutil
+from binascii import unhexlify
+from random import Random
+from threading import Event, Lock
+
+from Tribler.Core.Utilities.Crypto import sha
+from Tribler.Core.BitTornado.BT1.Storage import Storage
+from Tribler.Core.BitTornado.BT1.StorageWrapper import StorageWrapper
+from Tribler.Core.BitTornado.BT1.HashChecker import HashCheckPool
+
+PIECE_LENGTH = 2 ** 14
+NUMPIECES = 61
+# Two files, the second does not start at a piece boundary, a short last piece
+LENGTHS = [20 * PIECE_LENGTH + 1000, 40 * PIECE_LENGTH + 3000]
+CONFIG = {'max_files_open': 50, 'write_buffer_size': 0, 'auto_flush': 0}
+
+
+class Torrent:
+    """ The files of a download on disk, partly broken """
+    def __init__(self, dir, seed):
+        rand = Random(seed)
+        total = sum(LENGTHS)
+        data = unhexlify('%0*x' % (2 * total, rand.getrandbits(8 * total)))
+        self.hashes = [sha(data[i:i+PIECE_LENGTH]).digest()
+                       for i in xrange(0, total, PIECE_LENGTH)]
+        assert len(self.hashes) == NUMPIECES
+
+        data = list(data)
+        # Corrupt some pieces, and move one piece to the place of another
+        for piece in rand.sample(xrange(NUMPIECES - 1), 8):
+            data[piece * PIECE_LENGTH + 10] = chr(ord(data[piece * PIECE_LENGTH + 10]) ^ 1)
+        data[30*PIECE_LENGTH:31*PIECE_LENGTH] = data[5*PIECE_LENGTH:6*PIECE_LENGTH]
+        data = ''.join(data)
+
+        self.files = []
+        pos = 0
+        for i in xrange(len(LENGTHS)):
+            name = os.path.join(dir, 'file%d.%d' % (seed, i))
+            f = open(name, 'wb')
+            f.write(data[pos:pos+LENGTHS[i]])
+            f.close()
+            self.files.append((name, LENGTHS[i]))
+            pos += LENGTHS[i]
+
+
+class Tasks:
+    """ RawServer.add_task for a single thread """
+    def __init__(self):
+        self.tasks = []
+
+    def add_task(self, func, delay = 0, id = None):
+        if func.__name__ != '_bgsync':
+            self.tasks.append((func, delay))
+
+    def run(self, doneflags):
+        deadline = time.time() + 30
+        while self.tasks and not all([flag.isSet() for flag in doneflags]):
+            assert time.time() < deadline
+            func, delay = self.tasks.pop(0)
+            if delay:
+                time.sleep(delay / 10.0)
+            func()
+
+
+class TestHashCheck(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.tasks = Tasks()
+        self.pool = None
+
+    def tearDown(self):
+        if self.pool is not None:
+            self.pool.shutdown()
+        shutil.rmtree(self.dir)
+
+    def _start(self, torrent, hashcheckpool):
+        storage = Storage(torrent.files, PIECE_LENGTH, Event(), CONFIG)
+        done = Event()
+        status = []
+        def statusfunc(activity = None, fractionDone = None):
+            status.append(fractionDone)
+        sw = StorageWrapper({'live': False}, storage, PIECE_LENGTH, torrent.hashes,
+                            PIECE_LENGTH, None, lambda: None, self.fail,
+                            backfunc = self.tasks.add_task, config = CONFIG)
+        sw.initialize(lambda success = True: done.set(), statusfunc, hashcheckpool)
+        return sw, done, status
+
+    def _check(self, torrents, hashcheckpool):
+        started = [self._start(torrent, hashcheckpool) for torrent in torrents]
+        self.tasks.run([done for sw, done, status in started])
+        for sw, done, status in started:
+            self.assert_(done.isSet())
+            sw.storage.close()
+        return started
+
+    def test_same_as_serial(self):
+        torrent = Torrent(self.dir, 1)
+        [(serial, done, serialstatus)] = self._check([torrent], None)
+        self.pool = HashCheckPool(3, 3 * PIECE_LENGTH, 2 * PIECE_LENGTH)
+        [(parallel, done, status)] = self._check([torrent], self.pool)
+
+        self.assertEquals(serial.get_have_list(), parallel.get_have_list())
+        self.assertEquals(serial.places, parallel.places)
+        self.assertEquals(serial.get_amount_left(), parallel.get_amount_left())
+        self.assertEquals(serial.pieces_on_disk_at_startup, parallel.pieces_on_disk_at_startup)
+        self.assert_(parallel.do_I_have(5))
+        # Progress is reported through the statusfunc
+        fractions = [x for x in status if x is not None]
+        self.assertEquals(fractions, sorted(fractions))
+        self.assertEquals(1.0, fractions[-1])
+
+    def test_several_downloads(self):
+        torrents = [Torrent(self.dir, seed) for seed in xrange(2, 5)]
+        serial = self._check(torrents, None)
+        self.pool = HashCheckPool(4, 8 * PIECE_LENGTH)
+        parallel = self._check(torrents, self.pool)
+        for (s, d, st), (p, d, st) in zip(serial, parallel):
+            self.assertEquals(s.get_have_list(), p.get_have_list())
+            self.assertEquals(s.places, p.places)
+
+    def test_io_budget(self):
+        torrent = Torrent(self.dir, 5)
+        storage = Storage(torrent.files, PIECE_LENGTH, Event(), CONFIG)
+        budget = 4 * PIECE_LENGTH
+        self.pool = HashCheckPool(4, budget, 2 * PIECE_LENGTH)
+        reserved = []
+        lock = Lock()
+        def readfunc(pos, amount):
+            lock.acquire()
+            reserved.append(self.pool.budget - self.pool.available)
+            lock.release()
+            time.sleep(0.01)
+            return storage.read(pos, amount)
+        piecelen = lambda piece: min(PIECE_LENGTH, sum(LENGTHS) - piece * PIECE_LENGTH)
+        job = self.pool.check_pieces(readfunc, range(NUMPIECES), PIECE_LENGTH,
+                                     piecelen, piecelen(NUMPIECES - 1), Event())
+        results = []
+        deadline = time.time() + 30
+        while len(results) < NUMPIECES and time.time() < deadline:
+            results.extend(job.get_results())
+            time.sleep(0.01)
+        storage.close()
+
+        self.assertEquals(range(NUMPIECES), sorted([piece for piece, sp, s in results]))
+        self.assert_(max(reserved) <= budget)
+        self.assertEquals(budget, self.pool.available)
+        hashes = dict([(piece, s) for piece, sp, s in results])
+        self.assertEquals(torrent.hashes[5], hashes[30])
+        self.assertEquals(torrent.hashes[NUMPIECES - 1], hashes[NUMPIECES - 1])
+
+    def test_stopped(self):
+        torrent = Torrent(self.dir, 6)
+        storage = Storage(torrent.files, PIECE_LENGTH, Event(), CONFIG)
+        self.pool = HashCheckPool(1, PIECE_LENGTH, PIECE_LENGTH)
+        flag = Event()
+        flag.set()
+        job = self.pool.check_pieces(storage.read, range(NUMPIECES), PIECE_LENGTH,
+                                     lambda piece: PIECE_LENGTH, PIECE_LENGTH, flag)
+        time.sleep(0.2)
+        storage.close()
+        self.assertEquals([], job.get_results())
+        self.assertEquals([], self.pool.jobs)
+
+
+def test_suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(TestHashCheck))
+    return suite
+
+def main():
+    unittest.main(defaultTest='test_suite')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,210 @@
+# see LICENSE.txt for license information
+#
+# Tests for the LookupManager in front of the mainline DHT: joining a
+# lookup in progress, handing out cached peers, starting lookups from the
+# cached closest nodes and the stats.
+#
+
+import unittest
+
+import Tribler.Core.DecentralizedTracking.mainlineDHTLookups as mainlineDHTLookups
+from Tribler.Core.DecentralizedTracking.mainlineDHTLookups import LookupManager
+
+INFOHASH1 = 'a' * 20
+INFOHASH2 = 'b' * 20
+PEERS1 = [('10.0.0.1', 6881), ('10.0.0.2', 6881)]
+PEERS2 = [('10.0.0.2', 6881), ('10.0.0.3', 6881)]
+NODES = ['node1', 'node2']
+
+
+class FakeDHT:
+    """ Pymdht that records the lookups instead of sending them """
+    def __init__(self):
+        self.lookups = []
+        self.queries_sent = 8
+
+    def get_peers(self, lookup_id, info_hash, callback_f, bt_port=0,
+                  bootstrap_nodes=None, closest_nodes_f=None):
+        self.lookups.append((lookup_id, info_hash, callback_f, bt_port,
+                             bootstrap_nodes, closest_nodes_f))
+        return self.queries_sent
+
+    def found(self, i, peers):
+        lookup_id, _, callback_f, _, _, _ = self.lookups[i]
+        callback_f(lookup_id, peers)
+
+    def done(self, i, nodes=NODES):
+        lookup_id, _, callback_f, _, _, closest_nodes_f = self.lookups[i]
+        closest_nodes_f(lookup_id, nodes)
+        callback_f(lookup_id, None)
+
+
+class TestLookupManager(unittest.TestCase):
+
+    def setUp(self):
+        self.dht = FakeDHT()
+        self.manager = LookupManager(self.dht)
+        self.results = []
+        self.time = 1000.0
+        self.real_time = mainlineDHTLookups.time
+        mainlineDHTLookups.time = lambda: self.time
+
+    def tearDown(self):
+        mainlineDHTLookups.time = self.real_time
+
+    def callback(self, lookup_id, peers):
+        self.results.append((lookup_id, peers))
+
+    def test_lookup(self):
+        self.manager.get_peers('id1', INFOHASH1, self.callback)
+        self.assertEqual(len(self.dht.lookups), 1)
+        self.assertEqual(self.dht.lookups[0][4], None)
+        self.dht.found(0, PEERS1)
+        self.dht.done(0)
+        self.assertEqual(self.results, [('id1', PEERS1), ('id1', None)])
+
+    def test_join_lookup_in_progress(self):
+        self.manager.get_peers('id1', INFOHASH1, self.callback)
+        self.dht.found(0, PEERS1)
+        # joins, gets the peers found so far and those found later
+        self.manager.get_peers('id2', INFOHASH1, self.callback)
+        self.dht.found(0, PEERS2)
+        self.dht.done(0)
+        self.assertEqual(len(self.dht.lookups), 1)
+        self.assertEqual(self.results, [('id1', PEERS1), ('id2', PEERS1),
+                                        ('id1', PEERS2), ('id2', PEERS2),
+                                        ('id1', None), ('id2', None)])
+        # other infohashes have lookups of their own
+        self.manager.get_peers('id3', INFOHASH2, self.callback)
+        self.assertEqual(len(self.dht.lookups), 2)
+
+    def test_cached_peers(self):
+        self.manager.get_peers('id1', INFOHASH1, self.callback)
+        self.dht.found(0, PEERS1)
+        self.dht.found(0, PEERS2)
+        self.dht.done(0)
+        self.results = []
+        self.time += mainlineDHTLookups.PEERS_TTL - 1
+        self.manager.get_peers('id2', INFOHASH1, self.callback)
+        self.assertEqual(len(self.dht.lookups), 1)
+        self.assertEqual(self.results, [('id2', PEERS1 + PEERS2[1:]), ('id2', None)])
+        # expired
+        self.time += 2
+        self.manager.get_peers('id3', INFOHASH1, self.callback)
+        self.assertEqual(len(self.dht.lookups), 2)
+
+    def test_warm_start(self):
+        self.manager.get_peers('id1', INFOHASH1, self.callback)
+        self.dht.done(0)
+        # no peers found, nothing to hand out, but the nodes are known
+        self.manager.get_peers('id2', INFOHASH1, self.callback)
+        self.assertEqual(len(self.dht.lookups), 2)
+        self.assertEqual(self.dht.lookups[1][4], NODES)
+        self.dht.done(1)
+        # the nodes expire too
+        self.time += mainlineDHTLookups.NODES_TTL + 1
+        self.manager.get_peers('id3', INFOHASH1, self.callback)
+        self.assertEqual(self.dht.lookups[2][4], None)
+
+    def test_announce(self):
+        self.manager.get_peers('id1', INFOHASH1, self.callback)
+        self.dht.found(0, PEERS1)
+        # announcing needs a lookup of its own, later ones join it
+        self.manager.get_peers('id2', INFOHASH1, self.callback, 6881)
+        self.assertEqual(len(self.dht.lookups), 2)
+        self.assertEqual(self.dht.lookups[1][3], 6881)
+        self.manager.get_peers('id3', INFOHASH1, self.callback, 6881)
+        self.manager.get_peers('id4', INFOHASH1, self.callback)
+        self.assertEqual(len(self.dht.lookups), 2)
+        self.dht.done(0)
+        self.dht.done(1)
+        # cached peers, but announcing still needs a lookup
+        self.manager.get_peers('id5', INFOHASH1, self.callback, 6881)
+        self.assertEqual(len(self.dht.lookups), 3)
+        self.assertEqual(self.dht.lookups[2][4], NODES)
+
+    def test_lookup_not_sent(self):
+        self.dht.queries_sent = 0
+        self.manager.get_peers('id1', INFOHASH1, self.callback)
+        self.dht.queries_sent = 8
+        # the first one will never end, don't join it
+        self.manager.get_peers('id2', INFOHASH1, self.callback)
+        self.assertEqual(len(self.dht.lookups), 2)
+
+    def test_lookup_timeout(self):
+        self.manager.get_peers('id1', INFOHASH1, self.callback)
+        self.time += mainlineDHTLookups.LOOKUP_TIMEOUT + 1
+        self.manager.get_peers('id2', INFOHASH1, self.callback)
+        self.assertEqual(len(self.dht.lookups), 2)
+        # the old lookup ending does not end the new one
+        self.dht.done(0)
+        self.manager.get_peers('id3', INFOHASH1, self.callback)
+        self.assertEqual(len(self.dht.lookups), 2)
+
+    def test_cache_size(self):
+        mainlineDHTLookups.MAX_CACHED, max_cached = 3, mainlineDHTLookups.MAX_CACHED
+        try:
+            for i in range(5):
+                self.manager.get_peers(i, chr(i) * 20, self.callback)
+                self.dht.found(i, PEERS1)
+                self.dht.done(i)
+                self.time += 1
+            self.assertEqual(len(self.manager.cache), 3)
+            # the most recent ones are kept
+            self.manager.get_peers(4, chr(4) * 20, self.callback)
+            self.manager.get_peers(0, chr(0) * 20, self.callback)
+            self.assertEqual(len(self.dht.lookups), 6)
+        finally:
+            mainlineDHTLookups.MAX_CACHED = max_cached
+
+    def test_sched(self):
+        tasks = []
+        manager = LookupManager(self.dht, lambda func, delay: tasks.append(func))
+        manager.get_peers('id1', INFOHASH1, self.callback)
+        self.dht.found(0, PEERS1)
+        self.dht.done(0)
+        self.results = []
+        manager.get_peers('id2', INFOHASH1, self.callback)
+        self.assertEqual(self.results, [])
+        tasks[0]()
+        self.assertEqual(self.results, [('id2', PEERS1), ('id2', None)])
+
+    def test_stats(self):
+        stats = self.manager.get_stats()
+        self.assertEqual(stats['requests'], 0)
+        self.assertEqual(stats['hit_rate'], None)
+        self.manager.get_peers('id1', INFOHASH1, self.callback)
+        self.time += 2
+        self.dht.found(0, PEERS1)
+        self.manager.get_peers('id2', INFOHASH1, self.callback)
+        self.time += 4
+        self.dht.done(0)
+        self.manager.get_peers('id3', INFOHASH1, self.callback)
+        self.manager.get_peers('id4', INFOHASH1, self.callback, 6881)
+        self.time += 2
+        self.dht.done(1)
+        stats = self.manager.get_stats()
+        self.assertEqual(stats['requests'], 4)
+        self.assertEqual(stats['coalesced'], 1)
+        self.assertEqual(stats['cache_hits'], 1)
+        self.assertEqual(stats['hit_rate'], 0.5)
+        self.assertEqual(stats['lookups'], 2)
+        self.assertEqual(stats['warm_lookups'], 1)
+        self.assertEqual(stats['lookups_in_progress'], 0)
+        self.assertEqual(stats['avg_first_peers_time'], 2)
+        self.assertEqual(stats['avg_cold_lookup_time'], 6)
+        self.assertEqual(stats['avg_warm_lookup_time'], 2)
+        self.assertEqual(stats['avg_lookup_time'], 4)
+
+
+def test_suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(TestLookupManager))
+    return suite
+
+def main():
+    unittest.main(defaultTest='test_suite')
+
+
+if __name__ == '__main__':
+    main()
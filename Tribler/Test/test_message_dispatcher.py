@@ -0,0 +1,106 @@
+# see LICENSE.txt for license information
+#
+# Tests for the MessageDispatcher of the OverlayThreadingBridge
+#
+
+import unittest
+from threading import Event, currentThread
+from time import sleep
+
+import Tribler.Core.Overlay.MessageDispatcher as MessageDispatcherModule
+from Tribler.Core.Overlay.MessageDispatcher import MessageDispatcher
+from Tribler.Core.BitTornado.BT1.MessageID import BUDDYCAST, QUERY, RELAY_REQUEST, getMessageName
+from Tribler.Utilities.TimedTaskQueue import TimedTaskQueue
+
+
+class TestMessageDispatcher(unittest.TestCase):
+
+    def setUp(self):
+        self.workers = [TimedTaskQueue(nameprefix="TestWorker%d" % i) for i in range(4)]
+        self.dispatcher = MessageDispatcher(self.workers)
+        self.handled = []
+        self.max_pending = MessageDispatcherModule.MAX_PENDING
+
+    def tearDown(self):
+        for worker in self.workers:
+            worker.add_task('stop')
+        MessageDispatcherModule.MAX_PENDING = self.max_pending
+
+    def handler(self, permid, i):
+        def handle():
+            self.handled.append((permid, i, currentThread().getName()))
+        return handle
+
+    def block(self):
+        """ Blocks all workers until the returned event is set """
+        event = Event()
+        for worker in self.workers:
+            worker.add_task(event.wait)
+        return event
+
+    def test_peer_order(self):
+        permids = ['permid%d' % i for i in range(20)]
+        for i in range(10):
+            for permid in permids:
+                self.dispatcher.dispatch(permid, QUERY, self.handler(permid, i))
+        sleep(1)
+        self.assertEquals(200, len(self.handled))
+        threads = {}
+        for permid in permids:
+            handled = [(i, thread) for (p, i, thread) in self.handled if p == permid]
+            self.assertEquals(range(10), [i for i, thread in handled])
+            # All messages of a peer are handled by one worker
+            self.assertEquals(1, len(set([thread for i, thread in handled])))
+            threads[handled[0][1]] = True
+        self.assert_(len(threads) > 1)
+
+    def test_not_limited(self):
+        # Messages that change state are never dropped
+        self.assert_(QUERY not in MessageDispatcherModule.MAX_PENDING)
+        self.assert_(RELAY_REQUEST not in MessageDispatcherModule.MAX_PENDING)
+        n = MessageDispatcherModule.MAX_PENDING[BUDDYCAST] + 10
+        event = self.block()
+        for i in range(n):
+            self.dispatcher.dispatch('permid', QUERY, self.handler('permid', i))
+        self.assertEquals(n, self.dispatcher.get_stats()[getMessageName(QUERY)]['pending'])
+        event.set()
+        sleep(1)
+        self.assertEquals(range(n), [i for p, i, thread in self.handled])
+        stats = self.dispatcher.get_stats()[getMessageName(QUERY)]
+        self.assertEquals(0, stats['pending'])
+        self.assertEquals(n, stats['handled'])
+        self.assertEquals(0, stats['dropped'])
+
+    def test_drop_oldest(self):
+        MessageDispatcherModule.MAX_PENDING = {BUDDYCAST: 2}
+        event = self.block()
+        for i in range(4):
+            self.dispatcher.dispatch('permid', BUDDYCAST, self.handler('permid', i))
+        self.assertEquals(2, self.dispatcher.get_stats()[getMessageName(BUDDYCAST)]['pending'])
+        event.set()
+        sleep(0.5)
+        self.assertEquals([2, 3], [i for p, i, thread in self.handled])
+        self.assertEquals(2, self.dispatcher.get_stats()[getMessageName(BUDDYCAST)]['dropped'])
+
+    def test_histogram(self):
+        self.dispatcher.dispatch('permid', QUERY, self.handler('permid', 0))
+        self.dispatcher.dispatch('permid', QUERY, lambda: sleep(0.1))
+        sleep(0.5)
+        histogram = self.dispatcher.get_stats()[getMessageName(QUERY)]['histogram']
+        self.assertEquals(2, sum(histogram))
+        # The second message took more than 64 ms
+        self.assertEquals(1, sum(histogram[:7]))
+        self.assertEquals(1, sum(histogram[7:]))
+
+
+def test_suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(TestMessageDispatcher))
+    return suite
+
+def main():
+    unittest.main(defaultTest='test_suite')
+
+
+if __name__ == '__main__':
+    main()
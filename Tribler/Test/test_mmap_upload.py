@@ -0,0 +1,156 @@
+# see LICENSE.txt for license information
+#
+# Tests for uploading from memory-mapped files: Storage.read_mapped() and
+# the batching of adjacent requests by the Uploader.
+#
+
+import unittest
+import os
+import tempfile
+import shutil
+from threading import Event
+
+from Tribler.Core.BitTornado.BT1.Storage import Storage
+from Tribler.Core.BitTornado.BT1.Uploader import Upload
+
+PIECE_LENGTH = 2 ** 15
+BLOCK = 2 ** 14
+FILE_LENGTH = 4 * PIECE_LENGTH
+
+
+class TestReadMapped(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.files = []
+        for i in xrange(3):
+            name = os.path.join(self.dir, 'data%d' % i)
+            f = open(name, 'wb')
+            f.write(chr(ord('a') + i) * FILE_LENGTH)
+            f.close()
+            self.files.append((name, FILE_LENGTH))
+        # Room for two of the three files
+        config = {'max_files_open': 50, 'mmap_cache_size': 1}
+        self.storage = Storage(self.files, PIECE_LENGTH, Event(), config)
+        self.storage.max_mapped = 2 * FILE_LENGTH
+
+    def tearDown(self):
+        self.storage.close()
+        shutil.rmtree(self.dir)
+
+    def test_read(self):
+        pos = FILE_LENGTH + 100
+        data = self.storage.read_mapped(pos, BLOCK)
+        self.assert_(isinstance(data, buffer))
+        self.assertEquals(self.storage.read(pos, BLOCK)[:].tostring(), str(data))
+
+    def test_spans_files(self):
+        self.assertEquals(None, self.storage.read_mapped(FILE_LENGTH - 10, 20))
+
+    def test_disabled(self):
+        storage = Storage(self.files, PIECE_LENGTH, Event(), {'max_files_open': 50})
+        self.assertEquals(None, storage.read_mapped(0, BLOCK))
+        storage.close()
+
+    def test_written_file_not_mapped(self):
+        data = self.storage.read_mapped(0, BLOCK)
+        self.storage.write(BLOCK, 'x' * 10)
+        # The file is being written to, it is read with read()
+        self.assertEquals([], self.storage.mappedlist)
+        self.assertEquals(None, self.storage.read_mapped(0, BLOCK))
+        # Buffers handed out before remain valid
+        self.assertEquals('a' * BLOCK, str(data))
+        self.storage.flush()
+        self.assertEquals('x' * 10, self.storage.read(BLOCK, 10)[:].tostring())
+
+    def test_lru(self):
+        storage = self.storage
+        storage.read_mapped(0, BLOCK)
+        storage.read_mapped(FILE_LENGTH, BLOCK)
+        storage.read_mapped(0, BLOCK)
+        data = storage.read_mapped(2 * FILE_LENGTH, BLOCK)
+        self.assertEquals([self.files[0][0], self.files[2][0]], storage.mappedlist)
+        self.assertEquals(2 * FILE_LENGTH, storage.mapped_size)
+        self.assertEquals('c' * BLOCK, str(data))
+
+
+class FakeStorage:
+    """ StorageWrapper with a memory-mapped piece per request """
+    def __init__(self):
+        self.diskio = None
+        self.mapped = []
+
+    def get_amount_left(self):
+        return 1
+
+    def do_I_have_anything(self):
+        return False
+
+    def get_piece_mapped(self, index, begin, length):
+        self.mapped.append((index, begin, length))
+        return buffer(chr(index) * (begin + length), begin, length)
+
+
+class FakeConnection:
+    def __init__(self):
+        self.next_upload = None
+        self.total_uploaded = 0
+
+    def send_unchoke(self):
+        return True
+
+
+class FakeChoker:
+    def interested(self, connection):
+        pass
+
+
+class FakeRateLimiter:
+    def queue(self, connection):
+        pass
+
+
+class FakeMeasure:
+    def update_rate(self, amount):
+        pass
+
+
+class TestUploadMapped(unittest.TestCase):
+
+    def setUp(self):
+        config = {'max_slice_length': 2 ** 17, 'max_rate_period': 20.0,
+                  'upload_rate_fudge': 5.0, 'breakup_seed_bitfield': 0,
+                  'buffer_reads': 1, 'mmap_cache_size': 64}
+        self.storage = FakeStorage()
+        self.upload = Upload(FakeConnection(), FakeRateLimiter(), FakeMeasure(),
+                             FakeChoker(), self.storage, None, config)
+        self.upload.got_interested()
+        self.upload.unchoke()
+
+    def test_adjacent_requests(self):
+        for index, begin in ((1, 0), (1, BLOCK), (2, 0), (1, 2 * BLOCK)):
+            self.upload.got_request(index, begin, BLOCK)
+        chunks = []
+        while self.upload.has_queries():
+            chunks.append(self.upload.get_upload_chunk())
+        self.assertEquals([(1, 0, 2 * BLOCK), (2, 0, BLOCK), (1, 2 * BLOCK, BLOCK)],
+                          self.storage.mapped)
+        self.assertEquals([(1, 0), (1, BLOCK), (2, 0), (1, 2 * BLOCK)],
+                          [(index, begin) for index, begin, hashlist, piece in chunks])
+        for index, begin, hashlist, piece in chunks:
+            self.assert_(isinstance(piece, buffer))
+            self.assertEquals(chr(index) * BLOCK, str(piece))
+
+
+def test_suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(TestReadMapped))
+    suite.addTest(unittest.makeSuite(TestUploadMapped))
+    return suite
+
+def main():
+    unittest.main(defaultTest='test_suite')
+
+
+if __name__ == '__main__':
+    main()
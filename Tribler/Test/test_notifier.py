@@ -0,0 +1,82 @@
+# see LICENSE.txt for license information
+#
+# Tests for the Notifier of the database observers
+#
+
+import unittest
+from time import sleep
+
+from Tribler.Core.CacheDB.Notifier import Notifier
+from Tribler.Core.simpledefs import *
+
+
+class TestNotifier(unittest.TestCase):
+
+    def setUp(self):
+        # Without a pool the observers are called by the notifying thread
+        self.notifier = Notifier.getInstance()
+        self.notifier.pool = None
+        self.calls = []
+
+    def tearDown(self):
+        for func in (self.observer, self.observer2):
+            self.notifier.remove_observer(func)
+
+    def observer(self, subject, changeType, obj_id, *args):
+        self.calls.append((1, subject, changeType, obj_id) + args)
+
+    def observer2(self, subject, changeType, obj_id, *args):
+        self.calls.append((2, subject, changeType, obj_id) + args)
+
+    def test_notify(self):
+        self.notifier.add_observer(self.observer, NTFY_TORRENTS, [NTFY_INSERT])
+        self.notifier.add_observer(self.observer2, NTFY_TORRENTS, [NTFY_INSERT, NTFY_UPDATE], 'id')
+        self.notifier.notify(NTFY_TORRENTS, NTFY_INSERT, 'id', 'arg')
+        self.notifier.notify(NTFY_TORRENTS, NTFY_UPDATE, 'id')
+        self.notifier.notify(NTFY_TORRENTS, NTFY_UPDATE, 'other')
+        self.notifier.notify(NTFY_TORRENTS, NTFY_INSERT, 'other')
+        self.notifier.notify(NTFY_PEERS, NTFY_INSERT, 'id')
+        self.assertEquals([(1, NTFY_TORRENTS, NTFY_INSERT, 'id', 'arg'),
+                           (2, NTFY_TORRENTS, NTFY_INSERT, 'id', 'arg'),
+                           (2, NTFY_TORRENTS, NTFY_UPDATE, 'id'),
+                           (1, NTFY_TORRENTS, NTFY_INSERT, 'other')], self.calls)
+
+        self.notifier.remove_observer(self.observer)
+        self.notifier.notify(NTFY_TORRENTS, NTFY_INSERT, 'id')
+        self.assertEquals((2, NTFY_TORRENTS, NTFY_INSERT, 'id'), self.calls[-1])
+        self.assertEquals(5, len(self.calls))
+
+    def test_cache(self):
+        self.notifier.add_observer(self.observer, NTFY_TORRENTS, [NTFY_INSERT, NTFY_UPDATE], cache = 0.2)
+        for obj_id in (1, 2, 1, 3):
+            self.notifier.notify(NTFY_TORRENTS, NTFY_INSERT, obj_id)
+        self.notifier.notify(NTFY_TORRENTS, NTFY_UPDATE, 4)
+        self.assertEquals([], self.calls)
+        self.assertEquals(1, self.notifier.get_stats()['pending'])
+        sleep(0.5)
+        self.assertEquals([(1, NTFY_TORRENTS, NTFY_INSERT, [1, 2, 3]),
+                           (1, NTFY_TORRENTS, NTFY_UPDATE, [4])], self.calls)
+        self.assertEquals(0, self.notifier.get_stats()['pending'])
+
+        # A new window starts with the next event
+        self.notifier.notify(NTFY_TORRENTS, NTFY_INSERT, 5)
+        sleep(0.5)
+        self.assertEquals((1, NTFY_TORRENTS, NTFY_INSERT, [5]), self.calls[-1])
+
+    def test_stats(self):
+        events = self.notifier.get_stats()['events']
+        self.notifier.notify(NTFY_TORRENTS, NTFY_INSERT, 1)
+        self.assertEquals(events + 1, self.notifier.get_stats()['events'])
+
+
+def test_suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(TestNotifier))
+    return suite
+
+def main():
+    unittest.main(defaultTest='test_suite')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+# see LICENSE.txt for license information
+#
+# Tests for the rarest-first piece selection of PiecePicker. The selection
+# scans the interest levels or, for peers with few pieces, visits the pieces
+# of the peer. Both must pick from the same interest level.
+#
+
+import unittest
+from random import randint, sample, seed
+
+from Tribler.Core.BitTornado.bitfield import Bitfield
+from Tribler.Core.BitTornado.BT1.PiecePicker import PiecePicker
+
+NUMPIECES = 500
+NUMPEERS = 30
+
+
+class PlainHaves:
+    """ Have-set that is not a Bitfield, like the haveComplete of the
+    HTTP seeds, so _next scans the interest levels only """
+    def __init__(self, have):
+        self.have = have
+
+    def __getitem__(self, piece):
+        return self.have[piece]
+
+    def complete(self):
+        return self.have.complete()
+
+
+class TestPiecePicker(unittest.TestCase):
+
+    def setUp(self):
+        seed(7)
+        self.picker = PiecePicker(NUMPIECES)
+        self.picker.fast_initialize(False)
+        self.peers = []
+        for i in xrange(NUMPEERS):
+            have = Bitfield(NUMPIECES)
+            for piece in sample(xrange(NUMPIECES), randint(1, NUMPIECES / 2)):
+                have[piece] = True
+                self.picker.got_have(piece)
+            self.peers.append(have)
+        for piece in sample(xrange(NUMPIECES), 50):
+            self.picker.complete(piece)
+
+    def _check(self, have, wantfunc):
+        picker = self.picker
+        byscan = picker._next(PlainHaves(have), wantfunc, False)
+        piece = picker._next(have, wantfunc, False)
+        byhaves = picker._next_from_haves(have, wantfunc, [(0, len(picker.interests))])
+        if byscan is None:
+            self.assertEquals(None, piece)
+            self.assertEquals(None, byhaves)
+            return
+        levels = picker.level_in_interests
+        for p in (piece, byhaves):
+            self.assert_(have[p] and wantfunc(p))
+            self.assertFalse(picker.has[p])
+            self.assertEquals(levels[byscan], levels[p])
+
+    def test_same_level(self):
+        for have in self.peers:
+            self._check(have, lambda piece: True)
+
+    def test_same_level_wantfunc(self):
+        for have in self.peers:
+            self._check(have, lambda piece: piece % 3 == 0)
+
+    def test_blocked_pieces(self):
+        for piece in xrange(0, NUMPIECES, 2):
+            self.picker.set_priority(piece, -1)
+        for have in self.peers:
+            self._check(have, lambda piece: True)
+            piece = self.picker._next(have, lambda piece: True, False)
+            self.assert_(piece is None or piece % 2 == 1)
+
+    def test_lost_have(self):
+        have = self.peers[0]
+        for piece in have.iter_true():
+            self.picker.lost_have(piece)
+        for have in self.peers[1:]:
+            self._check(have, lambda piece: True)
+
+    def test_empty_peer(self):
+        self.assertEquals(None, self.picker._next(Bitfield(NUMPIECES), lambda piece: True, False))
+
+    def test_few_pieces(self):
+        # Rarest pieces are at the front, a peer with one piece is not
+        # served by scanning them
+        have = Bitfield(NUMPIECES)
+        piece = [l for l in self.picker.interests if l][-1][0]
+        have[piece] = True
+        self.assertEquals(piece, self.picker._next(have, lambda piece: True, False))
+
+
+def test_suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(TestPiecePicker))
+    return suite
+
+def main():
+    unittest.main(defaultTest='test_suite')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,237 @@
+# see LICENSE.txt for license information
+#
+# Tests for the pluggable network event loop: the epoll() backend of
+# SocketHandler, the task heap in RawServer and the write buffer of 
+# SingleSocket.
+#
+
+import unittest
+import socket
+from heapq import heappop
+from array import array
+from threading import Event
+
+from Tribler.Core.simpledefs import REACTOR_POLL, REACTOR_EPOLL
+from Tribler.Core.BitTornado import epollpoll
+from Tribler.Core.BitTornado.RawServer import RawServer
+from Tribler.Core.BitTornado.SocketHandler import SocketHandler, SingleSocket, POLLIN, POLLOUT
+
+
+class DummyHandler:
+    def __init__(self):
+        self.received = []
+        self.lost = []
+
+    def data_came_in(self, s, data):
+        self.received.append(data)
+
+    def connection_flushed(self, s):
+        pass
+
+    def connection_lost(self, s):
+        self.lost.append(s)
+
+
+class TestEPollPoll(unittest.TestCase):
+
+    def setUp(self):
+        if not epollpoll.available():
+            self.skipped = True
+            return
+        self.skipped = False
+        self.poll = epollpoll.poll()
+        self.a, self.b = socket.socketpair()
+        self.a.setblocking(0)
+
+    def tearDown(self):
+        if not self.skipped:
+            self.a.close()
+            self.b.close()
+            self.poll.close()
+
+    def test_edge_triggered(self):
+        if self.skipped:
+            return
+        self.poll.register(self.a, POLLIN)
+        self.b.send("x")
+        events = self.poll.poll(100)
+        self.assertEquals([(self.a.fileno(), POLLIN)], events)
+        # No new edge, so no new event although the data was not read
+        self.assertEquals([], self.poll.poll(0))
+
+    def test_rearm(self):
+        if self.skipped:
+            return
+        self.poll.register(self.a, POLLIN)
+        self.b.send("x")
+        self.poll.poll(100)
+        self.poll.rearm(self.a.fileno(), POLLIN)
+        self.assertEquals([(self.a.fileno(), POLLIN)], self.poll.poll(1000))
+        self.assertEquals([], self.poll.poll(0))
+
+    def test_rearm_unregistered(self):
+        if self.skipped:
+            return
+        self.poll.register(self.a, POLLIN)
+        self.poll.rearm(self.a.fileno(), POLLIN)
+        self.poll.unregister(self.a)
+        self.assertEquals([], self.poll.poll(0))
+
+    def test_modify(self):
+        if self.skipped:
+            return
+        self.poll.register(self.a, POLLIN)
+        self.poll.register(self.a, POLLIN|POLLOUT)
+        self.assertEquals([(self.a.fileno(), POLLOUT)], self.poll.poll(100))
+
+
+class TestSocketHandlerBackends(unittest.TestCase):
+
+    def _test_read_all(self, backend):
+        sh = SocketHandler(300, False, 10, backend)
+        a, b = socket.socketpair()
+        a.setblocking(0)
+        handler = DummyHandler()
+        ss = SingleSocket(sh, a, handler)
+        sh.single_sockets[a.fileno()] = ss
+        sh.poll.register(a, POLLIN)
+
+        # More data than a single read, must arrive without further writes
+        b.send("x" * 35)
+        for i in range(10):
+            sh.handle_events(sh.do_poll(0.1))
+        self.assertEquals("x" * 35, "".join(handler.received))
+        self.assertEquals([], handler.lost)
+        a.close()
+        b.close()
+
+    def test_read_all_poll(self):
+        self._test_read_all(REACTOR_POLL)
+
+    def test_read_all_epoll(self):
+        self._test_read_all(REACTOR_EPOLL)
+
+
+class TestRawServerTasks(unittest.TestCase):
+
+    def setUp(self):
+        self.doneflag = Event()
+        self.rawserver = RawServer(self.doneflag, 60, 300)
+        self.calls = []
+
+    def tearDown(self):
+        self.rawserver.shutdown()
+
+    def _run_tasks(self):
+        """ Run the scheduled tasks in order, without the network loop """
+        self.rawserver.pop_external()
+        self.rawserver._kill_tasks()
+        while self.rawserver.funcs:
+            t, seqno, func, id = heappop(self.rawserver.funcs)
+            if func != self.rawserver.scan_for_timeouts:
+                func()
+
+    def test_fifo_same_delay(self):
+        for i in range(5):
+            self.rawserver.add_task(lambda i=i: self.calls.append(i))
+        self._run_tasks()
+        self.assertEquals(range(5), self.calls)
+
+    def test_delay_order(self):
+        self.rawserver.add_task(lambda: self.calls.append(2), 0.02)
+        self.rawserver.add_task(lambda: self.calls.append(0), 0)
+        self.rawserver.add_task(lambda: self.calls.append(1), 0.01)
+        self._run_tasks()
+        self.assertEquals([0, 1, 2], self.calls)
+
+    def test_kill_tasks(self):
+        self.rawserver.add_task(lambda: self.calls.append('a'), 0, 'a')
+        self.rawserver.add_task(lambda: self.calls.append('b'), 0, 'b')
+        self.rawserver.add_task(lambda: self.calls.append('a'), 0.01, 'a')
+        self.rawserver.kill_tasks('a')
+        self._run_tasks()
+        self.assertEquals(['b'], self.calls)
+
+
+class FakePoll:
+    def register(self, s, events):
+        pass
+
+
+class FakeSocketHandler:
+    def __init__(self):
+        self.poll = FakePoll()
+        self.dead_from_write = []
+
+
+class SlowSocket:
+    """ Accepts at most limit bytes per send() """
+    def __init__(self, limit):
+        self.limit = limit
+        self.sends = []
+        self.data = []
+
+    def fileno(self):
+        return 42
+
+    def send(self, s):
+        self.sends.append(s)
+        amount = min(len(s), self.limit)
+        self.data.append(buffer(s, 0, amount)[:])
+        return amount
+
+
+class TestSingleSocketWrite(unittest.TestCase):
+
+    def _socket(self, limit):
+        sock = SlowSocket(limit)
+        s = SingleSocket(FakeSocketHandler(), sock, DummyHandler())
+        s.connected = True
+        return s, sock
+
+    def test_partial_sends(self):
+        s, sock = self._socket(1000)
+        s.write('a' * 2500)
+        self.assertEquals(1, len(sock.sends))
+        self.assertEquals(1000, s.offset)
+        s.try_write()
+        s.try_write()
+        self.assert_(s.is_flushed())
+        self.assertEquals(0, s.offset)
+        self.assertEquals('a' * 2500, ''.join(sock.data))
+        # the rest of the string is sent without copying it
+        self.assert_(isinstance(sock.sends[1], buffer))
+
+    def test_vector_not_copied(self):
+        s, sock = self._socket(100000)
+        piece = array('c', 'p' * 16384)
+        s.write_vector(['header', piece, 'have'])
+        self.assert_(s.is_flushed())
+        self.assertEquals('header' + piece.tostring() + 'have', ''.join(sock.data))
+        self.assertEquals(3, len(sock.sends))
+        self.assert_(sock.sends[1] is piece)
+
+    def test_vector_partial_sends(self):
+        s, sock = self._socket(3000)
+        l = ['x' * 10, array('c', 'y' * 5000), buffer('z' * 7000, 1000), 'w']
+        s.write_vector(l)
+        while not s.is_flushed():
+            s.try_write()
+        self.assertEquals(''.join(buffer(x)[:] for x in l), ''.join(sock.data))
+        self.assertEquals(0, s.offset)
+
+
+def test_suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(TestEPollPoll))
+    suite.addTest(unittest.makeSuite(TestSocketHandlerBackends))
+    suite.addTest(unittest.makeSuite(TestRawServerTasks))
+    suite.addTest(unittest.makeSuite(TestSingleSocketWrite))
+    return suite
+
+def main():
+    unittest.main(defaultTest='test_suite')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,265 @@
+# see LICENSE.txt for license information
+#
+# Tests for resuming a download that was not shut down cleanly: only the
+# pieces written to since the resume data was saved, as recorded in the
+# WriteJournal, are checked again.
+#
+
+import unittest
+import os
+import tempfile
+import shutil
+from threading import Event
+
+from Tribler.Core.Utilities.Crypto import sha
+from Tribler.Core.BitTornado.BT1.Storage import Storage
+from Tribler.Core.BitTornado.BT1.StorageWrapper import StorageWrapper
+from Tribler.Core.BitTornado.BT1.FileSelector import FileSelector
+from Tribler.Core.BitTornado.BT1.WriteJournal import WriteJournal
+
+PIECE_LENGTH = 2 ** 12
+LENGTHS = [10 * PIECE_LENGTH + 100, 20 * PIECE_LENGTH]
+NUMPIECES = 31
+CONFIG = {'max_files_open': 50, 'write_buffer_size': 0, 'auto_flush': 0}
+
+
+class TestWriteJournal(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.dir, 'test.journal')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_record(self):
+        journal = WriteJournal(self.filename, 100)
+        self.assertEquals(None, journal.get_written(None))
+        generation = journal.reset()
+        journal.record(50, 100)
+        journal.record(120, 10)
+        journal.record(1000, 1)
+        journal.close()
+
+        journal = WriteJournal(self.filename, 100)
+        self.assertEquals([0, 1, 10], sorted(journal.get_written(generation)))
+        self.assertEquals(None, journal.get_written('other'))
+        # Appends to the journal of the same generation
+        journal.record(300, 1)
+        journal.close()
+        journal = WriteJournal(self.filename, 100)
+        self.assertEquals([0, 1, 3, 10], sorted(journal.get_written(generation)))
+
+        newgeneration = journal.reset()
+        self.assertNotEquals(generation, newgeneration)
+        self.assertEquals([], journal.get_written(newgeneration))
+        journal.close()
+
+    def test_last_record_time(self):
+        journal = WriteJournal(self.filename, 100)
+        self.assertEquals(None, journal.get_last_record_time())
+        journal.reset()
+        journal.record(0, 10)
+        os.utime(self.filename, (1000, 1000))
+        # Writes to a piece in the journal touch it too
+        journal.touched = 0
+        journal.record(20, 10)
+        self.assertEquals([0], journal.get_written(journal.generation))
+        self.assert_(journal.get_last_record_time() > 1000)
+        journal.close()
+
+    def test_cut_off(self):
+        f = open(self.filename, 'wb')
+        f.write('abcd\n1\n23\n4')
+        f.close()
+        journal = WriteJournal(self.filename, 100)
+        self.assertEquals([1, 23], sorted(journal.get_written('abcd')))
+
+    def test_no_journal(self):
+        journal = WriteJournal(self.filename, 100)
+        self.assertEquals(None, journal.get_written(None))
+        # The first write starts a journal no resume data refers to
+        journal.record(0, 10)
+        journal.close()
+        self.assert_(os.path.exists(self.filename))
+        self.assertEquals(None, WriteJournal(self.filename, 100).get_written(None))
+
+
+class Download:
+    """ The Storage, StorageWrapper and FileSelector of a download """
+    def __init__(self, files, hashes, journalname, resumedata = None):
+        self.storage = Storage(files, PIECE_LENGTH, Event(), CONFIG)
+        if journalname is not None:
+            self.journal = WriteJournal(journalname, PIECE_LENGTH)
+            self.storage.set_journal(self.journal)
+        else:
+            self.journal = None
+        self.tasks = []
+        self.sw = StorageWrapper({'live': False}, self.storage, PIECE_LENGTH, hashes,
+                                 PIECE_LENGTH, None, lambda: None, self._failed,
+                                 backfunc = self._add_task, config = CONFIG)
+        self.fileselector = FileSelector(files, PIECE_LENGTH, None, self.storage,
+                                         self.sw, self._add_task, self._failed)
+        if resumedata is not None:
+            self.fileselector.unpickle(resumedata)
+
+        done = Event()
+        self.sw.initialize(lambda success = True: done.set())
+        while self.tasks and not done.isSet():
+            self.tasks.pop(0)()
+        assert done.isSet()
+
+    def _add_task(self, func, delay = 0, id = None):
+        if func.__name__ != '_bgsync':
+            self.tasks.append(func)
+
+    def _failed(self, reason):
+        raise AssertionError(reason)
+
+    def shutdown(self, clean = True):
+        self.storage.close()
+        if clean:
+            resumedata = self.fileselector.pickle()
+        else:
+            resumedata = None
+        if self.journal is not None:
+            self.journal.close()
+        return resumedata
+
+
+class TestResume(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.journalname = os.path.join(self.dir, 'download.journal')
+        self.data = os.urandom(sum(LENGTHS))
+        self.hashes = [sha(self.data[i:i+PIECE_LENGTH]).digest()
+                       for i in xrange(0, len(self.data), PIECE_LENGTH)]
+        assert len(self.hashes) == NUMPIECES
+        self.files = []
+        pos = 0
+        for i in xrange(len(LENGTHS)):
+            name = os.path.join(self.dir, 'file%d' % i)
+            f = open(name, 'wb')
+            f.write(self.data[pos:pos+LENGTHS[i]])
+            f.close()
+            self.files.append((name, LENGTHS[i]))
+            pos += LENGTHS[i]
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def _checkpoint_and_crash(self, journalname):
+        """ Saves the resume data, then overwrites piece 20 with bad data
+        and stops without saving it again """
+        dl = Download(self.files, self.hashes, journalname)
+        self.assertEquals(NUMPIECES, dl.sw.check_total)
+        self.assertEquals(0, dl.sw.get_amount_left())
+        resumedata = dl.fileselector.pickle()
+        dl.storage.write(20 * PIECE_LENGTH + 10, 'x' * 10)
+        dl.shutdown(clean = False)
+        # Make sure the modification is noticed, the write was recorded
+        # at the same time
+        for name in [self.files[1][0], journalname]:
+            if name is not None:
+                self._touch(name, 10)
+        return resumedata
+
+    def _touch(self, name, delay):
+        mtime = os.path.getmtime(name) + delay
+        os.utime(name, (mtime, mtime))
+
+    def _modify(self, pos, delay):
+        """ Overwrites data at pos outside the download, without changing
+        the size of the file, delay seconds from now """
+        for name, length in self.files:
+            if pos < length:
+                break
+            pos -= length
+        f = open(name, 'r+b')
+        f.seek(pos)
+        f.write('y' * 10)
+        f.close()
+        self._touch(name, delay)
+
+    def test_clean_shutdown(self):
+        dl = Download(self.files, self.hashes, self.journalname)
+        resumedata = dl.shutdown()
+        dl = Download(self.files, self.hashes, self.journalname, resumedata)
+        self.assertEquals(0, dl.sw.check_total)
+        self.assertEquals(0, dl.sw.get_amount_left())
+        dl.shutdown()
+
+    def test_recheck_written_pieces(self):
+        resumedata = self._checkpoint_and_crash(self.journalname)
+        dl = Download(self.files, self.hashes, self.journalname, resumedata)
+        # Only the piece written to after the checkpoint is checked
+        self.assertEquals(1, dl.sw.check_total)
+        self.assertFalse(dl.sw.do_I_have(20))
+        self.assertEquals(NUMPIECES - 1, len([i for i in xrange(NUMPIECES) if dl.sw.do_I_have(i)]))
+        dl.shutdown()
+
+    def test_modified_after_clean_shutdown(self):
+        dl = Download(self.files, self.hashes, self.journalname)
+        resumedata = dl.shutdown()
+        # The journal is empty, it does not explain the modification
+        self._modify(25 * PIECE_LENGTH, 10)
+        dl = Download(self.files, self.hashes, self.journalname, resumedata)
+        self.assertEquals(21, dl.sw.check_total)
+        self.assertFalse(dl.sw.do_I_have(25))
+        dl.shutdown()
+
+    def test_modified_file_not_in_journal(self):
+        resumedata = self._checkpoint_and_crash(self.journalname)
+        # The journal only has a piece of the second file
+        self._modify(3 * PIECE_LENGTH, 5)
+        dl = Download(self.files, self.hashes, self.journalname, resumedata)
+        # The first file and the piece in the journal are checked
+        self.assertEquals(12, dl.sw.check_total)
+        self.assertFalse(dl.sw.do_I_have(3))
+        self.assertFalse(dl.sw.do_I_have(20))
+        dl.shutdown()
+
+    def test_modified_after_last_record(self):
+        resumedata = self._checkpoint_and_crash(self.journalname)
+        self._modify(25 * PIECE_LENGTH, 20)
+        dl = Download(self.files, self.hashes, self.journalname, resumedata)
+        # All pieces of the second file are checked
+        self.assertEquals(21, dl.sw.check_total)
+        self.assertFalse(dl.sw.do_I_have(20))
+        self.assertFalse(dl.sw.do_I_have(25))
+        dl.shutdown()
+
+    def test_without_journal(self):
+        resumedata = self._checkpoint_and_crash(None)
+        dl = Download(self.files, self.hashes, None, resumedata)
+        # All pieces of the modified file are checked, the first piece of
+        # the second file begins in the first
+        self.assertEquals(21, dl.sw.check_total)
+        self.assertFalse(dl.sw.do_I_have(20))
+        dl.shutdown()
+
+    def test_journal_of_other_checkpoint(self):
+        resumedata = self._checkpoint_and_crash(self.journalname)
+        # Start a new generation the resume data does not refer to
+        journal = WriteJournal(self.journalname, PIECE_LENGTH)
+        journal.reset()
+        journal.close()
+        dl = Download(self.files, self.hashes, self.journalname, resumedata)
+        self.assertEquals(21, dl.sw.check_total)
+        self.assertFalse(dl.sw.do_I_have(20))
+        dl.shutdown()
+
+
+def test_suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(TestWriteJournal))
+    suite.addTest(unittest.makeSuite(TestResume))
+    return suite
+
+def main():
+    unittest.main(defaultTest='test_suite')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+# see LICENSE.txt for license information
+#
+# Tests for the PreferenceMatrix of BuddyCast: its similarities must be those
+# of P2PSim_Single with the overlap of the peers with my preferences.
+#
+
+import unittest
+from random import Random
+
+from Tribler.Core.BuddyCast.similarity import P2PSim_Single, PreferenceMatrix
+
+
+def random_prefs(rand, npeers, ntorrents, nprefs):
+    prefs = {}
+    for peer_id in xrange(1, npeers + 1):
+        prefs[peer_id] = rand.sample(xrange(1, ntorrents + 1), rand.randint(0, nprefs))
+    return prefs
+
+def similarities(prefs, nprefs, myprefs):
+    """ The similarities as computed from the overlap in the database """
+    sims = {}
+    for peer_id in prefs:
+        overlap = len([tid for tid in prefs[peer_id] if tid in myprefs])
+        if overlap:
+            sims[peer_id] = P2PSim_Single((peer_id, nprefs[peer_id], overlap), len(myprefs))
+    return sims
+
+
+class TestPreferenceMatrix(unittest.TestCase):
+
+    def setUp(self):
+        rand = Random(0)
+        self.prefs = random_prefs(rand, 200, 500, 60)
+        self.nprefs = dict([(peer_id, len(prefs) + rand.randint(0, 5)) for peer_id, prefs in self.prefs.iteritems()])
+        self.myprefs = rand.sample(xrange(1, 501), 40)
+        self.matrix = PreferenceMatrix()
+        for peer_id, prefs in self.prefs.iteritems():
+            self.matrix.addPeerPreferences(peer_id, prefs, self.nprefs[peer_id])
+
+    def test_similarities(self):
+        self.assertEquals({}, self.matrix.getSimilarities())
+        self.matrix.setMyPreferences(self.myprefs)
+        expected = similarities(self.prefs, self.nprefs, self.myprefs)
+        self.assertEquals(expected, self.matrix.getSimilarities())
+        for peer_id in self.prefs:
+            self.assertEquals(expected.get(peer_id, 0), self.matrix.getSimilarity(peer_id))
+
+    def test_incremental(self):
+        # Add the preferences in two parts, after setting mine
+        matrix = PreferenceMatrix()
+        matrix.setMyPreferences(self.myprefs[:20])
+        for peer_id, prefs in self.prefs.iteritems():
+            matrix.addPeerPreferences(peer_id, prefs[:10])
+        for myprefs in self.myprefs[20:]:
+            matrix.addMyPreference(myprefs)
+        for peer_id, prefs in self.prefs.iteritems():
+            # Preferences it already has are ignored
+            matrix.addPeerPreferences(peer_id, prefs)
+            matrix.setPeerNumPrefs(peer_id, self.nprefs[peer_id])
+        self.assertEquals(similarities(self.prefs, self.nprefs, self.myprefs), matrix.getSimilarities())
+
+        removed = self.myprefs[:5]
+        for torrent_id in removed:
+            matrix.removeMyPreference(torrent_id)
+        self.assertEquals(similarities(self.prefs, self.nprefs, self.myprefs[5:]), matrix.getSimilarities())
+
+
+def test_suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(TestPreferenceMatrix))
+    return suite
+
+def main():
+    unittest.main(defaultTest='test_suite')
+
+
+if __name__ == '__main__':
+    main()
@@ -10,7 +10,7 @@ from random import shuffle
 import apsw
 
 
-from Tribler.Core.CacheDB.sqlitecachedb import SQLiteCacheDB, DEFAULT_BUSY_TIMEOUT,CURRENT_MAIN_DB_VERSION
+from Tribler.Core.CacheDB.sqlitecachedb import SQLiteCacheDB, DEFAULT_BUSY_TIMEOUT,CURRENT_MAIN_DB_VERSION,BATCH_COMMIT
 from bak_tribler_sdb import *    
 
 CREATE_SQL_FILE = os.path.join('..',"schema_sdb_v"+str(CURRENT_MAIN_DB_VERSION)+".sql")
@@ -459,6 +459,56 @@ class TestSqliteCacheDB(unittest.TestCase):
     def test_basic_funcs_lib0(self):
         self.basic_funcs()
         
+    def test_batch_commit(self):
+        db = SQLiteCacheDB.getInstance()
+        db.createDBTable("create table person(lastname, firstname);", self.db_path)
+        for i in range(10):
+            db.insert('person', commit=BATCH_COMMIT, lastname=str(i), firstname='a')
+
+        # Another thread does not see the batched writes yet
+        found = []
+        def count():
+            db.openDB(self.db_path, 0)
+            found.append(db.size('person'))
+            db.close()
+        t = Thread(target=count)
+        t.start()
+        t.join()
+        assert found == [0], found
+
+        # This thread does, they are committed first
+        assert db.getOne('person', 'firstname', lastname='9') == 'a'
+        t = Thread(target=count)
+        t.start()
+        t.join()
+        assert found == [0, 10], found
+
+        # flush() commits the batched writes of all threads
+        def insert():
+            db.openDB(self.db_path, 0)
+            db.insert('person', commit=BATCH_COMMIT, lastname='x', firstname='b')
+        t = Thread(target=insert)
+        t.start()
+        t.join()
+        db.flush()
+        assert db.size('person') == 11
+        stats = db.get_stats()
+        assert stats['commits'] >= 2, stats
+        assert stats['statements_per_second'] > 0, stats
+        db.close()
+        
+    def test_sql_cache(self):
+        db = SQLiteCacheDB.getInstance()
+        db.createDBTable("create table person(lastname, firstname);", self.db_path)
+        db.insert('person', lastname='a', firstname='b')
+        db.insert('person', lastname='c', firstname='d')
+        assert db.getOne('person', 'firstname', lastname='c') == 'd'
+        assert db.getOne('person', 'firstname', lastname='a') == 'b'
+        assert db.getAll('person', 'lastname', firstname=('>', 'a'), order_by='lastname') == [('a',), ('c',)]
+        # Both inserts and both getOnes have the same SQL
+        assert len(db.sql_cache) == 3, db.sql_cache
+        db.close()
+        
     def test_insertPeer(self):
         create_sql = """
         CREATE TABLE Peer (
@@ -523,6 +573,50 @@ class TestThreadedSqliteCacheDB(unittest.TestCase):
         #print "initDB", db_path
         db.initDB(db_path, tmp_sql_path, busytimeout=busytimeout, check_version=False)
         os.remove(tmp_sql_path)
+
+    def test_batch_commit_delay(self):
+        # A batch is committed BATCH_MAX_DELAY seconds after it started,
+        # also when its thread does not use the database again
+        self.create_db(self.db_path)
+        db = SQLiteCacheDB.getInstance()
+        max_delay = Tribler.Core.CacheDB.sqlitecachedb.BATCH_MAX_DELAY
+        Tribler.Core.CacheDB.sqlitecachedb.BATCH_MAX_DELAY = 0.5
+        try:
+            def insert():
+                db.insert('person', commit=BATCH_COMMIT, lastname='a', firstname='b')
+                db.insert('person', commit=False, lastname='c', firstname='d')
+            t = Thread(target=insert)
+            t.start()
+            t.join()
+            assert db.size('person') == 0
+            sleep(2)
+            # Not the write that was queued after the batch
+            assert db.size('person') == 1
+            db.flush()
+            assert db.batch_queue is None
+        finally:
+            Tribler.Core.CacheDB.sqlitecachedb.BATCH_MAX_DELAY = max_delay
+
+    def test_batch_commit_after_write(self):
+        # A batch does not commit the writes that were queued before it
+        # without BATCH_COMMIT
+        self.create_db(self.db_path)
+        db = SQLiteCacheDB.getInstance()
+        max_delay = Tribler.Core.CacheDB.sqlitecachedb.BATCH_MAX_DELAY
+        Tribler.Core.CacheDB.sqlitecachedb.BATCH_MAX_DELAY = 0.5
+        try:
+            def insert():
+                db.insert('person', commit=False, lastname='a', firstname='b')
+                db.insert('person', commit=BATCH_COMMIT, lastname='c', firstname='d')
+            t = Thread(target=insert)
+            t.start()
+            t.join()
+            sleep(2)
+            assert db.size('person') == 0
+            db.flush()
+            assert db.size('person') == 2
+        finally:
+            Tribler.Core.CacheDB.sqlitecachedb.BATCH_MAX_DELAY = max_delay
                     
     def write_data(self):
         db = SQLiteCacheDB.getInstance()
@@ -970,6 +970,7 @@ class TestTorrentDBHandler(unittest.TestCase):
                 "getTorrent",
                 "freeSpace",
                 "getInfohash",
+                "searchNames",
             ]
             for func in all_funcs:
                 if func not in tested_funcs:
@@ -1151,6 +1152,46 @@ class TestTorrentDBHandler(unittest.TestCase):
         my_infohash = str2bin(my_infohash_str_126)
         assert not db.deleteTorrent(my_infohash)
         
+    def singtest_searchNames(self):
+        self.addTorrent()
+        db = TorrentDBHandler.getInstance()
+        s_infohash = unhexlify('44865489ac16e2f34ea0cd3043cfd970cc24ec09')
+        m_infohash = unhexlify('ed81da94d21ad1b305133f2726cdaec5a57fed98')
+
+        res = db.searchNames(['tribler', 'src'])
+        infohashes = [torrent['infohash'] for torrent in res]
+        assert s_infohash in infohashes and m_infohash in infohashes, infohashes
+        assert len(infohashes) == len(set(infohashes))
+        torrent = res[infohashes.index(s_infohash)]
+        assert torrent['name'] == 'Tribler_4.1.7_src.zip', torrent['name']
+        for key in ('torrent_id', 'channel_permid', 'channel_name', 'source', 'category',
+                    'status', 'simRank', 'last_check_time', 'subscriptions', 'neg_votes'):
+            assert key in torrent, key
+        assert 'source_id' not in torrent
+        # The best torrents first
+        seeders = [torrent['num_seeders'] for torrent in res]
+        assert seeders == sorted(seeders, reverse=True), seeders
+
+        # Prefix matching and the combination of keywords
+        if db.fts:
+            res = db.searchNames(['TRIBL', 'zi'])
+            assert s_infohash in [torrent['infohash'] for torrent in res]
+        res = db.searchNames(['tribler zip'])
+        assert s_infohash in [torrent['infohash'] for torrent in res]
+        assert [] == db.searchNames(['tribler', 'notakeyword'])
+        assert [] == db.searchNames(['--'])
+
+        # Pages
+        page1 = db.searchNames(['tribler'], limit=1)
+        page2 = db.searchNames(['tribler'], limit=1, offset=1)
+        assert len(page1) == 1 and len(page2) == 1
+        assert page1[0]['infohash'] != page2[0]['infohash']
+
+        db._deleteTorrent(m_infohash, keep_infohash=False)
+        res = db.searchNames(['tribler', 'src'])
+        assert m_infohash not in [torrent['infohash'] for torrent in res]
+        self.deleteTorrent()
+
     def singtest_getCollectedTorrentHashes(self):
         db = TorrentDBHandler.getInstance()
         res = db.getNumberCollectedTorrents()
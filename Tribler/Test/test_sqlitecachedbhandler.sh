@@ -45,6 +45,7 @@ python test_sqlitecachedbhandler.py TestTorrentDBHandler singtested_functions
 python test_sqlitecachedbhandler.py TestTorrentDBHandler singtest_count
 python test_sqlitecachedbhandler.py TestTorrentDBHandler singtest_loadTorrents
 python test_sqlitecachedbhandler.py TestTorrentDBHandler singtest_add_update_delete_Torrent
+python test_sqlitecachedbhandler.py TestTorrentDBHandler singtest_searchNames
 python test_sqlitecachedbhandler.py TestTorrentDBHandler singtest_getCollectedTorrentHashes
 python test_sqlitecachedbhandler.py TestTorrentDBHandler singtest_freeSpace
 
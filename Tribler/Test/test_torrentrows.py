@@ -0,0 +1,92 @@
+# see LICENSE.txt for license information
+#
+# Tests for the TorrentResultSet of TorrentDBHandler: its rows must behave
+# like the dicts of the torrents and only decode the fields that are read.
+#
+
+import unittest
+
+from Tribler.Core.CacheDB.torrentrows import TorrentResultSet
+
+COLUMNS = ['torrent_id', 'infohash', 'name', 'category_id', 'num_seeders']
+RECORDS = [(1, 'ab', u'one', 1, 5),
+           (2, 'cd', u'two', 2, 20),
+           (3, 'ef', u'three', 1, 10)]
+CATEGORIES = {1: 'Video', 2: 'Audio'}
+
+
+class TestTorrentResultSet(unittest.TestCase):
+
+    def setUp(self):
+        self.decoded = []
+        decoders = {'infohash': ('infohash', self.decode('infohash', lambda infohash: infohash.upper())),
+                    'category': ('category_id', self.decode('category', lambda category_id: [CATEGORIES[category_id]]))}
+        self.torrents = TorrentResultSet(COLUMNS, list(RECORDS), decoders, ('category_id',), {'simRank': -1})
+
+    def decode(self, field, func):
+        def decoder(value):
+            self.decoded.append((field, value))
+            return func(value)
+        return decoder
+
+    def test_fields(self):
+        self.assertEquals(3, len(self.torrents))
+        torrent = self.torrents[1]
+        self.assertEquals(u'two', torrent['name'])
+        self.assertEquals([], self.decoded)
+        self.assertEquals('CD', torrent['infohash'])
+        self.assertEquals('CD', torrent['infohash'])
+        self.assertEquals(['Audio'], torrent['category'])
+        # Decoded once, and only for the rows that are read
+        self.assertEquals([('infohash', 'cd'), ('category', 2)], self.decoded)
+        self.assertEquals('cd', torrent.raw('infohash'))
+
+        self.assert_('category_id' not in torrent)
+        self.assertRaises(KeyError, lambda: torrent['category_id'])
+        self.assertEquals(None, torrent.get('category_id'))
+        self.assertEquals(-1, torrent['simRank'])
+        self.assertEquals(sorted(['torrent_id', 'infohash', 'name', 'num_seeders', 'category', 'simRank']), sorted(torrent.keys()))
+
+    def test_dict(self):
+        torrent = self.torrents[0]
+        torrent['metadata'] = 'data'
+        torrent['name'] = u'changed'
+        del torrent['num_seeders']
+        self.assert_('num_seeders' not in torrent)
+        expected = {'torrent_id': 1, 'infohash': 'AB', 'name': u'changed', 'category': ['Video'], 'simRank': -1, 'metadata': 'data'}
+        self.assertEquals(expected, torrent.todict())
+        self.assertEquals(expected, dict(torrent))
+        d = {'hittype': 'localdb'}
+        d.update(torrent)
+        self.assertEquals('data', d['metadata'])
+        # The changes stay with the row
+        self.assertEquals(u'changed', self.torrents[0]['name'])
+        self.assertEquals([u'changed', u'two', u'three'], [torrent['name'] for torrent in self.torrents.todicts()])
+
+    def test_sort(self):
+        self.torrents[0]['metadata'] = 'data'
+        self.torrents.sort('num_seeders', reverse = True)
+        self.assertEquals([2, 3, 1], [torrent['torrent_id'] for torrent in self.torrents])
+        self.assertEquals('data', self.torrents[2]['metadata'])
+        self.assertEquals([], self.decoded)
+
+        page = self.torrents[1:]
+        self.assertEquals(2, len(page))
+        self.assertEquals(['EF', 'AB'], [torrent['infohash'] for torrent in page])
+
+    def test_plain(self):
+        torrents = TorrentResultSet(COLUMNS, list(RECORDS))
+        self.assertEquals([dict(zip(COLUMNS, record)) for record in RECORDS], torrents.todicts())
+
+
+def test_suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(TestTorrentResultSet))
+    return suite
+
+def main():
+    unittest.main(defaultTest='test_suite')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,297 @@
+# see LICENSE.txt for license information
+#
+# Tests for the TrackerClient: announces and batched scrapes to a local HTTP
+# tracker over a kept-alive connection and to a local UDP (BEP 15) tracker,
+# and the backoff after a tracker does not respond. Also tests the
+# Rerequester and the tracker checking on top of it.
+#
+
+import unittest
+import socket
+from struct import pack, unpack
+from threading import Thread, Event
+from urlparse import urlparse, parse_qs
+from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+
+from Tribler.Core.BitTornado.bencode import bencode
+from Tribler.Core.BitTornado.RawServer import RawServer
+from Tribler.Core.BitTornado.BT1.TrackerClient import TrackerClient, get_scrape_url, HTTPResponse, ERROR_CONNECTION, ERROR_DATA, UDP_PROTOCOL_ID
+from Tribler.Core.BitTornado.BT1.Rerequester import Rerequester
+from Tribler.TrackerChecking.TrackerChecking import trackerChecking
+
+INFOHASH1 = 'a' * 20
+INFOHASH2 = 'b' * 20
+PEERID = 'p' * 20
+PEERS = socket.inet_aton('10.0.0.1') + pack('!H', 6881)
+
+
+class TrackerHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self.server.requests.append(self.path)
+        self.server.connections.add(self.client_address)
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        if url.path == '/announce':
+            response = {'interval': 1800, 'peers': PEERS}
+        else:
+            response = {'files': dict([(infohash, {'complete': 5, 'incomplete': 3, 'downloaded': 1}) for infohash in query['info_hash']])}
+        data = bencode(response)
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+class UDPTracker(Thread):
+    def __init__(self):
+        Thread.__init__(self)
+        self.setDaemon(True)
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket.bind(('127.0.0.1', 0))
+        self.port = self.socket.getsockname()[1]
+        self.requests = []
+
+    def run(self):
+        while True:
+            try:
+                data, addr = self.socket.recvfrom(65535)
+            except socket.error:
+                return
+            connection_id, action, tid = unpack('!QII', data[:16])
+            self.requests.append(action)
+            if action == 0:
+                assert connection_id == UDP_PROTOCOL_ID
+                reply = pack('!IIQ', 0, tid, 1234)
+            elif action == 1:
+                assert connection_id == 1234
+                infohash, peerid = unpack('!20s20s', data[16:56])
+                assert infohash == INFOHASH1 and peerid == PEERID
+                reply = pack('!IIIII', 1, tid, 900, 2, 7) + PEERS
+            else:
+                assert connection_id == 1234
+                reply = pack('!II', 2, tid)
+                for i in range(16, len(data), 20):
+                    reply += pack('!III', 4, 0, 6)
+            self.socket.sendto(reply, addr)
+
+
+class TestTrackerClient(unittest.TestCase):
+
+    def setUp(self):
+        self.doneflag = Event()
+        self.rawserver = RawServer(self.doneflag, 60, 300)
+        self.client = TrackerClient.getInstance(self.rawserver, 5)
+        self.thread = Thread(target = self.rawserver.listen_forever, args = [None])
+        self.thread.setDaemon(True)
+        self.thread.start()
+
+        self.httpd = HTTPServer(('127.0.0.1', 0), TrackerHandler)
+        self.httpd.requests = []
+        self.httpd.connections = set()
+        t = Thread(target = self.httpd.serve_forever)
+        t.setDaemon(True)
+        t.start()
+        self.http_url = 'http://127.0.0.1:%d/announce' % self.httpd.server_port
+
+        self.udpd = UDPTracker()
+        self.udpd.start()
+        self.udp_url = 'udp://127.0.0.1:%d/announce' % self.udpd.port
+
+        self.results = []
+        self.event = Event()
+
+    def tearDown(self):
+        self.rawserver.add_task(self.client.shutdown)
+        self.rawserver.add_task(self.doneflag.set)
+        self.thread.join(5)
+        self.rawserver.shutdown()
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        self.udpd.socket.close()
+        TrackerClient.delInstance()
+
+    def wait(self, n):
+        for i in range(100):
+            if len(self.results) >= n:
+                return
+            self.event.wait(0.1)
+        self.fail('no result')
+
+    def announce(self, url):
+        params = '&info_hash=%s&peer_id=%s&port=6881&uploaded=0&downloaded=0&left=10&numwant=50&key=abc&event=started' % (INFOHASH1, PEERID)
+        self.rawserver.add_task(lambda: self.client.announce(url, params, lambda response, error: self.results.append((response, error))))
+
+    def scrape(self, url, infohash):
+        self.rawserver.add_task(lambda: self.client.scrape(url, infohash, lambda *result: self.results.append(result)))
+
+    def test_scrape_url(self):
+        self.assertEquals('http://t/scrape', get_scrape_url('http://t/announce'))
+        self.assertEquals('http://t/x/scrape.php?k=1', get_scrape_url('http://t/x/announce.php?k=1'))
+        self.assertEquals(None, get_scrape_url('http://t/a'))
+        self.assertEquals('udp://t:80', get_scrape_url('udp://t:80'))
+
+    def test_http_response(self):
+        response = HTTPResponse()
+        self.assertFalse(response.feed('HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\n3\r\nabc\r\n'))
+        self.assertTrue(response.feed('2\r\nde\r\n0\r\n\r\n'))
+        self.assertEquals('abcde', response.get_body())
+        self.assertTrue(response.keepalive)
+
+        response = HTTPResponse()
+        self.assertFalse(response.feed('HTTP/1.0 200 OK\r\n\r\nabc'))
+        self.assertTrue(response.close())
+        self.assertEquals('abc', response.get_body())
+        self.assertFalse(response.keepalive)
+
+    def test_http_announce(self):
+        self.announce(self.http_url)
+        self.wait(1)
+        self.announce(self.http_url)
+        self.wait(2)
+        for response, error in self.results:
+            self.assertEquals(None, error)
+            self.assertEquals(PEERS, response['peers'])
+        # The second announce reused the connection
+        self.assertEquals(2, len(self.httpd.requests))
+        self.assertEquals(1, len(self.httpd.connections))
+
+    def test_http_scrape_batch(self):
+        self.scrape(self.http_url, INFOHASH1)
+        self.scrape(self.http_url, INFOHASH2)
+        self.wait(2)
+        self.assertEquals(1, len(self.httpd.requests))
+        self.assertEquals(set([INFOHASH1, INFOHASH2]), set([infohash for infohash, response, error in self.results]))
+        for infohash, response, error in self.results:
+            self.assertEquals(5, response['files'][infohash]['complete'])
+
+    def test_udp(self):
+        self.announce(self.udp_url)
+        self.wait(1)
+        response, error = self.results[0]
+        self.assertEquals(None, error)
+        self.assertEquals({'interval': 900, 'complete': 7, 'incomplete': 2, 'peers': PEERS}, response)
+
+        self.scrape(self.udp_url, INFOHASH1)
+        self.scrape(self.udp_url, INFOHASH2)
+        self.wait(3)
+        for infohash, response, error in self.results[1:]:
+            self.assertEquals({'complete': 4, 'downloaded': 0, 'incomplete': 6}, response['files'][infohash])
+        # One connect, then the connection id is reused
+        self.assertEquals([0, 1, 2], self.udpd.requests)
+
+    def test_backoff(self):
+        # Nothing listens on this port
+        s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        s.bind(('127.0.0.1', 0))
+        url = 'udp://127.0.0.1:%d/announce' % s.getsockname()[1]
+        self.client.timeout = 0.5
+        self.announce(url)
+        self.wait(1)
+        self.announce(url)
+        self.wait(2)
+        s.close()
+        self.assertEquals(ERROR_CONNECTION, self.results[0][1][0])
+        self.assert_('not retrying' in self.results[1][1][1])
+
+
+class FakeTrackerClient:
+    """ Answers announces and scrapes at once, with the responses and
+    errors given by tracker """
+    def __init__(self, results):
+        self.results = results
+        self.requests = []
+
+    def announce(self, url, params, callback, timeout = None):
+        self.requests.append(url)
+        callback(*self.results[url])
+
+    def scrape(self, announce, infohash, callback):
+        self.requests.append(announce)
+        callback(infohash, *self.results[announce])
+
+
+class TestRerequester(unittest.TestCase):
+
+    def setUp(self):
+        self.peers = []
+        self.errors = []
+
+    def create(self, trackerlist, results):
+        self.trackerclient = FakeTrackerClient(results)
+        return Rerequester(trackerlist, 300, lambda f, t=0: None, lambda: 0, 20,
+                           self.peers.extend, lambda f, t=0: f(), lambda: 10, lambda: 0, lambda: 0,
+                           6881, '', PEERID, INFOHASH1, 60, self.errors.append, None, 50,
+                           Event(), lambda: 0, lambda: 0, config = {}, trackerclient = self.trackerclient)
+
+    def test_next_tracker(self):
+        results = {'http://a/announce': (None, (ERROR_CONNECTION, 'timeout exceeded')),
+                   'http://b/announce': ({'failure reason': 'unregistered torrent'}, None),
+                   'udp://c:80': ({'interval': 900, 'peers': PEERS}, None)}
+        rerequester = self.create([['http://a/announce'], ['http://b/announce', 'udp://c:80']], results)
+        rerequester.trackerlist[1].sort()
+        rerequester.announce(0)
+        self.assertEquals(['http://a/announce', 'http://b/announce', 'udp://c:80'], self.trackerclient.requests)
+        self.assertEquals([(('10.0.0.1', 6881), 0)], self.peers)
+        self.assertEquals(900, rerequester.announce_interval)
+        self.assertFalse(rerequester.busy)
+        # The tracker that responded moved to the front of its tier
+        self.assertEquals(['udp://c:80', 'http://b/announce'], rerequester.trackerlist[1])
+
+    def test_fail(self):
+        results = {'http://a/announce': (None, (ERROR_DATA, 'not a dictionary'))}
+        rerequester = self.create([['http://a/announce']], results)
+        rerequester.announce(0)
+        self.assertEquals(['bad data from tracker - not a dictionary'], self.errors)
+        self.assertTrue(rerequester.last_failed)
+        self.assertFalse(rerequester.busy)
+
+
+class TestTrackerChecking(unittest.TestCase):
+
+    def check(self, info, results):
+        self.trackerclient = FakeTrackerClient(results)
+        torrent = {'infohash': INFOHASH1, 'info': info}
+        checked = []
+        trackerChecking(torrent, self.trackerclient, checked.append)
+        self.assertEquals([torrent], checked)
+        return torrent
+
+    def test_tiers(self):
+        files = lambda seeders, leechers: ({'files': {INFOHASH1: {'complete': seeders, 'incomplete': leechers}}}, None)
+        results = {'http://a/announce': (None, (ERROR_CONNECTION, 'timeout exceeded')),
+                   'http://b/announce': files(0, 4),
+                   'http://c/announce': files(3, 1),
+                   'http://d/announce': files(9, 9)}
+        info = {'announce-list': [['http://a/announce'], ['http://b/announce'], ['http://c/announce'], ['http://d/announce']]}
+        torrent = self.check(info, results)
+        # Stops at the first tracker with seeders
+        self.assertEquals(['http://a/announce', 'http://b/announce', 'http://c/announce'], self.trackerclient.requests)
+        self.assertEquals((3, 4, 'good'), (torrent['seeder'], torrent['leecher'], torrent['status']))
+
+    def test_status(self):
+        results = {'http://a/announce': (None, (ERROR_CONNECTION, 'timeout exceeded')),
+                   'http://b/announce': ({'flags': {'min_request_interval': 60}}, None),
+                   'http://c/announce': (None, (ERROR_DATA, 'tracker does not support scrape'))}
+        self.assertEquals('unknown', self.check({'announce': 'http://a/announce'}, results)['status'])
+        self.assert_('status' not in self.check({'announce': 'http://b/announce'}, results))
+        self.assertEquals('dead', self.check({'announce': 'http://c/announce'}, results)['status'])
+
+
+def test_suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(TestTrackerClient))
+    suite.addTest(unittest.makeSuite(TestRerequester))
+    suite.addTest(unittest.makeSuite(TestTrackerChecking))
+    return suite
+
+def main():
+    unittest.main(defaultTest='test_suite')
+
+
+if __name__ == '__main__':
+    main()
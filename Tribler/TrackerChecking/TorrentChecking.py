@@ -22,13 +22,14 @@
 
 import sys
 import threading
-from threading import Thread
 from random import sample
 from time import time
 
 from Tribler.Core.BitTornado.bencode import bdecode
+from Tribler.Core.BitTornado.BT1.TrackerClient import TrackerClient
 from Tribler.TrackerChecking.TrackerChecking import trackerChecking
 from Tribler.Core.CacheDB.sqlitecachedb import safe_dict
+from Tribler.Utilities.TimedTaskQueue import TimedTaskQueue
 
 
 # LAYERVIOLATION: careful: uses two threads depending on code, make sure we have DB session per thread.
@@ -38,21 +39,34 @@ from Tribler.Core.DecentralizedTracking.mainlineDHTChecker import mainlineDHTChe
 
 DEBUG = False
 
-class TorrentChecking(Thread):
+class TorrentChecking:
+    """ Checks the trackers of a torrent. The database is accessed by a
+    single thread shared by all checks, the trackers are scraped by the
+    TrackerClient on the network thread. """
+
+    # the thread that accesses the database for all checks
+    db_queue = None
+    db_queue_lock = threading.Lock()
     
     def __init__(self, infohash=None):
-        Thread.__init__(self)
-        self.setName('TorrentChecking'+self.getName())
         if DEBUG:
             print >> sys.stderr, 'TorrentChecking: Started torrentchecking', threading.currentThread().getName()
-        self.setDaemon(True)
         
         self.infohash = infohash
         self.retryThreshold = 10
         self.gnThreashold = 0.9
         self.mldhtchecker = mainlineDHTChecker.getInstance()
-        self.db_thread = None   # if it is set, use another thread to access db
-        #self.db_thread = OverlayThreadingBridge.getInstance()
+        self.trackerclient = TrackerClient.getInstance()
+
+    def getDBQueue():
+        TorrentChecking.db_queue_lock.acquire()
+        try:
+            if TorrentChecking.db_queue is None:
+                TorrentChecking.db_queue = TimedTaskQueue(nameprefix="TorrentChecking")
+            return TorrentChecking.db_queue
+        finally:
+            TorrentChecking.db_queue_lock.release()
+    getDBQueue = staticmethod(getDBQueue)
         
     def selectPolicy(self):
         policies = ["oldest", "random", "popular"]
@@ -72,100 +86,80 @@ class TorrentChecking(Thread):
         except Exception:
             #print_exc()
             return torrent
+
+    def start(self):
+        """ Starts the check. Called by any thread """
+        self.getDBQueue().add_task(self.run)
             
     def run(self):
-        """ Gets one torrent from good or unknown list and checks it """
+        """ Gets one torrent from good or unknown list and starts checking
+        it. Called by the database thread """
         
-        try:
-            if DEBUG:
-                print >> sys.stderr, "Torrent Checking: RUN", threading.currentThread().getName()
-                
-            event = threading.Event()
-            return_value = safe_dict()
-            return_value['event'] = event
-            return_value['torrent'] = None
-            if self.infohash is None:   # select torrent by a policy
-                policy = self.selectPolicy()
-                if self.db_thread:
-                    self.db_thread.add_task(lambda:
-                        TorrentDBHandler.getInstance().selectTorrentToCheck(policy=policy, return_value=return_value))
-                else:
-                    TorrentDBHandler.getInstance().selectTorrentToCheck(policy=policy, return_value=return_value)
-            else:   # know which torrent to check
-                if self.db_thread:
-                    self.db_thread.add_task(lambda:TorrentDBHandler.getInstance().selectTorrentToCheck(infohash=self.infohash, return_value=return_value))
-                else:
-                    TorrentDBHandler.getInstance().selectTorrentToCheck(infohash=self.infohash, return_value=return_value)
-            event.wait(60.0)
-            
-            torrent = return_value['torrent']
-            if DEBUG:
-                print >> sys.stderr, "Torrent Checking: get value from DB:", torrent['infohash'] 
-            
-            if not torrent:
-                return
-    
-            if self.infohash is None and torrent['ignored_times'] > 0:
-                if DEBUG:
-                    print >> sys.stderr, 'Torrent_checking: torrent: %s' % torrent
-                kw = { 'ignored_times': torrent['ignored_times']-1 }
-                if self.db_thread:
-                    self.db_thread.add_task(lambda:
-                        TorrentDBHandler.getInstance().updateTracker(torrent['infohash'], kw))
-                else:
-                    TorrentDBHandler.getInstance().updateTracker(torrent['infohash'], kw)
-                return
-    
-            # may be block here because the internet IO
-            torrent = self.readTorrent(torrent)    # read the torrent 
-            if 'info' not in torrent:    #torrent has been deleted
-                if self.db_thread:
-                    self.db_thread.add_task(lambda:
-                        TorrentDBHandler.getInstance().deleteTorrent(torrent['infohash']))
-                else:
-                    TorrentDBHandler.getInstance().deleteTorrent(torrent['infohash'])
-                return
-            
-            # TODO: tracker checking also needs to be update
-            if DEBUG:
-                print >> sys.stderr, "Tracker Checking"
-            
-            #Niels: update last_check_time now to prevent multiple requests
-            kw = { 'last_check_time': int(time()) }
-            if self.db_thread:
-                self.db_thread.add_task(lambda:
-                    TorrentDBHandler.getInstance().updateTracker(torrent['infohash'], kw))
-            else:
-                TorrentDBHandler.getInstance().updateTracker(torrent['infohash'], kw)    
-            
-            trackerChecking(torrent)
-            
-            # Must come after tracker check, such that if tracker dead and DHT still alive, the
-            # status is still set to good
-            self.mldhtchecker.lookup(torrent['infohash'])
-            
-            self.updateTorrentInfo(torrent)            # set the ignored_times
-            
-            kw = {
-                'seeder': torrent['seeder'],
-                'leecher': torrent['leecher'],
-                'status': torrent['status'],
-                'ignored_times': torrent['ignored_times'],
-                'retried_times': torrent['retried_times'],
-                #'info': torrent['info']
-                }
+        if DEBUG:
+            print >> sys.stderr, "Torrent Checking: RUN", threading.currentThread().getName()
             
+        return_value = safe_dict()
+        return_value['event'] = threading.Event()
+        return_value['torrent'] = None
+        if self.infohash is None:   # select torrent by a policy
+            policy = self.selectPolicy()
+            TorrentDBHandler.getInstance().selectTorrentToCheck(policy=policy, return_value=return_value)
+        else:   # know which torrent to check
+            TorrentDBHandler.getInstance().selectTorrentToCheck(infohash=self.infohash, return_value=return_value)
+        
+        torrent = return_value['torrent']
+        if not torrent:
+            return
+        if DEBUG:
+            print >> sys.stderr, "Torrent Checking: get value from DB:", torrent['infohash'] 
+
+        if self.infohash is None and torrent['ignored_times'] > 0:
             if DEBUG:
-                print >> sys.stderr, "Torrent Checking: selectTorrentToCheck:", kw
-            
-            if self.db_thread:
-                self.db_thread.add_task(lambda:
-                    TorrentDBHandler.getInstance().updateTorrent(torrent['infohash'], **kw))
-            else:
-                TorrentDBHandler.getInstance().updateTorrent(torrent['infohash'], **kw)
-        finally:
-            if not self.db_thread:
-                TorrentDBHandler.getInstance().close()
+                print >> sys.stderr, 'Torrent_checking: torrent: %s' % torrent
+            kw = { 'ignored_times': torrent['ignored_times']-1 }
+            TorrentDBHandler.getInstance().updateTracker(torrent['infohash'], kw)
+            return
+
+        torrent = self.readTorrent(torrent)    # read the torrent 
+        if 'info' not in torrent:    #torrent has been deleted
+            TorrentDBHandler.getInstance().deleteTorrent(torrent['infohash'])
+            return
+        
+        # TODO: tracker checking also needs to be update
+        if DEBUG:
+            print >> sys.stderr, "Tracker Checking"
+        
+        #Niels: update last_check_time now to prevent multiple requests
+        kw = { 'last_check_time': int(time()) }
+        TorrentDBHandler.getInstance().updateTracker(torrent['infohash'], kw)
+        
+        self.trackerclient.rawserver.add_task(lambda: trackerChecking(torrent, self.trackerclient, self.trackerChecked))
+
+    def trackerChecked(self, torrent):
+        """ Called by the network thread """
+        self.getDBQueue().add_task(lambda: self.updateTorrent(torrent))
+
+    def updateTorrent(self, torrent):
+        """ Stores the result of the check. Called by the database thread """
+        # Must come after tracker check, such that if tracker dead and DHT still alive, the
+        # status is still set to good
+        self.mldhtchecker.lookup(torrent['infohash'])
+        
+        self.updateTorrentInfo(torrent)            # set the ignored_times
+        
+        kw = {
+            'seeder': torrent['seeder'],
+            'leecher': torrent['leecher'],
+            'status': torrent['status'],
+            'ignored_times': torrent['ignored_times'],
+            'retried_times': torrent['retried_times'],
+            #'info': torrent['info']
+            }
+        
+        if DEBUG:
+            print >> sys.stderr, "Torrent Checking: selectTorrentToCheck:", kw
+        
+        TorrentDBHandler.getInstance().updateTorrent(torrent['infohash'], **kw)
             
 #===============================================================================
 #    def tooFast(self, torrent):
@@ -196,6 +190,8 @@ class TorrentChecking(Thread):
 
 
 if __name__ == '__main__':
+    from threading import Event
+    from Tribler.Core.BitTornado.RawServer import RawServer
     from Tribler.Core.CacheDB.sqlitecachedb import init as init_db, str2bin
     configure_dir = sys.argv[1]
     config = {}
@@ -203,17 +199,18 @@ if __name__ == '__main__':
     config['install_dir'] = '.'
     config['peer_icon_path'] = '.'
     init_db(config)
+    doneflag = Event()
+    rawserver = RawServer(doneflag, 60, 300)
+    TrackerClient.getInstance(rawserver)
+    
     t = TorrentChecking()
     t.start()
-    t.join()
-    
     
     infohash_str = 'TkFX5S4qd2DPW63La/VObgOH/Nc='
     infohash = str2bin(infohash_str)
     
-    del t
-    
     t = TorrentChecking(infohash)
     t.start()
-    t.join()
     
+    rawserver.add_task(doneflag.set, 120)
+    rawserver.listen_forever(None)
@@ -1,142 +1,120 @@
 # written by Yuan Yuan
 # see LICENSE.txt for license information
 
-# single torrent checking without Thread
+# single torrent checking through the TrackerClient, without Thread
 import sys
-from Tribler.Core.BitTornado.bencode import bdecode
 from random import shuffle
-import urllib
-import socket
-import Tribler.Core.Utilities.timeouturlopen as timeouturlopen
 from time import time
-from traceback import print_exc
 
-HTTP_TIMEOUT = 30 # seconds
+from Tribler.Core.BitTornado.BT1.TrackerClient import ERROR_CONNECTION
 
 DEBUG = False
 
-def trackerChecking(torrent):    
-    single_no_thread(torrent)              
-        
-def single_no_thread(torrent):
-    
-    (seeder, leecher) = (-2, -2)        # default dead
-    if ( torrent["info"].get("announce-list", "") == "" ):        # no announce-list
-        try:
-            announce = torrent["info"]["announce"]                    # get the single tracker
-            (s, l) = singleTrackerStatus(torrent, announce)
-            seeder = max(seeder, s)
-            leecher = max(leecher, l)
-        except:
-            pass
-    else:                                                # have announce-list
-        for announces in torrent["info"]["announce-list"]:
-            a_len = len(announces)
-            if (a_len == 0):                            # length = 0
-                continue
-            if (a_len == 1):                            # length = 1
-                announce = announces[0]
-                (s, l) = singleTrackerStatus(torrent, announce)
-                seeder = max(seeder, s)
-                leecher = max(leecher, l)
-            else:                                        # length > 1
-                aindex = torrent["info"]["announce-list"].index(announces)                                    
-                shuffle(announces)
-                # Arno: protect agaist DoS torrents with many trackers in announce list. 
-                announces = announces[:16]
-                for announce in announces:                # for eache announce
-                    (s, l) = singleTrackerStatus(torrent, announce)
-                    seeder = max(seeder, s)
-                    leecher = max(leecher, l)
-                    if seeder > 0:  # good
-                        break
-                if (seeder > 0 or leecher > 0):        # put the announce\
-                    announces.remove(announce)            # in front of the tier
-                    announces.insert(0, announce)                    
-                    torrent["info"]["announce-list"][aindex] = announces
-#                    print "one changed"
-            if (seeder > 0):
-                break
-    if (seeder == -3 and leecher == -3):
-        pass        # if interval problem, just keep the last status
-    else:
-        torrent["seeder"] = seeder
-        torrent["leecher"] = leecher
-        if (torrent["seeder"] > 0 or torrent["leecher"] > 0):
-            torrent["status"] = "good"
-        elif (torrent["seeder"] == 0 and torrent["leecher"] == 0):
-            torrent["status"] = "unknown"
-#            torrent["seeder"] = 0
-#            torrent["leecher"] = 0
-        elif (torrent["seeder"] == -1 and torrent["leecher"] == -1):    # unknown
-            torrent["status"] = "unknown"
-#            torrent["seeder"] = -1
-#            torrent["leecher"] = -1
-        else:        # if seeder == -2 and leecher == -2, dead
-            torrent["status"] = "dead"
-            torrent["seeder"] = -2
-            torrent["leecher"] = -2
-    torrent["last_check_time"] = long(time())
-    return torrent
-
-
-def singleTrackerStatus(torrent, announce):
-    # return (-1, -1) means the status of torrent is unknown
-    # return (-2. -2) means the status of torrent is dead
-    # return (-3, -3) means the interval problem 
-    info_hash = torrent["infohash"]
-    
-    if DEBUG:
-        print >>sys.stderr,"TrackerChecking: Checking",announce,"for",`info_hash`
-    
-    url = getUrl(announce, info_hash)            # whether scrape support
-    if (url == None):                            # tracker url error
-        return (-2, -2)                            # use announce instead
-    try:
-        #print 'Checking url: %s' % url
-        (seeder, leecher) = getStatus(url, info_hash)
-        
+# Arno: protect agaist DoS torrents with many trackers in announce list.
+MAX_TRACKERS_PER_TIER = 16
+
+def trackerChecking(torrent, trackerclient, callback):
+    """ Scrapes the trackers of the torrent, sets its seeder, leecher,
+    status and last_check_time and calls callback(torrent). Called by the
+    network thread, and so is the callback. """
+    TrackerCheck(torrent, trackerclient, callback).start()
+
+
+class TrackerCheck:
+    """ Scrapes the trackers of a torrent one by one, in the order of the
+    tiers of its announce-list, until one knows a seeder """
+    def __init__(self, torrent, trackerclient, callback):
+        self.torrent = torrent
+        self.trackerclient = trackerclient
+        self.callback = callback
+        (self.seeder, self.leecher) = (-2, -2)        # default dead
+
+        self.tiers = []     # (index in announce-list, announces)
+        info = torrent["info"]
+        if ( info.get("announce-list", "") == "" ):        # no announce-list
+            if "announce" in info:
+                self.tiers.append((None, [info["announce"]]))    # get the single tracker
+        else:                                                # have announce-list
+            for aindex, announces in enumerate(info["announce-list"]):
+                if len(announces) == 0:
+                    continue
+                if len(announces) > 1:
+                    shuffle(announces)
+                    announces = announces[:MAX_TRACKERS_PER_TIER]
+                self.tiers.append((aindex, announces))
+        if self.tiers:
+            # the interval problem, unless a tracker tells otherwise
+            (self.seeder, self.leecher) = (-3, -3)
+        self.tier = 0
+        self.pos = 0
+
+    def start(self):
+        self._next()
+
+    def _next(self):
+        if self.tier < len(self.tiers):
+            aindex, announces = self.tiers[self.tier]
+            announce = announces[self.pos]
+            if DEBUG:
+                print >>sys.stderr,"TrackerChecking: Checking",announce,"for",`self.torrent["infohash"]`
+            self.trackerclient.scrape(announce, self.torrent["infohash"], self._scraped)
+        else:
+            self._done()
+
+    def _scraped(self, info_hash, response, error):
+        (s, l) = getStatus(info_hash, response, error)
         if DEBUG:
-            print >>sys.stderr,"TrackerChecking: Result",(seeder,leecher)
-    except:
-        (seeder, leecher) = (-2, -2)
-    return (seeder, leecher)
+            print >>sys.stderr,"TrackerChecking: Result",(s, l)
+        self.seeder = max(self.seeder, s)
+        self.leecher = max(self.leecher, l)
 
-# generate the query URL
-def getUrl(announce, info_hash):
-    if (announce == -1):                        # tracker url error
-        return None                                # return None
-    announce_index = announce.rfind("announce")
-    last_index = announce.rfind("/")    
-    
-    url = announce    
-    if (last_index +1 == announce_index):        # srape supprot
-        url = url.replace("announce","scrape")
-    url += "?info_hash=" + urllib.quote(info_hash)
-#    print url
-    return url
-
-
-            
-def getStatus(url, info_hash):
-    try:
-        resp = timeouturlopen.urlOpenTimeout(url,timeout=HTTP_TIMEOUT)
-        response = resp.read()
-        
-    except IOError:
-#        print "IOError"
-        return (-1, -1)                    # unknown
-    except AttributeError:
-#        print "AttributeError"
-        return (-2, -2)                    # dead
-    
-    try:
-        response_dict = bdecode(response)
+        aindex, announces = self.tiers[self.tier]
+        self.pos += 1
+        if self.seeder > 0 or self.pos == len(announces):
+            if aindex is not None and len(announces) > 1 and (self.seeder > 0 or self.leecher > 0):
+                # put the announce in front of the tier
+                announce = announces[self.pos-1]
+                announces.remove(announce)
+                announces.insert(0, announce)
+                self.torrent["info"]["announce-list"][aindex] = announces
+            if self.seeder > 0:
+                self._done()
+                return
+            self.tier += 1
+            self.pos = 0
+        self._next()
+
+    def _done(self):
+        torrent = self.torrent
+        (seeder, leecher) = (self.seeder, self.leecher)
+        if (seeder == -3 and leecher == -3):
+            pass        # if interval problem, just keep the last status
+        else:
+            torrent["seeder"] = seeder
+            torrent["leecher"] = leecher
+            if (torrent["seeder"] > 0 or torrent["leecher"] > 0):
+                torrent["status"] = "good"
+            elif (torrent["seeder"] == 0 and torrent["leecher"] == 0):
+                torrent["status"] = "unknown"
+            elif (torrent["seeder"] == -1 and torrent["leecher"] == -1):    # unknown
+                torrent["status"] = "unknown"
+            else:        # if seeder == -2 and leecher == -2, dead
+                torrent["status"] = "dead"
+                torrent["seeder"] = -2
+                torrent["leecher"] = -2
+        torrent["last_check_time"] = long(time())
+        self.callback(torrent)
 
-    except:
-#        print "DeCode Error "  + response
+
+def getStatus(info_hash, response_dict, error):
+    # return (-1, -1) means the status of torrent is unknown
+    # return (-2. -2) means the status of torrent is dead
+    # return (-3, -3) means the interval problem
+    if error is not None:
+        if error[0] == ERROR_CONNECTION:
+            return (-1, -1)                # unknown
         return (-2, -2)                    # dead
-    
+
     try:
         status = response_dict["files"][info_hash]
         seeder = status["complete"]
@@ -145,17 +123,14 @@ def getStatus(url, info_hash):
         leecher = status["incomplete"]
         if leecher < 0:
             leecher = 0
-        
-    except KeyError:
-#        print "KeyError "  + info_hash + str(response_dict)
+
+    except (KeyError, TypeError):
         try:
-            if response_dict.has_key("flags"): # may be interval problem        
+            if response_dict.has_key("flags"): # may be interval problem
                 if response_dict["flags"].has_key("min_request_interval"):
-#                    print "interval problem"
                     return (-3 ,-3)
         except:
             pass
-#        print "KeyError "  + info_hash + str(response_dict)
         return (-2, -2)                    # dead
-    
+
     return (seeder, leecher)
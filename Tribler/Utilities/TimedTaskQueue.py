@@ -11,8 +11,29 @@ import sys
 from threading import Thread,Condition
 from traceback import print_exc,print_stack,format_stack
 from time import time
+from heapq import heappush, heappop, heapify
 
 DEBUG = False
+# Record where each task was added, printed when the task raises an exception
+RECORD_STACKS = False
+
+
+class TimedTask:
+    """ Handle of a task added to a TimedTaskQueue """
+    def __init__(self,queue,when,task,id,stack):
+        self.queue = queue
+        self.when = when
+        self.task = task
+        self.id = id
+        self.stack = stack
+        self.cancelled = False
+        self.done = False
+
+    def cancel(self):
+        """ Removes the task from the queue. Returns False if it already ran 
+        or was removed """
+        return self.queue.cancel(self)
+
 
 class TimedTaskQueue:
     
@@ -20,79 +41,157 @@ class TimedTaskQueue:
     
     def __init__(self,nameprefix="TimedTaskQueue",isDaemon=True):
         self.cond = Condition()
+        # Heap of (when,count,TimedTask). The count keeps tasks that were 
+        # scheduled at the same time in FIFO order. Cancelled tasks stay in 
+        # the heap until they come up or the heap is rebuilt. 
         self.queue = []
-        self.count = 0.0 # serves to keep task that were scheduled at the same time in FIFO order
+        self.count = 0
+        self.ids = {} # TimedTask by id
+        self.ncancelled = 0
+
+        # Statistics, see get_stats()
+        self.nexecuted = 0
+        self.total_lag = 0.0
+        self.max_lag = 0.0
+        self.max_depth = 0
+
         self.thread = Thread(target = self.run)
         self.thread.setDaemon(isDaemon)
         self.thread.setName( nameprefix+self.thread.getName() )
         self.thread.start()
-
-        if __debug__:
-            self.callstack = {} # callstack by self.count
         
     def add_task(self,task,t=0,id=None):
-        """ t parameter is now usable, unlike before. 
-            If id is given, all the existing tasks with the same id will be removed
+        """ Runs task in t seconds and returns its TimedTask handle.
+            If id is given, the existing task with the same id will be removed
             before inserting this task 
         """
         
         if task is None:
             print_stack()
 
+        if RECORD_STACKS:
+            stack = format_stack()
+        else:
+            stack = None
+
         self.cond.acquire()
-        when = time()+t
-        if DEBUG:
-            print >>sys.stderr,"ttqueue: ADD EVENT",t,task
+        try:
+            when = time()+t
+            if DEBUG:
+                print >>sys.stderr,"ttqueue: ADD EVENT",t,task
 
-        if __debug__:
-            self.callstack[self.count] = format_stack()
-            
-        if id != None:  # remove all redundant tasks
-            self.queue = filter(lambda item:item[3]!=id, self.queue)
-        self.queue.append((when,self.count,task,id))
-        self.count += 1.0
-        self.cond.notify()
-        self.cond.release()
+            handle = TimedTask(self,when,task,id,stack)
+            if id is not None:  # remove the redundant task
+                if id in self.ids:
+                    self._cancel(self.ids[id])
+                self.ids[id] = handle
+            heappush(self.queue,(when,self.count,handle))
+            self.count += 1
+            self.max_depth = max(self.max_depth,len(self.queue)-self.ncancelled)
+            self.cond.notify()
+            return handle
+        finally:
+            self.cond.release()
+
+    def cancel(self,handle):
+        """ Removes a task from the queue, see TimedTask.cancel() """
+        self.cond.acquire()
+        try:
+            return self._cancel(handle)
+        finally:
+            self.cond.release()
+
+    def remove_task(self,id):
+        """ Removes the task with the given id from the queue. Returns False 
+        if there is none """
+        self.cond.acquire()
+        try:
+            if id in self.ids:
+                return self._cancel(self.ids[id])
+            return False
+        finally:
+            self.cond.release()
+
+    def get_stats(self):
+        """ Returns the number of tasks in the queue, the maximum since the 
+        queue was created, the number of tasks executed and the average and 
+        maximum time in seconds tasks started after they were due """
+        self.cond.acquire()
+        try:
+            if self.nexecuted:
+                avg_lag = self.total_lag / self.nexecuted
+            else:
+                avg_lag = 0.0
+            return {'depth':len(self.queue)-self.ncancelled,
+                    'max_depth':self.max_depth,
+                    'executed':self.nexecuted,
+                    'avg_lag':avg_lag,
+                    'max_lag':self.max_lag}
+        finally:
+            self.cond.release()
+
+    def _cancel(self,handle):
+        """ Called with the lock held """
+        if handle.cancelled or handle.done:
+            return False
+        handle.cancelled = True
+        handle.task = None
+        if handle.id is not None and self.ids.get(handle.id) is handle:
+            del self.ids[handle.id]
+        self.ncancelled += 1
+        # Rebuild the heap when most of it has been cancelled
+        if self.ncancelled > 100 and self.ncancelled > len(self.queue)/2:
+            self.queue = [item for item in self.queue if not item[2].cancelled]
+            heapify(self.queue)
+            self.ncancelled = 0
+        return True
+
+    def _pop(self):
+        """ Called with the lock held, removes the first task and returns it """
+        (when,count,handle) = heappop(self.queue)
+        if handle.cancelled:
+            self.ncancelled -= 1
+        else:
+            handle.done = True
+            if handle.id is not None and self.ids.get(handle.id) is handle:
+                del self.ids[handle.id]
+        return handle
         
     def run(self):
         """ Run by server thread """
         while True:
-            task = None
-            timeout = None
-            flag = False
             self.cond.acquire()
-            while True:
-                while len(self.queue) == 0 or flag:
-                    flag = False
-                    if timeout is None:
+            try:
+                while True:
+                    if not self.queue:
                         # Wait until something is queued
                         self.cond.wait()
-                    else:
-                        # Wait till first event is due
-                        self.cond.wait(timeout)
-                # A new event was added or an event is due
-                self.queue.sort()
-                
-                (when,count,task,id) = self.queue[0]
-                if DEBUG:
-                    print >>sys.stderr,"ttqueue: EVENT IN QUEUE",when,task
-                now = time()
-                if now < when:
-                    # Event not due, wait some more
+                        continue
+                    (when,count,handle) = self.queue[0]
+                    if handle.cancelled:
+                        self._pop()
+                        continue
                     if DEBUG:
-                        print >>sys.stderr,"ttqueue: EVENT NOT TILL",when-now
-                    timeout = when-now
-                    flag = True
-                else:
-                    # Event due, execute
-                    if DEBUG:
-                        print >>sys.stderr,"ttqueue: EVENT DUE"
-                    self.queue.pop(0)
-                    if __debug__:
-                        assert count in self.callstack
-                        stack = self.callstack.pop(count)
-                    break
-            self.cond.release()
+                        print >>sys.stderr,"ttqueue: EVENT IN QUEUE",when,handle.task
+                    now = time()
+                    if now < when:
+                        # Event not due, wait till it is or a new event is added
+                        if DEBUG:
+                            print >>sys.stderr,"ttqueue: EVENT NOT TILL",when-now
+                        self.cond.wait(when-now)
+                    else:
+                        # Event due, execute
+                        if DEBUG:
+                            print >>sys.stderr,"ttqueue: EVENT DUE"
+                        self._pop()
+                        lag = now-when
+                        self.nexecuted += 1
+                        self.total_lag += lag
+                        self.max_lag = max(self.max_lag,lag)
+                        break
+            finally:
+                self.cond.release()
+            task = handle.task
             
             # Execute task outside lock
             try:
@@ -100,19 +199,22 @@ class TimedTaskQueue:
                 if task == 'stop':  
                     break
                 elif task == 'quit':
-                    if len(self.queue) == 0:
+                    self.cond.acquire()
+                    try:
+                        whens = [item[0] for item in self.queue if not item[2].cancelled]
+                    finally:
+                        self.cond.release()
+                    if not whens:
                         break
                     else:
-                        (when,count,task,id) = self.queue[-1]
-                        t = when-time()+0.001
+                        t = max(whens)-time()+0.001
                         self.add_task('quit',t)
                 else:
                     task()
             except:
                 print_exc()
-                if __debug__:
+                if handle.stack is not None:
                     print >> sys.stderr, "<<<<<<<<<<<<<<<<"
                     print >> sys.stderr, "TASK QUEUED FROM"
-                    print >> sys.stderr, "".join(stack)
+                    print >> sys.stderr, "".join(handle.stack)
                     print >> sys.stderr, ">>>>>>>>>>>>>>>>"
-
@@ -1,5 +1,5 @@
 -- Tribler SQLite Database
--- Version: 6
+-- Version: 9
 --
 -- History:
 --   v1: Published as part of Tribler 4.5
@@ -478,6 +478,81 @@ CREATE TABLE UserEventLog (
   message        text
 );
 
+-------------------------------------
+
+-- v8: TorrentFTS full-text index of the keywords of each torrent, the
+--     docid of a row is the torrent_id. Filled from the InvertedIndex.
+
+CREATE VIRTUAL TABLE TorrentFTS USING fts3(keywords);
+
+-------------------------------------
+
+-- v9: ChannelStats with the number of torrents, the latest update and the
+--     number of positive and negative votes of each channel. The triggers
+--     keep it up to date when ChannelCast and VoteCast change.
+
+CREATE TABLE ChannelStats (
+  publisher_id   text PRIMARY KEY,
+  nr_torrents    integer DEFAULT 0,
+  latest_update  integer,
+  nr_favorites   integer DEFAULT 0,
+  nr_spam        integer DEFAULT 0
+);
+
+CREATE INDEX ChannelStats_popular_idx
+  ON ChannelStats
+  (nr_favorites, latest_update);
+
+CREATE INDEX ChannelStats_latest_idx
+  ON ChannelStats
+  (latest_update);
+
+CREATE TRIGGER ChannelStats_torrent_insert AFTER INSERT ON ChannelCast
+BEGIN
+  INSERT OR IGNORE INTO ChannelStats (publisher_id) VALUES (NEW.publisher_id);
+  UPDATE ChannelStats SET nr_torrents = nr_torrents + 1,
+                          latest_update = max(ifnull(latest_update, NEW.time_stamp), NEW.time_stamp)
+    WHERE publisher_id = NEW.publisher_id;
+END;
+
+CREATE TRIGGER ChannelStats_torrent_delete AFTER DELETE ON ChannelCast
+BEGIN
+  UPDATE ChannelStats SET nr_torrents = nr_torrents - 1,
+                          latest_update = (SELECT max(time_stamp) FROM ChannelCast WHERE publisher_id = OLD.publisher_id)
+    WHERE publisher_id = OLD.publisher_id;
+END;
+
+CREATE TRIGGER ChannelStats_torrent_update AFTER UPDATE OF publisher_id, time_stamp ON ChannelCast
+BEGIN
+  INSERT OR IGNORE INTO ChannelStats (publisher_id) VALUES (NEW.publisher_id);
+  UPDATE ChannelStats SET nr_torrents = (SELECT count(*) FROM ChannelCast WHERE publisher_id = ChannelStats.publisher_id),
+                          latest_update = (SELECT max(time_stamp) FROM ChannelCast WHERE publisher_id = ChannelStats.publisher_id)
+    WHERE publisher_id IN (OLD.publisher_id, NEW.publisher_id);
+END;
+
+CREATE TRIGGER ChannelStats_vote_insert AFTER INSERT ON VoteCast
+BEGIN
+  INSERT OR IGNORE INTO ChannelStats (publisher_id) VALUES (NEW.mod_id);
+  UPDATE ChannelStats SET nr_favorites = nr_favorites + (CASE WHEN NEW.vote = 2 THEN 1 ELSE 0 END),
+                          nr_spam = nr_spam + (CASE WHEN NEW.vote = -1 THEN 1 ELSE 0 END)
+    WHERE publisher_id = NEW.mod_id;
+END;
+
+CREATE TRIGGER ChannelStats_vote_delete AFTER DELETE ON VoteCast
+BEGIN
+  UPDATE ChannelStats SET nr_favorites = nr_favorites - (CASE WHEN OLD.vote = 2 THEN 1 ELSE 0 END),
+                          nr_spam = nr_spam - (CASE WHEN OLD.vote = -1 THEN 1 ELSE 0 END)
+    WHERE publisher_id = OLD.mod_id;
+END;
+
+CREATE TRIGGER ChannelStats_vote_update AFTER UPDATE OF mod_id, vote ON VoteCast
+BEGIN
+  INSERT OR IGNORE INTO ChannelStats (publisher_id) VALUES (NEW.mod_id);
+  UPDATE ChannelStats SET nr_favorites = (SELECT count(*) FROM VoteCast WHERE mod_id = ChannelStats.publisher_id AND vote = 2),
+                          nr_spam = (SELECT count(*) FROM VoteCast WHERE mod_id = ChannelStats.publisher_id AND vote = -1)
+    WHERE publisher_id IN (OLD.mod_id, NEW.mod_id);
+END;
+
 
 ----------------------------------------
 -- Patch for GameCast
@@ -564,7 +639,7 @@ INSERT INTO TorrentStatus VALUES (2, 'dead', NULL);
 INSERT INTO TorrentSource VALUES (0, '', 'Unknown');
 INSERT INTO TorrentSource VALUES (1, 'BC', 'Received from other user');
 
-INSERT INTO MyInfo VALUES ('version', 7);
+INSERT INTO MyInfo VALUES ('version', 9);
 
 COMMIT TRANSACTION init_values;
 